@@ -0,0 +1,210 @@
+"""
+alert_rules.py - กฎการแจ้งเตือนรายผู้ใช้ที่ประเมินกับสัญญาณแต่ละตัว
+
+กฎแต่ละข้อกำหนดสัญลักษณ์ ประเภทสัญญาณ ความมั่นใจขั้นต่ำ การตัดผ่านระดับ RSI และช่วงราคา
+พร้อมช่องทางและปลายทางของผู้ใช้ กฎถูกคอมไพล์เป็นดัชนี (สัญลักษณ์, ประเภท) -> รายการที่เรียงตาม
+ความมั่นใจขั้นต่ำ สัญญาณหนึ่งตัวจึงค้นเพียงไม่กี่กลุ่มแล้ว bisect หากฎที่ความมั่นใจผ่าน
+แทนการไล่ตรวจกฎทั้งหมด
+
+กฎเก็บใน Redis hash พร้อมเลขเวอร์ชันที่เพิ่มทุกครั้งที่แก้ไข
+AlertRuleEngine โหลดดัชนีใหม่เฉพาะเมื่อเวอร์ชันเปลี่ยน
+"""
+import bisect
+import json
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import sys
+
+# นำเข้าโมดูลจัดการตัวแปรสภาพแวดล้อม
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+import env_manager as env
+
+try:
+    from .redis_manager import get_redis_client
+except ImportError:
+    from redis_manager import get_redis_client
+
+ALERT_RULES_KEY = "crypto_signals:{alerts}:rules"
+ALERT_RULES_VERSION_KEY = "crypto_signals:{alerts}:version"
+ALERT_RULES_REFRESH_SECONDS = env.getenv("ALERT_RULES_REFRESH_SECONDS", 5, float)
+
+ANY_SYMBOL = "*"
+CHANNELS = ("email", "webhook", "discord")
+CATEGORIES = ("strong buy", "weak buy", "hold", "weak sell", "strong sell")
+
+
+@dataclass
+class AlertRule:
+    """กฎการแจ้งเตือนของผู้ใช้หนึ่งคน (เงื่อนไขที่ไม่ระบุถือว่าผ่าน)"""
+    user_id: str
+    channel: str                      # email, webhook หรือ discord
+    target: str                       # อีเมล หรือ URL ของ webhook
+    symbol: str = ANY_SYMBOL
+    categories: List[str] = field(default_factory=list)
+    min_confidence: float = 0.0
+    rsi_cross_above: Optional[float] = None
+    rsi_cross_below: Optional[float] = None
+    price_above: Optional[float] = None
+    price_below: Optional[float] = None
+    rule_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def __post_init__(self):
+        self.symbol = self.symbol.strip().upper() or ANY_SYMBOL
+        self.categories = [category.strip().lower() for category in self.categories]
+
+    def validate(self) -> None:
+        """
+        ตรวจสอบความถูกต้องของกฎ
+
+        Raises:
+            ValueError: เมื่อช่องทาง ประเภทสัญญาณ หรือช่วงค่าไม่ถูกต้อง
+        """
+        if not self.user_id:
+            raise ValueError("ต้องระบุ user_id")
+        if self.channel not in CHANNELS:
+            raise ValueError(f"ช่องทางไม่ถูกต้อง: {self.channel} (รองรับ {', '.join(CHANNELS)})")
+        if not self.target:
+            raise ValueError("ต้องระบุปลายทางของการแจ้งเตือน")
+        unknown = set(self.categories) - set(CATEGORIES)
+        if unknown:
+            raise ValueError(f"ประเภทสัญญาณไม่ถูกต้อง: {', '.join(sorted(unknown))}")
+        if not 0.0 <= self.min_confidence <= 1.0:
+            raise ValueError("min_confidence ต้องอยู่ระหว่าง 0 ถึง 1")
+        if self.price_above is not None and self.price_below is not None and self.price_above > self.price_below:
+            raise ValueError("price_above ต้องไม่มากกว่า price_below")
+
+    def matches_details(self, price: Optional[float], rsi: Optional[float], prev_rsi: Optional[float]) -> bool:
+        """ตรวจเงื่อนไขราคาและ RSI (สัญลักษณ์ ประเภท และความมั่นใจถูกกรองโดยดัชนีแล้ว)"""
+        if self.price_above is not None and (price is None or price < self.price_above):
+            return False
+        if self.price_below is not None and (price is None or price > self.price_below):
+            return False
+        if self.rsi_cross_above is not None:
+            if rsi is None or prev_rsi is None or not prev_rsi < self.rsi_cross_above <= rsi:
+                return False
+        if self.rsi_cross_below is not None:
+            if rsi is None or prev_rsi is None or not prev_rsi > self.rsi_cross_below >= rsi:
+                return False
+        return True
+
+
+class AlertRuleIndex:
+    """ดัชนีของกฎที่คอมไพล์แล้ว (สร้างใหม่ทั้งชุดเมื่อกฎเปลี่ยน จึงอ่านได้โดยไม่ต้องล็อก)"""
+
+    def __init__(self, rules: List[AlertRule]):
+        # (สัญลักษณ์, ประเภท หรือ None = ทุกประเภท) -> (ความมั่นใจขั้นต่ำที่เรียงแล้ว, กฎ)
+        groups: Dict[Tuple[str, Optional[str]], List[AlertRule]] = {}
+        for rule in rules:
+            for category in rule.categories or [None]:
+                groups.setdefault((rule.symbol, category), []).append(rule)
+
+        self._groups: Dict[Tuple[str, Optional[str]], Tuple[List[float], List[AlertRule]]] = {}
+        for key, group in groups.items():
+            group.sort(key=lambda rule: rule.min_confidence)
+            self._groups[key] = ([rule.min_confidence for rule in group], group)
+        self.size = len(rules)
+
+    def candidates(self, symbol: str, category: str, confidence: float) -> List[AlertRule]:
+        """กฎที่สัญลักษณ์ ประเภท และความมั่นใจตรงกับสัญญาณ"""
+        matched = []
+        for key in ((symbol, category), (symbol, None), (ANY_SYMBOL, category), (ANY_SYMBOL, None)):
+            group = self._groups.get(key)
+            if group is not None:
+                thresholds, rules = group
+                matched.extend(rules[:bisect.bisect_right(thresholds, confidence)])
+        return matched
+
+
+class AlertRuleStore:
+    """บันทึกกฎการแจ้งเตือนใน Redis"""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client(decode_responses=True)
+
+    def save(self, rule: AlertRule) -> AlertRule:
+        """
+        บันทึกหรือแทนที่กฎ
+
+        Raises:
+            ValueError: เมื่อกฎไม่ถูกต้อง
+        """
+        rule.validate()
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.hset(ALERT_RULES_KEY, rule.rule_id, json.dumps(asdict(rule)))
+        pipeline.incr(ALERT_RULES_VERSION_KEY)
+        pipeline.execute()
+        return rule
+
+    def delete(self, rule_id: str) -> bool:
+        """ลบกฎ คืน False ถ้าไม่พบ"""
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.hdel(ALERT_RULES_KEY, rule_id)
+        pipeline.incr(ALERT_RULES_VERSION_KEY)
+        deleted, _ = pipeline.execute()
+        return bool(deleted)
+
+    def list(self, user_id: Optional[str] = None) -> List[AlertRule]:
+        """กฎทั้งหมด หรือเฉพาะของผู้ใช้ที่ระบุ"""
+        rules = [AlertRule(**json.loads(raw)) for raw in self.redis.hvals(ALERT_RULES_KEY)]
+        if user_id is not None:
+            rules = [rule for rule in rules if rule.user_id == user_id]
+        return rules
+
+    def version(self) -> int:
+        return int(self.redis.get(ALERT_RULES_VERSION_KEY) or 0)
+
+
+class AlertRuleEngine:
+    """ประเมินสัญญาณกับกฎของผู้ใช้ทุกคนผ่านดัชนีตามสัญลักษณ์"""
+
+    def __init__(self, store: Optional[AlertRuleStore] = None,
+                 refresh_seconds: float = ALERT_RULES_REFRESH_SECONDS):
+        """
+        Args:
+            store: ที่เก็บกฎ (ค่าเริ่มต้นคือ Redis ที่ใช้ร่วมกันทั้งแอป)
+            refresh_seconds: ระยะห่างขั้นต่ำระหว่างการตรวจเวอร์ชันของกฎ
+        """
+        self.store = store or AlertRuleStore()
+        self.refresh_seconds = refresh_seconds
+        self.index = AlertRuleIndex([])
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._last_rsi: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> None:
+        """โหลดกฎใหม่ถ้าเวอร์ชันใน Redis เปลี่ยน (ตรวจไม่บ่อยกว่า refresh_seconds)"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = now
+        version = self.store.version()
+        if force or version != self._version:
+            self.index = AlertRuleIndex(self.store.list())
+            self._version = version
+
+    def match(self, signal: Dict[str, Any]) -> List[AlertRule]:
+        """
+        กฎที่สัญญาณนี้ผ่านทุกเงื่อนไข
+
+        Args:
+            signal: ข้อมูลสัญญาณ (symbol, category, confidence, price, indicators)
+        """
+        self.refresh()
+        symbol = signal.get('symbol', '').upper()
+        rsi = (signal.get('indicators') or {}).get('rsi14')
+        with self._lock:
+            # RSI ก่อนหน้าของสัญลักษณ์นี้ ใช้ตรวจการตัดผ่านระดับ
+            prev_rsi = self._last_rsi.get(symbol)
+            if rsi is not None:
+                self._last_rsi[symbol] = rsi
+
+        candidates = self.index.candidates(symbol, signal.get('category', '').lower(),
+                                           float(signal.get('confidence', 0.0)))
+        return [rule for rule in candidates if rule.matches_details(signal.get('price'), rsi, prev_rsi)]
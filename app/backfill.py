@@ -0,0 +1,376 @@
+"""
+backfill.py - เติมข้อมูลแท่งเทียนย้อนหลังลง InfluxDB
+
+แบ่งช่วงวันที่เป็น chunk (จัดตำแหน่งตาม epoch UTC) แล้วโหลดแท่ง 1m จากแหล่งข้อมูล
+(ไฟล์ CSV/Parquet ที่ดาวน์โหลดไว้, Binance REST API หรือคลาสที่กำหนดเอง) แบบขนาน
+เขียนผ่าน line protocol แบบ batch ทั้ง 1m และ timeframe ที่ใหญ่ขึ้น พร้อมรายงานช่วงข้อมูลที่ขาด
+
+การรันซ้ำปลอดภัย: InfluxDB เขียนทับ point ที่มี series และเวลาเดียวกัน
+
+ตัวอย่าง:
+    python -m app.backfill --symbols BTCUSDT,ETHUSDT --start 2024-01-01 --end 2024-04-01 \\
+        --source csv --path ./dumps --concurrency 4
+"""
+import argparse
+import glob
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+try:
+    from . import env_manager as env
+    from .candle_aggregator import CandleAggregator, DEFAULT_TIMEFRAMES, TIMEFRAME_MS, kline_measurement
+    from .influxdb_storage import get_influxdb_storage
+    from .logger import LoggerFactory
+except ImportError:
+    import env_manager as env
+    from candle_aggregator import CandleAggregator, DEFAULT_TIMEFRAMES, TIMEFRAME_MS, kline_measurement
+    from influxdb_storage import get_influxdb_storage
+    from logger import LoggerFactory
+
+logger = LoggerFactory.get_logger('backfill')
+
+MINUTE_MS = 60_000
+_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+
+class KlineSource:
+    """แหล่งข้อมูลแท่ง 1m (สืบทอดคลาสนี้เพื่อเพิ่มแหล่งข้อมูลใหม่)"""
+
+    def fetch(self, symbol: str, start_ms: int, end_ms: int) -> Iterable[Dict[str, Any]]:
+        """
+        คืนแท่ง 1m ที่มีเวลาเปิดอยู่ในช่วง [start_ms, end_ms)
+
+        แต่ละแท่งเป็น dict ที่มี timestamp (ms) และ open/high/low/close/volume
+        """
+        raise NotImplementedError
+
+
+class FileSource(KlineSource):
+    """
+    อ่านไฟล์ dump ในเครื่อง เช่น data.binance.vision (ชื่อไฟล์ขึ้นต้นด้วยสัญลักษณ์)
+    คอลัมน์ 6 ตัวแรกคือ open_time, open, high, low, close, volume (มีหรือไม่มี header ก็ได้)
+    """
+
+    def __init__(self, path: str, extension: str):
+        self.path = path
+        self.extension = extension
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def _read_file(self, filename: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def _load(self, symbol: str) -> pd.DataFrame:
+        """โหลดไฟล์ทั้งหมดของสัญลักษณ์ครั้งเดียว แล้วใช้ร่วมกันทุก chunk"""
+        with self._lock:
+            if symbol not in self._frames:
+                files = sorted(glob.glob(os.path.join(self.path, f"{symbol}*.{self.extension}")))
+                frames = [self._read_file(filename) for filename in files]
+                frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=_COLUMNS)
+
+                timestamps = frame["timestamp"].astype(np.int64)
+                # dump ของ spot ตั้งแต่ปี 2025 ใช้ microsecond
+                frame["timestamp"] = np.where(timestamps > 10**14, timestamps // 1000, timestamps)
+                frame = frame.drop_duplicates("timestamp").sort_values("timestamp", ignore_index=True)
+                self._frames[symbol] = frame
+                logger.info(f"โหลด {len(frame)} แท่งของ {symbol} จาก {len(files)} ไฟล์")
+            return self._frames[symbol]
+
+    def fetch(self, symbol: str, start_ms: int, end_ms: int) -> Iterable[Dict[str, Any]]:
+        frame = self._load(symbol)
+        timestamps = frame["timestamp"].to_numpy()
+        lo, hi = np.searchsorted(timestamps, [start_ms, end_ms])
+        return frame.iloc[lo:hi].to_dict("records")
+
+
+class CsvSource(FileSource):
+    """อ่านไฟล์ CSV"""
+
+    def __init__(self, path: str):
+        super().__init__(path, "csv")
+
+    def _read_file(self, filename: str) -> pd.DataFrame:
+        frame = pd.read_csv(filename, header=None, usecols=range(6), names=_COLUMNS)
+        # ตัดแถว header ออก (ถ้ามี)
+        if not str(frame.iloc[0, 0]).isdigit():
+            frame = frame.iloc[1:]
+        return frame.astype({"timestamp": np.int64, "open": float, "high": float,
+                             "low": float, "close": float, "volume": float})
+
+
+class ParquetSource(FileSource):
+    """อ่านไฟล์ Parquet (ต้องติดตั้ง pyarrow หรือ fastparquet)"""
+
+    def __init__(self, path: str):
+        super().__init__(path, "parquet")
+
+    def _read_file(self, filename: str) -> pd.DataFrame:
+        frame = pd.read_parquet(filename)
+        frame = frame.iloc[:, :6]
+        frame.columns = _COLUMNS
+        return frame
+
+
+class BinanceRestSource(KlineSource):
+    """ดึงแท่ง 1m จาก Binance REST API สาธารณะ (สูงสุด 1000 แท่งต่อคำขอ)"""
+
+    def __init__(self, base_url: str = "https://api.binance.com", pause: float = 0.1):
+        self.base_url = base_url
+        self.pause = pause
+
+    def fetch(self, symbol: str, start_ms: int, end_ms: int) -> Iterable[Dict[str, Any]]:
+        records = []
+        cursor = start_ms
+        while cursor < end_ms:
+            response = requests.get(f"{self.base_url}/api/v3/klines", params={
+                "symbol": symbol, "interval": "1m", "startTime": cursor, "endTime": end_ms - 1, "limit": 1000
+            }, timeout=30)
+            response.raise_for_status()
+            rows = response.json()
+            if not rows:
+                break
+            for row in rows:
+                records.append(dict(zip(_COLUMNS, (int(row[0]), *map(float, row[1:6])))))
+            cursor = int(rows[-1][0]) + MINUTE_MS
+            time.sleep(self.pause)
+        return records
+
+
+def load_source(name: str, path: Optional[str] = None) -> KlineSource:
+    """
+    สร้างแหล่งข้อมูลจากชื่อ: csv, parquet, binance หรือ module:Class สำหรับคลาสที่กำหนดเอง
+    (คลาสที่กำหนดเองจะได้รับ path เป็นอาร์กิวเมนต์ถ้าระบุไว้)
+    """
+    if name == "csv":
+        return CsvSource(path or ".")
+    if name == "parquet":
+        return ParquetSource(path or ".")
+    if name == "binance":
+        return BinanceRestSource()
+
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"ไม่รู้จักแหล่งข้อมูล {name} (ใช้ csv, parquet, binance หรือ module:Class)")
+    source_class = getattr(importlib.import_module(module_name), class_name)
+    return source_class(path) if path else source_class()
+
+
+@dataclass
+class ChunkResult:
+    """ผลลัพธ์ของการเติมข้อมูลหนึ่ง chunk"""
+    symbol: str
+    start_ms: int
+    end_ms: int
+    candles: int = 0
+    aggregated: int = 0
+    gaps: List[Tuple[int, int]] = field(default_factory=list)  # ช่วง [start, end) ของแท่ง 1m ที่ขาด
+    error: Optional[str] = None
+
+
+def split_chunks(start_ms: int, end_ms: int, chunk_ms: int) -> List[Tuple[int, int]]:
+    """แบ่งช่วงเวลาเป็น chunk ที่ขอบตรงกับผลคูณของ chunk_ms นับจาก epoch"""
+    chunks = []
+    cursor = start_ms
+    while cursor < end_ms:
+        boundary = cursor - cursor % chunk_ms + chunk_ms
+        chunks.append((cursor, min(boundary, end_ms)))
+        cursor = boundary
+    return chunks
+
+
+def find_gaps(timestamps: List[int], start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+    """หาช่วงของแท่ง 1m ที่ขาดหายไปใน [start_ms, end_ms) จากรายการเวลาเปิดที่เรียงแล้ว"""
+    gaps = []
+    expected = start_ms - start_ms % MINUTE_MS
+    if expected < start_ms:
+        expected += MINUTE_MS
+    for timestamp in timestamps:
+        if timestamp > expected:
+            gaps.append((expected, timestamp))
+        expected = max(expected, timestamp + MINUTE_MS)
+    if expected < end_ms:
+        gaps.append((expected, end_ms))
+    return gaps
+
+
+def backfill_chunk(source: KlineSource, storage, symbol: str, start_ms: int, end_ms: int,
+                   timeframes: Iterable[str]) -> ChunkResult:
+    """โหลดและเขียนข้อมูลหนึ่ง chunk (1m และ timeframe ที่ใหญ่ขึ้น)"""
+    result = ChunkResult(symbol, start_ms, end_ms)
+    try:
+        records = {int(record["timestamp"]): record for record in source.fetch(symbol, start_ms, end_ms)}
+        candles = [records[timestamp] for timestamp in sorted(records)]
+        result.candles = len(candles)
+        result.gaps = find_gaps([int(candle["timestamp"]) for candle in candles], start_ms, end_ms)
+
+        if candles:
+            storage.store_kline_data(symbol, candles)
+
+            # chunk จัดตำแหน่งตรงกับทุก timeframe จึงรวมแท่งภายใน chunk ได้ครบโดยไม่ต้องใช้ข้อมูลข้าง chunk
+            aggregator = CandleAggregator(timeframes)
+            bars: Dict[str, List[Dict[str, Any]]] = {}
+            for candle in candles:
+                for bar in aggregator.add_kline(symbol, candle):
+                    bars.setdefault(bar.timeframe, []).append(bar.to_dict())
+            for timeframe, items in bars.items():
+                storage.store_kline_data(symbol, items, measurement=kline_measurement(timeframe))
+                result.aggregated += len(items)
+    except Exception as e:
+        result.error = str(e)
+        logger.error(f"เติมข้อมูล {symbol} ช่วง {start_ms}-{end_ms} ไม่สำเร็จ: {e}")
+    return result
+
+
+def _chunk_ms(chunk_hours: int, timeframes: Tuple[str, ...]) -> int:
+    """ขนาด chunk (ms) ที่ตรวจแล้วว่าหารด้วยทุก timeframe ลงตัว"""
+    chunk_ms = chunk_hours * 3_600_000
+    invalid = [tf for tf in timeframes if chunk_ms % TIMEFRAME_MS[tf]]
+    if invalid:
+        raise ValueError(f"chunk_hours={chunk_hours} หารด้วย timeframe {', '.join(invalid)} ไม่ลงตัว")
+    return chunk_ms
+
+
+def _run_chunks(tasks: List[Tuple[str, int, int]], source: KlineSource, storage, concurrency: int,
+                timeframes: Tuple[str, ...]) -> List[ChunkResult]:
+    """ประมวลผล chunk (symbol, start, end) แบบขนานด้วย thread pool"""
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backfill") as executor:
+        futures = [
+            executor.submit(backfill_chunk, source, storage, symbol, chunk_start, chunk_end, timeframes)
+            for symbol, chunk_start, chunk_end in tasks
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            logger.info(
+                f"{result.symbol} {_format_ms(result.start_ms)}: {result.candles} แท่ง, "
+                f"{result.aggregated} แท่งรวม, ขาด {len(result.gaps)} ช่วง"
+            )
+    return sorted(results, key=lambda r: (r.symbol, r.start_ms))
+
+
+def run_backfill(symbols: List[str], start_ms: int, end_ms: int, source: KlineSource,
+                 chunk_hours: int = 24, concurrency: int = 4,
+                 timeframes: Iterable[str] = DEFAULT_TIMEFRAMES, storage=None) -> List[ChunkResult]:
+    """
+    เติมข้อมูลทุกสัญลักษณ์ในช่วงที่กำหนดแบบขนาน
+    (ข้อมูลถูกส่งเป็น batch ตาม flush interval หรือเมื่อเรียก storage.close())
+
+    Args:
+        symbols: สัญลักษณ์ที่ต้องการ
+        start_ms: เวลาเริ่มต้น (ms)
+        end_ms: เวลาสิ้นสุด (ms, ไม่รวม)
+        source: แหล่งข้อมูลแท่ง 1m
+        chunk_hours: ขนาดของแต่ละ chunk (ต้องหารด้วยทุก timeframe ลงตัว)
+        concurrency: จำนวน chunk ที่ประมวลผลพร้อมกัน
+        timeframes: timeframe ที่ต้องการรวมเพิ่ม
+        storage: InfluxDBStorage (ค่าเริ่มต้นคือ instance ที่ใช้ร่วมกันทั้ง process)
+
+    Returns:
+        ผลลัพธ์ของแต่ละ chunk
+    """
+    timeframes = tuple(timeframes)
+    chunk_ms = _chunk_ms(chunk_hours, timeframes)
+    tasks = [
+        (symbol, chunk_start, chunk_end)
+        for symbol in symbols
+        for chunk_start, chunk_end in split_chunks(start_ms, end_ms, chunk_ms)
+    ]
+    logger.info(f"เริ่มเติมข้อมูล {len(symbols)} สัญลักษณ์ {len(tasks)} chunk (พร้อมกัน {concurrency})")
+    return _run_chunks(tasks, source, storage or get_influxdb_storage(), concurrency, timeframes)
+
+
+def repair_gaps(symbols: List[str], start_ms: int, end_ms: int, source: KlineSource,
+                chunk_hours: int = 24, concurrency: int = 4,
+                timeframes: Iterable[str] = DEFAULT_TIMEFRAMES, storage=None) -> List[ChunkResult]:
+    """
+    เติมเฉพาะ chunk ที่ดัชนีช่วงข้อมูลระบุว่ามีแท่ง 1m ขาด
+
+    ทั้ง chunk ถูกโหลดใหม่เพื่อให้แท่งของ timeframe ที่ใหญ่ขึ้นถูกคำนวณใหม่จากข้อมูลครบชุด
+    (นาทีปัจจุบันที่ยังไม่ปิดไม่นับเป็นช่วงที่ขาด)
+
+    Returns:
+        ผลลัพธ์ของแต่ละ chunk ที่ถูกซ่อม
+    """
+    timeframes = tuple(timeframes)
+    chunk_ms = _chunk_ms(chunk_hours, timeframes)
+    storage = storage or get_influxdb_storage()
+    now_ms = int(time.time() * 1000)
+    end_ms = min(end_ms, now_ms - now_ms % MINUTE_MS)
+
+    tasks = []
+    for symbol in symbols:
+        chunk_starts = set()
+        for gap_start, gap_end in storage.coverage.gaps(symbol, start_ms, end_ms):
+            chunk_starts.update(range(gap_start - gap_start % chunk_ms, gap_end, chunk_ms))
+        tasks.extend((symbol, chunk_start, min(chunk_start + chunk_ms, end_ms)) for chunk_start in sorted(chunk_starts))
+
+    logger.info(f"เริ่มซ่อมข้อมูลที่ขาด {len(tasks)} chunk ของ {len(symbols)} สัญลักษณ์")
+    return _run_chunks(tasks, source, storage, concurrency, timeframes)
+
+
+def _format_ms(timestamp_ms: int) -> str:
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def _parse_date(value: str) -> int:
+    """แปลงวันที่ YYYY-MM-DD หรือ YYYY-MM-DDTHH:MM (UTC) เป็น ms"""
+    for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M"):
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp() * 1000)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"รูปแบบวันที่ไม่ถูกต้อง: {value}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="เติมข้อมูลแท่งเทียนย้อนหลังลง InfluxDB")
+    parser.add_argument("--symbols", help="สัญลักษณ์คั่นด้วยคอมมา (ค่าเริ่มต้น: AVAILABLE_SYMBOLS)")
+    parser.add_argument("--start", required=True, type=_parse_date, help="วันที่เริ่มต้น (UTC) เช่น 2024-01-01")
+    parser.add_argument("--end", type=_parse_date, help="วันที่สิ้นสุด (UTC, ไม่รวม) ค่าเริ่มต้นคือปัจจุบัน")
+    parser.add_argument("--source", default="csv", help="csv, parquet, binance หรือ module:Class")
+    parser.add_argument("--path", help="โฟลเดอร์ของไฟล์ dump สำหรับ csv/parquet")
+    parser.add_argument("--chunk-hours", type=int, default=24, help="ขนาดของแต่ละ chunk (ชั่วโมง)")
+    parser.add_argument("--concurrency", type=int, default=4, help="จำนวน chunk ที่ประมวลผลพร้อมกัน")
+    parser.add_argument("--timeframes", default=",".join(DEFAULT_TIMEFRAMES),
+                        help="timeframe ที่รวมเพิ่ม คั่นด้วยคอมมา (ค่าว่าง = เฉพาะ 1m)")
+    parser.add_argument("--repair", action="store_true",
+                        help="เติมเฉพาะ chunk ที่ดัชนีช่วงข้อมูลระบุว่ามีแท่งขาด")
+    args = parser.parse_args(argv)
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",")] if args.symbols else env.get_available_symbols()
+    end_ms = args.end or int(time.time() * 1000)
+    timeframes = [tf for tf in args.timeframes.split(",") if tf]
+
+    run = repair_gaps if args.repair else run_backfill
+    storage = get_influxdb_storage()
+    try:
+        results = run(symbols, args.start, end_ms, load_source(args.source, args.path),
+                      chunk_hours=args.chunk_hours, concurrency=args.concurrency,
+                      timeframes=timeframes, storage=storage)
+    finally:
+        # flush batch ที่ค้างอยู่และบันทึกดัชนีช่วงข้อมูลก่อนจบ
+        storage.close()
+
+    failed = [r for r in results if r.error]
+    total = sum(r.candles for r in results)
+    print(f"✅ เติมข้อมูลแล้ว {total} แท่ง 1m จาก {len(results)} chunk (ล้มเหลว {len(failed)})")
+    for result in results:
+        for gap_start, gap_end in result.gaps:
+            print(f"⚠️ {result.symbol} ขาดข้อมูล {_format_ms(gap_start)} - {_format_ms(gap_end)} "
+                  f"({(gap_end - gap_start) // MINUTE_MS} แท่ง)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -16,7 +16,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # นำเข้าโมดูลที่ต้องการ
 from app.signal_processor import grade_signal, calculate_ema, calculate_sma, calculate_rsi
-from app.influxdb_storage import InfluxDBStorage
+from app.influxdb_storage import get_influxdb_storage
 
 
 class BacktestAnalyzer:
@@ -49,8 +49,8 @@ class BacktestAnalyzer:
         self.start_timestamp = int(self.start_time.timestamp() * 1000)
         self.end_timestamp = int(self.end_time.timestamp() * 1000)
         
-        # เชื่อมต่อกับ InfluxDB
-        self.influxdb_storage = InfluxDBStorage()
+        # ใช้ InfluxDBStorage ที่ใช้ร่วมกันทั้ง process
+        self.influxdb_storage = get_influxdb_storage()
         
         # เก็บประวัติสัญญาณและข้อมูลแท่งเทียน
         self.klines_df = pd.DataFrame()
@@ -462,11 +462,10 @@ class BacktestAnalyzer:
         print(f"บันทึกผลการทดสอบย้อนหลังไปยัง: {output_file}")
     
     def close(self):
-        """ปิดการเชื่อมต่อทั้งหมด"""
-        try:
-            self.influxdb_storage.close()
-        except Exception as e:
-            print(f"เกิดข้อผิดพลาดในการปิดการเชื่อมต่อ: {e}")
+        """
+        ปล่อย resources ของการทดสอบย้อนหลัง
+        InfluxDBStorage ใช้ร่วมกันทั้ง process จึงไม่ปิดที่นี่ (ปิดใน main ของสคริปต์)
+        """
 
 
 # ฟังก์ชันหลักสำหรับรัน backtest
@@ -529,4 +528,7 @@ if __name__ == "__main__":
     
     args = parser.parse_args()
     
-    run_backtest(args.symbol, args.start, args.end, args.output, args.balance)
\ No newline at end of file
+    try:
+        run_backtest(args.symbol, args.start, args.end, args.output, args.balance)
+    finally:
+        get_influxdb_storage().close()
\ No newline at end of file
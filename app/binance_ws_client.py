@@ -18,17 +18,17 @@ import env_manager as env
 # นำเข้าคลาส InfluxDBStorage
 try:
     # เมื่อรันเป็น module โดยตรง
-    from .influxdb_storage import InfluxDBStorage
+    from .influxdb_storage import InfluxDBStorage, get_influxdb_storage
     has_influxdb = True
 except (ImportError, ModuleNotFoundError):
     try:
         # เมื่อรันจาก parent directory
-        from app.influxdb_storage import InfluxDBStorage
+        from app.influxdb_storage import InfluxDBStorage, get_influxdb_storage
         has_influxdb = True
     except (ImportError, ModuleNotFoundError):
         try:
             # เมื่อรันเป็น script โดยตรง
-            from influxdb_storage import InfluxDBStorage
+            from influxdb_storage import InfluxDBStorage, get_influxdb_storage
             has_influxdb = True
         except (ImportError, ModuleNotFoundError):
             # กรณีที่ไม่สามารถนำเข้า InfluxDBStorage ได้
@@ -48,11 +48,14 @@ except (ImportError, ModuleNotFoundError):
                 def store_ticker(self, data):
                     pass
                 
-                def store_depth(self, data):
+                def store_depth(self, data, symbol=None):
                     pass
                 
                 def close(self):
                     pass
+            
+            def get_influxdb_storage():
+                return InfluxDBStorage()
 
 # ค่าตัวแปรสำหรับการเชื่อมต่อ
 redis_config = env.get_redis_config()
@@ -68,6 +71,19 @@ BINANCE_WS_TESTNET_ENDPOINT = "wss://ws-api.testnet.binance.vision/ws-api/v3"
 
 from .optimized_signal_processor import signal_processor
 from .logger import LoggerFactory, log_execution_time, error_logger, MetricsLogger
+from .metrics import registry
+from . import latency_trace
+from .redis_manager import get_async_redis_client, get_async_redis_client_for_symbol, close_async_redis, symbol_key
+from .candle_aggregator import CandleAggregator, DEFAULT_TIMEFRAMES, persist_and_publish
+
+# เมตริกของ hot path (สะสมในหน่วยความจำ ดูได้ที่ /metrics)
+WS_MESSAGES = registry.counter("binance_ws_messages_total", "WebSocket messages received from Binance")
+WS_DECODE_SECONDS = registry.histogram("binance_ws_message_decode_seconds", "Time to decode and buffer one message")
+WS_BUFFER_SIZE = registry.gauge("binance_ws_buffer_size", "Messages waiting in the flush buffer")
+WS_FLUSH_SECONDS = registry.histogram("binance_ws_flush_seconds", "Time to process one buffer flush")
+WS_KLINES = registry.counter("binance_ws_klines_total", "Kline updates processed in buffer flushes")
+WS_RECONNECTS = registry.counter("binance_ws_reconnects_total", "WebSocket reconnection attempts")
+WS_HEALTHY = registry.gauge("binance_ws_healthy", "1 when the last WebSocket health check passed")
 
 class BinanceWebSocketClient:
     def __init__(self, symbols: List[str], callback: Optional[Callable] = None):
@@ -82,12 +98,20 @@ class BinanceWebSocketClient:
             # ใช้ redis client จาก redis_manager แทนการสร้างใหม่
             from .redis_manager import get_redis_client
             self.redis_client = get_redis_client(decode_responses=True)
+            # client แบบ redis.asyncio สำหรับ stream ที่เขียนทุกข้อความ (ไม่บล็อก event loop)
+            self.async_redis = get_async_redis_client(decode_responses=True)
             self.logger.info("Redis connection established via connection pool")
         except Exception as e:
             self.logger.error(f"Redis connection failed: {e}")
             error_logger.log_error(e, {'component': 'binance_ws', 'connection': 'redis'})
             raise
         
+        # InfluxDB สำหรับบันทึก trades และ depth (write API แบบ batching จึงไม่ต้องรอ round-trip ต่อ event)
+        self.influxdb = get_influxdb_storage()
+        
+        # รวมแท่ง 1m ที่ปิดแล้วเป็น 2m/5m/15m/1h/4h/1d (1m ถูกบันทึกและเผยแพร่ด้วย)
+        self.candle_aggregator = CandleAggregator(("1m",) + DEFAULT_TIMEFRAMES)
+        
         # Initialize metrics
         self.metrics.record_metric('initialization', {
             'symbols': symbols,
@@ -164,29 +188,24 @@ class BinanceWebSocketClient:
                 self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
                 self.reconnect_count += 1
                 
-                # Record metrics for reconnection
-                self.metrics.record_metric('reconnection_attempt', {
-                    'attempt_number': self.reconnect_count,
-                    'delay': self.reconnect_delay,
-                    'timestamp': datetime.now().isoformat()
-                })
+                WS_RECONNECTS.inc()
 
     @log_execution_time()
     async def _handle_message(self, message: str):
         """Handle incoming messages with error tracking"""
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             data = json.loads(message)
+            trace = latency_trace.start(data.get("data") if isinstance(data, dict) else None)
+            if trace:
+                data["_trace"] = trace
             self.message_buffer.append(data)
             
             # Record message processing metrics
-            processing_time = time.time() - start_time
-            self.metrics.record_metric('message_processing', {
-                'processing_time': processing_time,
-                'buffer_size': len(self.message_buffer),
-                'timestamp': datetime.now().isoformat()
-            })
+            WS_MESSAGES.inc()
+            WS_DECODE_SECONDS.observe(time.perf_counter() - start_time)
+            WS_BUFFER_SIZE.set(len(self.message_buffer))
             
             # Check if buffer should be flushed
             current_time = time.time()
@@ -219,11 +238,15 @@ class BinanceWebSocketClient:
             return
             
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Process messages in batch
             kline_data = []
+            traces = []
+            flush_time = time.time()
             for msg in self.message_buffer:
+                trace = msg.pop("_trace", None)
+                latency_trace.mark(trace, "flush", flush_time)
                 if "data" in msg and "k" in msg["data"]:
                     kline = msg["data"]["k"]
                     kline_data.append({
@@ -233,13 +256,15 @@ class BinanceWebSocketClient:
                         "high": float(kline["h"]),
                         "low": float(kline["l"]),
                         "close": float(kline["c"]),
-                        "volume": float(kline["v"])
+                        "volume": float(kline["v"]),
+                        "is_closed": kline["x"]
                     })
+                    traces.append(trace)
             
             # Store in Redis
             if kline_data:
                 try:
-                    self.redis_client.xadd(
+                    await self.async_redis.xadd(
                         "market_data",
                         {"data": json.dumps(kline_data)},
                         maxlen=10000
@@ -262,14 +287,26 @@ class BinanceWebSocketClient:
                         'event': 'callback_error'
                     })
             
+            # Roll closed 1m klines into higher timeframes, persist and publish each closed bar
+            closed_candles = []
+            for data, trace in zip(kline_data, traces):
+                if data["is_closed"]:
+                    for candle in self.candle_aggregator.add_kline(data["symbol"], data):
+                        candle.trace = trace
+                        closed_candles.append(candle)
+            if closed_candles:
+                try:
+                    persist_and_publish(closed_candles, self.influxdb, self.redis_client)
+                except redis.RedisError as e:
+                    self.logger.error(f"Candle publish error: {e}")
+                    error_logger.log_error(e, {
+                        'component': 'binance_ws',
+                        'event': 'candle_publish_error'
+                    })
+            
             # Record metrics
-            processing_time = time.time() - start_time
-            self.metrics.record_metric('buffer_flush', {
-                'processing_time': processing_time,
-                'messages_processed': len(self.message_buffer),
-                'klines_processed': len(kline_data),
-                'timestamp': datetime.now().isoformat()
-            })
+            WS_FLUSH_SECONDS.observe(time.perf_counter() - start_time)
+            WS_KLINES.inc(len(kline_data))
             
         except Exception as e:
             self.logger.error(f"Buffer flush error: {e}")
@@ -281,6 +318,7 @@ class BinanceWebSocketClient:
         finally:
             self.message_buffer.clear()
             self.last_flush_time = time.time()
+            WS_BUFFER_SIZE.set(0)
 
     @log_execution_time()
     async def _health_check(self):
@@ -289,16 +327,10 @@ class BinanceWebSocketClient:
             try:
                 if self.websocket and self.websocket.open:
                     await self.websocket.ping()
-                    self.metrics.record_metric('health_check', {
-                        'status': 'healthy',
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    WS_HEALTHY.set(1)
                 else:
                     self.logger.warning("WebSocket connection unhealthy")
-                    self.metrics.record_metric('health_check', {
-                        'status': 'unhealthy',
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    WS_HEALTHY.set(0)
                 await asyncio.sleep(30)
             except Exception as e:
                 self.logger.error(f"Health check error: {e}")
@@ -324,6 +356,9 @@ class BinanceWebSocketClient:
             
             if hasattr(self, 'processor'):
                 self.processor.cleanup()
+            
+            # InfluxDBStorage และ connection pools ของ redis_manager ใช้ร่วมกันทั้งแอป
+            # จึงไม่ปิดที่นี่ (ปิดใน shutdown_event หรือ main ของสคริปต์)
                 
         except Exception as e:
             self.logger.error(f"Error during cleanup: {e}")
@@ -331,10 +366,6 @@ class BinanceWebSocketClient:
                 'component': 'binance_ws',
                 'event': 'cleanup_error'
             })
-        finally:            try:
-                await self.redis_client.close()
-            except Exception as e:
-                self.logger.error(f"Error closing Redis connection: {e}")
                 
     @log_execution_time()
     async def start_kline_streams(self):
@@ -383,6 +414,9 @@ class BinanceWebSocketClient:
         
         self.logger.info(f"Connecting to depth stream: {url}")
         
+        # client ของ shard/slot ที่เก็บข้อมูลสัญลักษณ์นี้ (Pub/Sub ยังใช้ client หลัก)
+        symbol_client = get_async_redis_client_for_symbol(symbol, decode_responses=True)
+        
         reconnect_delay = 1.0
         max_reconnect_delay = 60.0
         reconnect_count = 0
@@ -403,13 +437,16 @@ class BinanceWebSocketClient:
                             # แปลงข้อความเป็น JSON และประมวลผล
                             data = json.loads(message)
                             
-                            # เก็บข้อมูลล่าสุดใน Redis
-                            redis_key = f"latest_depth:{symbol}"
-                            self.redis_client.set(redis_key, message, ex=60)  # หมดอายุใน 60 วินาที
+                            # เก็บข้อมูลล่าสุดใน Redis (shard/slot ของสัญลักษณ์)
+                            redis_key = symbol_key("latest_depth", symbol)
+                            await symbol_client.set(redis_key, message, ex=60)  # หมดอายุใน 60 วินาที
                             
                             # เผยแพร่ข้อมูลไปยัง channel
                             redis_channel = f"crypto_signals:depth:{symbol}"
-                            self.redis_client.publish(redis_channel, message)
+                            await self.async_redis.publish(redis_channel, message)
+                            
+                            # บันทึกสรุป order book ลง InfluxDB
+                            self.influxdb.store_depth(data, symbol)
                             
                         except asyncio.TimeoutError:
                             # ส่ง ping เพื่อตรวจสอบการเชื่อมต่อ
@@ -473,6 +510,9 @@ class BinanceWebSocketClient:
         
         self.logger.info(f"Connecting to trades stream: {url}")
         
+        # client ของ shard/slot ที่เก็บข้อมูลสัญลักษณ์นี้ (Pub/Sub ยังใช้ client หลัก)
+        symbol_client = get_async_redis_client_for_symbol(symbol, decode_responses=True)
+        
         reconnect_delay = 1.0
         max_reconnect_delay = 60.0
         reconnect_count = 0
@@ -494,19 +534,23 @@ class BinanceWebSocketClient:
                             data = json.loads(message)
                             
                             # เก็บข้อมูลล่าสุดใน Redis (เฉพาะรายการซื้อขายล่าสุด 100 รายการ)
-                            redis_key = f"latest_trades:{symbol}"
-                            trade_list_key = f"trades_list:{symbol}"
-                            
-                            # เก็บข้อมูลซื้อขายล่าสุดใน Redis
-                            self.redis_client.set(redis_key, message, ex=60)  # หมดอายุใน 60 วินาที
+                            redis_key = symbol_key("latest_trades", symbol)
+                            trade_list_key = symbol_key("trades_list", symbol)
                             
-                            # เก็บรายการซื้อขายล่าสุด 100 รายการใน Redis List
-                            self.redis_client.lpush(trade_list_key, message)
-                            self.redis_client.ltrim(trade_list_key, 0, 99)  # เก็บเฉพาะ 100 รายการล่าสุด
+                            # เก็บข้อมูลซื้อขายล่าสุดและรายการซื้อขายล่าสุด 100 รายการใน round-trip เดียว
+                            # (ทุกคีย์มี hash tag เดียวกัน จึงอยู่ใน slot/shard เดียวกัน)
+                            pipeline = symbol_client.pipeline(transaction=False)
+                            pipeline.set(redis_key, message, ex=60)  # หมดอายุใน 60 วินาที
+                            pipeline.lpush(trade_list_key, message)
+                            pipeline.ltrim(trade_list_key, 0, 99)  # เก็บเฉพาะ 100 รายการล่าสุด
+                            await pipeline.execute()
                             
                             # เผยแพร่ข้อมูลไปยัง channel
                             redis_channel = f"crypto_signals:trades:{symbol}"
-                            self.redis_client.publish(redis_channel, message)
+                            await self.async_redis.publish(redis_channel, message)
+                            
+                            # บันทึกรายการซื้อขายลง InfluxDB
+                            self.influxdb.store_trade(data)
                             
                         except asyncio.TimeoutError:
                             # ส่ง ping เพื่อตรวจสอบการเชื่อมต่อ
@@ -569,6 +613,9 @@ async def main():
         print(f"เกิดข้อผิดพลาดหลัก: {e}")
     finally:
         await client.close()
+        await close_async_redis()
+        # flush batch ที่ค้างอยู่ของ InfluxDB ก่อนจบโปรแกรม
+        get_influxdb_storage().close()
 
 if __name__ == "__main__":
     # รันโปรแกรมหลัก
@@ -6,11 +6,35 @@ import pickle
 import zlib
 from functools import wraps
 import os
+import time
+import threading
 from dotenv import load_dotenv
-from .redis_manager import get_redis_client
+from .redis_manager import get_redis_client, get_node_clients, get_redis_mode
 
 load_dotenv()
 
+# แพทเทิร์นของแคชที่ไม่จำเป็น สามารถล้างได้ทันทีเมื่อหน่วยความจำวิกฤต
+NON_ESSENTIAL_CACHE_PATTERNS = ("market:indicator:*", "market:prediction:*")
+
+# สคริปต์ Lua สำหรับ SCAN + UNLINK หนึ่งรอบฝั่งเซิร์ฟเวอร์ (ใช้ได้กับ Redis แบบ standalone เท่านั้น)
+# ARGV: cursor, pattern, count, measure_memory ("1"/"0")
+# คืนค่า: {cursor ถัดไป, จำนวนคีย์ที่ SCAN พบ, จำนวนคีย์ที่ลบ, จำนวนไบต์ที่คืนได้}
+_SCAN_UNLINK_SCRIPT = """
+local result = redis.call('SCAN', ARGV[1], 'MATCH', ARGV[2], 'COUNT', ARGV[3])
+local keys = result[2]
+local reclaimed = 0
+local deleted = 0
+if ARGV[4] == '1' then
+    for _, key in ipairs(keys) do
+        reclaimed = reclaimed + (redis.call('MEMORY', 'USAGE', key) or 0)
+    end
+end
+if #keys > 0 then
+    deleted = redis.call('UNLINK', unpack(keys))
+end
+return {result[1], #keys, deleted, reclaimed}
+"""
+
 class CacheManager:
     """ตัวจัดการแคชสำหรับ Redis ที่มีประสิทธิภาพ"""
     
@@ -29,11 +53,21 @@ class CacheManager:
             'access_counts': {}  # เก็บสถิติการเข้าถึงแต่ละ key
         }
         
-        # ปรับแต่งการใช้หน่วยความจำเมื่อเริ่มต้น
-        self._configure_memory_policy()
+        # สถานะของตัวกวาดคีย์เบื้องหลัง
+        self.cleanup_stats: Dict[str, Dict[str, Any]] = {}
+        self._cleanup_lock = threading.Lock()
+        self._sweeper_thread: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+        self._scan_unlink_script = None
+        
+        # ตั้งค่านโยบายหน่วยความจำเมื่อเขียนแคชครั้งแรก เพื่อไม่ให้การ import เปิดการเชื่อมต่อ Redis
+        self._memory_policy_configured = False
     
     def _configure_memory_policy(self):
-        """ตั้งค่านโยบายการจัดการหน่วยความจำ Redis"""
+        """ตั้งค่านโยบายการจัดการหน่วยความจำ Redis (ครั้งเดียว)"""
+        if self._memory_policy_configured:
+            return
+        self._memory_policy_configured = True
         try:
             self.redis.config_set('maxmemory-policy', 'volatile-lru')
             self.redis.config_set('maxmemory-samples', 10)
@@ -56,6 +90,7 @@ class CacheManager:
     def set_market_data(self, symbol: str, interval: str, data: Dict[str, Any], ttl: int = None) -> None:
         """บันทึกข้อมูลตลาดพร้อมการบีบอัด"""
         key = f"market:{symbol}:{interval}"
+        self._configure_memory_policy()
         try:
             pickled_data = pickle.dumps(data)
             compressed_data, is_compressed = self._compress_data(pickled_data)
@@ -134,6 +169,7 @@ class CacheManager:
         Args:
             updates: รายการอัพเดทข้อมูลแคช มีรูปแบบ {'symbol', 'interval', 'data', 'ttl', 'priority'}
         """
+        self._configure_memory_policy()
         pipeline = self.redis.pipeline()
         
         for update in updates:
@@ -167,15 +203,201 @@ class CacheManager:
             
         pipeline.execute()
 
-    def cleanup_old_keys(self, pattern: str = "market:*", batch_size: int = 1000) -> None:
-        """ทำความสะอาดคีย์เก่าเพื่อประหยัดหน่วยความจำ"""
-        cursor = 0
-        while True:
-            cursor, keys = self.redis.scan(cursor, pattern, batch_size)
-            if keys:
-                self.redis.delete(*keys)
-            if cursor == 0:
-                break
+    def cleanup_old_keys(
+        self,
+        pattern: str = "market:*",
+        batch_size: int = 500,
+        max_keys_per_second: Optional[int] = 5000,
+        measure_memory: bool = True,
+        use_lua: bool = False,
+        progress_callback=None
+    ) -> Dict[str, Any]:
+        """
+        ทำความสะอาดคีย์เก่าเพื่อประหยัดหน่วยความจำ โดยไม่บล็อก Redis
+        
+        ใช้ SCAN ทีละชุดและ UNLINK (ลบแบบ asynchronous ฝั่งเซิร์ฟเวอร์) พร้อมจำกัดอัตราการลบ
+        
+        Args:
+            pattern: แพทเทิร์นของคีย์ที่ต้องการลบ
+            batch_size: จำนวนคีย์สูงสุดต่อชุด (ค่า COUNT ของ SCAN และขนาดของ UNLINK แต่ละครั้ง)
+            max_keys_per_second: จำกัดจำนวนคีย์ที่ลบต่อวินาที (None = ไม่จำกัด)
+            measure_memory: วัดขนาดหน่วยความจำที่คืนได้ด้วย MEMORY USAGE ก่อนลบ
+            use_lua: ใช้สคริปต์ Lua ทำ SCAN + UNLINK ฝั่งเซิร์ฟเวอร์ (ลด round-trip, ไม่ใช้ในโหมด cluster)
+            progress_callback: ฟังก์ชันที่ถูกเรียกพร้อม dict ความคืบหน้าหลังจบแต่ละชุด
+            
+        Returns:
+            dict ความคืบหน้าสุดท้าย (scanned, deleted, reclaimed_bytes, batches, elapsed)
+        """
+        progress = {
+            'pattern': pattern,
+            'scanned': 0,
+            'deleted': 0,
+            'reclaimed_bytes': 0,
+            'batches': 0,
+            'elapsed': 0.0,
+            'started_at': datetime.now().isoformat(),
+            'done': False
+        }
+        self.cleanup_stats[pattern] = progress
+        started = time.monotonic()
+        
+        # ทำทีละ node (standalone = เครื่องเดียว, cluster = ทุก primary, sharded = ทุก shard)
+        cluster_mode = get_redis_mode() == "cluster"
+        clients = [self.redis] if get_redis_mode() == "standalone" else get_node_clients(decode_responses=False)
+        
+        for client in clients:
+            cursor = 0
+            while True:
+                batch_started = time.monotonic()
+                
+                if use_lua and not cluster_mode:
+                    cursor, scanned, deleted, reclaimed = self._scan_unlink_lua(
+                        client, cursor, pattern, batch_size, measure_memory
+                    )
+                else:
+                    cursor, keys = client.scan(cursor, match=pattern, count=batch_size)
+                    cursor = int(cursor)
+                    scanned = len(keys)
+                    deleted, reclaimed = self._unlink_keys(client, keys, batch_size, measure_memory, cluster_mode)
+                
+                progress['scanned'] += scanned
+                progress['deleted'] += deleted
+                progress['reclaimed_bytes'] += reclaimed
+                progress['batches'] += 1
+                progress['elapsed'] = time.monotonic() - started
+                
+                if progress_callback:
+                    progress_callback(dict(progress))
+                
+                if cursor == 0:
+                    break
+                
+                # จำกัดอัตราการลบเพื่อไม่ให้ Redis ทำงานหนักเกินไป
+                if max_keys_per_second and deleted:
+                    delay = deleted / max_keys_per_second - (time.monotonic() - batch_started)
+                    if delay > 0:
+                        time.sleep(delay)
+        
+        progress['done'] = True
+        progress['elapsed'] = time.monotonic() - started
+        return progress
+
+    def _unlink_keys(self, client: redis.Redis, keys: List[bytes], batch_size: int,
+                     measure_memory: bool, cluster_mode: bool = False) -> tuple[int, int]:
+        """ลบคีย์ด้วย UNLINK ทีละชุด และคืนค่า (จำนวนที่ลบ, ไบต์ที่คืนได้)"""
+        deleted = 0
+        reclaimed = 0
+        
+        for i in range(0, len(keys), batch_size):
+            chunk = keys[i:i + batch_size]
+            
+            if measure_memory:
+                pipeline = client.pipeline(transaction=False)
+                for key in chunk:
+                    pipeline.memory_usage(key)
+                reclaimed += sum(size or 0 for size in pipeline.execute(raise_on_error=False)
+                                 if isinstance(size, int))
+            
+            if cluster_mode:
+                # คีย์ต่าง slot ไม่สามารถ UNLINK รวมในคำสั่งเดียวได้ (CROSSSLOT)
+                pipeline = client.pipeline(transaction=False)
+                for key in chunk:
+                    pipeline.unlink(key)
+                deleted += sum(result for result in pipeline.execute(raise_on_error=False)
+                               if isinstance(result, int))
+                continue
+            
+            try:
+                deleted += client.unlink(*chunk)
+            except redis.ResponseError:
+                # Redis เวอร์ชันเก่า (< 4.0) ไม่มีคำสั่ง UNLINK
+                deleted += client.delete(*chunk)
+                
+        return deleted, reclaimed
+
+    def _scan_unlink_lua(self, client: redis.Redis, cursor: int, pattern: str,
+                         batch_size: int, measure_memory: bool) -> tuple[int, int, int, int]:
+        """เรียกสคริปต์ Lua (EVALSHA) สำหรับ SCAN + UNLINK หนึ่งรอบ คืนค่า (cursor, พบ, ลบ, ไบต์ที่คืนได้)"""
+        if self._scan_unlink_script is None:
+            self._scan_unlink_script = self.redis.register_script(_SCAN_UNLINK_SCRIPT)
+            
+        next_cursor, scanned, deleted, reclaimed = self._scan_unlink_script(
+            args=[cursor, pattern, batch_size, "1" if measure_memory else "0"],
+            client=client
+        )
+        return int(next_cursor), int(scanned), int(deleted), int(reclaimed)
+
+    def schedule_cleanup(self, patterns: List[str], **kwargs) -> Optional[threading.Thread]:
+        """
+        สั่งล้างคีย์ตามแพทเทิร์นในเธรดเบื้องหลังหนึ่งครั้ง โดยไม่รอผลลัพธ์
+        
+        Args:
+            patterns: รายการแพทเทิร์นของคีย์ที่ต้องการลบ
+            **kwargs: พารามิเตอร์ที่ส่งต่อให้ cleanup_old_keys
+            
+        Returns:
+            เธรดที่กำลังทำงาน หรือ None ถ้ามีการล้างค้างอยู่แล้ว
+        """
+        if self._cleanup_lock.locked():
+            return None
+            
+        thread = threading.Thread(
+            target=self._run_cleanup,
+            args=(list(patterns),),
+            kwargs=kwargs,
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _run_cleanup(self, patterns: List[str], **kwargs) -> None:
+        """ทำงานล้างคีย์ทุกแพทเทิร์น โดยไม่ให้มีการล้างซ้อนกัน"""
+        if not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            for pattern in patterns:
+                try:
+                    result = self.cleanup_old_keys(pattern, **kwargs)
+                    print(f"🧹 ล้างคีย์ {pattern} แล้ว {result['deleted']} คีย์ "
+                          f"คืนหน่วยความจำ {result['reclaimed_bytes'] / 1024:.1f}KB "
+                          f"ใน {result['elapsed']:.2f} วินาที")
+                except Exception as e:
+                    print(f"⚠️ ข้อผิดพลาดในการล้างคีย์ {pattern}: {e}")
+        finally:
+            self._cleanup_lock.release()
+
+    def start_background_cleanup(self, patterns: List[str], interval: int = 300, **kwargs) -> None:
+        """
+        เริ่มตัวกวาดคีย์เบื้องหลังที่ทำงานเป็นรอบ ๆ
+        
+        Args:
+            patterns: รายการแพทเทิร์นของคีย์ที่ต้องการลบ
+            interval: ระยะเวลาระหว่างรอบ (วินาที)
+            **kwargs: พารามิเตอร์ที่ส่งต่อให้ cleanup_old_keys
+        """
+        if self._sweeper_thread and self._sweeper_thread.is_alive():
+            return
+            
+        self._sweeper_stop.clear()
+        
+        def sweep_loop():
+            while not self._sweeper_stop.is_set():
+                self._run_cleanup(list(patterns), **kwargs)
+                self._sweeper_stop.wait(interval)
+        
+        self._sweeper_thread = threading.Thread(target=sweep_loop, daemon=True)
+        self._sweeper_thread.start()
+
+    def stop_background_cleanup(self, timeout: float = 5.0) -> None:
+        """หยุดตัวกวาดคีย์เบื้องหลัง"""
+        self._sweeper_stop.set()
+        if self._sweeper_thread:
+            self._sweeper_thread.join(timeout)
+            self._sweeper_thread = None
+
+    def get_cleanup_progress(self) -> Dict[str, Dict[str, Any]]:
+        """ดึงความคืบหน้าของการล้างคีย์ล่าสุดแยกตามแพทเทิร์น"""
+        return {pattern: dict(progress) for pattern, progress in self.cleanup_stats.items()}
 
     def get_cache_stats(self) -> Dict[str, int]:
         """ดึงสถิติการใช้งานแคช"""
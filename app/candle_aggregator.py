@@ -0,0 +1,157 @@
+"""
+candle_aggregator.py - รวมแท่งเทียน 1 นาทีเป็น timeframe ที่ใหญ่ขึ้นแบบ incremental
+
+เมื่อแท่ง 1m ปิด จะอัปเดตแท่ง 2m/5m/15m/1h/4h/1d ที่กำลังก่อตัว และคืนแท่งที่ปิดแล้ว
+แต่ละ timeframe ถูกบันทึกลง measurement ของตัวเอง (kline_2m, kline_5m, ...) ใน InfluxDB
+และเผยแพร่ไปยังช่อง crypto_signals:kline:{symbol}:{timeframe}
+"""
+import json
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+REDIS_KLINE_CHANNEL_PREFIX = "crypto_signals:kline:"
+BASE_INTERVAL_MS = 60_000
+
+# ความยาวของแต่ละ timeframe (ms) แท่งจัดตำแหน่งตาม epoch UTC เช่นเดียวกับ Binance
+TIMEFRAME_MS: Dict[str, int] = {
+    "1m": 60_000,
+    "2m": 120_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "1h": 3_600_000,
+    "4h": 14_400_000,
+    "1d": 86_400_000,
+}
+DEFAULT_TIMEFRAMES = ("2m", "5m", "15m", "1h", "4h", "1d")
+
+
+def kline_measurement(timeframe: str) -> str:
+    """ชื่อ measurement ของ timeframe (1m ใช้ kline_data เดิม)"""
+    return "kline_data" if timeframe == "1m" else f"kline_{timeframe}"
+
+
+@dataclass
+class Candle:
+    """แท่งเทียนของ timeframe ใด ๆ"""
+    symbol: str
+    timeframe: str
+    timestamp: int      # เวลาเปิดแท่ง (ms)
+    close_time: int     # เวลาปิดแท่ง (ms)
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    count: int = 1      # จำนวนแท่ง 1m ที่รวมเข้ามา
+    partial: bool = False  # ได้รับแท่ง 1m ไม่ครบ (count น้อยกว่าจำนวนนาทีของ timeframe) ผู้ใช้ควรกรองออก
+    # เริ่มรวมกลางแท่ง (เช่นหลังรีสตาร์ท) จึงไม่รู้ราคาเปิดจริง แท่งแบบนี้ไม่ถูกส่งออกจาก add_kline
+    opened_late: bool = field(default=False, repr=False, compare=False)
+    # trace ความหน่วงของแท่ง 1m ที่ปิดแท่งนี้ (ดู latency_trace) ส่งไปกับข้อความ Pub/Sub เท่านั้น
+    trace: Optional[Dict[str, float]] = field(default=None, repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """แปลงเป็น dict รูปแบบเดียวกับ kline ที่ signal processor ใช้"""
+        data = asdict(self)
+        del data["opened_late"]
+        del data["trace"]
+        data["is_closed"] = True
+        return data
+
+
+class CandleAggregator:
+    """รวมแท่ง 1m ที่ปิดแล้วเป็นแท่ง timeframe ที่ใหญ่ขึ้นโดยเก็บเฉพาะแท่งที่กำลังก่อตัวในหน่วยความจำ"""
+
+    def __init__(self, timeframes: Iterable[str] = DEFAULT_TIMEFRAMES):
+        """
+        Args:
+            timeframes: timeframe ที่ต้องการ (ต้องเป็นคีย์ใน TIMEFRAME_MS และหารด้วย 1 นาทีลงตัว)
+        """
+        self.timeframes = [(tf, TIMEFRAME_MS[tf]) for tf in timeframes]
+        self._building: Dict[Tuple[str, str], Candle] = {}
+
+    def add_kline(self, symbol: str, kline: Dict[str, Any]) -> List[Candle]:
+        """
+        เพิ่มแท่ง 1m ที่ปิดแล้ว
+
+        Args:
+            symbol: สัญลักษณ์คู่เหรียญ
+            kline: แท่ง 1m ที่มี timestamp (เวลาเปิด ms) และ open/high/low/close/volume
+
+        Returns:
+            แท่งของ timeframe ที่ใหญ่ขึ้นที่ปิดแล้วจากแท่งนี้ แท่งที่ข้อมูลขาดกลางแท่งมี partial=True
+            (ไม่รวมแท่งที่เริ่มรวมกลางแท่ง เพราะไม่รู้ราคาเปิดจริง)
+        """
+        timestamp = int(kline["timestamp"])
+        open_, high, low = float(kline["open"]), float(kline["high"]), float(kline["low"])
+        close, volume = float(kline["close"]), float(kline["volume"])
+
+        closed = []
+        for timeframe, interval_ms in self.timeframes:
+            key = (symbol, timeframe)
+            bucket_start = timestamp - timestamp % interval_ms
+            candle = self._building.get(key)
+
+            # แท่งก่อนหน้าไม่ได้รับนาทีสุดท้าย (ข้อมูลขาด) ให้ปิดเมื่อเริ่มแท่งใหม่
+            if candle is not None and candle.timestamp != bucket_start:
+                if timestamp > candle.timestamp:
+                    closed.append(candle)
+                    candle = None
+                else:
+                    # แท่ง 1m ที่มาช้ากว่าแท่งที่กำลังก่อตัว ข้ามไป
+                    continue
+
+            if candle is None:
+                candle = Candle(
+                    symbol=symbol,
+                    timeframe=timeframe,
+                    timestamp=bucket_start,
+                    close_time=bucket_start + interval_ms - 1,
+                    open=open_, high=high, low=low, close=close, volume=volume,
+                    opened_late=timestamp != bucket_start
+                )
+                self._building[key] = candle
+            else:
+                candle.high = max(candle.high, high)
+                candle.low = min(candle.low, low)
+                candle.close = close
+                candle.volume += volume
+                candle.count += 1
+
+            # นาทีสุดท้ายของแท่ง: ปิดแท่งทันที
+            if timestamp + BASE_INTERVAL_MS >= bucket_start + interval_ms:
+                closed.append(candle)
+                del self._building[key]
+
+        for candle in closed:
+            candle.partial = candle.count < TIMEFRAME_MS[candle.timeframe] // BASE_INTERVAL_MS
+        return [candle for candle in closed if not candle.opened_late]
+
+    def get_building(self, symbol: str, timeframe: str) -> Optional[Candle]:
+        """แท่งที่กำลังก่อตัวของสัญลักษณ์และ timeframe ที่ระบุ"""
+        return self._building.get((symbol, timeframe))
+
+
+def persist_and_publish(candles: List[Candle], storage=None, redis_client=None) -> None:
+    """
+    บันทึกแท่งที่ปิดแล้วลง measurement ของแต่ละ timeframe และเผยแพร่ผ่าน Redis Pub/Sub
+    แท่งที่ partial=True ถูกบันทึกและเผยแพร่พร้อม flag เพื่อให้ผู้ใช้แต่ละรายเลือกกรองเอง
+
+    Args:
+        candles: แท่งที่ปิดแล้ว
+        storage: InfluxDBStorage (None = ไม่บันทึก)
+        redis_client: Redis client สำหรับ publish (None = ไม่เผยแพร่)
+    """
+    grouped: Dict[Tuple[str, str], List[Candle]] = {}
+    for candle in candles:
+        grouped.setdefault((candle.symbol, candle.timeframe), []).append(candle)
+
+    for (symbol, timeframe), group in grouped.items():
+        bars = [candle.to_dict() for candle in group]
+        if storage is not None:
+            storage.store_kline_data(symbol, bars, measurement=kline_measurement(timeframe))
+        if redis_client is not None:
+            channel = f"{REDIS_KLINE_CHANNEL_PREFIX}{symbol}:{timeframe}"
+            for candle, bar in zip(group, bars):
+                if candle.trace:
+                    bar = dict(bar, trace=candle.trace)
+                redis_client.publish(channel, json.dumps(bar))
@@ -0,0 +1,170 @@
+"""
+candle_coverage.py - ดัชนีช่วงเวลาของแท่ง 1m ที่มีอยู่ใน InfluxDB ต่อสัญลักษณ์
+
+เก็บเป็นรายการช่วง [start, end) ที่ไม่ซ้อนทับและเรียงตามเวลา (ms) แล้วค้นหาด้วย bisect
+การหาช่วงที่ขาดจึงใช้เวลา O(log n + จำนวนช่วงที่ขาด) ไม่ต้องสแกนข้อมูลทั้งช่วง
+ดัชนีถูกอัปเดตเมื่อ InfluxDB ยืนยันการเขียน kline_data แล้ว และบันทึกเป็นไฟล์ JSON เป็นระยะและเมื่อปิด storage
+"""
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MINUTE_MS = 60_000
+
+
+class IntervalSet:
+    """ชุดช่วงเวลา [start, end) ที่ไม่ซ้อนทับกัน (ช่วงที่ติดกันจะถูกรวมเป็นช่วงเดียว)"""
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for start, end in intervals:
+            self.add(start, end)
+
+    def add(self, start: int, end: int) -> None:
+        """เพิ่มช่วง [start, end) และรวมกับช่วงที่ซ้อนทับหรือติดกัน"""
+        if end <= start:
+            return
+        i = bisect_left(self.ends, start)
+        j = bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def gaps(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """ช่วงภายใน [start, end) ที่ไม่อยู่ในชุดนี้"""
+        gaps = []
+        cursor = start
+        i = bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.starts[i] > cursor:
+                gaps.append((cursor, self.starts[i]))
+            cursor = max(cursor, self.ends[i])
+            i += 1
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def covers(self, start: int, end: int) -> bool:
+        """ช่วง [start, end) อยู่ในชุดนี้ทั้งหมดหรือไม่"""
+        i = bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        return list(zip(self.starts, self.ends))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+class CoverageIndex:
+    """ดัชนีช่วงเวลาของแท่ง 1m ที่บันทึกแล้วของทุกสัญลักษณ์"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: ไฟล์ JSON สำหรับบันทึกดัชนี (None = เก็บในหน่วยความจำอย่างเดียว)
+        """
+        self.path = path
+        self._sets: Dict[str, IntervalSet] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path:
+            for symbol, intervals in self._read_file().items():
+                self._sets[symbol] = IntervalSet(intervals)
+
+    def _read_file(self) -> Dict[str, List[List[int]]]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ ไม่สามารถอ่านดัชนีช่วงข้อมูล {self.path}: {e}")
+            return {}
+
+    def record(self, symbol: str, timestamps: Iterable[int]) -> None:
+        """
+        บันทึกว่ามีแท่ง 1m ของเวลาเปิดที่ระบุแล้ว
+
+        Args:
+            symbol: สัญลักษณ์คู่เหรียญ
+            timestamps: เวลาเปิดของแท่ง (ms)
+        """
+        ordered = sorted(set(int(ts) for ts in timestamps))
+        if not ordered:
+            return
+
+        # รวมแท่งที่ต่อเนื่องกันเป็นช่วงเดียวก่อนเพิ่มลงดัชนี
+        runs = []
+        run_start = previous = ordered[0]
+        for timestamp in ordered[1:]:
+            if timestamp != previous + MINUTE_MS:
+                runs.append((run_start, previous + MINUTE_MS))
+                run_start = timestamp
+            previous = timestamp
+        runs.append((run_start, previous + MINUTE_MS))
+
+        with self._lock:
+            interval_set = self._sets.setdefault(symbol, IntervalSet())
+            for start, end in runs:
+                interval_set.add(start, end)
+            self._dirty = True
+
+    def gaps(self, symbol: str, start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """ช่วงเวลาที่ไม่มีแท่ง 1m ภายใน [start_ms, end_ms) (ปัดลงเป็นนาที)"""
+        start_ms -= start_ms % MINUTE_MS
+        end_ms -= end_ms % MINUTE_MS
+        with self._lock:
+            interval_set = self._sets.get(symbol)
+            if interval_set is None:
+                return [(start_ms, end_ms)] if start_ms < end_ms else []
+            return interval_set.gaps(start_ms, end_ms)
+
+    def is_complete(self, symbol: str, start_ms: int, end_ms: int) -> bool:
+        """มีแท่ง 1m ครบทุกนาทีใน [start_ms, end_ms) หรือไม่"""
+        with self._lock:
+            interval_set = self._sets.get(symbol)
+            return interval_set is not None and interval_set.covers(start_ms, end_ms)
+
+    def save(self) -> None:
+        """
+        บันทึกดัชนีลงไฟล์ โดยรวมกับข้อมูลที่มีในไฟล์อยู่แล้ว
+        (process อื่น เช่น backfill อาจบันทึกช่วงของตัวเองไว้)
+        """
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            for symbol, intervals in self._read_file().items():
+                interval_set = self._sets.setdefault(symbol, IntervalSet())
+                for start, end in intervals:
+                    interval_set.add(start, end)
+            data = {symbol: interval_set.intervals() for symbol, interval_set in self._sets.items()}
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+# ดัชนีที่ใช้ร่วมกันทั้ง process
+_coverage_index: Optional[CoverageIndex] = None
+_coverage_lock = threading.Lock()
+
+
+def get_coverage_index(path: Optional[str] = None) -> CoverageIndex:
+    """ดึงดัชนีช่วงข้อมูลที่ใช้ร่วมกันทั้ง process (สร้างเมื่อเรียกใช้ครั้งแรก)"""
+    global _coverage_index
+    if _coverage_index is None:
+        with _coverage_lock:
+            if _coverage_index is None:
+                _coverage_index = CoverageIndex(path)
+    return _coverage_index
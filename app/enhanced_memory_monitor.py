@@ -11,6 +11,7 @@ import weakref
 
 from .redis_manager import get_redis_client
 from .logger import LoggerFactory, MetricsLogger
+from .cache_manager import cache_manager, NON_ESSENTIAL_CACHE_PATTERNS
 
 @dataclass
 class MemoryThresholds:
@@ -278,14 +279,11 @@ class EnhancedMemoryMonitor:
         gc.collect()
         gc.collect()  # รอบที่สอง
         
-        # ล้างแคชต่าง ๆ
-        if self.redis:
-            try:
-                # ล้างแคชที่ไม่สำคัญ
-                self.redis.delete('market_data:cache:*')
-                self.redis.delete('technical_indicators:cache:*')
-            except Exception as e:
-                self.logger.error(f"ไม่สามารถล้างแคช Redis ได้: {e}")
+        # ล้างแคชที่ไม่สำคัญในเธรดเบื้องหลัง (SCAN + UNLINK พร้อมจำกัดอัตรา)
+        try:
+            cache_manager.schedule_cleanup(NON_ESSENTIAL_CACHE_PATTERNS)
+        except Exception as e:
+            self.logger.error(f"ไม่สามารถสั่งล้างแคช Redis ได้: {e}")
         
         # บันทึกการดำเนินการ
         self.metrics.record_metric('memory_action', {
@@ -9,17 +9,19 @@ from typing import Dict, List, Optional, Union, Callable, Any
 import redis
 from dotenv import load_dotenv
 
+from . import env_manager as env
 from .logger import LoggerFactory, log_execution_time, error_logger, MetricsLogger
+from .metrics import registry
+from . import latency_trace
 from .optimized_signal_processor import signal_processor
-from .influxdb_storage import InfluxDBStorage
+from .influxdb_storage import get_influxdb_storage
+from .redis_manager import get_redis_client, get_async_redis_client, close_async_redis
+from .candle_aggregator import CandleAggregator, persist_and_publish
 
 # Load environment variables
 load_dotenv()
 
 # Redis connection settings
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 REDIS_CHANNEL_PREFIX = "crypto_signals:kline:"
 
 # Default symbols to monitor - โหลดจากตัวแปรสภาพแวดล้อม
@@ -30,6 +32,16 @@ BINANCE_WS_API_ENDPOINT = "wss://ws-api.binance.com:443/ws-api/v3"
 BINANCE_WS_STREAM_ENDPOINT = "wss://stream.binance.com:9443/ws"
 BINANCE_WS_TESTNET_ENDPOINT = "wss://ws-api.testnet.binance.vision/ws-api/v3"
 
+# เมตริกของ hot path ใช้ชื่อเดียวกับ BinanceWebSocketClient (สะสมในหน่วยความจำ ดูได้ที่ /metrics)
+WS_MESSAGES = registry.counter("binance_ws_messages_total", "WebSocket messages received from Binance")
+WS_DECODE_SECONDS = registry.histogram("binance_ws_message_decode_seconds", "Time to decode and buffer one message")
+WS_BUFFER_SIZE = registry.gauge("binance_ws_buffer_size", "Messages waiting in the flush buffer")
+WS_FLUSH_SECONDS = registry.histogram("binance_ws_flush_seconds", "Time to process one buffer flush")
+WS_KLINES = registry.counter("binance_ws_klines_total", "Kline updates processed in buffer flushes")
+WS_FLUSH_ERRORS = registry.counter("binance_ws_flush_errors_total", "Messages that failed to parse during a flush")
+WS_RECONNECTS = registry.counter("binance_ws_reconnects_total", "WebSocket reconnection attempts")
+WS_HEALTHY = registry.gauge("binance_ws_healthy", "1 when the last WebSocket health check passed")
+
 class EnhancedWebSocketClient:
     """Enhanced WebSocket Client with comprehensive error handling and logging"""
     
@@ -45,16 +57,10 @@ class EnhancedWebSocketClient:
         
         # Initialize Redis connection
         try:
-            self.redis_client = redis.Redis(
-                host=REDIS_HOST,
-                port=REDIS_PORT,
-                password=REDIS_PASSWORD,
-                decode_responses=True,
-                socket_timeout=5,
-                socket_connect_timeout=5,
-                socket_keepalive=True,
-                health_check_interval=30
-            )
+            # Use the shared connection pool from redis_manager
+            self.redis_client = get_redis_client(decode_responses=True)
+            # client แบบ redis.asyncio สำหรับเขียน stream ทุกรอบ flush (ไม่บล็อก event loop)
+            self.async_redis = get_async_redis_client(decode_responses=True)
             self.logger.info("Redis connection established")
         except redis.RedisError as e:
             self.logger.error(f"Redis connection failed: {e}")
@@ -63,12 +69,14 @@ class EnhancedWebSocketClient:
             
         # Initialize InfluxDB connection
         try:
-            self.influxdb = InfluxDBStorage()
-            self.logger.info("InfluxDB connection established")
+            self.influxdb = get_influxdb_storage()
         except Exception as e:
             self.logger.error(f"InfluxDB connection failed: {e}")
             error_logger.log_error(e, {'component': 'binance_ws', 'connection': 'influxdb'})
         
+        # Higher-timeframe candles (1m is already stored by _flush_buffer)
+        self.candle_aggregator = CandleAggregator()
+        
         # Reconnection settings
         self.reconnect_delay = 1.0
         self.max_reconnect_delay = 60.0
@@ -166,30 +174,24 @@ class EnhancedWebSocketClient:
                 self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
                 self.reconnect_count += 1
                 
-                self.metrics.record_metric('reconnection_attempt', {
-                    'attempt_number': self.reconnect_count,
-                    'delay': self.reconnect_delay,
-                    'connection_id': self.connection_id,
-                    'timestamp': datetime.now().isoformat()
-                })
+                WS_RECONNECTS.inc()
     
     @log_execution_time()
     async def _handle_message(self, message: str):
         """Handle incoming messages with comprehensive error tracking"""
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             data = json.loads(message)
+            trace = latency_trace.start(data.get("data") if isinstance(data, dict) else None)
+            if trace:
+                data["_trace"] = trace
             self.message_buffer.append(data)
             
             # Record message processing metrics
-            processing_time = time.time() - start_time
-            self.metrics.record_metric('message_processing', {
-                'processing_time': processing_time,
-                'buffer_size': len(self.message_buffer),
-                'connection_id': self.connection_id,
-                'timestamp': datetime.now().isoformat()
-            })
+            WS_MESSAGES.inc()
+            WS_DECODE_SECONDS.observe(time.perf_counter() - start_time)
+            WS_BUFFER_SIZE.set(len(self.message_buffer))
             
             # Check if buffer should be flushed
             current_time = time.time()
@@ -224,13 +226,17 @@ class EnhancedWebSocketClient:
             return
             
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Process messages in batch
             kline_data = []
+            traces = []
             processing_errors = []
+            flush_time = time.time()
             
             for msg in self.message_buffer:
+                trace = msg.pop("_trace", None)
+                latency_trace.mark(trace, "flush", flush_time)
                 try:
                     if "data" in msg and "k" in msg["data"]:
                         kline = msg["data"]["k"]
@@ -241,8 +247,10 @@ class EnhancedWebSocketClient:
                             "high": float(kline["h"]),
                             "low": float(kline["l"]),
                             "close": float(kline["c"]),
-                            "volume": float(kline["v"])
+                            "volume": float(kline["v"]),
+                            "is_closed": kline["x"]
                         })
+                        traces.append(trace)
                 except (KeyError, ValueError) as e:
                     processing_errors.append({
                         "error": str(e),
@@ -252,13 +260,11 @@ class EnhancedWebSocketClient:
             # Store in Redis
             if kline_data:
                 try:
-                    pipeline = self.redis_client.pipeline()
-                    pipeline.xadd(
+                    await self.async_redis.xadd(
                         "market_data",
                         {"data": json.dumps(kline_data)},
                         maxlen=10000
                     )
-                    pipeline.execute()
                 except redis.RedisError as e:
                     self.logger.error(f"Redis storage error: {e}")
                     error_logger.log_error(e, {
@@ -270,8 +276,12 @@ class EnhancedWebSocketClient:
             # Store in InfluxDB
             if kline_data and hasattr(self, 'influxdb'):
                 try:
+                    # รวมแท่งเทียนตามสัญลักษณ์เพื่อเขียนครั้งเดียวต่อสัญลักษณ์
+                    klines_by_symbol: Dict[str, List[Dict[str, Any]]] = {}
                     for data in kline_data:
-                        self.influxdb.store_kline_data(data["symbol"], [data])
+                        klines_by_symbol.setdefault(data["symbol"], []).append(data)
+                    for symbol, points in klines_by_symbol.items():
+                        self.influxdb.store_kline_data(symbol, points)
                 except Exception as e:
                     self.logger.error(f"InfluxDB storage error: {e}")
                     error_logger.log_error(e, {
@@ -280,6 +290,24 @@ class EnhancedWebSocketClient:
                         'connection_id': self.connection_id
                     })
             
+            # Roll closed 1m klines into higher timeframes, persist and publish each closed bar
+            closed_candles = []
+            for data, trace in zip(kline_data, traces):
+                if data["is_closed"]:
+                    for candle in self.candle_aggregator.add_kline(data["symbol"], data):
+                        candle.trace = trace
+                        closed_candles.append(candle)
+            if closed_candles:
+                try:
+                    persist_and_publish(closed_candles, getattr(self, 'influxdb', None), self.redis_client)
+                except Exception as e:
+                    self.logger.error(f"Candle aggregation error: {e}")
+                    error_logger.log_error(e, {
+                        'component': 'binance_ws',
+                        'event': 'candle_aggregation_error',
+                        'connection_id': self.connection_id
+                    })
+            
             # Call callback if exists
             if self.callback and kline_data:
                 try:
@@ -293,15 +321,9 @@ class EnhancedWebSocketClient:
                     })
             
             # Record metrics
-            processing_time = time.time() - start_time
-            self.metrics.record_metric('buffer_flush', {
-                'processing_time': processing_time,
-                'messages_processed': len(self.message_buffer),
-                'klines_processed': len(kline_data),
-                'errors': len(processing_errors),
-                'connection_id': self.connection_id,
-                'timestamp': datetime.now().isoformat()
-            })
+            WS_FLUSH_SECONDS.observe(time.perf_counter() - start_time)
+            WS_KLINES.inc(len(kline_data))
+            WS_FLUSH_ERRORS.inc(len(processing_errors))
             
             # Log processing errors if any
             if processing_errors:
@@ -318,6 +340,7 @@ class EnhancedWebSocketClient:
         finally:
             self.message_buffer.clear()
             self.last_flush_time = time.time()
+            WS_BUFFER_SIZE.set(0)
     
     @log_execution_time()
     async def _health_check(self):
@@ -326,18 +349,10 @@ class EnhancedWebSocketClient:
             try:
                 if self.websocket and self.websocket.open:
                     await self.websocket.ping()
-                    self.metrics.record_metric('health_check', {
-                        'status': 'healthy',
-                        'connection_id': self.connection_id,
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    WS_HEALTHY.set(1)
                 else:
                     self.logger.warning("WebSocket connection unhealthy")
-                    self.metrics.record_metric('health_check', {
-                        'status': 'unhealthy',
-                        'connection_id': self.connection_id,
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    WS_HEALTHY.set(0)
                 await asyncio.sleep(30)
             except Exception as e:
                 self.logger.error(f"Health check error: {e}")
@@ -367,13 +382,7 @@ class EnhancedWebSocketClient:
             if hasattr(self, 'processor'):
                 self.processor.cleanup()
             
-            # Close Redis connection
-            if hasattr(self, 'redis_client'):
-                await self.redis_client.close()
-            
-            # Close InfluxDB connection
-            if hasattr(self, 'influxdb'):
-                self.influxdb.close()
+            # Redis pools และ InfluxDBStorage ใช้ร่วมกันทั้งแอป จึงไม่ปิดที่นี่ (ปิดใน main ของสคริปต์)
             
             self.logger.info("All connections closed successfully")
             
@@ -404,6 +413,9 @@ async def main():
     finally:
         if client:
             await client.close()
+        await close_async_redis()
+        # flush batch ที่ค้างอยู่ของ InfluxDB ก่อนจบโปรแกรม
+        get_influxdb_storage().close()
 
 if __name__ == "__main__":
     # Set up asyncio error handling
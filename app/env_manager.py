@@ -204,6 +204,14 @@ def get_redis_config() -> Dict[str, Any]:
         "host": getenv("REDIS_HOST", "localhost"),
         "port": getenv("REDIS_PORT", 6379, int),
         "password": getenv("REDIS_PASSWORD", None),
+        "max_connections": getenv("REDIS_MAX_CONNECTIONS", 20, int),
+        "pool_timeout": getenv("REDIS_POOL_TIMEOUT", 5.0, float),
+        "protocol": getenv("REDIS_PROTOCOL", 2, int),
+        "parser": getenv("REDIS_PARSER", "auto").lower(),
+        "mode": getenv("REDIS_MODE", "standalone").lower(),
+        "cluster_nodes": getenv("REDIS_CLUSTER_NODES", ""),
+        "shards": getenv("REDIS_SHARDS", ""),
+        "shard_vnodes": getenv("REDIS_SHARD_VNODES", 160, int),
     }
 
 # ฟังก์ชันสำหรับการตั้งค่า InfluxDB
@@ -214,6 +222,19 @@ def get_influxdb_config() -> Dict[str, Any]:
         "token": getenv("INFLUXDB_TOKEN", ""),
         "org": getenv("INFLUXDB_ORG", ""),
         "bucket": getenv("INFLUXDB_BUCKET", "crypto_signals"),
+        "spool_dir": getenv("INFLUXDB_SPOOL_DIR", "data/influx_spool"),
+        "spool_max_mb": getenv("INFLUXDB_SPOOL_MAX_MB", 512, int),
+        "spool_segment_mb": getenv("INFLUXDB_SPOOL_SEGMENT_MB", 16, int),
+        "spool_replay_rate": getenv("INFLUXDB_SPOOL_REPLAY_RATE", 5000, int),
+        "spool_fsync": getenv("INFLUXDB_SPOOL_FSYNC", False, bool),
+        "max_concurrent_queries": getenv("INFLUXDB_MAX_CONCURRENT_QUERIES", 4, int),
+        "query_window_hours": getenv("INFLUXDB_QUERY_WINDOW_HOURS", 24, int),
+        "coverage_path": getenv("INFLUXDB_COVERAGE_PATH", "data/candle_coverage.json"),
+        "coverage_save_seconds": getenv("INFLUXDB_COVERAGE_SAVE_SECONDS", 60, int),
+        "raw_retention_hours": getenv("INFLUXDB_RAW_RETENTION_HOURS", 6, int),
+        "candle_retention_days": getenv("INFLUXDB_CANDLE_RETENTION_DAYS", 180, int),
+        "auto_provision": getenv("INFLUXDB_AUTO_PROVISION", False, bool),
+        "enforce_retention": getenv("INFLUXDB_ENFORCE_RETENTION", False, bool),
     }
 
 # ฟังก์ชันสำหรับการตั้งค่า Binance API
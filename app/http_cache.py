@@ -0,0 +1,43 @@
+"""
+http_cache.py - ตอบ JSON พร้อม ETag และ 304 Not Modified สำหรับ endpoint ที่ dashboard เรียกถี่
+
+ETag คำนวณจาก body ที่ serialize แล้ว (blake2b 128 บิต) และเทียบ If-None-Match
+แบบ weak comparison ตาม RFC 9110 §13.1.2 เพราะ proxy ที่บีบอัดข้อมูลมักแปลง ETag เป็น weak
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    เทียบ If-None-Match กับ ETag แบบ weak comparison (RFC 9110 §13.1.2)
+    "*" ตรงกับทุกค่า และ tag ที่มี W/ (เช่นที่ proxy บีบอัดแล้วแปลงเป็น weak) ถือว่าตรงกัน
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def etag_json_response(body: str, request: Request) -> Response:
+    """
+    ส่ง JSON ที่ serialize แล้วพร้อม ETag และตอบ 304 เมื่อ If-None-Match ตรงกัน
+    เพื่อให้ dashboard ไม่ต้องดาวน์โหลดข้อมูลเดิมซ้ำ
+    """
+    payload = body.encode("utf-8")
+    etag = '"' + hashlib.blake2b(payload, digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=payload, media_type="application/json", headers=headers)
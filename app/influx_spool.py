@@ -0,0 +1,246 @@
+"""
+influx_spool.py - spool ไฟล์แบบ append-only สำหรับข้อมูล InfluxDB ที่เขียนไม่สำเร็จ
+
+ข้อมูลถูกเก็บเป็น segment (spool-<ลำดับ>.seg) แต่ละ record คือความยาว 4 ไบต์ (big-endian)
+ตามด้วย line protocol แบบ UTF-8 เมื่อ InfluxDB กลับมาใช้งานได้ จะส่งซ้ำตามลำดับแบบจำกัดอัตรา
+แล้วลบ segment ที่ส่งครบ ขนาดรวมถูกจำกัดโดยลบ segment เก่าที่สุดทิ้ง
+"""
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+_HEADER = struct.Struct(">I")
+_SEGMENT_PREFIX = "spool-"
+_SEGMENT_SUFFIX = ".seg"
+
+
+class WriteSpool:
+    """spool แบบแบ่ง segment สำหรับเก็บ line protocol ระหว่างที่ InfluxDB ไม่พร้อมใช้งาน"""
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024,
+                 segment_bytes: int = 16 * 1024 * 1024, fsync: bool = False):
+        """
+        Args:
+            directory: โฟลเดอร์ที่เก็บไฟล์ segment
+            max_bytes: ขนาดรวมสูงสุดของทุก segment
+            segment_bytes: ขนาดสูงสุดของแต่ละ segment ก่อนเปิดไฟล์ใหม่
+            fsync: เรียก fsync หลังเขียนทุก record
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_seq = None
+        self._replay_thread: Optional[threading.Thread] = None
+        self._replay_stop = threading.Event()
+        self.stats = {'spooled': 0, 'replayed': 0, 'rejected': 0, 'dropped_segments': 0, 'dropped_bytes': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(self._segment_path(seq)) for seq in self._list_segments())
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}")
+
+    def _list_segments(self) -> List[int]:
+        """ลำดับของ segment ทั้งหมด เรียงจากเก่าไปใหม่"""
+        seqs = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                try:
+                    seqs.append(int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(seqs)
+
+    def _close_active(self):
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+            self._active_seq = None
+
+    def _enforce_limit(self, incoming: int):
+        """ลบ segment เก่าที่สุดจนขนาดรวมไม่เกิน max_bytes (ไม่ลบ segment ที่กำลังเขียน)"""
+        for seq in self._list_segments():
+            if self._total_bytes + incoming <= self.max_bytes or seq == self._active_seq:
+                break
+            path = self._segment_path(seq)
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._total_bytes -= size
+            self.stats['dropped_segments'] += 1
+            self.stats['dropped_bytes'] += size
+            print(f"⚠️ spool เกินขนาดที่กำหนด ลบ segment เก่า {seq} ({size} ไบต์)")
+
+    def append(self, lines: str) -> None:
+        """
+        เพิ่ม line protocol หนึ่งชุดลงท้าย segment ปัจจุบัน
+
+        Args:
+            lines: line protocol (หลายบรรทัดคั่นด้วย newline ได้)
+        """
+        payload = lines.encode("utf-8")
+        record = _HEADER.pack(len(payload)) + payload
+
+        with self._lock:
+            if self._active is not None and self._active.tell() + len(record) > self.segment_bytes:
+                self._close_active()
+
+            if self._total_bytes + len(record) > self.max_bytes:
+                self._enforce_limit(len(record))
+
+            if self._active is None:
+                segments = self._list_segments()
+                self._active_seq = (segments[-1] + 1) if segments else 0
+                self._active = open(self._segment_path(self._active_seq), "ab")
+
+            self._active.write(record)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._total_bytes += len(record)
+            self.stats['spooled'] += 1
+
+    def pending_bytes(self) -> int:
+        """ขนาดรวมของข้อมูลที่ยังค้างอยู่ใน spool"""
+        return self._total_bytes
+
+    @staticmethod
+    def _read_records(path: str) -> List[str]:
+        """อ่าน record ทั้งหมดจาก segment (หยุดที่ record ท้ายไฟล์ที่เขียนไม่ครบ)"""
+        records = []
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                (length,) = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                records.append(payload.decode("utf-8"))
+        return records
+
+    def replay(self, write: Callable[[str], None], lines_per_second: Optional[int] = 5000,
+               stop_event: Optional[threading.Event] = None,
+               is_permanent: Optional[Callable[[Exception], bool]] = None) -> int:
+        """
+        ส่งข้อมูลใน spool ซ้ำตามลำดับ แล้วลบ segment ที่ส่งครบ
+
+        การเขียน point เดิมซ้ำใน InfluxDB จะเขียนทับค่าเดิม (series + เวลาเดียวกัน)
+        จึงส่งซ้ำทั้ง segment ได้อย่างปลอดภัยหากล้มเหลวกลางทาง
+
+        Args:
+            write: ฟังก์ชันเขียนแบบ synchronous (โยน exception เมื่อไม่สำเร็จ)
+            lines_per_second: จำกัดจำนวนบรรทัดต่อวินาที (None = ไม่จำกัด)
+            stop_event: Event สำหรับหยุดกลางทาง
+            is_permanent: ฟังก์ชันตัดสินว่า exception เป็นการปฏิเสธถาวร (เช่น HTTP 400)
+                record นั้นจะถูกข้ามแทนการหยุดทั้ง segment เพื่อไม่ให้ค้างตลอดไป
+
+        Returns:
+            จำนวน record ที่ส่งสำเร็จ
+        """
+        with self._lock:
+            # ปิด segment ปัจจุบันเพื่อให้ส่งซ้ำได้ครบ record ที่เขียนใหม่จะไปอยู่ segment ถัดไป
+            self._close_active()
+            segments = self._list_segments()
+
+        replayed = 0
+        started = time.monotonic()
+        sent_lines = 0
+
+        for seq in segments:
+            path = self._segment_path(seq)
+            for payload in self._read_records(path):
+                if stop_event is not None and stop_event.is_set():
+                    return replayed
+
+                try:
+                    write(payload)
+                except Exception as e:
+                    if is_permanent is None or not is_permanent(e):
+                        raise
+                    self.stats['rejected'] += 1
+                    print(f"⚠️ InfluxDB ปฏิเสธ record ใน spool ถาวร ข้ามไป: {e}")
+                    continue
+                replayed += 1
+                self.stats['replayed'] += 1
+
+                if lines_per_second:
+                    sent_lines += payload.count("\n") + 1
+                    delay = sent_lines / lines_per_second - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+            with self._lock:
+                # segment อาจถูกลบไปแล้วโดย _enforce_limit ระหว่างส่งซ้ำ
+                if os.path.exists(path):
+                    self._total_bytes -= os.path.getsize(path)
+                    os.remove(path)
+
+        return replayed
+
+    def start_replay(self, write: Callable[[str], None], is_available: Callable[[], bool],
+                     lines_per_second: Optional[int] = 5000, interval: float = 10.0,
+                     is_permanent: Optional[Callable[[Exception], bool]] = None):
+        """
+        เริ่มเธรดเบื้องหลังที่ตรวจสอบ InfluxDB เป็นระยะและส่งข้อมูลใน spool ซ้ำเมื่อกลับมาใช้งานได้
+
+        Args:
+            write: ฟังก์ชันเขียนแบบ synchronous
+            is_available: ฟังก์ชันตรวจสอบว่า InfluxDB พร้อมใช้งานหรือไม่ (เช่น ping)
+            lines_per_second: จำกัดอัตราการส่งซ้ำ
+            interval: ระยะเวลา (วินาที) ระหว่างการตรวจสอบแต่ละครั้ง
+            is_permanent: ดู replay()
+        """
+        if self._replay_thread is not None and self._replay_thread.is_alive():
+            return
+
+        self._replay_stop.clear()
+
+        def _loop():
+            while not self._replay_stop.wait(interval):
+                if not self._list_segments():
+                    continue
+                try:
+                    if not is_available():
+                        continue
+                    count = self.replay(write, lines_per_second, self._replay_stop, is_permanent)
+                    if count:
+                        print(f"✅ ส่งข้อมูลจาก spool ซ้ำลง InfluxDB แล้ว {count} ชุด")
+                except Exception as e:
+                    print(f"⚠️ ส่งข้อมูลจาก spool ซ้ำไม่สำเร็จ จะลองใหม่ภายหลัง: {e}")
+
+        self._replay_thread = threading.Thread(target=_loop, name="influx-spool-replay", daemon=True)
+        self._replay_thread.start()
+
+    def stop_replay(self, timeout: float = 5.0):
+        """หยุดเธรดส่งซ้ำ"""
+        self._replay_stop.set()
+        if self._replay_thread is not None:
+            self._replay_thread.join(timeout)
+            self._replay_thread = None
+
+    def close(self):
+        """หยุดเธรดส่งซ้ำและปิดไฟล์ segment ปัจจุบัน"""
+        self.stop_replay()
+        with self._lock:
+            self._close_active()
+
+
+# spool ใช้ร่วมกันทั้ง process ต่อโฟลเดอร์ เพื่อไม่ให้หลาย instance เขียน/ส่งซ้ำไฟล์เดียวกัน
+_spools: Dict[str, WriteSpool] = {}
+_spools_lock = threading.Lock()
+
+
+def get_write_spool(directory: str, **kwargs) -> WriteSpool:
+    """ดึง WriteSpool ของโฟลเดอร์ที่ระบุ (สร้างใหม่ถ้ายังไม่มี)"""
+    key = os.path.abspath(directory)
+    with _spools_lock:
+        if key not in _spools:
+            _spools[key] = WriteSpool(directory, **kwargs)
+        return _spools[key]
@@ -1,9 +1,22 @@
+import asyncio
 import json
+import math
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Union
+from typing import AsyncIterator, Dict, List, Any, Optional, Sequence, Tuple, Union
+import numpy as np
 import pandas as pd
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client import BucketRetentionRules, InfluxDBClient, Point, TaskCreateRequest, WritePrecision
+from influxdb_client.domain.task_update_request import TaskUpdateRequest
+from influxdb_client.client.write_api import SYNCHRONOUS, WriteOptions, WriteType
+from influxdb_client.rest import ApiException
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 import os
 import sys
@@ -12,9 +25,194 @@ import sys
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 import env_manager as env
+from influx_spool import get_write_spool
+from candle_coverage import CoverageIndex, get_coverage_index
+from candle_aggregator import TIMEFRAME_MS, kline_measurement
 
 # ตั้งค่าการเชื่อมต่อ InfluxDB
 influxdb_config = env.get_influxdb_config()
+INFLUXDB_URL = influxdb_config["url"]
+INFLUXDB_TOKEN = influxdb_config["token"]
+INFLUXDB_ORG = influxdb_config["org"]
+INFLUXDB_BUCKET = influxdb_config["bucket"]
+MAX_QUERY_POOL_SIZE = 5
+
+# ตารางแปลงอักขระพิเศษตามข้อกำหนด line protocol
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ "})
+_TAG_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ "})
+_FIELD_STRING_ESCAPES = str.maketrans({'"': '\\"', "\\": "\\\\"})
+_KLINE_FIELDS = ("open", "high", "low", "close", "volume")
+
+# measurement สำหรับข้อมูลแต่ละประเภท (tag คงที่: symbol และ category/side ตามประเภท)
+SIGNAL_MEASUREMENT = "signal"
+TRADE_MEASUREMENT = "trade"
+DEPTH_MEASUREMENT = "depth"
+TICKER_MEASUREMENT = "ticker"
+DEPTH_1M_MEASUREMENT = "depth_1m"
+TRADE_1M_MEASUREMENT = "trade_1m"
+
+
+@dataclass(frozen=True)
+class StorageTier:
+    """ระดับการเก็บข้อมูล: bucket หนึ่งพร้อมระยะเวลาเก็บและ measurement ที่เขียนลง bucket นั้น"""
+    name: str
+    bucket: str
+    retention_seconds: int  # 0 = เก็บตลอดไป
+    measurements: Tuple[str, ...]
+
+
+# ข้อมูลดิบความถี่สูงเก็บไม่กี่ชั่วโมง แท่ง 1m เก็บหลายเดือน ข้อมูลที่สรุปแล้วเก็บตลอดไป
+STORAGE_TIERS = (
+    StorageTier("raw", f"{INFLUXDB_BUCKET}_raw", influxdb_config["raw_retention_hours"] * 3600,
+                (DEPTH_MEASUREMENT, TRADE_MEASUREMENT, TICKER_MEASUREMENT)),
+    StorageTier("candles", INFLUXDB_BUCKET, influxdb_config["candle_retention_days"] * 86400,
+                (kline_measurement("1m"),)),
+    StorageTier("aggregates", f"{INFLUXDB_BUCKET}_agg", 0,
+                tuple(kline_measurement(tf) for tf in TIMEFRAME_MS if tf != "1m")
+                + (SIGNAL_MEASUREMENT, DEPTH_1M_MEASUREMENT, TRADE_1M_MEASUREMENT)),
+)
+_MEASUREMENT_BUCKETS = {measurement: tier.bucket for tier in STORAGE_TIERS for measurement in tier.measurements}
+_RAW_BUCKET = STORAGE_TIERS[0].bucket
+_AGG_BUCKET = STORAGE_TIERS[2].bucket
+
+# task ที่สรุปข้อมูลดิบเป็นแท่ง 1 นาทีลง bucket aggregates ก่อนที่ข้อมูลดิบจะหมดอายุ
+# ประมวลผลเฉพาะนาทีที่ครบแล้วย้อนหลัง 10 นาที การรันซ้อนกันจะเขียนทับค่าเดิม
+_COMPACTION_RANGE = 'range(start: date.truncate(t: -10m, unit: 1m), stop: date.truncate(t: now(), unit: 1m))'
+COMPACTION_TASKS: Dict[str, str] = {
+    "compact_depth_1m": f'''import "date"
+
+option task = {{name: "compact_depth_1m", every: 5m}}
+
+from(bucket: "{_RAW_BUCKET}")
+    |> {_COMPACTION_RANGE}
+    |> filter(fn: (r) => r["_measurement"] == "{DEPTH_MEASUREMENT}")
+    |> filter(fn: (r) => r["_field"] == "spread" or r["_field"] == "bid_depth" or r["_field"] == "ask_depth"
+        or r["_field"] == "best_bid" or r["_field"] == "best_ask")
+    |> aggregateWindow(every: 1m, fn: mean, timeSrc: "_start", createEmpty: false)
+    |> set(key: "_measurement", value: "{DEPTH_1M_MEASUREMENT}")
+    |> to(bucket: "{_AGG_BUCKET}")
+''',
+    "compact_trade_1m": f'''import "date"
+
+option task = {{name: "compact_trade_1m", every: 5m}}
+
+trades = from(bucket: "{_RAW_BUCKET}")
+    |> {_COMPACTION_RANGE}
+    |> filter(fn: (r) => r["_measurement"] == "{TRADE_MEASUREMENT}" and r["_field"] == "quantity")
+
+trades
+    |> aggregateWindow(every: 1m, fn: sum, timeSrc: "_start", createEmpty: false)
+    |> set(key: "_measurement", value: "{TRADE_1M_MEASUREMENT}")
+    |> set(key: "_field", value: "volume")
+    |> to(bucket: "{_AGG_BUCKET}")
+
+trades
+    |> aggregateWindow(every: 1m, fn: count, timeSrc: "_start", createEmpty: false)
+    |> set(key: "_measurement", value: "{TRADE_1M_MEASUREMENT}")
+    |> set(key: "_field", value: "trades")
+    |> to(bucket: "{_AGG_BUCKET}")
+''',
+}
+
+
+def bucket_for(measurement: str) -> str:
+    """bucket ที่เก็บ measurement นี้ตาม STORAGE_TIERS (measurement อื่นอยู่ใน bucket หลัก)"""
+    return _MEASUREMENT_BUCKETS.get(measurement, INFLUXDB_BUCKET)
+
+
+def escape_measurement(name: str) -> str:
+    """escape ชื่อ measurement สำหรับ line protocol"""
+    return name.translate(_MEASUREMENT_ESCAPES)
+
+
+def escape_tag(value: str) -> str:
+    """escape คีย์/ค่า tag สำหรับ line protocol"""
+    return value.translate(_TAG_ESCAPES)
+
+
+def format_field_value(value: Any) -> str:
+    """แปลงค่า field เป็นรูปแบบ line protocol (float, integer ลงท้าย i, boolean, string)"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).translate(_FIELD_STRING_ESCAPES) + '"'
+
+
+def encode_line(measurement: str, tags: Dict[str, str], fields: Dict[str, Any],
+                timestamp_ns: int) -> Optional[str]:
+    """
+    สร้างบรรทัด line protocol หนึ่งบรรทัด (ข้าม field ที่เป็น None, NaN หรือ inf
+    ซึ่ง line protocol ไม่รองรับและทำให้ทั้ง batch ถูกปฏิเสธ)
+    
+    Args:
+        measurement: ชื่อ measurement
+        tags: tag ของข้อมูล (ควรมีค่าจำนวนจำกัด)
+        fields: ค่าที่ต้องการบันทึก
+        timestamp_ns: เวลาในหน่วย nanosecond
+        
+    Returns:
+        บรรทัด line protocol หรือ None ถ้าไม่เหลือ field ให้บันทึก (บรรทัดที่ไม่มี field ก็ผิดรูปแบบเช่นกัน)
+    """
+    field_part = ",".join(
+        f"{escape_tag(key)}={format_field_value(value)}" for key, value in fields.items()
+        if value is not None and not (isinstance(value, float) and not math.isfinite(value))
+    )
+    if not field_part:
+        return None
+    tag_part = "".join(f",{escape_tag(key)}={escape_tag(str(value))}" for key, value in tags.items())
+    return f"{escape_measurement(measurement)}{tag_part} {field_part} {timestamp_ns}"
+
+
+# สถานะ HTTP ที่ InfluxDB ปฏิเสธข้อมูลเอง (line protocol ผิด, ใหญ่เกิน, ชนิด field ไม่ตรง)
+# ส่งซ้ำกี่ครั้งก็ไม่สำเร็จ จึงไม่เก็บลง spool (ส่วน 429, 5xx และ connection error ส่งซ้ำได้)
+_PERMANENT_WRITE_STATUSES = (400, 413, 422)
+
+
+def is_permanent_write_error(exception: BaseException) -> bool:
+    """การเขียนล้มเหลวเพราะข้อมูลถูกปฏิเสธถาวร (ไม่ควร spool หรือส่งซ้ำ)"""
+    return isinstance(exception, ApiException) and exception.status in _PERMANENT_WRITE_STATUSES
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """แปลงเป็น float (None ถ้าไม่มีค่า) เพื่อให้ชนิดของ field คงที่ทุก point"""
+    return None if value is None else float(value)
+
+
+def _to_ns(timestamp_ms: Any) -> int:
+    """แปลง timestamp หน่วย millisecond เป็น nanosecond (ใช้เวลาปัจจุบันถ้าไม่มีค่า)"""
+    return int(timestamp_ms) * 1_000_000 if timestamp_ms else time.time_ns()
+
+
+def encode_kline_lines(symbol: str, data_points: List[Dict[str, Any]],
+                       measurement: str = "kline_data") -> List[str]:
+    """
+    แปลงข้อมูล kline เป็น line protocol โดยตรง (ไม่สร้าง Point หรือ datetime)
+    ค่า NaN หรือ inf ถูกข้ามทีละ field และแท่งที่ไม่เหลือ field เลยถูกข้ามทั้งแถว
+    แท่งรวมจาก CandleAggregator (มีคีย์ partial) บันทึก field partial เสมอ เพื่อให้แท่งที่ซ่อมแล้วเขียนทับค่าเดิมได้
+    
+    ตัวอย่าง: kline_data,symbol=BTCUSDT open=54000.0,high=...,volume=15.5 1619712000000000000
+    
+    Args:
+        symbol: สัญลักษณ์คู่เหรียญ
+        data_points: รายการข้อมูล kline ที่มี timestamp (ms) และ open/high/low/close/volume
+        measurement: ชื่อ measurement
+        
+    Returns:
+        รายการบรรทัด line protocol ที่ใช้ timestamp เป็น nanosecond
+    """
+    prefix = f"{escape_measurement(measurement)},symbol={escape_tag(symbol)} "
+    lines = []
+    for data in data_points:
+        values = [(field, float(data[field])) for field in _KLINE_FIELDS]
+        field_part = ",".join(f"{field}={value!r}" for field, value in values if math.isfinite(value))
+        if field_part:
+            if "partial" in data:
+                field_part += ",partial=true" if data["partial"] else ",partial=false"
+            lines.append(f"{prefix}{field_part} {int(data['timestamp']) * 1_000_000}")
+    return lines
 
 
 class InfluxDBStorage:
@@ -22,94 +220,374 @@ class InfluxDBStorage:
 
     def __init__(self, batch_size: int = 5000, flush_interval: int = 10000):
         """
-        เริ่มต้นการเชื่อมต่อกับ InfluxDB พร้อมการตั้งค่า batch
+        เตรียมการตั้งค่า batch โดยยังไม่สร้าง client ใด ๆ
+        client สำหรับเขียนจะถูกสร้างเมื่อใช้งานครั้งแรก และ client สำหรับ query จะถูกสร้างตามต้องการ
         
         Args:
             batch_size: จำนวนข้อมูลสูงสุดต่อ batch
             flush_interval: ระยะเวลา (ms) ในการ flush batch อัตโนมัติ
         """
-        try:            from influxdb_client.client.write_api import ASYNCHRONOUS
-            
-            self.client = InfluxDBClient(
-                url=influxdb_config["url"],
-                token=influxdb_config["token"],
-                org=influxdb_config["org"],
-                enable_gzip=True  # เปิดใช้การบีบอัดข้อมูล
-            )
-            
-            # ใช้ ASYNCHRONOUS write API พร้อม batching
-            self.write_api = self.client.write_api(
-                write_options=ASYNCHRONOUS,
-                batch_size=batch_size,
-                flush_interval=flush_interval
-            )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        self.client = None
+        self.write_api = None
+        self.query_api = None
+        self.delete_api = None
+        self.spools: Dict[str, Any] = {}  # bucket -> WriteSpool
+        self.query_clients = []
+        self.current_client_index = 0
+        self.connected = False
+        self._initialized = False
+        # RLock: _write_lines ถือ lock ระหว่างเขียนและเรียก _ensure_client ซ้อนได้ ทำให้ close() ไม่ปิด write API กลางการเขียน
+        self._init_lock = threading.RLock()
+        
+        # client แบบ async สร้างเมื่อเรียก query ครั้งแรก (ผูกกับ event loop ที่ใช้งาน)
+        self._async_client = None
+        self._async_loop = None
+        self._query_semaphore = None
+        self.max_concurrent_queries = influxdb_config["max_concurrent_queries"]
+        
+        # False เมื่อ batch เขียนไม่สำเร็จหลังลองใหม่ครบ (ข้อมูลใหม่จะลง spool จนกว่า ping สำเร็จ)
+        self.available = True
+        
+        # bucket ของ tier ที่ยังไม่ถูกสร้าง (InfluxDB ตอบ 404) ข้อมูลของ tier นั้นจะเขียนลง bucket หลักแทน
+        self.missing_buckets = set()
+        
+        # แท่ง 1m ที่ยังไม่ปิด (symbol, เวลาเปิด ms) ไม่นับเป็นช่วงที่มีข้อมูลแม้เขียนสำเร็จแล้ว
+        self._open_bars = set()
+        self._coverage_saved_at = time.monotonic()
+        
+    def _ensure_client(self) -> bool:
+        """
+        สร้าง client, write API และ spool เมื่อใช้งานครั้งแรก
+        
+        Returns:
+            True ถ้าพร้อมเขียนข้อมูลลง InfluxDB
+        """
+        # อ่าน _initialized ภายใต้ lock เสมอ เพราะ close() อาจกำลังรีเซ็ต client จากเธรดอื่น
+        with self._init_lock:
+            if self._initialized:
+                return self.connected
+                
+            # spool เก็บข้อมูลลงไฟล์ระหว่างที่ InfluxDB ใช้งานไม่ได้ แล้วส่งซ้ำเมื่อกลับมา
+            # (หนึ่ง spool ต่อ bucket: bucket หลักใช้โฟลเดอร์เดิม bucket อื่นใช้โฟลเดอร์ย่อยตามชื่อ tier)
+            spool_dir = influxdb_config["spool_dir"]
+            if spool_dir:
+                for tier in STORAGE_TIERS:
+                    self.spools[tier.bucket] = get_write_spool(
+                        spool_dir if tier.bucket == INFLUXDB_BUCKET else os.path.join(spool_dir, tier.name),
+                        max_bytes=influxdb_config["spool_max_mb"] * 1024 * 1024,
+                        segment_bytes=influxdb_config["spool_segment_mb"] * 1024 * 1024,
+                        fsync=influxdb_config["spool_fsync"]
+                    )
             
-            self.query_api = self.client.query_api()
-            self.delete_api = self.client.delete_api()
+            try:
+                self.client = InfluxDBClient(
+                    url=INFLUXDB_URL,
+                    token=INFLUXDB_TOKEN,
+                    org=INFLUXDB_ORG,
+                    enable_gzip=True  # เปิดใช้การบีบอัดข้อมูล
+                )
+                
+                # ใช้ write API แบบ batching: write() คืนค่าทันทีและส่งข้อมูลเป็นชุดในเธรดเบื้องหลัง
+                self.write_api = self.client.write_api(
+                    write_options=WriteOptions(
+                        write_type=WriteType.batching,
+                        batch_size=self.batch_size,
+                        flush_interval=self.flush_interval
+                    ),
+                    success_callback=self._on_write_success,
+                    error_callback=self._on_write_error
+                )
+                
+                self.query_api = self.client.query_api()
+                self.delete_api = self.client.delete_api()
+                
+                if self.spools:
+                    replay_api = self.client.write_api(write_options=SYNCHRONOUS)
+                    for bucket, spool in self.spools.items():
+                        spool.start_replay(
+                            lambda record, bucket=bucket: self._replay_write(replay_api, bucket, record),
+                            self._check_available,
+                            lines_per_second=influxdb_config["spool_replay_rate"],
+                            is_permanent=is_permanent_write_error
+                        )
+                
+                print(f"✅ เชื่อมต่อกับ InfluxDB สำเร็จที่ {INFLUXDB_URL}")
+                self.connected = True
+                
+            except Exception as e:
+                print(f"⚠️ ไม่สามารถเชื่อมต่อกับ InfluxDB ได้: {e}")
+                self.client = None
+                self.write_api = None
+                self.query_api = None
+                self.delete_api = None
+                self.connected = False
+                
+            self._initialized = True
             
-            # สร้าง connection pool
-            self._setup_connection_pool()
+        return self.connected
             
-            print(f"✅ เชื่อมต่อกับ InfluxDB สำเร็จที่ {INFLUXDB_URL}")
-            self.connected = True
+    @property
+    def coverage(self) -> CoverageIndex:
+        """ดัชนีช่วงเวลาของแท่ง 1m ที่เขียนผ่าน storage นี้ (ใช้หาช่วงข้อมูลที่ขาด)"""
+        return get_coverage_index(influxdb_config["coverage_path"])
+        
+    def _get_next_client(self):
+        """เลือก client ถัดไปจาก pool (สร้างเพิ่มตามต้องการจนครบ MAX_QUERY_POOL_SIZE)"""
+        with self._init_lock:
+            if len(self.query_clients) < MAX_QUERY_POOL_SIZE:
+                client = InfluxDBClient(
+                    url=INFLUXDB_URL,
+                    token=INFLUXDB_TOKEN,
+                    org=INFLUXDB_ORG,
+                    enable_gzip=True
+                )
+                self.query_clients.append(client)
+                return client
+                
+            client = self.query_clients[self.current_client_index]
+            self.current_client_index = (self.current_client_index + 1) % len(self.query_clients)
+            return client
+        
+    def _bucket_for(self, measurement: str) -> str:
+        """bucket ที่ใช้จริงของ measurement (bucket หลักถ้า bucket ของ tier ยังไม่ถูกสร้าง)"""
+        bucket = bucket_for(measurement)
+        return INFLUXDB_BUCKET if bucket in self.missing_buckets else bucket
+        
+    def _is_missing_bucket(self, bucket: str, exception: BaseException) -> bool:
+        """
+        ตรวจว่าการเขียนล้มเหลวเพราะ bucket ของ tier ยังไม่มี (HTTP 404) และจำไว้เพื่อเปลี่ยนไปใช้ bucket หลัก
+        404 ไม่ใช่การปฏิเสธถาวร ถ้าไม่เปลี่ยน bucket ข้อมูลจะวนอยู่ใน spool ตลอดไป
+        """
+        if bucket == INFLUXDB_BUCKET or not (isinstance(exception, ApiException) and exception.status == 404):
+            return False
+        if bucket not in self.missing_buckets:
+            self.missing_buckets.add(bucket)
+            print(f"⚠️ ไม่พบ bucket {bucket} จะเขียนข้อมูลของ tier นี้ลง {INFLUXDB_BUCKET} แทน "
+                  f"(ตั้ง INFLUXDB_AUTO_PROVISION=true เพื่อสร้าง bucket)")
+        return True
+        
+    def _replay_write(self, replay_api, bucket: str, record: str) -> None:
+        """เขียนข้อมูลจาก spool ของ bucket แบบ synchronous (ใช้ bucket หลักแทน bucket ที่ยังไม่มี)"""
+        target = INFLUXDB_BUCKET if bucket in self.missing_buckets else bucket
+        try:
+            replay_api.write(bucket=target, record=record, write_precision=WritePrecision.NS)
+        except ApiException as e:
+            if target == INFLUXDB_BUCKET or not self._is_missing_bucket(bucket, e):
+                raise
+            replay_api.write(bucket=INFLUXDB_BUCKET, record=record, write_precision=WritePrecision.NS)
+        self._record_coverage(record)
+        
+    def _record_coverage(self, record: str) -> None:
+        """
+        บันทึกแท่ง kline_data ในข้อมูลที่ InfluxDB ยืนยันการเขียนแล้วลงดัชนีช่วงข้อมูล
+        (batch ที่ถูกปฏิเสธหรือยังค้างใน spool จึงยังเป็นช่วงที่ขาดให้ /api/gaps และ repair_gaps เห็น)
+        """
+        prefix = "kline_data,symbol="
+        timestamps: Dict[str, List[int]] = {}
+        for line in record.split("\n"):
+            if not line.startswith(prefix):
+                continue
+            head, _, timestamp_ns = line.rpartition(" ")
+            symbol = head[len(prefix):].split(" ", 1)[0]
+            timestamp_ms = int(timestamp_ns) // 1_000_000
+            if (symbol, timestamp_ms) not in self._open_bars:
+                timestamps.setdefault(symbol, []).append(timestamp_ms)
+        if not timestamps:
+            return
             
-        except Exception as e:
-            print(f"⚠️ ไม่สามารถเชื่อมต่อกับ InfluxDB ได้: {e}")
-            self.client = None
-            self.write_api = None
-            self.query_api = None
-            self.delete_api = None
-            self.connected = False
+        coverage = self.coverage
+        for symbol, values in timestamps.items():
+            coverage.record(symbol, values)
             
-    def _setup_connection_pool(self):
-        """ตั้งค่า connection pool สำหรับ query"""
-        self.query_clients = []
-        MAX_POOL_SIZE = 5
-        
-        for _ in range(MAX_POOL_SIZE):
-            client = InfluxDBClient(
-                url=INFLUXDB_URL,
-                token=INFLUXDB_TOKEN,
-                org=INFLUXDB_ORG,
-                enable_gzip=True
-            )
-            self.query_clients.append(client)
+        # บันทึกดัชนีลงไฟล์เป็นระยะ เพื่อไม่ให้ช่วงที่บันทึกไว้หายทั้งหมดเมื่อ process หยุดกะทันหัน
+        now = time.monotonic()
+        if now - self._coverage_saved_at >= influxdb_config["coverage_save_seconds"]:
+            self._coverage_saved_at = now
+            try:
+                coverage.save()
+            except OSError as e:
+                print(f"⚠️ ไม่สามารถบันทึกดัชนีช่วงข้อมูลได้: {e}")
         
-        self.current_client_index = 0
+    def _on_write_success(self, conf, data):
+        """callback เมื่อ batch ถูกเขียนลง InfluxDB สำเร็จ: อัปเดตดัชนีช่วงข้อมูลของแท่ง 1m"""
+        if conf[0] == INFLUXDB_BUCKET:
+            self._record_coverage(data.decode("utf-8") if isinstance(data, bytes) else data)
         
-    def _get_next_client(self):
-        """เลือก client ถัดไปจาก pool"""
-        client = self.query_clients[self.current_client_index]
-        self.current_client_index = (self.current_client_index + 1) % len(self.query_clients)
-        return client
+    def _on_write_error(self, conf, data, exception):
+        """
+        callback เมื่อ batch เขียนไม่สำเร็จหลังลองใหม่ครบแล้ว: เก็บ batch ลง spool แทนการทิ้ง
+        ยกเว้น batch ที่ InfluxDB ปฏิเสธถาวร (ส่งซ้ำไม่สำเร็จและจะขวางข้อมูลอื่นใน spool)
+        batch ของ bucket ที่ยังไม่มีจะลง spool ของ bucket หลักเพื่อส่งซ้ำไปที่นั่น
+        """
+        if self._is_missing_bucket(conf[0], exception):
+            spool = self.spools.get(INFLUXDB_BUCKET)
+            if spool:
+                spool.append(data.decode("utf-8") if isinstance(data, bytes) else data)
+            return
+        if is_permanent_write_error(exception):
+            record = data.decode("utf-8") if isinstance(data, bytes) else data
+            first_line = record.split("\n", 1)[0][:200]
+            print(f"❌ InfluxDB ปฏิเสธ batch ถาวร ทิ้งข้อมูล: {exception} (บรรทัดแรก: {first_line})")
+            return
+        print(f"⚠️ ไม่สามารถเขียน batch ลง InfluxDB ได้: {exception}")
+        spool = self.spools.get(conf[0])
+        if spool:
+            self.available = False
+            spool.append(data.decode("utf-8") if isinstance(data, bytes) else data)
+            
+    def _check_available(self) -> bool:
+        """ตรวจสอบว่า InfluxDB กลับมาใช้งานได้หรือยัง (ใช้โดยเธรดส่งซ้ำของ spool)"""
+        client = self.client
+        self.available = bool(client and client.ping())
+        return self.available
         
-    def store_kline_data(self, symbol: str, data_points: List[Dict[str, Any]]) -> None:
+    def _write_lines(self, lines: List[Optional[str]], measurement: str) -> None:
+        """
+        ส่งบรรทัด line protocol เข้า batching write API ของ bucket ตาม tier (หรือ spool เมื่อ InfluxDB ใช้งานไม่ได้)
+        บรรทัดที่เป็น None (จาก encode_line เมื่อไม่เหลือ field) ถูกข้าม
+        """
+        lines = [line for line in lines if line]
+        if not lines:
+            return
+            
+        record = "\n".join(lines)
+        bucket = self._bucket_for(measurement)
+        # write() ของ batching API แค่ส่งเข้าคิว จึงถือ lock ได้โดยไม่บล็อกนาน และ close() จะรอจนเขียนเสร็จ
+        with self._init_lock:
+            if not (self._ensure_client() and self.available):
+                if bucket in self.spools:
+                    self.spools[bucket].append(record)
+                return
+                
+            try:
+                self.write_api.write(bucket=bucket, record=record, write_precision=WritePrecision.NS)
+            except Exception as e:
+                print(f"⚠️ ไม่สามารถบันทึกข้อมูลลง InfluxDB ได้: {e}")
+                if bucket in self.spools and not is_permanent_write_error(e):
+                    self.spools[bucket].append(record)
+            
+    def store_kline_data(self, symbol: str, data_points: List[Dict[str, Any]],
+                         measurement: str = "kline_data") -> None:
         """
         บันทึกข้อมูล OHLCV (kline) แบบ batch ลงใน InfluxDB
         
         Args:
             symbol: สัญลักษณ์คู่เหรียญ
             data_points: รายการข้อมูล kline
+            measurement: measurement ปลายทาง (แต่ละ timeframe ใช้ measurement ของตัวเอง เช่น kline_5m)
         """
-        if not self.connected:
-            return
+        # จำแท่ง 1m ที่ยังไม่ปิดไว้ก่อนเขียน ดัชนีช่วงข้อมูลจะอัปเดตเมื่อ InfluxDB ยืนยันการเขียน (_on_write_success)
+        if measurement == "kline_data":
+            for data in data_points:
+                key = (symbol, int(data["timestamp"]))
+                if data.get("is_closed", True):
+                    self._open_bars.discard(key)
+                else:
+                    self._open_bars.add(key)
+                    
+        # เขียน line protocol โดยตรงแทนการสร้าง Point ทีละแท่ง
+        self._write_lines(encode_kline_lines(symbol, data_points, measurement), measurement)
+        
+    def store_signal(self, signal: Dict[str, Any]) -> None:
+        """
+        บันทึกสัญญาณการซื้อขายลง measurement "signal"
+        
+        Args:
+            signal: ข้อมูลสัญญาณจาก signal processor (symbol, timestamp, forecast_pct,
+                    confidence, category, price, indicators)
+        """
+        category = signal.get("category")
+        fields = {
+            "forecast_pct": _to_float(signal.get("forecast_pct")),
+            "confidence": _to_float(signal.get("confidence")),
+            "price": _to_float(signal.get("price")),
+        }
+        for name, value in (signal.get("indicators") or {}).items():
+            fields[name] = _to_float(value)
             
-        points = []
-        for data in data_points:
-            point = Point("kline_data") \
-                .tag("symbol", symbol) \
-                .field("open", float(data["open"])) \
-                .field("high", float(data["high"])) \
-                .field("low", float(data["low"])) \
-                .field("close", float(data["close"])) \
-                .field("volume", float(data["volume"])) \
-                .time(datetime.fromtimestamp(int(data["timestamp"]) / 1000))
-            points.append(point)
+        self._write_lines([encode_line(
+            SIGNAL_MEASUREMENT,
+            {"symbol": signal["symbol"], "category": getattr(category, "value", category) or "unknown"},
+            fields,
+            _to_ns(signal.get("timestamp"))
+        )], SIGNAL_MEASUREMENT)
+        
+    def store_trade(self, data: Dict[str, Any]) -> None:
+        """
+        บันทึกรายการซื้อขายจาก Binance trade stream ลง measurement "trade"
+        
+        Args:
+            data: ข้อความ trade ของ Binance (s, t, p, q, T, m)
+        """
+        trade_id = int(data["t"])
+        # หลายรายการอาจเกิดใน millisecond เดียวกัน จึงใช้ trade id เป็นส่วน nanosecond
+        # เพื่อไม่ให้ point ที่มี tag และเวลาเดียวกันเขียนทับกัน
+        timestamp_ns = int(data["T"]) * 1_000_000 + trade_id % 1_000_000
+        
+        self._write_lines([encode_line(
+            TRADE_MEASUREMENT,
+            # m = true หมายถึงผู้ซื้อเป็น maker ฝั่งที่เปิดคำสั่งจึงเป็นฝั่งขาย
+            {"symbol": data["s"], "side": "sell" if data.get("m") else "buy"},
+            {"price": float(data["p"]), "quantity": float(data["q"]), "trade_id": trade_id},
+            timestamp_ns
+        )], TRADE_MEASUREMENT)
+        
+    def store_depth(self, data: Dict[str, Any], symbol: Optional[str] = None) -> None:
+        """
+        บันทึกสรุป order book (depth snapshot) ลง measurement "depth"
+        
+        Args:
+            data: ข้อความ depth ของ Binance (bids/asks หรือ b/a, lastUpdateId)
+            symbol: สัญลักษณ์คู่เหรียญ (จำเป็นสำหรับ partial depth stream ที่ไม่มีฟิลด์ s)
+        """
+        bids = data.get("bids", data.get("b")) or []
+        asks = data.get("asks", data.get("a")) or []
+        if not bids or not asks:
+            return
             
-        try:
-            self.write_api.write(bucket=INFLUXDB_BUCKET, record=points)
-        except Exception as e:
-            print(f"⚠️ ไม่สามารถบันทึกข้อมูล kline ได้: {e}")
+        best_bid, best_ask = float(bids[0][0]), float(asks[0][0])
+        fields = {
+            "best_bid": best_bid,
+            "best_ask": best_ask,
+            "bid_qty": float(bids[0][1]),
+            "ask_qty": float(asks[0][1]),
+            "spread": best_ask - best_bid,
+            "bid_depth": sum(float(level[1]) for level in bids),
+            "ask_depth": sum(float(level[1]) for level in asks),
+            "last_update_id": data.get("lastUpdateId", data.get("u")),
+        }
+        
+        self._write_lines([encode_line(
+            DEPTH_MEASUREMENT,
+            {"symbol": symbol or data["s"]},
+            fields,
+            _to_ns(data.get("E"))
+        )], DEPTH_MEASUREMENT)
+        
+    def store_ticker(self, data: Dict[str, Any]) -> None:
+        """
+        บันทึกข้อมูล 24hr ticker ของ Binance ลง measurement "ticker"
+        
+        Args:
+            data: ข้อความ 24hrTicker ของ Binance (s, E, c, o, h, l, v, q, P)
+        """
+        self._write_lines([encode_line(
+            TICKER_MEASUREMENT,
+            {"symbol": data["s"]},
+            {
+                "last_price": _to_float(data.get("c")),
+                "open": _to_float(data.get("o")),
+                "high": _to_float(data.get("h")),
+                "low": _to_float(data.get("l")),
+                "volume": _to_float(data.get("v")),
+                "quote_volume": _to_float(data.get("q")),
+                "price_change_pct": _to_float(data.get("P")),
+            },
+            _to_ns(data.get("E"))
+        )], TICKER_MEASUREMENT)
             
     def query_market_data(self, symbol: str, start_time: datetime, end_time: datetime) -> pd.DataFrame:
         """
@@ -120,7 +598,7 @@ class InfluxDBStorage:
             start_time: เวลาเริ่มต้น
             end_time: เวลาสิ้นสุด
         """
-        if not self.connected:
+        if not self._ensure_client():
             return pd.DataFrame()
             
         query = f'''
@@ -138,14 +616,203 @@ class InfluxDBStorage:
             print(f"⚠️ ไม่สามารถดึงข้อมูลตลาดได้: {e}")
             return pd.DataFrame()
             
+    def _get_async_client(self):
+        """ดึง InfluxDBClientAsync ของ event loop ปัจจุบัน (ต้องติดตั้ง influxdb-client[async])"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+            
+            self._async_client = InfluxDBClientAsync(
+                url=INFLUXDB_URL,
+                token=INFLUXDB_TOKEN,
+                org=INFLUXDB_ORG,
+                enable_gzip=True
+            )
+            self._async_loop = loop
+            self._query_semaphore = asyncio.Semaphore(self.max_concurrent_queries)
+        return self._async_client
+        
+    async def iter_market_data(self, symbol: str, start: Union[datetime, int], end: Union[datetime, int],
+                               fields: Sequence[str] = _KLINE_FIELDS, measurement: str = "kline_data",
+                               window_hours: Optional[int] = None, page_size: int = 10000,
+                               as_arrow: bool = False) -> AsyncIterator[Any]:
+        """
+        ดึงข้อมูลเป็นหน้าแบบ async โดยแบ่งช่วงเวลาเป็น window และคืนค่าเป็นคอลัมน์ NumPy/Arrow
+        
+        แต่ละหน้าเป็น query ที่มีช่วงเวลาจำกัด ดึงเฉพาะ field ที่ต้องการ และจำนวนแถวไม่เกิน page_size
+        จำนวน query ที่รันพร้อมกันทั้ง process ถูกจำกัดด้วย INFLUXDB_MAX_CONCURRENT_QUERIES
+        
+        Args:
+            symbol: สัญลักษณ์คู่เหรียญ
+            start: เวลาเริ่มต้น (datetime หรือ timestamp หน่วย ms)
+            end: เวลาสิ้นสุด (ไม่รวม)
+            fields: field ที่ต้องการ
+            measurement: ชื่อ measurement
+            window_hours: ช่วงเวลาสูงสุดต่อ query (ค่าเริ่มต้นจาก INFLUXDB_QUERY_WINDOW_HOURS)
+            page_size: จำนวนแถวสูงสุดต่อหน้า
+            as_arrow: คืนค่าเป็น pyarrow.RecordBatch แทน dict ของ NumPy array
+            
+        Yields:
+            dict ของคอลัมน์ {"timestamp": int64 (ms), field: float64} หรือ pyarrow.RecordBatch
+        """
+        if as_arrow and pa is None:
+            raise ImportError("ต้องติดตั้ง pyarrow เพื่อใช้ as_arrow=True")
+            
+        start_ms = int(start.timestamp() * 1000) if isinstance(start, datetime) else int(start)
+        end_ms = int(end.timestamp() * 1000) if isinstance(end, datetime) else int(end)
+        window_ms = (window_hours or influxdb_config["query_window_hours"]) * 3_600_000
+        
+        client = self._get_async_client()
+        query_api = client.query_api()
+        field_filter = " or ".join(f'r["_field"] == "{field}"' for field in fields)
+        keep_columns = ", ".join(f'"{column}"' for column in ("_time", *fields))
+        
+        for window_start in range(start_ms, end_ms, window_ms):
+            window_end = min(window_start + window_ms, end_ms)
+            offset = 0
+            
+            while True:
+                query = f'''
+                from(bucket: "{self._bucket_for(measurement)}")
+                    |> range(start: time(v: {window_start * 1_000_000}), stop: time(v: {window_end * 1_000_000}))
+                    |> filter(fn: (r) => r["_measurement"] == "{measurement}" and r["symbol"] == "{symbol}")
+                    |> filter(fn: (r) => {field_filter})
+                    |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+                    |> keep(columns: [{keep_columns}])
+                    |> sort(columns: ["_time"])
+                    |> limit(n: {page_size}, offset: {offset})
+                '''
+                
+                timestamps = []
+                values = {field: [] for field in fields}
+                async with self._query_semaphore:
+                    records = await query_api.query_stream(query, org=INFLUXDB_ORG)
+                    async for record in records:
+                        timestamps.append(round(record.get_time().timestamp() * 1000))
+                        row = record.values
+                        for field in fields:
+                            values[field].append(row.get(field))
+                            
+                if timestamps:
+                    batch = {"timestamp": np.array(timestamps, dtype=np.int64)}
+                    for field in fields:
+                        batch[field] = np.array(values[field], dtype=np.float64)
+                    yield pa.RecordBatch.from_pydict(batch) if as_arrow else batch
+                    
+                if len(timestamps) < page_size:
+                    break
+                offset += page_size
+                
+    def provision_storage(self, enforce_retention: Optional[bool] = None) -> bool:
+        """
+        สร้าง bucket ที่ยังไม่มีตาม STORAGE_TIERS
+        แล้วสร้างหรืออัปเดต task compaction ตาม COMPACTION_TASKS (ต้องใช้ token ที่มีสิทธิ์จัดการ bucket/task)
+        
+        retention ของ bucket ที่มีอยู่แล้วจะไม่ถูกแก้ไข เว้นแต่ enforce_retention เป็น True
+        เพราะการลด retention ทำให้ข้อมูลที่เก่ากว่าหมดอายุทันที และจะทับค่าที่ผู้ดูแลตั้งไว้เอง
+        
+        Args:
+            enforce_retention: ปรับ retention ของ bucket ที่มีอยู่ให้ตรงกับ tier
+                (ค่าเริ่มต้นจาก INFLUXDB_ENFORCE_RETENTION)
+        
+        Returns:
+            True ถ้าจัดเตรียมครบทุกรายการ
+        """
+        if enforce_retention is None:
+            enforce_retention = influxdb_config["enforce_retention"]
+        if not self._ensure_client():
+            return False
+            
+        try:
+            buckets_api = self.client.buckets_api()
+            for tier in STORAGE_TIERS:
+                rules = [BucketRetentionRules(type="expire", every_seconds=tier.retention_seconds)] \
+                    if tier.retention_seconds else []
+                bucket = buckets_api.find_bucket_by_name(tier.bucket)
+                if bucket is None:
+                    buckets_api.create_bucket(bucket_name=tier.bucket, retention_rules=rules, org=INFLUXDB_ORG)
+                    print(f"✅ สร้าง bucket {tier.bucket} (tier {tier.name})")
+                else:
+                    current = bucket.retention_rules[0].every_seconds if bucket.retention_rules else 0
+                    if current != tier.retention_seconds:
+                        if enforce_retention:
+                            bucket.retention_rules = rules
+                            buckets_api.update_bucket(bucket=bucket)
+                            print(f"✅ ปรับระยะเวลาเก็บข้อมูลของ bucket {tier.bucket} เป็น {tier.retention_seconds} วินาที")
+                        else:
+                            print(f"ℹ️ bucket {tier.bucket} ใช้ retention {current} วินาที (tier กำหนด "
+                                  f"{tier.retention_seconds}) ไม่ปรับเพราะไม่ได้ตั้ง INFLUXDB_ENFORCE_RETENTION")
+                self.missing_buckets.discard(tier.bucket)
+                        
+            tasks_api = self.client.tasks_api()
+            for name, flux in COMPACTION_TASKS.items():
+                existing = tasks_api.find_tasks(name=name)
+                if not existing:
+                    tasks_api.create_task(task_create_request=TaskCreateRequest(
+                        org=INFLUXDB_ORG, flux=flux, status="active", description="compaction จาก tier raw"
+                    ))
+                    print(f"✅ สร้าง task {name}")
+                elif existing[0].flux.strip() != flux.strip():
+                    tasks_api.update_task_request(task_id=existing[0].id,
+                                                  task_update_request=TaskUpdateRequest(flux=flux))
+                    print(f"✅ อัปเดต task {name}")
+            return True
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถจัดเตรียม bucket/task ของ InfluxDB ได้: {e}")
+            return False
+            
+    async def aclose(self):
+        """ปิด client แบบ async (ต้องเรียกจาก event loop เดียวกับที่ใช้ query)"""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._async_loop = None
+            
     def close(self):
-        """ปิดการเชื่อมต่อและ resource ทั้งหมด"""
-        if self.write_api:
-            self.write_api.close()
-        if self.client:
-            self.client.close()
-        for client in self.query_clients:
-            client.close()
+        """
+        flush ข้อมูลที่ค้างและปิด client ทั้งหมด
+        instance ยังใช้งานต่อได้ โดย client จะถูกสร้างใหม่เมื่อเรียกใช้ครั้งถัดไป
+        
+        instance จาก get_influxdb_storage() ใช้ร่วมกันทั้ง process จึงให้เจ้าของ process
+        (shutdown_event ของ API หรือ main ของสคริปต์) เรียกเพียงครั้งเดียวตอนจบ ไม่ใช่ผู้ใช้แต่ละราย
+        """
+        with self._init_lock:
+            if self.write_api:
+                self.write_api.close()
+            for spool in self.spools.values():
+                spool.close()
+            self.coverage.save()
+            if self.client:
+                self.client.close()
+            for client in self.query_clients:
+                client.close()
+                
+            self.client = None
+            self.write_api = None
+            self.query_api = None
+            self.delete_api = None
+            self.query_clients = []
+            self.current_client_index = 0
+            self.connected = False
+            self._initialized = False
+            
+            
+# instance เดียวที่ใช้ร่วมกันทั้ง process
+_storage_instance: Optional[InfluxDBStorage] = None
+_storage_lock = threading.Lock()
+
+
+def get_influxdb_storage() -> InfluxDBStorage:
+    """
+    ดึง InfluxDBStorage ที่ใช้ร่วมกันทั้ง process
+    การเรียกครั้งแรกไม่เปิดการเชื่อมต่อเครือข่าย client จะถูกสร้างเมื่อเขียนหรือ query ครั้งแรก
+    """
+    global _storage_instance
+    if _storage_instance is None:
+        with _storage_lock:
+            if _storage_instance is None:
+                _storage_instance = InfluxDBStorage()
+    return _storage_instance
             
             
 # ตัวอย่างการใช้งาน
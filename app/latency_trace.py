@@ -0,0 +1,100 @@
+"""
+latency_trace.py - วัดความหน่วงของข้อมูลตั้งแต่เวลาเหตุการณ์ของ Binance จนส่งถึง client
+
+แต่ละข้อความพก trace (dict ของ stage -> epoch วินาที) ไปตามเส้นทาง
+event (E/T ของ Binance) -> receive -> flush -> process -> publish -> broadcast
+trace ถูกส่งต่อใน JSON ของแท่งเทียนที่เผยแพร่และในสัญญาณ ทุก stage บันทึกลง histogram สองชุด
+- pipeline_stage_seconds{stage}: เวลาจาก stage ก่อนหน้า (ใช้ปรับ buffer_size/flush_interval)
+- pipeline_age_seconds{stage}: อายุของข้อมูลนับจากเวลาเหตุการณ์ของ Binance
+
+ใช้ time.time() เพราะต้องเทียบกับเวลาของ Binance และข้าม process ได้ (ค่าติดลบจาก clock skew ถูกปัดเป็น 0)
+"""
+import time
+from typing import Any, Dict, Optional
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+STAGES = ("receive", "flush", "process", "publish", "broadcast")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = registry.histogram(
+    "pipeline_stage_seconds", "Time from the previous pipeline stage to this stage", ("stage",), LATENCY_BUCKETS
+)
+AGE_SECONDS = registry.histogram(
+    "pipeline_age_seconds", "Time since the Binance event when a message reached this stage", ("stage",), LATENCY_BUCKETS
+)
+_STAGE_CHILDREN = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+_AGE_CHILDREN = {stage: AGE_SECONDS.labels(stage) for stage in STAGES}
+
+
+def start(payload: Any, now: Optional[float] = None) -> Optional[Dict[str, float]]:
+    """
+    เริ่ม trace ของข้อความ Binance ที่เพิ่งได้รับ (บันทึก stage receive)
+
+    Args:
+        payload: ข้อมูลของ event (ส่วน data ของ combined stream) ที่มี E หรือ T เป็น ms
+        now: เวลาที่ได้รับ (ค่าเริ่มต้น time.time())
+
+    Returns:
+        trace ที่ต้องส่งต่อไปกับข้อความ หรือ None ถ้าข้อความไม่มีเวลาเหตุการณ์
+    """
+    if not isinstance(payload, dict):
+        return None
+    event_ms = payload.get("E") or payload.get("T")
+    if not event_ms:
+        return None
+    trace = {"event": event_ms / 1000.0}
+    mark(trace, "receive", now)
+    return trace
+
+
+def mark(trace: Optional[Dict[str, float]], stage: str, now: Optional[float] = None) -> None:
+    """
+    บันทึกว่าข้อความถึง stage แล้ว (trace เป็น None หรือ stage ไม่รู้จักจะถูกข้าม)
+
+    Args:
+        trace: trace จาก start() หรือที่ได้จาก JSON ของ stage ก่อนหน้า
+        stage: ชื่อ stage ใน STAGES
+        now: เวลาปัจจุบัน (ส่งค่าเดียวกันได้เมื่อบันทึกหลายข้อความพร้อมกัน)
+    """
+    if not isinstance(trace, dict) or stage not in _STAGE_CHILDREN:
+        return
+    event = trace.get("event")
+    if event is None:
+        return
+    now = time.time() if now is None else now
+    # dict รักษาลำดับการใส่ (รวมถึงหลังผ่าน JSON) ค่าสุดท้ายจึงเป็น stage ก่อนหน้า
+    previous = next(reversed(trace.values()))
+    _STAGE_CHILDREN[stage].observe(max(now - previous, 0.0))
+    _AGE_CHILDREN[stage].observe(max(now - event, 0.0))
+    trace[stage] = now
+
+
+def _summary(histogram) -> Dict[str, Any]:
+    count = histogram.count
+    return {
+        "count": count,
+        "mean": histogram.sum / count if count else None,
+        "p50": histogram.quantile(0.5),
+        "p90": histogram.quantile(0.9),
+        "p99": histogram.quantile(0.99),
+    }
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """
+    สรุปความหน่วงของแต่ละ stage (วินาที, quantile เป็นขอบบนของ bucket)
+
+    Returns:
+        {stage: {"since_previous": {...}, "since_event": {...}}} เรียงตามลำดับใน pipeline
+    """
+    return {
+        stage: {
+            "since_previous": _summary(_STAGE_CHILDREN[stage]),
+            "since_event": _summary(_AGE_CHILDREN[stage]),
+        }
+        for stage in STAGES
+    }
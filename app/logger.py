@@ -1,16 +1,96 @@
+import atexit
+import copy
+import inspect
+import itertools
 import logging
 import logging.handlers
 import os
 import json
-import traceback
-from datetime import datetime
+import queue
+import threading
+import time
 from functools import wraps
-from typing import Any, Callable, Dict, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Union
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+# ระดับ log ขั้นต่ำของทุก logger ที่สร้างจาก LoggerFactory
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# ข้อความ WARNING ขึ้นไปที่ซ้ำจากจุดเดียวกัน ผ่านได้ไม่เกิน BURST ข้อความต่อ WINDOW วินาที (0 = ไม่จำกัด)
+LOG_RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "5"))
+LOG_RATE_LIMIT_WINDOW = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "60"))
+
+# สัดส่วนการเรียกที่ log_execution_time วัดเวลา (1 = ทุกครั้ง, 0 = ไม่วัด)
+LOG_TIMING_SAMPLE_RATE = float(os.getenv("LOG_TIMING_SAMPLE_RATE", "1.0"))
+_FUNCTION_SECONDS = registry.histogram(
+    "function_duration_seconds", "Execution time of functions decorated with log_execution_time", ("function",)
+)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    จำกัดจำนวนข้อความระดับ WARNING ขึ้นไปที่ซ้ำกัน (จากจุดเดียวกันในโค้ด หรือ rate_key เดียวกัน)
+    
+    ผ่านได้ไม่เกิน burst ข้อความต่อช่วง window วินาที ข้อความแรกของช่วงถัดไปจะแจ้งจำนวนที่ถูกระงับ
+    """
+    
+    def __init__(self, burst: int = 5, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._state: Dict[Any, list] = {}  # key -> [เริ่มช่วง, จำนวนที่ผ่าน, จำนวนที่ถูกระงับ]
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        key = getattr(record, "rate_key", None) or (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if len(self._state) > 10000:
+                    self._state.clear()
+            elif state[1] < self.burst:
+                state[1] += 1
+                return True
+            else:
+                state[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} (ระงับข้อความซ้ำ {suppressed} ครั้งในช่วงก่อนหน้า)"
+            record.args = None
+        return True
+
+
+class _DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler ที่ส่ง traceback ไปจัดรูปแบบในเธรดของ listener แทน event loop"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # แทนค่า args ทันที (ค่าอาจเปลี่ยนก่อนถูกเขียน) แต่เก็บ exc_info ไว้ให้ formatter ของ listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
 
 class LoggerFactory:
-    """Factory class สำหรับสร้างและจัดการ loggers"""
+    """
+    Factory class สำหรับสร้างและจัดการ loggers
+    
+    แต่ละ logger เขียนผ่าน QueueHandler ลงคิว และมี QueueListener ในเธรดเบื้องหลังที่เขียนไฟล์และ console
+    โค้ดใน event loop จึงไม่ต้องรอ disk I/O
+    """
     
     _loggers: Dict[str, logging.Logger] = {}
+    _listeners: List[logging.handlers.QueueListener] = []
+    _lock = threading.Lock()
     
     @classmethod
     def get_logger(cls, name: str, log_file: str = None) -> logging.Logger:
@@ -23,41 +103,78 @@ class LoggerFactory:
         """
         if name in cls._loggers:
             return cls._loggers[name]
-            
-        logger = logging.getLogger(name)
-        logger.setLevel(logging.DEBUG)
-        
-        # สร้างโฟลเดอร์ logs ถ้ายังไม่มี
-        os.makedirs('logs', exist_ok=True)
         
-        # ตั้งค่า file handler
-        log_file = log_file or f'logs/{name}.log'
-        file_handler = logging.handlers.RotatingFileHandler(
-            log_file,
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=5,
-            encoding='utf-8'
-        )
-        file_handler.setLevel(logging.DEBUG)
-        
-        # ตั้งค่า console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        
-        # กำหนดรูปแบบ log
-        formatter = logging.Formatter(
-            '[%(asctime)s] %(levelname)s [%(name)s] %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-        
-        # เพิ่ม handlers
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-        
-        cls._loggers[name] = logger
-        return logger
+        with cls._lock:
+            if name in cls._loggers:
+                return cls._loggers[name]
+            
+            logger = logging.getLogger(name)
+            if any(isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers):
+                # ตั้งค่าไว้แล้วโดยโมดูลนี้ที่ถูก import ในชื่ออื่น (logger / app.logger)
+                cls._loggers[name] = logger
+                return logger
+            # ระดับของ logger กรองก่อนสร้างข้อความ (ตั้ง LOG_LEVEL=DEBUG เพื่อเขียน log ระดับ debug ลงไฟล์)
+            logger.setLevel(LOG_LEVEL)
+            
+            # สร้างโฟลเดอร์ logs ถ้ายังไม่มี
+            os.makedirs('logs', exist_ok=True)
+            
+            # ตั้งค่า file handler
+            log_file = log_file or f'logs/{name}.log'
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=10 * 1024 * 1024,  # 10MB
+                backupCount=5,
+                encoding='utf-8'
+            )
+            file_handler.setLevel(logging.DEBUG)
+            
+            # ตั้งค่า console handler
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(logging.INFO)
+            
+            # กำหนดรูปแบบ log
+            formatter = logging.Formatter(
+                '[%(asctime)s] %(levelname)s [%(name)s] %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
+            file_handler.setFormatter(formatter)
+            console_handler.setFormatter(formatter)
+            
+            # logger เขียนลงคิว ส่วน listener เขียนไฟล์และ console ในเธรดเบื้องหลัง
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            queue_handler = _DeferredFormatQueueHandler(log_queue)
+            queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT_BURST, LOG_RATE_LIMIT_WINDOW))
+            listener = logging.handlers.QueueListener(
+                log_queue, file_handler, console_handler, respect_handler_level=True
+            )
+            listener.start()
+            
+            logger.addHandler(queue_handler)
+            cls._listeners.append(listener)
+            cls._loggers[name] = logger
+            return logger
+    
+    @classmethod
+    def shutdown(cls) -> None:
+        """หยุด listener ทั้งหมดหลังเขียนข้อความที่ค้างในคิว (เรียกอัตโนมัติเมื่อ process จบ)"""
+        with cls._lock:
+            listeners, cls._listeners = cls._listeners, []
+        for listener in listeners:
+            listener.stop()
+
+atexit.register(LoggerFactory.shutdown)
+
+
+class _LazyJson:
+    """แปลงเป็น JSON เฉพาะเมื่อข้อความถูกเขียนจริง (ไม่ถูกกรองหรือระงับ)"""
+    __slots__ = ("value",)
+    
+    def __init__(self, value: Any):
+        self.value = value
+    
+    def __str__(self) -> str:
+        return json.dumps(self.value, indent=2, default=str)
 
 class ErrorLogger:
     """คลาสสำหรับจัดการการบันทึก error logs"""
@@ -73,73 +190,113 @@ class ErrorLogger:
             error: Exception ที่เกิดขึ้น
             context: ข้อมูลเพิ่มเติมที่เกี่ยวข้องกับข้อผิดพลาด
         """
-        error_info = {
-            'error_type': type(error).__name__,
-            'error_message': str(error),
-            'traceback': traceback.format_exc(),
-            'timestamp': datetime.now().isoformat(),
-            'context': context or {}
-        }
-        
+        context = context or {}
+        # traceback ถูกจัดรูปแบบในเธรดของ listener และข้อผิดพลาดชนิดเดียวกันจากเหตุการณ์เดียวกันถูกจำกัดจำนวน
         self.logger.error(
-            f"Error occurred: {error_info['error_type']}\n"
-            f"Message: {error_info['error_message']}\n"
-            f"Context: {json.dumps(error_info['context'], indent=2)}\n"
-            f"Traceback:\n{error_info['traceback']}"
+            "Error occurred: %s\nMessage: %s\nContext: %s",
+            type(error).__name__, error, _LazyJson(context),
+            exc_info=(type(error), error, error.__traceback__),
+            extra={'rate_key': (self.logger.name, type(error).__name__,
+                                context.get('event') or context.get('method') or context.get('component'))}
         )
 
-def log_execution_time(logger: Optional[logging.Logger] = None):
+def log_execution_time(logger: Optional[logging.Logger] = None, sample_rate: Optional[float] = None,
+                       name: Optional[str] = None):
     """
-    Decorator สำหรับบันทึกเวลาที่ใช้ในการทำงานของฟังก์ชัน
+    Decorator สำหรับวัดเวลาที่ใช้ในการทำงานของฟังก์ชัน (รองรับทั้งฟังก์ชันปกติและ async def)
+    
+    วัดด้วย time.perf_counter_ns เฉพาะการเรียกที่ถูกสุ่ม (ทุก ๆ 1/sample_rate ครั้ง) แล้วบันทึกลง
+    histogram function_duration_seconds ข้อความ debug จะถูกสร้างเฉพาะเมื่อ logger เปิดระดับ DEBUG
+    ข้อผิดพลาดถูกบันทึกทุกครั้งไม่ว่าจะถูกสุ่มหรือไม่
     
     Args:
-        logger: Logger ที่จะใช้บันทึก (ถ้าไม่ระบุจะสร้างใหม่)
+        logger: Logger ที่จะใช้บันทึก (ถ้าไม่ระบุจะใช้ logger ของโมดูลของฟังก์ชัน)
+        sample_rate: สัดส่วนการเรียกที่วัดเวลา 0-1 (ค่าเริ่มต้นจาก LOG_TIMING_SAMPLE_RATE)
+        name: ชื่อใน label ของ histogram (ค่าเริ่มต้นคือ module.qualname)
     """
+    rate = LOG_TIMING_SAMPLE_RATE if sample_rate is None else sample_rate
+    # สุ่มแบบนับรอบ (ถูกกว่า random) เช่น rate 0.1 = วัดทุกการเรียกที่ 10
+    every = max(1, round(1 / rate)) if rate > 0 else 0
+    
     def decorator(func: Callable) -> Callable:
+        label = name or f"{func.__module__}.{func.__qualname__}"
+        histogram = _FUNCTION_SECONDS.labels(label)
+        calls = itertools.count()
+        log = logger
+        
+        def get_logger() -> logging.Logger:
+            nonlocal log
+            if log is None:
+                log = LoggerFactory.get_logger(func.__module__)
+            return log
+        
+        def finish(started: int) -> None:
+            elapsed = (time.perf_counter_ns() - started) / 1e9
+            histogram.observe(elapsed)
+            current = get_logger()
+            if current.isEnabledFor(logging.DEBUG):
+                current.debug("Function '%s' executed in %.6f seconds", func.__name__, elapsed)
+        
+        def fail(started: int, error: Exception) -> None:
+            elapsed = (time.perf_counter_ns() - started) / 1e9
+            get_logger().error(
+                "Function '%s' failed after %.3f seconds\nError: %s",
+                func.__name__, elapsed, error, exc_info=True
+            )
+        
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter_ns()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    fail(started, e)
+                    raise
+                if every and next(calls) % every == 0:
+                    finish(started)
+                return result
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = datetime.now()
-            
-            nonlocal logger
-            if logger is None:
-                logger = LoggerFactory.get_logger(func.__module__)
-                
+            started = time.perf_counter_ns()
             try:
                 result = func(*args, **kwargs)
-                execution_time = (datetime.now() - start_time).total_seconds()
-                logger.debug(
-                    f"Function '{func.__name__}' executed in {execution_time:.3f} seconds"
-                )
-                return result
             except Exception as e:
-                execution_time = (datetime.now() - start_time).total_seconds()
-                logger.error(
-                    f"Function '{func.__name__}' failed after {execution_time:.3f} seconds\n"
-                    f"Error: {str(e)}\n"
-                    f"Traceback:\n{traceback.format_exc()}"
-                )
+                fail(started, e)
                 raise
-                
+            if every and next(calls) % every == 0:
+                finish(started)
+            return result
         return wrapper
     return decorator
 
 class MetricsLogger:
-    """คลาสสำหรับบันทึกและติดตามเมตริกต่างๆ"""
+    """
+    เก็บค่าล่าสุดของเมตริกแบบเหตุการณ์ (เช่น initialization, shutdown, memory_alert) ในหน่วยความจำ
+    
+    ไม่เขียน log ในระดับ INFO อีกต่อไป ค่าที่เกิดถี่บน hot path ให้ใช้ counter/gauge/histogram
+    จาก metrics.registry ซึ่งดูได้ที่ /metrics
+    """
     
     def __init__(self, name: str):
         self.logger = LoggerFactory.get_logger(f"{name}_metrics")
+        # ค่าเริ่มต้น WARNING: ไม่ serialize หรือเขียนไฟล์ต่อการบันทึก (ตั้ง METRICS_LOG_LEVEL=DEBUG เพื่อดีบัก)
+        self.logger.setLevel(os.getenv("METRICS_LOG_LEVEL", "WARNING").upper())
         self.metrics: Dict[str, Any] = {}
         
     def record_metric(self, name: str, value: Union[int, float, str, dict]) -> None:
         """
-        บันทึกค่าเมตริก
+        บันทึกค่าเมตริก (serialize เป็น log เฉพาะเมื่อเปิดระดับ DEBUG)
         
         Args:
             name: ชื่อเมตริก
             value: ค่าที่จะบันทึก
         """
         self.metrics[name] = value
-        self.logger.info(f"Metric {name}: {json.dumps(value)}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Metric %s: %s", name, json.dumps(value, default=str))
         
     def get_metrics(self) -> Dict[str, Any]:
         """ดึงค่าเมตริกทั้งหมด"""
@@ -1,10 +1,14 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Request, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
 import json
 import asyncio
+import hmac
+import threading
+import redis
+from dataclasses import asdict
 from datetime import datetime
 import sys
 
@@ -20,7 +24,17 @@ sys.path.insert(0, current_dir)
 import env_manager as env
 
 # ใช้ RedisManager แทนการสร้าง Redis client แยก
-from redis_manager import get_redis_client, check_redis_connection
+from redis_manager import get_redis_client, get_async_redis_client, close_async_redis, check_redis_connection, get_redis_pool_stats, get_redis_client_for_symbol, symbol_key
+from signal_store import signal_store
+from http_cache import etag_json_response
+from influxdb_storage import get_influxdb_storage
+from backfill import BinanceRestSource, repair_gaps
+from warm_start import WARM_START_TIMEOUT, warm_start
+from alert_rules import AlertRule, AlertRuleStore
+from metrics import PROMETHEUS_CONTENT_TYPE, registry
+from logger import LoggerFactory
+import latency_trace
+from profiler import PROFILE_MODES, PROFILER_ENABLED, PROFILER_MAX_SECONDS, PROFILER_TOKEN, ProfilerBusy, loop_lag_monitor, run_profile
 
 # นำเข้าคลาสและฟังก์ชันที่เราสร้างไว้
 from binance_ws_client import BinanceWebSocketClient
@@ -28,6 +42,9 @@ from signal_processor import SignalProcessor, grade_signal
 from notification_service import NotificationService
 from enhanced_memory_monitor import enhanced_memory_monitor
 
+# log ผ่านคิวของ LoggerFactory (เขียนไฟล์/console ในเธรดเบื้องหลัง กรองตาม LOG_LEVEL)
+logger = LoggerFactory.get_logger('main')
+
 # โหลดรายการสัญลักษณ์คริปโตที่รองรับจากตัวแปรสภาพแวดล้อม
 SYMBOLS = env.get_available_symbols()
 
@@ -71,10 +88,25 @@ class SymbolResponse(BaseModel):
     message: str
     symbols: List[str]
 
+class AlertRuleRequest(BaseModel):
+    user_id: str
+    channel: str  # email, webhook หรือ discord
+    target: str
+    symbol: str = "*"
+    categories: List[str] = []
+    min_confidence: float = 0.0
+    rsi_cross_above: Optional[float] = None
+    rsi_cross_below: Optional[float] = None
+    price_above: Optional[float] = None
+    price_below: Optional[float] = None
+
 # ตัวแปรที่ใช้ตรวจสอบสถานะ Redis
 redis_connected = False
 redis_client = None
 
+# task วัดความหน่วงของ event loop (เก็บ reference ไว้ไม่ให้ถูก garbage collect และยกเลิกตอนปิดแอป)
+loop_lag_task = None
+
 # ฟังก์ชันเชื่อมต่อกับ Redis พร้อมจัดการข้อผิดพลาด
 def connect_to_redis():
     global redis_client, redis_connected
@@ -84,10 +116,10 @@ def connect_to_redis():
         # ทดสอบการเชื่อมต่อ
         redis_connected = redis_client.ping()
         if redis_connected:
-            print(f"✅ เชื่อมต่อกับ Redis สำเร็จที่ {REDIS_HOST}:{REDIS_PORT}")
+            logger.info("✅ เชื่อมต่อกับ Redis สำเร็จที่ %s:%s", REDIS_HOST, REDIS_PORT)
         return redis_connected
     except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดในการเชื่อมต่อกับ Redis: {e}")
+        logger.error("❌ เกิดข้อผิดพลาดในการเชื่อมต่อกับ Redis: %s", e)
         redis_connected = False
         return False
 
@@ -117,6 +149,17 @@ def create_empty_signal(symbol: str) -> dict:
         }
     }
 
+def parse_symbols_param(symbols: Optional[str]) -> List[str]:
+    """แปลงพารามิเตอร์ symbols=BTCUSDT,ETHUSDT เป็นรายการ (ค่าว่าง = ทุกสัญลักษณ์ที่รองรับ)"""
+    if not symbols:
+        return list(SYMBOLS)
+    
+    requested = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    unknown = [s for s in requested if s not in SYMBOLS]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"No data for symbols {', '.join(unknown)}")
+    return requested
+
 # จัดการการเชื่อมต่อ WebSocket จาก clients
 class ConnectionManager:
     def __init__(self):
@@ -130,23 +173,23 @@ class ConnectionManager:
         await websocket.accept()
         self.active_connections.append(websocket)
         self.client_subscriptions[websocket] = set()  # เริ่มต้นด้วยเซ็ตว่าง
-        print(f"📡 WebSocket client เชื่อมต่อแล้ว - จำนวนการเชื่อมต่อทั้งหมด: {len(self.active_connections)}")
+        logger.info("📡 WebSocket client เชื่อมต่อแล้ว - จำนวนการเชื่อมต่อทั้งหมด: %s", len(self.active_connections))
         
         # เริ่ม Redis PubSub ถ้ายังไม่ได้เริ่มและ Redis เชื่อมต่อได้
         if self.redis_pubsub is None and redis_connected:
             try:
-                self.redis_pubsub = redis_client.pubsub()
-                self.redis_pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+                self.redis_pubsub = get_async_redis_client(decode_responses=True).pubsub()
+                await self.redis_pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
                 # เริ่มตรวจสอบข้อความใหม่
                 self.task = asyncio.create_task(self.listen_for_messages())
-                print(f"📢 เริ่มต้น Redis PubSub listener สำหรับช่อง {REDIS_SIGNAL_CHANNEL}")
+                logger.info("📢 เริ่มต้น Redis PubSub listener สำหรับช่อง %s", REDIS_SIGNAL_CHANNEL)
             except Exception as e:
-                print(f"❌ ไม่สามารถเริ่ม Redis PubSub ได้: {e}")
+                logger.error("❌ ไม่สามารถเริ่ม Redis PubSub ได้: %s", e)
         
         # เริ่ม heartbeat task ถ้ายังไม่มี
         if self.heartbeat_task is None:
             self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
-            print("💓 เริ่มต้น heartbeat system เพื่อรักษาการเชื่อมต่อ WebSocket")
+            logger.info("💓 เริ่มต้น heartbeat system เพื่อรักษาการเชื่อมต่อ WebSocket")
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
@@ -154,30 +197,27 @@ class ConnectionManager:
             # ลบข้อมูลการสมัครสมาชิกของ client นี้
             if websocket in self.client_subscriptions:
                 del self.client_subscriptions[websocket]
-            print(f"🔌 WebSocket client ยกเลิกการเชื่อมต่อแล้ว - จำนวนการเชื่อมต่อที่เหลือ: {len(self.active_connections)}")
+            logger.info("🔌 WebSocket client ยกเลิกการเชื่อมต่อแล้ว - จำนวนการเชื่อมต่อที่เหลือ: %s", len(self.active_connections))
             
-            # หากไม่มีการเชื่อมต่อเหลืออยู่ ให้หยุด PubSub
+            # หากไม่มีการเชื่อมต่อเหลืออยู่ ให้หยุด PubSub (listener จะปิด PubSub เมื่อถูกยกเลิก)
             if not self.active_connections:
                 if self.task:
                     self.task.cancel()
-                if self.redis_pubsub:
-                    try:
-                        self.redis_pubsub.unsubscribe()
-                    except Exception as e:
-                        print(f"⚠️ ไม่สามารถยกเลิกการสมัครสมาชิก Redis PubSub ได้: {e}")
                 self.redis_pubsub = None
                 self.task = None
-                print("📢 ยกเลิก Redis PubSub listener แล้ว")
+                logger.info("📢 ยกเลิก Redis PubSub listener แล้ว")
                 
                 # ยกเลิก heartbeat task
                 if self.heartbeat_task:
                     self.heartbeat_task.cancel()
                     self.heartbeat_task = None
-                    print("💓 ยกเลิก heartbeat system")
+                    logger.info("💓 ยกเลิก heartbeat system")
 
     async def broadcast(self, message: str):
         try:
             message_data = json.loads(message)
+            # trace ใช้วัดความหน่วงภายใน ไม่ส่งต่อให้ browser
+            trace = message_data.pop('trace', None) if isinstance(message_data, dict) else None
             # สร้างรายการของ WebSockets ที่ต้องลบเนื่องจากถูกปิด
             disconnected_websockets = []
             
@@ -186,12 +226,12 @@ class ConnectionManager:
                     await connection.send_json(message_data)
                 except RuntimeError as e:
                     if "Cannot call 'send' once a close message has been sent" in str(e):
-                        print(f"⚠️ พบ WebSocket ที่ถูกปิดแล้วระหว่างการ broadcast - กำลังเพิ่มเข้าสู่รายการลบ")
+                        logger.warning("⚠️ พบ WebSocket ที่ถูกปิดแล้วระหว่างการ broadcast - กำลังเพิ่มเข้าสู่รายการลบ")
                         disconnected_websockets.append(connection)
                     else:
                         raise
                 except Exception as e:
-                    print(f"❌ เกิดข้อผิดพลาดในการ broadcast ไปยัง client: {e}")
+                    logger.error("❌ เกิดข้อผิดพลาดในการ broadcast ไปยัง client: %s", e)
                     if "WebSocket is not connected" in str(e):
                         disconnected_websockets.append(connection)
             
@@ -200,10 +240,12 @@ class ConnectionManager:
                 if ws in self.active_connections:
                     self.disconnect(ws)
             
+            latency_trace.mark(trace, "broadcast")
+            
             if self.active_connections:  # ตรวจสอบว่ามี connections เหลืออยู่หรือไม่
-                print(f"📢 ส่งข้อความไปยัง WebSocket clients ทั้งหมด {len(self.active_connections)} การเชื่อมต่อ")
+                logger.debug("📢 ส่งข้อความไปยัง WebSocket clients ทั้งหมด %s การเชื่อมต่อ", len(self.active_connections))
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการส่งข้อความไปยัง clients: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดในการส่งข้อความไปยัง clients: %s", e)
     
     async def send_to_client(self, websocket: WebSocket, message: Dict):
         """ส่งข้อความไปยัง client เฉพาะราย"""
@@ -213,58 +255,64 @@ class ConnectionManager:
                 try:
                     # ส่งข้อความไปยัง client
                     await websocket.send_json(message)
-                    print(f"📨 ส่งข้อความไปยัง WebSocket client เฉพาะราย")
+                    logger.debug("📨 ส่งข้อความไปยัง WebSocket client เฉพาะราย")
                 except RuntimeError as e:
                     if "Cannot call 'send' once a close message has been sent" in str(e):
-                        print(f"⚠️ WebSocket ถูกปิดระหว่างส่งข้อความ - กำลังลบออกจากรายการ")
+                        logger.warning("⚠️ WebSocket ถูกปิดระหว่างส่งข้อความ - กำลังลบออกจากรายการ")
                         # เอาออกจาก active_connections เพื่อป้องกันการส่งซ้ำ
                         if websocket in self.active_connections:
                             self.disconnect(websocket)
                     else:
                         raise
             else:
-                print("⚠️ พยายามส่งข้อความไปยัง WebSocket ที่ไม่ได้เชื่อมต่อแล้ว - ข้ามการส่ง")
+                logger.warning("⚠️ พยายามส่งข้อความไปยัง WebSocket ที่ไม่ได้เชื่อมต่อแล้ว - ข้ามการส่ง")
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการส่งข้อความไปยัง client: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดในการส่งข้อความไปยัง client: %s", e)
             # ตรวจสอบว่าเป็นข้อผิดพลาดเกี่ยวกับการปิดการเชื่อมต่อหรือไม่
             if "WebSocket is not connected" in str(e) and websocket in self.active_connections:
-                print("⚠️ พบ WebSocket ที่ไม่ได้เชื่อมต่อแล้วในรายการ active_connections - กำลังลบออก")
+                logger.warning("⚠️ พบ WebSocket ที่ไม่ได้เชื่อมต่อแล้วในรายการ active_connections - กำลังลบออก")
                 self.disconnect(websocket)
     
     async def listen_for_messages(self):
         """ตรวจสอบข้อความใหม่จาก Redis PubSub และส่งไปยัง clients"""
+        pubsub = self.redis_pubsub
         try:
             while True:
-                if not redis_connected or self.redis_pubsub is None:
-                    print("⚠️ Redis ไม่ได้เชื่อมต่อ - รอก่อนจะลองอีกครั้ง")
+                if not redis_connected or pubsub is None:
+                    logger.warning("⚠️ Redis ไม่ได้เชื่อมต่อ - รอก่อนจะลองอีกครั้ง")
                     await asyncio.sleep(5)
                     # พยายามเชื่อมต่อกับ Redis อีกครั้ง
                     if connect_to_redis() and redis_connected:
                         try:
-                            self.redis_pubsub = redis_client.pubsub()
-                            self.redis_pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
-                            print(f"📢 เริ่มต้น Redis PubSub listener สำหรับช่อง {REDIS_SIGNAL_CHANNEL} อีกครั้ง")
+                            pubsub = self.redis_pubsub = get_async_redis_client(decode_responses=True).pubsub()
+                            await pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+                            logger.info("📢 เริ่มต้น Redis PubSub listener สำหรับช่อง %s อีกครั้ง", REDIS_SIGNAL_CHANNEL)
                         except Exception as e:
-                            print(f"❌ ไม่สามารถเริ่ม Redis PubSub ได้: {e}")
+                            logger.error("❌ ไม่สามารถเริ่ม Redis PubSub ได้: %s", e)
                     continue
                     
                 try:
-                    message = self.redis_pubsub.get_message(ignore_subscribe_messages=True)
+                    # redis.asyncio รอข้อความได้โดยไม่บล็อก event loop
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
                     if message and message['type'] == 'message':
-                        print(f"📬 ได้รับข้อความใหม่จาก Redis ช่อง {message.get('channel')}")
+                        logger.debug("📬 ได้รับข้อความใหม่จาก Redis ช่อง %s", message.get('channel'))
                         await self.broadcast(message['data'])
                 except redis.RedisError as e:
-                    print(f"⚠️ เกิดข้อผิดพลาด Redis ในการรับข้อความ: {e}")
+                    logger.warning("⚠️ เกิดข้อผิดพลาด Redis ในการรับข้อความ: %s", e)
                     await asyncio.sleep(5)  # รอก่อนลองอีกครั้ง
                 except Exception as e:
-                    print(f"❌ เกิดข้อผิดพลาดไม่ทราบสาเหตุในการรับข้อความ: {e}")
-                
-                await asyncio.sleep(0.01)  # ลดการใช้ CPU
+                    logger.error("❌ เกิดข้อผิดพลาดไม่ทราบสาเหตุในการรับข้อความ: %s", e)
         except asyncio.CancelledError:
             # ถูกยกเลิกเมื่อไม่มีผู้ใช้เชื่อมต่อแล้ว
-            print("🛑 Redis listener ถูกยกเลิก")
+            logger.info("🛑 Redis listener ถูกยกเลิก")
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดใน WebSocket listener: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดใน WebSocket listener: %s", e)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception as e:
+                    logger.warning("⚠️ ไม่สามารถยกเลิกการสมัครสมาชิก Redis PubSub ได้: %s", e)
             
     async def send_heartbeats(self):
         """ส่ง heartbeat ไปยัง clients เพื่อรักษาการเชื่อมต่อ"""
@@ -278,7 +326,7 @@ class ConnectionManager:
                         await connection.send_json({"type": "heartbeat", "timestamp": int(datetime.now().timestamp())})
                     except Exception as e:
                         # หากไม่สามารถส่งได้ แสดงว่า connection อาจถูกปิดไปแล้ว
-                        print(f"⚠️ ไม่สามารถส่ง heartbeat ได้: {e}")
+                        logger.warning("⚠️ ไม่สามารถส่ง heartbeat ได้: %s", e)
                         disconnected_websockets.append(connection)
                 
                 # ลบ connections ที่ไม่สามารถส่ง heartbeat ได้
@@ -287,19 +335,19 @@ class ConnectionManager:
                         self.disconnect(ws)
                 
                 if self.active_connections and not disconnected_websockets:
-                    print(f"💓 ส่ง heartbeat ไปยัง {len(self.active_connections)} connections")
+                    logger.debug("💓 ส่ง heartbeat ไปยัง %s connections", len(self.active_connections))
                 
                 # รอ 30 วินาทีก่อนส่ง heartbeat ครั้งต่อไป
                 await asyncio.sleep(30)
         except asyncio.CancelledError:
-            print("💓 ยกเลิก heartbeat task")
+            logger.info("💓 ยกเลิก heartbeat task")
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดใน heartbeat system: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดใน heartbeat system: %s", e)
             # พยายามรีสตาร์ท heartbeat task
             await asyncio.sleep(10)
             if self.active_connections:
                 self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
-                print("💓 รีสตาร์ท heartbeat system")
+                logger.info("💓 รีสตาร์ท heartbeat system")
 
 # สร้าง Connection Manager
 manager = ConnectionManager()
@@ -321,6 +369,95 @@ async def root():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/api/system/redis-pool")
+async def get_redis_pool_status():
+    """
+    ดึงสถิติการใช้งาน Redis connection pool (ถูกยืม, กำลังรอ, สร้างแล้ว, timeout)
+    ใช้สำหรับปรับขนาด REDIS_MAX_CONNECTIONS ให้เหมาะกับโหลดจริง
+    """
+    return {
+        "pools": get_redis_pool_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+REDIS_POOL_CONNECTIONS = registry.gauge("redis_pool_connections", "Redis connection pool statistics", ("pool", "stat"))
+
+def _collect_redis_pool_stats() -> None:
+    """คัดลอกสถิติ connection pool ลง gauge ตอน scrape"""
+    for pool, stats in get_redis_pool_stats().items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                REDIS_POOL_CONNECTIONS.labels(pool, stat).set(value)
+
+registry.add_collector(_collect_redis_pool_stats)
+
+@app.get("/api/system/event-loop")
+async def get_event_loop_lag():
+    """
+    ความหน่วงของ event loop (เวลาที่ตื่นช้ากว่ากำหนดเพราะถูกบล็อกโดยโค้ดแบบ synchronous)
+    """
+    return {
+        "lag": loop_lag_monitor.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/admin/profile")
+async def admin_profile(
+    seconds: float = 10.0,
+    mode: str = "wall",
+    interval_ms: float = 10.0,
+    x_profiler_token: Optional[str] = Header(None)
+):
+    """
+    profile ทั้ง process (event loop และทุกเธรด) เป็นเวลา seconds วินาที แล้วคืน collapsed stacks
+    สำหรับสร้าง flamegraph (เช่น flamegraph.pl profile.collapsed > profile.svg หรือเปิดใน speedscope)
+    
+    ใช้ได้เมื่อตั้ง PROFILER_ENABLED=true และส่ง PROFILER_TOKEN ใน header X-Profiler-Token
+    การสุ่มทำในเธรดแยก จึงไม่บล็อก event loop และทำได้ครั้งละหนึ่งรายการ
+    """
+    if not PROFILER_ENABLED or not PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_profiler_token or not hmac.compare_digest(x_profiler_token.encode(), PROFILER_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid profiler token")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PROFILE_MODES)}")
+    if not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILER_MAX_SECONDS:g}")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    
+    try:
+        profile = await asyncio.to_thread(run_profile, seconds, mode, interval_ms / 1000, threading.get_ident())
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Another profile is already running")
+    
+    return Response(
+        profile.collapsed,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{mode}.collapsed"',
+            "X-Profile-Samples": str(profile.samples)
+        }
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """
+    เมตริกทั้งหมดของ process ในรูปแบบ Prometheus (counter, gauge, histogram ที่สะสมในหน่วยความจำ)
+    """
+    return Response(registry.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/api/latency")
+async def get_pipeline_latency():
+    """
+    ความหน่วงของแต่ละ stage ตั้งแต่เวลาเหตุการณ์ของ Binance จนส่งถึง WebSocket clients
+    (receive, flush, process, publish, broadcast) ใช้ประกอบการปรับ buffer_size/flush_interval
+    """
+    return {
+        "stages": latency_trace.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.get("/api/latest-signal")
 async def get_latest_signal(symbol: str = "BTCUSDT"):
     if symbol not in SYMBOLS:
@@ -330,19 +467,42 @@ async def get_latest_signal(symbol: str = "BTCUSDT"):
         if not redis_connected:
             raise HTTPException(status_code=503, detail="Redis service unavailable")
             
-        latest_signal = redis_client.get(f"latest_signal:{symbol}")
+        latest_signal = get_redis_client_for_symbol(symbol, decode_responses=True).get(symbol_key("latest_signal", symbol))
         
         if not latest_signal:
             return create_empty_signal(symbol)
         
         return json.loads(latest_signal)
     except redis.RedisError as e:
-        print(f"⚠️ Redis error: {e}")
+        logger.warning("⚠️ Redis error: %s", e)
         raise HTTPException(status_code=503, detail="Redis service error")
     except Exception as e:
-        print(f"❌ Error fetching latest signal: {e}")
+        logger.error("❌ Error fetching latest signal: %s", e)
         raise HTTPException(status_code=500, detail=f"Error fetching latest signal: {str(e)}")
 
+@app.get("/api/latest-signals")
+async def get_latest_signals(request: Request, symbols: Optional[str] = None):
+    """
+    ดึงสัญญาณล่าสุดของหลายสัญลักษณ์ในคำขอเดียว (MGET หนึ่งครั้งต่อ shard)
+    คืนค่า {"BTCUSDT": {...}, ...} โดยสัญลักษณ์ที่ยังไม่มีสัญญาณจะเป็น null
+    """
+    requested = parse_symbols_param(symbols)
+    
+    try:
+        if not redis_connected:
+            raise HTTPException(status_code=503, detail="Redis service unavailable")
+        
+        latest = signal_store.get_latest_many(requested)
+        
+        # ประกอบ JSON จากสตริงที่เก็บไว้โดยตรง ไม่ต้อง json.loads/json.dumps ซ้ำ
+        body = "{" + ",".join(
+            f"{json.dumps(symbol)}:{latest.get(symbol) or 'null'}" for symbol in requested
+        ) + "}"
+        return etag_json_response(body, request)
+    except redis.RedisError as e:
+        logger.warning("⚠️ Redis error: %s", e)
+        raise HTTPException(status_code=503, detail="Redis service error")
+
 @app.get("/api/history-signals")
 async def get_history_signals(symbol: str = "BTCUSDT", limit: int = 10):
     if symbol not in SYMBOLS:
@@ -352,19 +512,82 @@ async def get_history_signals(symbol: str = "BTCUSDT", limit: int = 10):
         if not redis_connected:
             raise HTTPException(status_code=503, detail="Redis service unavailable")
             
-        signals = redis_client.lrange(f"signal_history:{symbol}", 0, limit - 1)
+        signals = get_redis_client_for_symbol(symbol, decode_responses=True).lrange(symbol_key("signal_history", symbol), 0, limit - 1)
         
         if not signals or len(signals) == 0:
             return []  # Return empty array if no signals found
         
         return [json.loads(signal) for signal in signals]
     except redis.RedisError as e:
-        print(f"⚠️ Redis error: {e}")
+        logger.warning("⚠️ Redis error: %s", e)
         raise HTTPException(status_code=503, detail="Redis service error")
     except Exception as e:
-        print(f"❌ Error fetching signal history: {e}")
+        logger.error("❌ Error fetching signal history: %s", e)
         raise HTTPException(status_code=500, detail=f"Error fetching signal history: {str(e)}")
 
+@app.get("/api/history-signals/batch")
+async def get_history_signals_batch(request: Request, symbols: Optional[str] = None, limit: int = 10):
+    """
+    ดึงประวัติสัญญาณของหลายสัญลักษณ์ในคำขอเดียว (LRANGE แบบ pipeline หนึ่ง round-trip ต่อ shard)
+    คืนค่า {"BTCUSDT": [...], ...} เรียงจากใหม่ไปเก่า
+    """
+    requested = parse_symbols_param(symbols)
+    limit = max(1, min(limit, 100))
+    
+    try:
+        if not redis_connected:
+            raise HTTPException(status_code=503, detail="Redis service unavailable")
+        
+        history = signal_store.get_history_many(requested, limit)
+        
+        body = "{" + ",".join(
+            f"{json.dumps(symbol)}:[{','.join(history.get(symbol) or [])}]" for symbol in requested
+        ) + "}"
+        return etag_json_response(body, request)
+    except redis.RedisError as e:
+        logger.warning("⚠️ Redis error: %s", e)
+        raise HTTPException(status_code=503, detail="Redis service error")
+
+def _resolve_range(start: Optional[int], end: Optional[int]) -> tuple:
+    """ช่วงเวลา (ms) จากพารามิเตอร์ start/end (ค่าเริ่มต้นคือ 24 ชั่วโมงล่าสุด ถึงนาทีปัจจุบัน)"""
+    if end is None:
+        now_ms = int(datetime.now().timestamp() * 1000)
+        end = now_ms - now_ms % 60_000
+    if start is None:
+        start = end - 86_400_000
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be earlier than end")
+    return start, end
+
+@app.get("/api/gaps")
+async def get_candle_gaps(symbols: Optional[str] = None, start: Optional[int] = None, end: Optional[int] = None):
+    """
+    ช่วงเวลาที่ไม่มีแท่ง 1m ใน InfluxDB (ตามดัชนีช่วงข้อมูล ไม่ต้องสแกนข้อมูล)
+    start/end เป็น ms คืนค่า {"BTCUSDT": {"complete": ..., "missing_minutes": ..., "gaps": [...]}, ...}
+    """
+    requested = parse_symbols_param(symbols)
+    start, end = _resolve_range(start, end)
+    coverage = get_influxdb_storage().coverage
+    
+    result = {}
+    for symbol in requested:
+        gaps = coverage.gaps(symbol, start, end)
+        result[symbol] = {
+            "complete": not gaps,
+            "missing_minutes": sum(gap_end - gap_start for gap_start, gap_end in gaps) // 60_000,
+            "gaps": [{"start": gap_start, "end": gap_end} for gap_start, gap_end in gaps],
+        }
+    return {"start": start, "end": end, "symbols": result}
+
+@app.post("/api/gaps/repair")
+async def repair_candle_gaps(background_tasks: BackgroundTasks, symbols: Optional[str] = None,
+                             start: Optional[int] = None, end: Optional[int] = None):
+    """เติมแท่งที่ขาดจาก Binance REST API ในเบื้องหลัง (เฉพาะ chunk ที่มีช่วงขาด)"""
+    requested = parse_symbols_param(symbols)
+    start, end = _resolve_range(start, end)
+    background_tasks.add_task(repair_gaps, requested, start, end, BinanceRestSource())
+    return {"status": "scheduled", "symbols": requested, "start": start, "end": end}
+
 @app.get("/available-symbols")
 async def get_available_symbols():
     """ดึงรายการสัญลักษณ์ที่มีให้บริการ"""
@@ -379,7 +602,7 @@ async def get_latest_indicators(symbol: str = "BTCUSDT"):
         if not redis_connected:
             raise HTTPException(status_code=503, detail="Redis service unavailable")
         
-        latest_signal = redis_client.get(f"latest_signal:{symbol}")
+        latest_signal = get_redis_client_for_symbol(symbol, decode_responses=True).get(symbol_key("latest_signal", symbol))
         
         if not latest_signal:
             empty = create_empty_signal(symbol)
@@ -393,10 +616,10 @@ async def get_latest_indicators(symbol: str = "BTCUSDT"):
             empty = create_empty_signal(symbol)
             return {"symbol": symbol, "indicators": empty["indicators"]}
     except redis.RedisError as e:
-        print(f"⚠️ Redis error: {e}")
+        logger.warning("⚠️ Redis error: %s", e)
         raise HTTPException(status_code=503, detail="Redis service error")
     except Exception as e:
-        print(f"❌ Error fetching latest indicators: {e}")
+        logger.error("❌ Error fetching latest indicators: %s", e)
         raise HTTPException(status_code=500, detail=f"Error fetching latest indicators: {str(e)}")
 
 # API endpoints สำหรับจัดการสัญลักษณ์คริปโต
@@ -517,6 +740,50 @@ async def remove_symbol(request: SymbolRequest, background_tasks: BackgroundTask
             symbols=env.get_available_symbols()
         )
 
+# API endpoints สำหรับกฎการแจ้งเตือนรายผู้ใช้
+@app.get("/api/alert-rules")
+async def list_alert_rules(user_id: Optional[str] = None):
+    """
+    ดึงกฎการแจ้งเตือนทั้งหมด หรือเฉพาะของผู้ใช้ที่ระบุ
+    """
+    try:
+        rules = await asyncio.to_thread(AlertRuleStore().list, user_id)
+        return {"rules": [asdict(rule) for rule in rules]}
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail="Redis service error")
+
+@app.post("/api/alert-rules")
+async def create_alert_rule(request: AlertRuleRequest):
+    """
+    สร้างกฎการแจ้งเตือนใหม่ (บริการแจ้งเตือนจะโหลดกฎใหม่ภายใน ALERT_RULES_REFRESH_SECONDS)
+    
+    Args:
+        request: เงื่อนไขและปลายทางของกฎ
+        
+    Returns:
+        กฎที่บันทึกแล้วพร้อม rule_id
+    """
+    try:
+        rule = await asyncio.to_thread(AlertRuleStore().save, AlertRule(**request.dict()))
+        return asdict(rule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail="Redis service error")
+
+@app.delete("/api/alert-rules/{rule_id}")
+async def delete_alert_rule(rule_id: str):
+    """
+    ลบกฎการแจ้งเตือน
+    """
+    try:
+        deleted = await asyncio.to_thread(AlertRuleStore().delete, rule_id)
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail="Redis service error")
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"No alert rule {rule_id}")
+    return {"deleted": rule_id}
+
 # ฟังก์ชันสำหรับรีสตาร์ท WebSocket client
 async def restart_websocket_client():
     """รีสตาร์ท Binance WebSocket client เพื่อปรับปรุงรายการสัญลักษณ์ที่ติดตาม"""
@@ -532,10 +799,10 @@ async def restart_websocket_client():
         asyncio.create_task(app.ws_client.start_kline_streams())
         
         # บันทึกการทำงาน
-        logger.info(f"รีสตาร์ท WebSocket client สำเร็จ กับสัญลักษณ์: {', '.join(SYMBOLS)}")
+        logger.info("รีสตาร์ท WebSocket client สำเร็จ กับสัญลักษณ์: %s", ', '.join(SYMBOLS))
         
     except Exception as e:
-        logger.error(f"เกิดข้อผิดพลาดในการรีสตาร์ท WebSocket client: {e}")
+        logger.error("เกิดข้อผิดพลาดในการรีสตาร์ท WebSocket client: %s", e)
 
 @app.websocket("/ws/signals")
 async def websocket_endpoint(websocket: WebSocket):
@@ -555,17 +822,17 @@ async def websocket_endpoint(websocket: WebSocket):
                     
                     try:
                         client_message = json.loads(data)
-                        print(f"📩 ได้รับข้อความจาก WebSocket client: {client_message}")
+                        logger.debug("📩 ได้รับข้อความจาก WebSocket client: %s", client_message)
                         
                         # จัดการกับ pong จาก client
                         if client_message.get('type') == 'pong':
-                            print(f"💓 ได้รับ pong จาก client เวลา {datetime.fromtimestamp(client_message.get('timestamp', 0)).strftime('%H:%M:%S')}")
+                            logger.debug("💓 ได้รับ pong จาก client เวลา %s", datetime.fromtimestamp(client_message.get('timestamp', 0)).strftime('%H:%M:%S'))
                             continue
                         
                         # ตรวจสอบการสมัครสมาชิก
                         if 'subscribe' in client_message:
                             symbol = client_message['subscribe']
-                            print(f"👂 Client ต้องการสมัครสมาชิกสำหรับ {symbol}")
+                            logger.info("👂 Client ต้องการสมัครสมาชิกสำหรับ %s", symbol)
                             
                             # บันทึกการสมัครสมาชิกของ client นี้
                             if websocket in manager.client_subscriptions:
@@ -574,7 +841,7 @@ async def websocket_endpoint(websocket: WebSocket):
                             if symbol in SYMBOLS and websocket in manager.active_connections:
                                 try:
                                     # ส่งข้อมูลล่าสุด
-                                    latest_signal = redis_client.get(f"latest_signal:{symbol}")
+                                    latest_signal = get_redis_client_for_symbol(symbol, decode_responses=True).get(symbol_key("latest_signal", symbol))
                                     if latest_signal:
                                         await manager.send_to_client(websocket, json.loads(latest_signal))
                                     else:
@@ -583,12 +850,12 @@ async def websocket_endpoint(websocket: WebSocket):
                                 except WebSocketDisconnect:
                                     raise
                                 except Exception as e:
-                                    print(f"⚠️ เกิดข้อผิดพลาดในการส่งข้อมูลสำหรับ {symbol}: {e}")
+                                    logger.warning("⚠️ เกิดข้อผิดพลาดในการส่งข้อมูลสำหรับ %s: %s", symbol, e)
 
                     except json.JSONDecodeError:
-                        print("⚠️ ได้รับข้อมูลที่ไม่ใช่ JSON ที่ถูกต้องจาก client")
+                        logger.warning("⚠️ ได้รับข้อมูลที่ไม่ใช่ JSON ที่ถูกต้องจาก client")
                     except Exception as e:
-                        print(f"❌ เกิดข้อผิดพลาดในการประมวลผลข้อความจาก client: {e}")
+                        logger.error("❌ เกิดข้อผิดพลาดในการประมวลผลข้อความจาก client: %s", e)
                         if "WebSocket is not connected" in str(e):
                             raise WebSocketDisconnect()
 
@@ -604,14 +871,14 @@ async def websocket_endpoint(websocket: WebSocket):
                     raise
 
         except WebSocketDisconnect:
-            print("🔌 WebSocket client ยกเลิกการเชื่อมต่อ")
+            logger.info("🔌 WebSocket client ยกเลิกการเชื่อมต่อ")
         finally:
             # ตรวจสอบว่า websocket ยังอยู่ในรายการ active_connections หรือไม่ก่อนเรียก disconnect
             if websocket in manager.active_connections:
                 manager.disconnect(websocket)
 
     except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดไม่ทราบสาเหตุใน WebSocket endpoint: {e}")
+        logger.error("❌ เกิดข้อผิดพลาดไม่ทราบสาเหตุใน WebSocket endpoint: %s", e)
         # ตรวจสอบว่า websocket ยังอยู่ในรายการ active_connections หรือไม่ก่อนเรียก disconnect
         if websocket in manager.active_connections:
             manager.disconnect(websocket)
@@ -625,7 +892,7 @@ async def depth_websocket_endpoint(websocket: WebSocket, symbol: str):
     try:
         # ยอมรับการเชื่อมต่อ
         await websocket.accept()
-        print(f"WebSocket connection accepted for depth/{symbol}")
+        logger.info("WebSocket connection accepted for depth/%s", symbol)
         
         # ตรวจสอบว่าสัญลักษณ์นี้สนับสนุนหรือไม่
         if symbol.upper() not in SYMBOLS:
@@ -661,7 +928,7 @@ async def depth_websocket_endpoint(websocket: WebSocket, symbol: str):
                         try:
                             client_data = json.loads(client_msg)
                             if client_data.get('type') == 'pong':
-                                print(f"Received pong from client for depth/{symbol}")
+                                logger.debug("Received pong from client for depth/%s", symbol)
                         except json.JSONDecodeError:
                             pass
                     except asyncio.TimeoutError:
@@ -671,16 +938,16 @@ async def depth_websocket_endpoint(websocket: WebSocket, symbol: str):
                     await asyncio.sleep(1.0)
                     
                 except asyncio.CancelledError:
-                    print(f"Task for depth/{symbol} was cancelled")
+                    logger.info("Task for depth/%s was cancelled", symbol)
                     break
                     
         except WebSocketDisconnect:
-            print(f"WebSocket client for depth/{symbol} disconnected")
+            logger.info("WebSocket client for depth/%s disconnected", symbol)
         except Exception as e:
-            print(f"Error handling depth WebSocket for {symbol}: {e}")
+            logger.error("Error handling depth WebSocket for %s: %s", symbol, e)
             
     except Exception as e:
-        print(f"Error in depth WebSocket endpoint for {symbol}: {e}")
+        logger.error("Error in depth WebSocket endpoint for %s: %s", symbol, e)
         try:
             await websocket.close()
         except:
@@ -695,7 +962,7 @@ async def trades_websocket_endpoint(websocket: WebSocket, symbol: str):
     try:
         # ยอมรับการเชื่อมต่อ
         await websocket.accept()
-        print(f"WebSocket connection accepted for trades/{symbol}")
+        logger.info("WebSocket connection accepted for trades/%s", symbol)
         
         # ตรวจสอบว่าสัญลักษณ์นี้สนับสนุนหรือไม่
         if symbol.upper() not in SYMBOLS:
@@ -737,16 +1004,16 @@ async def trades_websocket_endpoint(websocket: WebSocket, symbol: str):
                     await asyncio.sleep(2.0)
                     
                 except asyncio.CancelledError:
-                    print(f"Task for trades/{symbol} was cancelled")
+                    logger.info("Task for trades/%s was cancelled", symbol)
                     break
                     
         except WebSocketDisconnect:
-            print(f"WebSocket client for trades/{symbol} disconnected")
+            logger.info("WebSocket client for trades/%s disconnected", symbol)
         except Exception as e:
-            print(f"Error handling trades WebSocket for {symbol}: {e}")
+            logger.error("Error handling trades WebSocket for %s: %s", symbol, e)
             
     except Exception as e:
-        print(f"Error in trades WebSocket endpoint for {symbol}: {e}")
+        logger.error("Error in trades WebSocket endpoint for %s: %s", symbol, e)
         try:
             await websocket.close()
         except:
@@ -761,7 +1028,7 @@ async def kline_websocket_endpoint(websocket: WebSocket, symbol: str):
     try:
         # ยอมรับการเชื่อมต่อ
         await websocket.accept()
-        print(f"WebSocket connection accepted for kline/{symbol}")
+        logger.info("WebSocket connection accepted for kline/%s", symbol)
         
         # ตรวจสอบว่าสัญลักษณ์นี้สนับสนุนหรือไม่
         if symbol.upper() not in SYMBOLS:
@@ -847,16 +1114,16 @@ async def kline_websocket_endpoint(websocket: WebSocket, symbol: str):
                     await asyncio.sleep(5.0)
                     
                 except asyncio.CancelledError:
-                    print(f"Task for kline/{symbol} was cancelled")
+                    logger.info("Task for kline/%s was cancelled", symbol)
                     break
                     
         except WebSocketDisconnect:
-            print(f"WebSocket client for kline/{symbol} disconnected")
+            logger.info("WebSocket client for kline/%s disconnected", symbol)
         except Exception as e:
-            print(f"Error handling kline WebSocket for {symbol}: {e}")
+            logger.error("Error handling kline WebSocket for %s: %s", symbol, e)
             
     except Exception as e:
-        print(f"Error in kline WebSocket endpoint for {symbol}: {e}")
+        logger.error("Error in kline WebSocket endpoint for %s: %s", symbol, e)
         try:
             await websocket.close()
         except:
@@ -870,26 +1137,26 @@ async def start_binance_client():
     
     while retry_count < max_retries:
         try:
-            print("🚀 กำลังเริ่มต้น Binance WebSocket client...")
+            logger.info("🚀 กำลังเริ่มต้น Binance WebSocket client...")
             client = BinanceWebSocketClient()
             connected = await client.connect()
             
             if connected and client.is_running:
-                print("✅ เชื่อมต่อกับ Binance WebSocket สำเร็จ")
+                logger.info("✅ เชื่อมต่อกับ Binance WebSocket สำเร็จ")
                 await client.start_kline_streams()
                 
                 # ทำงานต่อไปจนกว่าจะถูกยกเลิก
                 while client.is_running:
                     await asyncio.sleep(60)
             else:
-                print("⚠️ ไม่สามารถเชื่อมต่อกับ Binance WebSocket ได้")
+                logger.warning("⚠️ ไม่สามารถเชื่อมต่อกับ Binance WebSocket ได้")
                 await asyncio.sleep(10)  # รอก่อนลองอีกครั้ง
                 retry_count += 1
         except asyncio.CancelledError:
-            print("🛑 ยกเลิกการทำงานของ Binance client")
+            logger.info("🛑 ยกเลิกการทำงานของ Binance client")
             break
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดใน Binance client: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดใน Binance client: %s", e)
             await asyncio.sleep(10)  # รอก่อนลองอีกครั้ง
             retry_count += 1
         finally:
@@ -897,34 +1164,33 @@ async def start_binance_client():
                 if 'client' in locals() and client:
                     await client.close()
             except Exception as e:
-                print(f"⚠️ เกิดข้อผิดพลาดในการปิด Binance client: {e}")
+                logger.warning("⚠️ เกิดข้อผิดพลาดในการปิด Binance client: %s", e)
     
-    print("⚠️ ไม่สามารถเริ่มต้น Binance client ได้หลังจากพยายามซ้ำหลายครั้ง")
+    logger.warning("⚠️ ไม่สามารถเริ่มต้น Binance client ได้หลังจากพยายามซ้ำหลายครั้ง")
 
 # ฟังก์ชันที่ตรวจสอบข้อมูล kline ใหม่และสร้างสัญญาณ
 async def process_kline_data():
     """รับข้อมูล kline จาก Redis PubSub และสร้างสัญญาณ"""
     if not redis_connected:
-        print("⚠️ ไม่สามารถเริ่มกระบวนการประมวลผลข้อมูล kline ได้ - Redis ไม่ได้เชื่อมต่อ")
+        logger.warning("⚠️ ไม่สามารถเริ่มกระบวนการประมวลผลข้อมูล kline ได้ - Redis ไม่ได้เชื่อมต่อ")
         return
     
+    pubsub = get_async_redis_client(decode_responses=True).pubsub()
     try:
-        pubsub = redis_client.pubsub()
-        
         # สมัครสมาชิกช่องสำหรับทุกสัญลักษณ์
         for symbol in SYMBOLS:
             channel = f"{REDIS_KLINE_CHANNEL_PREFIX}{symbol}:2m"
-            pubsub.subscribe(channel)
-            print(f"👂 สมัครสมาชิก Redis ช่อง {channel}")
+            await pubsub.subscribe(channel)
+            logger.info("👂 สมัครสมาชิก Redis ช่อง %s", channel)
         
         while True:
             if not redis_connected:
-                print("⚠️ Redis ไม่ได้เชื่อมต่อ - หยุดประมวลผลข้อมูล kline ชั่วคราว")
+                logger.warning("⚠️ Redis ไม่ได้เชื่อมต่อ - หยุดประมวลผลข้อมูล kline ชั่วคราว")
                 await asyncio.sleep(10)
                 continue
                 
             try:
-                message = pubsub.get_message(ignore_subscribe_messages=True)
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
                 
                 if message and message['type'] == 'message':
                     try:
@@ -940,127 +1206,165 @@ async def process_kline_data():
                         if len(parts) >= 3:
                             symbol = parts[2].split(":")[0]  # ดึงสัญลักษณ์จากชื่อช่อง
                             
+                            # แท่งที่ได้รับแท่ง 1m ไม่ครบ (ข้อมูลขาดกลางแท่ง) ไม่นำมาสร้างสัญญาณ
+                            if data.get('partial'):
+                                logger.warning("⚠️ ข้ามแท่ง %s ของ %s ที่ข้อมูลไม่ครบ (%s แท่ง 1m)", channel_str, symbol, data.get('count'))
                             # เพิ่มการตรวจสอบว่า symbol อยู่ใน SYMBOLS หรือไม่
-                            if symbol in SYMBOLS:
+                            elif symbol in SYMBOLS:
                                 # ประมวลผลข้อมูลและสร้างสัญญาณ
-                                print(f"📊 ได้รับข้อมูล kline ใหม่สำหรับ {symbol}")
+                                logger.debug("📊 ได้รับข้อมูล kline ใหม่สำหรับ %s", symbol)
                                 signal = signal_processor.process_market_data(symbol, data)
                                 
                                 if signal:
-                                    print(f"📊 สร้างสัญญาณใหม่: {signal['category']} สำหรับ {symbol}")
+                                    logger.info("📊 สร้างสัญญาณใหม่: %s สำหรับ %s", signal['category'], symbol)
                                     
                                     # ตรวจสอบว่าสัญญาณถูกบันทึกไปยัง Redis หรือไม่
                                     try:
-                                        latest_signal = redis_client.get(f"latest_signal:{symbol}")
+                                        latest_signal = get_redis_client_for_symbol(symbol, decode_responses=True).get(symbol_key("latest_signal", symbol))
                                         if latest_signal:
-                                            print(f"✅ บันทึกสัญญาณล่าสุดสำหรับ {symbol} สำเร็จ")
+                                            logger.debug("✅ บันทึกสัญญาณล่าสุดสำหรับ %s สำเร็จ", symbol)
                                         else:
-                                            print(f"⚠️ ไม่พบการบันทึกสัญญาณล่าสุดสำหรับ {symbol}")
+                                            logger.warning("⚠️ ไม่พบการบันทึกสัญญาณล่าสุดสำหรับ %s", symbol)
                                     except Exception as e:
-                                        print(f"⚠️ ไม่สามารถตรวจสอบสัญลักษณ์ล่าสุดได้: {e}")
+                                        logger.warning("⚠️ ไม่สามารถตรวจสอบสัญลักษณ์ล่าสุดได้: %s", e)
                             else:
-                                print(f"⚠️ ได้รับข้อมูลสำหรับสัญลักษณ์ที่ไม่รู้จัก: {symbol}")
+                                logger.warning("⚠️ ได้รับข้อมูลสำหรับสัญลักษณ์ที่ไม่รู้จัก: %s", symbol)
                         else:
-                            print(f"⚠️ รูปแบบช่อง Redis ไม่ถูกต้อง: {channel_str}")
+                            logger.warning("⚠️ รูปแบบช่อง Redis ไม่ถูกต้อง: %s", channel_str)
                             
                     except json.JSONDecodeError as e:
-                        print(f"⚠️ ไม่สามารถแปลงข้อความเป็น JSON ได้: {e}")
+                        logger.warning("⚠️ ไม่สามารถแปลงข้อความเป็น JSON ได้: %s", e)
                     except Exception as e:
-                        print(f"❌ เกิดข้อผิดพลาดในการประมวลผลข้อความ: {e}")
+                        logger.error("❌ เกิดข้อผิดพลาดในการประมวลผลข้อความ: %s", e)
             except redis.RedisError as e:
-                print(f"⚠️ เกิดข้อผิดพลาด Redis ในการรับข้อความ: {e}")
+                logger.warning("⚠️ เกิดข้อผิดพลาด Redis ในการรับข้อความ: %s", e)
                 await asyncio.sleep(5)  # รอก่อนลองอีกครั้ง
             except Exception as e:
-                print(f"❌ เกิดข้อผิดพลาดในการรับข้อความ: {e}")
+                logger.error("❌ เกิดข้อผิดพลาดในการรับข้อความ: %s", e)
                 await asyncio.sleep(5)  # รอก่อนลองอีกครั้ง
-            
-            await asyncio.sleep(0.01)  # ลดการใช้ CPU
     except asyncio.CancelledError:
         # หยุดการทำงานเมื่อแอปถูกปิด
-        try:
-            pubsub.unsubscribe()
-        except Exception as e:
-            print(f"⚠️ เกิดข้อผิดพลาดในการยกเลิกการสมัครสมาชิก: {e}")
-        print("🛑 กระบวนการประมวลผลข้อมูล kline ถูกยกเลิก")
+        logger.info("🛑 กระบวนการประมวลผลข้อมูล kline ถูกยกเลิก")
     except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดในตัวประมวลผลข้อมูล: {e}")
+        logger.error("❌ เกิดข้อผิดพลาดในตัวประมวลผลข้อมูล: %s", e)
+    finally:
         try:
-            pubsub.unsubscribe()
-        except Exception as unsub_err:
-            print(f"⚠️ เกิดข้อผิดพลาดในการยกเลิกการสมัครสมาชิก: {unsub_err}")
+            await pubsub.aclose()
+        except Exception as e:
+            logger.warning("⚠️ เกิดข้อผิดพลาดในการยกเลิกการสมัครสมาชิก: %s", e)
 
 # ฟังก์ชันเริ่มต้น Notification Service ในพื้นหลัง
 async def start_notification_service():
     """เริ่มต้นบริการแจ้งเตือนในพื้นหลัง"""
     if not redis_connected:
-        print("⚠️ ไม่สามารถเริ่มบริการแจ้งเตือนได้ - Redis ไม่ได้เชื่อมต่อ")
+        logger.warning("⚠️ ไม่สามารถเริ่มบริการแจ้งเตือนได้ - Redis ไม่ได้เชื่อมต่อ")
         return
         
     try:
-        print("📱 กำลังเริ่มต้นบริการแจ้งเตือน...")
+        logger.info("📱 กำลังเริ่มต้นบริการแจ้งเตือน...")
         notification_service = NotificationService()
+        notification_service.start_outbox_worker()
         
         try:
             pubsub = notification_service.pubsub
-            print("👂 บริการแจ้งเตือนกำลังฟังข้อความ...")
+            await pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+            logger.info("👂 บริการแจ้งเตือนกำลังฟังข้อความ...")
             
             while True:
                 if not redis_connected:
-                    print("⚠️ Redis ไม่ได้เชื่อมต่อ - หยุดบริการแจ้งเตือนชั่วคราว")
+                    logger.warning("⚠️ Redis ไม่ได้เชื่อมต่อ - หยุดบริการแจ้งเตือนชั่วคราว")
                     await asyncio.sleep(10)
                     continue
                     
                 try:
-                    message = pubsub.get_message(ignore_subscribe_messages=True)
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
                     if message:
-                        print(f"📣 ได้รับข้อความใหม่สำหรับการแจ้งเตือน")
-                        notification_service.process_message(message)
+                        logger.debug("📣 ได้รับข้อความใหม่สำหรับการแจ้งเตือน")
+                        # ส่งทุกช่องทางพร้อมกันใน task เบื้องหลัง ไม่บล็อก event loop
+                        await notification_service.process_message_async(message)
                 except redis.RedisError as e:
-                    print(f"⚠️ เกิดข้อผิดพลาด Redis ในบริการแจ้งเตือน: {e}")
+                    logger.warning("⚠️ เกิดข้อผิดพลาด Redis ในบริการแจ้งเตือน: %s", e)
                     await asyncio.sleep(5)
-                    
-                await asyncio.sleep(0.01)  # ลดการใช้ CPU
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในบริการแจ้งเตือน: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดในบริการแจ้งเตือน: %s", e)
     except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดในการเริ่มบริการแจ้งเตือน: {e}")
+        logger.error("❌ เกิดข้อผิดพลาดในการเริ่มบริการแจ้งเตือน: %s", e)
     finally:
         try:
+            if 'notification_service' in locals():
+                await notification_service.aclose()
             if 'pubsub' in locals():
-                pubsub.unsubscribe()
+                await pubsub.aclose()
         except Exception as e:
-            print(f"⚠️ เกิดข้อผิดพลาดในการยกเลิกการสมัครสมาชิกของบริการแจ้งเตือน: {e}")
+            logger.warning("⚠️ เกิดข้อผิดพลาดในการยกเลิกการสมัครสมาชิกของบริการแจ้งเตือน: %s", e)
 
 @app.on_event("startup")
 async def startup_event():
     """เริ่มต้นงานพื้นหลังเมื่อแอปเริ่มต้น"""
-    global redis_connected
+    global redis_connected, loop_lag_task
+    
+    logger.info("🚀 กำลังเริ่มต้น API server...")
     
-    print("🚀 กำลังเริ่มต้น API server...")
+    # วัดความหน่วงของ event loop ตลอดอายุของแอป (ดูที่ /api/system/event-loop และ /metrics)
+    loop_lag_task = asyncio.create_task(loop_lag_monitor.run())
     
     # ตรวจสอบการเชื่อมต่อ Redis อีกครั้ง
     if not redis_connected:
         redis_connected = connect_to_redis()
     
+    # สร้าง bucket ที่ยังไม่มีและ task compaction ของ InfluxDB ในเธรดแยก (ไม่บล็อกการเริ่มต้น)
+    if env.get_influxdb_config()["auto_provision"]:
+        asyncio.get_running_loop().run_in_executor(None, get_influxdb_storage().provision_storage)
+    
     # เริ่มเก็บข้อมูลจาก Binance WebSocket
     asyncio.create_task(start_binance_client())
-    print("✅ เริ่มต้น task Binance WebSocket client แล้ว")
+    logger.info("✅ เริ่มต้น task Binance WebSocket client แล้ว")
+    
+    # เติมประวัติราคาจากแท่งที่บันทึกไว้ก่อนเริ่มประมวลผล เพื่อให้สร้างสัญญาณได้ทันทีหลังรีสตาร์ท
+    try:
+        await asyncio.wait_for(warm_start(signal_processor, SYMBOLS), timeout=WARM_START_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️ เติมประวัติราคาไม่เสร็จภายใน %s วินาที จะเริ่มจากข้อมูลสด", WARM_START_TIMEOUT)
+    except Exception as e:
+        logger.warning("⚠️ ไม่สามารถเติมประวัติราคาได้: %s", e)
     
     # เริ่มประมวลผลข้อมูลเพื่อสร้างสัญญาณ
     asyncio.create_task(process_kline_data())
-    print("✅ เริ่มต้น task ประมวลผลข้อมูล kline แล้ว")
+    logger.info("✅ เริ่มต้น task ประมวลผลข้อมูล kline แล้ว")
     
     # เริ่มบริการแจ้งเตือน
     asyncio.create_task(start_notification_service())
-    print("✅ เริ่มต้น task บริการแจ้งเตือนแล้ว")
+    logger.info("✅ เริ่มต้น task บริการแจ้งเตือนแล้ว")
     
-    print("🌟 API server เริ่มต้นเสร็จสมบูรณ์")
+    logger.info("🌟 API server เริ่มต้นเสร็จสมบูรณ์")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """จัดการการปิดแอปอย่างสะอาด"""
     # ทาสคงจะถูกยกเลิกโดยอัตโนมัติเมื่อแอปถูกปิด
-    print("⏹️ กำลังปิดแอป...")
+    logger.info("⏹️ กำลังปิดแอป...")
+    
+    if loop_lag_task is not None:
+        loop_lag_task.cancel()
+        try:
+            await loop_lag_task
+        except asyncio.CancelledError:
+            pass
+    
+    # ปิด redis.asyncio pools ที่ PubSub listener และ WebSocket streams ใช้ร่วมกัน
+    try:
+        await close_async_redis()
+    except Exception as e:
+        logger.warning("⚠️ ไม่สามารถปิด Redis async pools ได้: %s", e)
+    
+    # flush batch ที่ค้างและปิด InfluxDBStorage ที่ใช้ร่วมกันทั้ง process เพียงครั้งเดียวที่นี่
+    # (close() รอ write API ส่งข้อมูลที่ค้าง จึงเรียกในเธรดแยกเพื่อไม่บล็อก event loop)
+    storage = get_influxdb_storage()
+    try:
+        await storage.aclose()
+        await asyncio.to_thread(storage.close)
+    except Exception as e:
+        logger.warning("⚠️ ไม่สามารถปิดการเชื่อมต่อ InfluxDB ได้: %s", e)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
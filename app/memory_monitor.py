@@ -11,6 +11,7 @@ import weakref
 
 from .redis_manager import get_redis_client
 from .logger import LoggerFactory, MetricsLogger
+from .cache_manager import cache_manager, NON_ESSENTIAL_CACHE_PATTERNS
 
 @dataclass
 class MemoryThresholds:
@@ -277,14 +278,11 @@ class MemoryMonitor:
         gc.collect()
         gc.collect()  # Second pass
         
-        # Clear any caches
-        if self.redis:
-            try:
-                # Clear non-essential caches
-                self.redis.delete('market_data:cache:*')
-                self.redis.delete('technical_indicators:cache:*')
-            except redis.RedisError as e:
-                self.logger.error(f"Failed to clear Redis caches: {e}")
+        # Clear non-essential caches in the background (SCAN + UNLINK, rate-limited)
+        try:
+            cache_manager.schedule_cleanup(NON_ESSENTIAL_CACHE_PATTERNS)
+        except Exception as e:
+            self.logger.error(f"Failed to schedule Redis cache cleanup: {e}")
         
         # Record action
         self.metrics.record_metric('memory_action', {
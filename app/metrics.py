@@ -0,0 +1,236 @@
+"""
+metrics.py - registry ของเมตริก (counter, gauge, histogram) ที่สะสมในหน่วยความจำ
+
+การบันทึกบน hot path เป็นเพียงการบวกตัวเลขภายใต้ lock ไม่มีการ format หรือเขียน log
+ค่าทั้งหมดถูกแปลงเป็นรูปแบบข้อความของ Prometheus เฉพาะตอนมีการ scrape ที่ /metrics
+histogram ใช้ bucket คงที่ (ค่าเริ่มต้นเหมาะกับเวลาเป็นวินาทีตั้งแต่ 50µs ถึง 10s)
+"""
+import bisect
+import math
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """ฐานของเมตริกที่มี label (ค่าของแต่ละชุด label เก็บแยกใน child)"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> "_Metric":
+        """child ของชุด label ที่ระบุ (ควรเก็บไว้ใช้ซ้ำบน hot path)"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} ต้องการ label {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+        if self.labelnames:
+            return sorted(self._children.items())
+        return [((), self)]
+
+    def _label_text(self, values: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(child._samples_of(self, values))
+        return lines
+
+    def _samples_of(self, parent: "_Metric", values: Tuple[str, ...]) -> List[str]:
+        return [f"{parent.name}{parent._label_text(values)} {_format_value(self._get())}"]
+
+    def _get(self) -> float:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """ค่าที่เพิ่มขึ้นอย่างเดียว"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def _get(self) -> float:
+        return self._value
+
+
+class Gauge(_Metric):
+    """ค่าที่ขึ้นลงได้ เช่น ขนาด buffer หรือจำนวนการเชื่อมต่อ"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def _get(self) -> float:
+        return self._value
+
+
+class Histogram(_Metric):
+    """การกระจายของค่า (เช่น latency) ใน bucket คงที่ พร้อมผลรวมและจำนวน"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # ช่องสุดท้ายคือ +Inf
+        self._sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ค่าประมาณของ quantile จากขอบบนของ bucket (None ถ้ายังไม่มีข้อมูล)"""
+        with self._lock:
+            counts = list(self._counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+    def _samples_of(self, parent: "_Metric", values: Tuple[str, ...]) -> List[str]:
+        with self._lock:
+            counts, total_sum = list(self._counts), self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = parent._label_text(values, (("le", _format_value(bound)),))
+            lines.append(f"{parent.name}_bucket{labels} {cumulative}")
+        labels = parent._label_text(values)
+        lines.append(f"{parent.name}_sum{labels} {_format_value(total_sum)}")
+        lines.append(f"{parent.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """ที่รวมเมตริกทั้งหมดของ process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif metric.kind != cls.kind or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"เมตริก {name} ถูกลงทะเบียนเป็น {metric.kind} {metric.labelnames} แล้ว")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """ฟังก์ชันที่ถูกเรียกก่อนเรนเดอร์ทุกครั้ง ใช้ปรับ gauge ที่อ่านจากแหล่งอื่น (เช่นสถิติ pool)"""
+        self._collectors.append(collect)
+
+    def render_prometheus(self) -> str:
+        """ค่าทั้งหมดในรูปแบบ Prometheus text exposition format 0.0.4"""
+        for collect in list(self._collectors):
+            try:
+                collect()
+            except Exception:
+                pass
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# โมดูลนี้อาจถูก import ทั้งในชื่อ metrics (main.py เพิ่ม app/ ใน sys.path) และ app.metrics
+# จึงใช้ registry ของโมดูลที่โหลดไว้ก่อน เพื่อให้ /metrics เห็นเมตริกของทุกโมดูล
+_loaded = [sys.modules.get(name) for name in ("app.metrics", "metrics") if name != __name__]
+registry: MetricsRegistry = next(
+    (module.registry for module in _loaded if module is not None and hasattr(module, "registry")),
+    None
+) or MetricsRegistry()
@@ -0,0 +1,350 @@
+"""
+notification_outbox.py - outbox ของการแจ้งเตือนบน Redis Stream
+
+การแจ้งเตือนแต่ละช่องทางถูกเขียนลง stream ของช่องทางนั้นก่อนส่ง แล้ว worker อ่านผ่าน consumer group
+แยกกันทีละช่องทาง (Discord ที่ช้าจึงไม่ขวาง webhook/email) และอ่านเท่ากับจำนวน token ที่มีใน token bucket
+entry ที่อ่านมาจึงส่งได้ทันทีและค้างโดยไม่ ack ไม่นานเกินเวลาส่งหนึ่งครั้ง ก่อนที่ process อื่นจะ XAUTOCLAIM ไป
+รายการที่ส่งไม่สำเร็จถูกพักใน sorted set และส่งซ้ำแบบ exponential backoff เมื่อครบจำนวนครั้งจะย้ายไป dead-letter stream
+idempotency key (ช่องทาง, สัญลักษณ์, เวลา, ประเภท) ป้องกันการแจ้งเตือนซ้ำ
+เช่นเมื่อหลาย process ได้รับสัญญาณเดียวกันจาก Pub/Sub
+
+คีย์ทั้งหมดใช้ hash tag {notify} จึงอยู่ใน slot เดียวกันและใช้สคริปต์ Lua ได้ในโหมด cluster
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger("notification_outbox")
+
+OUTBOX_STREAM = "crypto_signals:{notify}:outbox"  # stream จริงคือ outbox_stream(ช่องทาง)
+RETRY_ZSET = "crypto_signals:{notify}:retry"  # sorted set จริงคือ retry_zset(ช่องทาง)
+DEAD_LETTER_STREAM = "crypto_signals:{notify}:dead"
+IDEMPOTENCY_PREFIX = "crypto_signals:{notify}:sent:"
+CONSUMER_GROUP = "notifiers"
+
+# อัตราเริ่มต้นต่อช่องทาง: (จำนวนต่อวินาที, จำนวนที่ส่งติดกันได้สูงสุด)
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "webhook": (10.0, 20.0),
+    "discord": (0.5, 5.0),  # Discord จำกัดราว 30 ข้อความต่อนาทีต่อช่อง
+    "email": (1.0, 5.0),
+}
+
+# KEYS[1] = idempotency key, KEYS[2] = outbox stream
+# ARGV[1] = entry JSON, ARGV[2] = อายุของ idempotency key (วินาที), ARGV[3] = MAXLEN โดยประมาณ
+# คืนค่า: id ของ entry หรือ false ถ้าเคยเขียนแล้ว
+_ENQUEUE_SCRIPT = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[2]) then
+    return redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'entry', ARGV[1])
+end
+return false
+"""
+
+# KEYS[1] = retry zset, KEYS[2] = outbox stream
+# ARGV[1] = เวลาปัจจุบัน (ms), ARGV[2] = จำนวนสูงสุดต่อครั้ง, ARGV[3] = MAXLEN โดยประมาณ
+# คืนค่า: จำนวน entry ที่ย้ายกลับเข้า stream
+_PROMOTE_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, entry in ipairs(due) do
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'entry', entry)
+    redis.call('ZREM', KEYS[1], entry)
+end
+return #due
+"""
+
+
+class RateLimited(Exception):
+    """ปลายทางตอบว่าส่งถี่เกินไป (HTTP 429) พร้อมเวลาที่ควรรอ"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """token bucket แบบ async สำหรับจำกัดอัตราการส่งของแต่ละช่องทาง"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """รอจนได้ token หนึ่งอัน"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def try_acquire(self) -> float:
+        """
+        ใช้ token หนึ่งอันทันทีถ้ามี
+
+        Returns:
+            0 เมื่อได้ token หรือเวลา (วินาที) ที่ต้องรอจนกว่าจะมี token
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def wait_available(self) -> int:
+        """รอจนมี token อย่างน้อยหนึ่งอัน (โดยไม่ใช้ token) แล้วคืนจำนวน token เต็มที่มีอยู่"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            return int(self._tokens)
+
+    def pause(self, seconds: float) -> None:
+        """หยุดส่งชั่วคราวตามที่ปลายทางร้องขอ (token ติดลบจนกว่าจะครบเวลา)"""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def outbox_stream(channel: str) -> str:
+    """stream ของการแจ้งเตือนที่รอส่งในช่องทางหนึ่ง"""
+    return f"{OUTBOX_STREAM}:{channel}"
+
+
+def retry_zset(channel: str) -> str:
+    """sorted set ของการแจ้งเตือนที่รอส่งซ้ำในช่องทางหนึ่ง (score = เวลาที่ถึงกำหนด ms)"""
+    return f"{RETRY_ZSET}:{channel}"
+
+
+def idempotency_key(channel: str, signal: Dict[str, Any], target: Optional[str] = None) -> str:
+    """คีย์ป้องกันการส่งซ้ำของสัญญาณหนึ่งในช่องทางหนึ่ง (และปลายทางหนึ่ง ถ้าระบุ)"""
+    channel = f"{channel}:{target}" if target else channel
+    return f"{channel}:{signal.get('symbol')}:{signal.get('timestamp')}:{signal.get('category')}"
+
+
+class NotificationOutbox:
+    """outbox ของการแจ้งเตือนที่ส่งซ้ำได้และจำกัดอัตราต่อช่องทาง"""
+
+    def __init__(self, redis_client: redis.Redis,
+                 senders: Dict[str, Callable[[Dict[str, Any], Optional[str]], Awaitable[bool]]],
+                 rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_attempts: int = 6, base_backoff: float = 2.0, max_backoff: float = 300.0,
+                 dedupe_ttl: int = 86400, maxlen: int = 100000, batch_size: int = 50,
+                 claim_idle: float = 60.0):
+        """
+        Args:
+            redis_client: Redis client (decode_responses=True)
+            senders: ฟังก์ชันส่งของแต่ละช่องทาง รับ (สัญญาณ, ปลายทาง หรือ None = ค่าที่ตั้งไว้)
+                คืน True เมื่อสำเร็จ (โยน RateLimited เมื่อโดนจำกัดอัตรา)
+            rate_limits: อัตราต่อช่องทาง (จำนวนต่อวินาที, จำนวนติดกันสูงสุด)
+            max_attempts: จำนวนครั้งที่พยายามส่งก่อนย้ายไป dead-letter stream
+            base_backoff: เวลารอ (วินาที) ก่อนส่งซ้ำครั้งแรก (เพิ่มเป็นสองเท่าทุกครั้ง)
+            max_backoff: เวลารอสูงสุดระหว่างการส่งซ้ำ
+            dedupe_ttl: อายุของ idempotency key (วินาที)
+            maxlen: ความยาวสูงสุดโดยประมาณของ stream
+            batch_size: จำนวน entry สูงสุดที่อ่านต่อครั้งต่อช่องทาง (จำกัดด้วย token ที่มีอยู่ด้วย)
+            claim_idle: เวลา (วินาที) ที่ entry ค้างโดยไม่ ack ก่อน process อื่นรับไปส่งแทน
+                ต้องมากกว่าเวลาส่งหนึ่งครั้งที่นานที่สุด (HTTP/SMTP timeout) เพื่อไม่ให้ส่งซ้ำสองที่
+        """
+        self.redis = redis_client
+        self.senders = senders
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.dedupe_ttl = dedupe_ttl
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.claim_idle_ms = int(claim_idle * 1000)
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+        limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}
+        self.buckets = {channel: TokenBucket(*limits.get(channel, (5.0, 10.0))) for channel in senders}
+
+        self._enqueue_script = redis_client.register_script(_ENQUEUE_SCRIPT)
+        self._promote_script = redis_client.register_script(_PROMOTE_DUE_SCRIPT)
+        self._stopping = False
+        self._last_reclaim: Dict[str, float] = {}
+        self.stats = {'enqueued': 0, 'duplicates': 0, 'delivered': 0, 'retried': 0, 'deferred': 0,
+                      'dead_lettered': 0}
+
+    def enqueue(self, signal: Dict[str, Any], channels: List[str], target: Optional[str] = None) -> List[str]:
+        """
+        เขียนการแจ้งเตือนของแต่ละช่องทางลง outbox (ข้ามช่องทางที่เคยเขียนสัญญาณนี้แล้ว)
+
+        Args:
+            signal: ข้อมูลสัญญาณ
+            channels: ช่องทางที่จะส่ง
+            target: ปลายทางเฉพาะ เช่น อีเมลหรือ webhook ของผู้ใช้ (None = ปลายทางที่ตั้งค่าไว้)
+
+        Returns:
+            id ของ entry ที่เขียนใหม่
+        """
+        ids = []
+        for channel in channels:
+            key = idempotency_key(channel, signal, target)
+            entry = json.dumps({"channel": channel, "key": key, "attempt": 0, "target": target, "signal": signal})
+            entry_id = self._enqueue_script(keys=[IDEMPOTENCY_PREFIX + key, outbox_stream(channel)],
+                                            args=[entry, self.dedupe_ttl, self.maxlen])
+            if entry_id:
+                ids.append(entry_id)
+                self.stats['enqueued'] += 1
+            else:
+                self.stats['duplicates'] += 1
+        return ids
+
+    def _ensure_groups(self) -> None:
+        for channel in self.senders:
+            try:
+                self.redis.xgroup_create(outbox_stream(channel), CONSUMER_GROUP, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.base_backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _settle(self, channel: str, entry_id: str, entry: Dict[str, Any], error: Optional[str],
+                retry_after: Optional[float] = None) -> None:
+        """ยืนยันการประมวลผล entry และพักไว้ส่งซ้ำหรือย้ายไป dead-letter ถ้าไม่สำเร็จ"""
+        pipeline = self.redis.pipeline(transaction=True)
+        if error is not None:
+            entry = {**entry, "attempt": entry["attempt"] + 1, "error": error}
+            if entry["attempt"] >= self.max_attempts:
+                pipeline.xadd(DEAD_LETTER_STREAM, {"entry": json.dumps(entry), "failed_at": int(time.time() * 1000)},
+                              maxlen=self.maxlen, approximate=True)
+                self.stats['dead_lettered'] += 1
+                logger.error("ย้ายการแจ้งเตือน %s ไป dead-letter หลังพยายาม %d ครั้ง: %s",
+                             entry["key"], entry["attempt"], error)
+            else:
+                delay = max(retry_after or 0.0, self._backoff(entry["attempt"]))
+                pipeline.zadd(retry_zset(channel), {json.dumps(entry): int((time.time() + delay) * 1000)})
+                self.stats['retried'] += 1
+                logger.warning("ส่งการแจ้งเตือน %s ไม่สำเร็จ จะลองใหม่ใน %.1f วินาที: %s",
+                               entry["key"], delay, error)
+        else:
+            self.stats['delivered'] += 1
+        pipeline.xack(outbox_stream(channel), CONSUMER_GROUP, entry_id)
+        pipeline.xdel(outbox_stream(channel), entry_id)
+        pipeline.execute()
+
+    def _defer(self, channel: str, entry_id: str, entry: Dict[str, Any], delay: float) -> None:
+        """ย้าย entry ที่ยังไม่ได้ token กลับไปรอใน retry zset โดยไม่นับเป็นความพยายาม แล้ว ack"""
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.zadd(retry_zset(channel), {json.dumps(entry): int((time.time() + delay) * 1000)})
+        pipeline.xack(outbox_stream(channel), CONSUMER_GROUP, entry_id)
+        pipeline.xdel(outbox_stream(channel), entry_id)
+        pipeline.execute()
+        self.stats['deferred'] += 1
+
+    def _dead_letter_malformed(self, channel: str, entry_id: str, fields: Dict[str, str], error: str) -> None:
+        """ย้าย entry ที่อ่านไม่ได้ไป dead-letter ตามข้อมูลดิบ แล้ว ack เพื่อไม่ให้ถูกอ่านซ้ำตลอดไป"""
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.xadd(DEAD_LETTER_STREAM, {**fields, "error": error, "failed_at": int(time.time() * 1000)},
+                      maxlen=self.maxlen, approximate=True)
+        pipeline.xack(outbox_stream(channel), CONSUMER_GROUP, entry_id)
+        pipeline.xdel(outbox_stream(channel), entry_id)
+        pipeline.execute()
+        self.stats['dead_lettered'] += 1
+
+    async def _handle(self, channel: str, entry_id: str, fields: Dict[str, str]) -> None:
+        try:
+            entry = json.loads(fields["entry"])
+            if not isinstance(entry, dict) or "signal" not in entry or "key" not in entry:
+                raise ValueError("entry ไม่มีข้อมูลสัญญาณหรือ idempotency key")
+            entry.setdefault("attempt", 0)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error("การแจ้งเตือน %s ใน outbox ของ %s อ่านไม่ได้ ย้ายไป dead-letter: %r", entry_id, channel, e)
+            await asyncio.to_thread(self._dead_letter_malformed, channel, entry_id, fields, repr(e))
+            return
+
+        sender = self.senders.get(channel)
+        if sender is None:
+            # ช่องทางถูกปิดไปแล้ว: ย้ายไป dead-letter ทันที
+            entry["attempt"] = self.max_attempts - 1
+            await asyncio.to_thread(self._settle, channel, entry_id, entry, f"ไม่มีช่องทาง {channel}")
+            return
+
+        bucket = self.buckets[channel]
+        # ไม่รอ token ขณะถือ entry ไว้โดยไม่ ack (เช่นหลังปลายทางตอบ 429 กลางชุด) แต่พักไว้ส่งภายหลัง
+        wait = bucket.try_acquire()
+        if wait > 0:
+            await asyncio.to_thread(self._defer, channel, entry_id, entry, wait)
+            return
+
+        error, retry_after = None, None
+        try:
+            if not await sender(entry["signal"], entry.get("target")):
+                error = "ปลายทางตอบกลับว่าไม่สำเร็จ"
+        except RateLimited as e:
+            bucket.pause(e.retry_after)
+            error, retry_after = str(e), e.retry_after
+        except Exception as e:
+            error = str(e)
+        await asyncio.to_thread(self._settle, channel, entry_id, entry, error, retry_after)
+
+    def _poll(self, channel: str, count: int) -> List[Tuple[str, Dict[str, str]]]:
+        """
+        ย้าย entry ที่ถึงเวลาส่งซ้ำกลับเข้า stream ของช่องทาง, รับ entry ค้างจาก consumer ที่หยุดไป
+        แล้วอ่านชุดใหม่ไม่เกิน count รายการ
+        """
+        stream = outbox_stream(channel)
+        self._promote_script(keys=[retry_zset(channel), stream],
+                             args=[int(time.time() * 1000), self.batch_size, self.maxlen])
+
+        if time.monotonic() - self._last_reclaim.get(channel, 0.0) > 30:
+            self._last_reclaim[channel] = time.monotonic()
+            reclaimed = self.redis.xautoclaim(stream, CONSUMER_GROUP, self.consumer,
+                                              min_idle_time=self.claim_idle_ms, count=count)
+            if reclaimed[1]:
+                return reclaimed[1]
+
+        response = self.redis.xreadgroup(CONSUMER_GROUP, self.consumer, {stream: ">"}, count=count, block=1000)
+        return response[0][1] if response else []
+
+    async def _run_channel(self, channel: str) -> None:
+        """อ่านและส่งการแจ้งเตือนของช่องทางหนึ่ง โดยอ่านครั้งละไม่เกินจำนวน token ที่มีอยู่"""
+        bucket = self.buckets[channel]
+        while not self._stopping:
+            try:
+                count = min(self.batch_size, await bucket.wait_available())
+                entries = await asyncio.to_thread(self._poll, channel, count)
+                results = await asyncio.gather(
+                    *(self._handle(channel, entry_id, fields) for entry_id, fields in entries if fields),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, redis.RedisError):
+                        raise result
+                    if isinstance(result, Exception):
+                        logger.error("outbox worker (%s) ส่งการแจ้งเตือนไม่สำเร็จ: %r", channel, result)
+            except redis.RedisError as e:
+                logger.error("outbox worker (%s) เกิดข้อผิดพลาด Redis: %s", channel, str(e))
+                await asyncio.sleep(5)
+            except Exception as e:
+                logger.exception("outbox worker (%s) เกิดข้อผิดพลาด: %s", channel, str(e))
+                await asyncio.sleep(1)
+
+    async def run(self) -> None:
+        """อ่านและส่งการแจ้งเตือนจาก outbox ของทุกช่องทางพร้อมกันจนกว่าจะเรียก stop()"""
+        await asyncio.to_thread(self._ensure_groups)
+        logger.info("outbox worker %s เริ่มทำงาน", self.consumer)
+        self._stopping = False
+        await asyncio.gather(*(self._run_channel(channel) for channel in self.senders))
+
+    def stop(self) -> None:
+        """ให้ worker หยุดหลังจบรอบปัจจุบัน"""
+        self._stopping = True
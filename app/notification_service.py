@@ -1,11 +1,12 @@
+import asyncio
 import json
 import redis
-import smtplib
+import httpx
 import requests
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Set
 
 import os
 import sys
@@ -15,6 +16,26 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 import env_manager as env
 
+# ใช้ Redis client จาก connection pool ที่ใช้ร่วมกันทั้งแอป
+try:
+    from .redis_manager import get_redis_client, get_async_redis_client, close_async_redis
+    from .smtp_pool import EmailDigest, get_smtp_pool
+    from .notification_outbox import NotificationOutbox, RateLimited
+    from .alert_rules import AlertRule, AlertRuleEngine, AlertRuleStore
+    from .notification_templates import (
+        CATEGORY_COLOR, CATEGORY_EMOJI, DEFAULT_COLOR, DEFAULT_DISCORD_COLOR, DEFAULT_EMOJI, DISCORD_COLOR,
+        render_digest, render_discord_payload, render_email, render_webhook_payload
+    )
+except ImportError:
+    from redis_manager import get_redis_client, get_async_redis_client, close_async_redis
+    from smtp_pool import EmailDigest, get_smtp_pool
+    from notification_outbox import NotificationOutbox, RateLimited
+    from alert_rules import AlertRule, AlertRuleEngine, AlertRuleStore
+    from notification_templates import (
+        CATEGORY_COLOR, CATEGORY_EMOJI, DEFAULT_COLOR, DEFAULT_DISCORD_COLOR, DEFAULT_EMOJI, DISCORD_COLOR,
+        render_digest, render_discord_payload, render_email, render_webhook_payload
+    )
+
 # ตั้งค่า logging
 logging.basicConfig(
     level=logging.INFO,
@@ -32,89 +53,121 @@ SMTP_PORT = env.getenv("SMTP_PORT", 587, int)
 SMTP_USERNAME = env.getenv("SMTP_USERNAME", "")
 SMTP_PASSWORD = env.getenv("SMTP_PASSWORD", "")
 EMAIL_RECIPIENTS = env.getenv("EMAIL_RECIPIENTS", "").split(",") if env.getenv("EMAIL_RECIPIENTS") else []
+SMTP_POOL_SIZE = env.getenv("SMTP_POOL_SIZE", 2, int)
+SMTP_IDLE_TIMEOUT = env.getenv("SMTP_IDLE_TIMEOUT", 240, int)
+EMAIL_DIGEST_SECONDS = env.getenv("EMAIL_DIGEST_SECONDS", 0, int)  # 0 = ส่งอีเมลทีละสัญญาณ
 
 # ตั้งค่า Webhook
 notification_config = env.get_notification_config()
 WEBHOOK_URL = env.getenv("WEBHOOK_URL", "")
+DISCORD_WEBHOOK_URL = notification_config["discord_webhook_url"]
+
+# การส่งแบบ async: เวลารอสูงสุดต่อคำขอ และจำนวนสัญญาณที่กำลังส่งพร้อมกันสูงสุด
+NOTIFICATION_HTTP_TIMEOUT = env.getenv("NOTIFICATION_HTTP_TIMEOUT", 10.0, float)
+NOTIFICATION_MAX_IN_FLIGHT = env.getenv("NOTIFICATION_MAX_IN_FLIGHT", 100, int)
+
+# outbox บน Redis Stream: ส่งซ้ำเมื่อล้มเหลว จำกัดอัตราต่อช่องทาง และกันการแจ้งเตือนซ้ำ
+NOTIFY_OUTBOX_ENABLED = env.getenv("NOTIFY_OUTBOX_ENABLED", True, bool)
+NOTIFY_MAX_ATTEMPTS = env.getenv("NOTIFY_MAX_ATTEMPTS", 6, int)
+NOTIFY_RATE_LIMITS = env.getenv("NOTIFY_RATE_LIMITS", {}, dict)  # {"discord": [0.5, 5], ...}
 
 class NotificationService:
     """บริการแจ้งเตือนที่ส่งการแจ้งเตือนเมื่อได้รับสัญญาณการซื้อขายใหม่"""
     
     def __init__(self):
         """เริ่มต้นบริการแจ้งเตือนด้วยการเชื่อมต่อกับ Redis"""
-        self.redis_client = redis.Redis(
-            host=redis_config["host"],
-            port=redis_config["port"],
-            password=redis_config["password"],
-            decode_responses=True
-        )
-        self.pubsub = self.redis_client.pubsub()
-        self.pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+        self.redis_client = get_redis_client(decode_responses=True)
+        # PubSub แบบ redis.asyncio จาก pool ที่ใช้ร่วมกัน (สมัครสมาชิกช่องเมื่อเริ่มฟังใน event loop)
+        self.pubsub = get_async_redis_client(decode_responses=True).pubsub()
+        
+        # HTTP client แบบ async ใช้ connection ซ้ำระหว่างการแจ้งเตือน (สร้างเมื่อส่งครั้งแรก)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        
+        # โหมด digest: รวมสัญญาณตามช่วงเวลาแล้วส่งเป็นอีเมลฉบับเดียว
+        self._email_digest = EmailDigest(EMAIL_DIGEST_SECONDS, self._send_digest) if EMAIL_DIGEST_SECONDS > 0 else None
+        
+        # กฎการแจ้งเตือนรายผู้ใช้ (ประเมินกับทุกสัญญาณรวมถึง hold เพื่อติดตามการตัดผ่านของ RSI)
+        self.alert_rules = AlertRuleEngine(AlertRuleStore(self.redis_client))
+        
+        # outbox ของการแจ้งเตือน (None = ส่งตรงแบบครั้งเดียวเหมือนเดิม)
+        self.outbox: Optional[NotificationOutbox] = None
+        self._outbox_task: Optional[asyncio.Task] = None
+        if NOTIFY_OUTBOX_ENABLED:
+            self.outbox = NotificationOutbox(
+                self.redis_client, self._channel_senders(),
+                rate_limits={channel: tuple(limit) for channel, limit in NOTIFY_RATE_LIMITS.items()},
+                max_attempts=NOTIFY_MAX_ATTEMPTS,
+                # entry ค้างโดยไม่ ack ได้นานเท่าการส่งหนึ่งครั้ง จึงให้ process อื่นรับไปหลังเกิน timeout หลายเท่า
+                claim_idle=max(60.0, 3 * NOTIFICATION_HTTP_TIMEOUT)
+            )
         logger.info("บริการแจ้งเตือนเริ่มต้นแล้ว และกำลังฟังช่อง %s", REDIS_SIGNAL_CHANNEL)
     
-    def send_email_notification(self, signal: Dict[str, Any]) -> bool:
+    def send_email_notification(self, signal: Dict[str, Any], recipients: Optional[List[str]] = None) -> bool:
         """
         ส่งการแจ้งเตือนทางอีเมล
         
         Args:
             signal: ข้อมูลสัญญาณที่จะส่ง
+            recipients: ผู้รับเฉพาะ เช่น จากกฎของผู้ใช้ (None = EMAIL_RECIPIENTS และใช้โหมด digest ได้)
             
         Returns:
             สถานะความสำเร็จของการส่ง
         """
-        if not SMTP_USERNAME or not SMTP_PASSWORD or not EMAIL_RECIPIENTS:
+        if not SMTP_USERNAME or not SMTP_PASSWORD or not (recipients or EMAIL_RECIPIENTS):
             logger.warning("ไม่ได้กำหนดค่า SMTP หรือผู้รับอีเมล")
             return False
         
+        if recipients is None and self._email_digest is not None:
+            self._email_digest.add(signal)
+            return True
+        
         try:
-            # สร้างข้อความ
-            subject = f"🚨 สัญญาณการซื้อขาย: {signal['category'].upper()} สำหรับ {signal['symbol']}"
+            msg = self._build_email_message(signal, recipients or EMAIL_RECIPIENTS)
             
-            # สร้างเนื้อหาอีเมลแบบ HTML
-            emoji = self._get_category_emoji(signal['category'])
-            color = self._get_category_color(signal['category'])
+            # ส่งอีเมลผ่าน connection ที่ login ค้างไว้ใน pool
+            self._get_smtp_pool().send(msg)
             
-            html_content = f"""
-            <html>
-            <body>
-                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                    <h2 style="color: #333;">{emoji} สัญญาณการซื้อขายคริปโต</h2>
-                    <div style="border-left: 4px solid {color}; padding: 10px; background-color: #f9f9f9; margin: 20px 0;">
-                        <h3 style="color: {color}; margin: 0;">{signal['category'].upper()}</h3>
-                        <p style="font-size: 18px; margin: 10px 0;">สัญลักษณ์: <strong>{signal['symbol']}</strong></p>
-                        <p>ราคาปัจจุบัน: ${signal['price']:.2f}</p>
-                        <p>การคาดการณ์: {signal['forecast_pct']:.2f}%</p>
-                        <p>ความมั่นใจ: {signal['confidence'] * 100:.1f}%</p>
-                    </div>
-                    <div style="font-size: 12px; color: #999; margin-top: 30px;">
-                        <p>ข้อมูลนี้เป็นเพียงการวิเคราะห์เชิงเทคนิค ไม่ใช่คำแนะนำในการลงทุน</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # สร้างข้อความอีเมล
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = SMTP_USERNAME
-            msg['To'] = ", ".join(EMAIL_RECIPIENTS)
-            
-            msg.attach(MIMEText(html_content, 'html'))
-            
-            # ส่งอีเมล
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls()
-                server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                server.send_message(msg)
-            
-            logger.info("ส่งการแจ้งเตือนทางอีเมลสำเร็จ: %s", subject)
+            logger.info("ส่งการแจ้งเตือนทางอีเมลสำเร็จ: %s", msg['Subject'])
             return True
             
         except Exception as e:
             logger.error("เกิดข้อผิดพลาดในการส่งอีเมล: %s", str(e))
             return False
     
+    def _get_smtp_pool(self):
+        return get_smtp_pool(SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+                             size=SMTP_POOL_SIZE, idle_timeout=SMTP_IDLE_TIMEOUT)
+    
+    def _send_digest(self, signals: List[Dict[str, Any]]) -> None:
+        """ส่งอีเมลสรุปสัญญาณที่รวบรวมไว้ (เรียกจากเธรดของ EmailDigest)"""
+        msg = self._build_digest_message(signals)
+        self._get_smtp_pool().send(msg)
+        logger.info("ส่งอีเมลสรุปสัญญาณ %d รายการสำเร็จ", len(signals))
+    
+    def _build_digest_message(self, signals: List[Dict[str, Any]]) -> MIMEMultipart:
+        """สร้างอีเมลสรุปหลายสัญญาณเป็นตารางเดียว"""
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = f"📊 สรุปสัญญาณการซื้อขาย {len(signals)} รายการ"
+        msg['From'] = SMTP_USERNAME
+        msg['To'] = ", ".join(EMAIL_RECIPIENTS)
+        msg.attach(MIMEText(render_digest(signals), 'html'))
+        return msg
+    
+    def _build_email_message(self, signal: Dict[str, Any], recipients: List[str]) -> MIMEMultipart:
+        """สร้างข้อความอีเมลแบบ HTML ของสัญญาณจากแม่แบบของประเภทสัญญาณ"""
+        subject, html_content = render_email(signal)
+        
+        # สร้างข้อความอีเมล
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = SMTP_USERNAME
+        msg['To'] = ", ".join(recipients)
+        
+        msg.attach(MIMEText(html_content, 'html'))
+        return msg
+    
     def send_webhook_notification(self, signal: Dict[str, Any]) -> bool:
         """
         ส่งการแจ้งเตือนผ่าน webhook
@@ -130,21 +183,10 @@ class NotificationService:
             return False
         
         try:
-            # สร้างข้อมูลที่จะส่ง
-            payload = {
-                "signal_type": signal['category'],
-                "symbol": signal['symbol'],
-                "price": signal['price'],
-                "forecast_pct": signal['forecast_pct'],
-                "confidence": signal['confidence'],
-                "timestamp": signal['timestamp'],
-                "indicators": signal.get('indicators', {})
-            }
-            
             # ส่งข้อมูลไปยัง webhook
             response = requests.post(
                 WEBHOOK_URL,
-                json=payload,
+                json=self._build_webhook_payload(signal),
                 headers={"Content-Type": "application/json"}
             )
             
@@ -174,40 +216,10 @@ class NotificationService:
             return False
         
         try:
-            # สร้าง embed สำหรับ Discord
-            emoji = self._get_category_emoji(signal['category'])
-            color = self._get_discord_color(signal['category'])
-            
-            embed = {
-                "title": f"{emoji} สัญญาณ {signal['category'].upper()} สำหรับ {signal['symbol']}",
-                "color": color,
-                "fields": [
-                    {"name": "ราคาปัจจุบัน", "value": f"${signal['price']:.2f}", "inline": True},
-                    {"name": "การคาดการณ์", "value": f"{signal['forecast_pct']:.2f}%", "inline": True},
-                    {"name": "ความมั่นใจ", "value": f"{signal['confidence'] * 100:.1f}%", "inline": True}
-                ],
-                "footer": {"text": "ข้อมูลนี้เป็นเพียงการวิเคราะห์เชิงเทคนิค ไม่ใช่คำแนะนำในการลงทุน"}
-            }
-            
-            # เพิ่มข้อมูลตัวชี้วัดถ้ามี
-            if 'indicators' in signal and signal['indicators']:
-                indicators_text = "\n".join([
-                    f"• EMA9: {signal['indicators'].get('ema9', 'N/A'):.2f}" if signal['indicators'].get('ema9') else "• EMA9: N/A",
-                    f"• EMA21: {signal['indicators'].get('ema21', 'N/A'):.2f}" if signal['indicators'].get('ema21') else "• EMA21: N/A",
-                    f"• RSI14: {signal['indicators'].get('rsi14', 'N/A'):.2f}" if signal['indicators'].get('rsi14') else "• RSI14: N/A"
-                ])
-                embed["fields"].append({"name": "ตัวชี้วัดเทคนิคอล", "value": indicators_text, "inline": False})
-            
-            # สร้าง payload สำหรับส่งไปยัง Discord
-            payload = {
-                "username": "Crypto Signal Bot",
-                "embeds": [embed]
-            }
-            
             # ส่งข้อมูลไปยัง Discord webhook
             response = requests.post(
                 DISCORD_WEBHOOK_URL,
-                json=payload,
+                json=self._build_discord_payload(signal),
                 headers={"Content-Type": "application/json"}
             )
             
@@ -222,38 +234,129 @@ class NotificationService:
             logger.error("เกิดข้อผิดพลาดในการส่ง Discord webhook: %s", str(e))
             return False
     
+    def _build_webhook_payload(self, signal: Dict[str, Any]) -> Dict[str, Any]:
+        """สร้างข้อมูลที่ส่งไปยัง webhook ทั่วไป"""
+        return render_webhook_payload(signal)
+    
+    def _build_discord_payload(self, signal: Dict[str, Any]) -> Dict[str, Any]:
+        """สร้าง payload พร้อม embed สำหรับ Discord webhook"""
+        return render_discord_payload(signal)
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """HTTP client แบบ async ที่ใช้ร่วมกันทุกช่องทาง (keep-alive ระหว่างการแจ้งเตือน)"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=NOTIFICATION_HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        return self._http
+    
+    async def _post_json_async(self, name: str, url: str, payload: Dict[str, Any]) -> bool:
+        """ส่ง JSON ไปยัง webhook แบบ async (โยน RateLimited เมื่อปลายทางตอบ 429)"""
+        try:
+            response = await self._get_http_client().post(url, json=payload)
+            if response.status_code == 429:
+                raise RateLimited(self._retry_after(response))
+            if response.status_code < 400:
+                logger.info("ส่งการแจ้งเตือน %s สำเร็จ: %s", name, response.status_code)
+                return True
+            logger.error("การส่ง %s ล้มเหลว: %s - %s", name, response.status_code, response.text)
+            return False
+        except RateLimited:
+            logger.warning("การส่ง %s ถูกจำกัดอัตรา", name)
+            raise
+        except Exception as e:
+            logger.error("เกิดข้อผิดพลาดในการส่ง %s: %s", name, str(e))
+            return False
+    
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        """เวลาที่ปลายทางขอให้รอ (วินาที) จาก header Retry-After หรือ retry_after ใน body ของ Discord"""
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            pass
+        try:
+            return float(response.json().get("retry_after", 1.0))
+        except Exception:
+            return 1.0
+    
+    async def _send_email_async(self, signal: Dict[str, Any], target: Optional[str] = None) -> bool:
+        recipients = [address.strip() for address in target.split(",")] if target else None
+        return await asyncio.to_thread(self.send_email_notification, signal, recipients)
+    
+    async def _send_webhook_async(self, signal: Dict[str, Any], target: Optional[str] = None) -> bool:
+        return await self._post_json_async("webhook", target or WEBHOOK_URL, self._build_webhook_payload(signal))
+    
+    async def _send_discord_async(self, signal: Dict[str, Any], target: Optional[str] = None) -> bool:
+        return await self._post_json_async("Discord", target or DISCORD_WEBHOOK_URL, self._build_discord_payload(signal))
+    
+    def _channel_senders(self) -> Dict[str, Callable[..., Awaitable[bool]]]:
+        """ฟังก์ชันส่งแบบ async ของทุกช่องทาง รับ (สัญญาณ, ปลายทาง หรือ None = ค่าที่ตั้งไว้)"""
+        return {
+            "email": self._send_email_async,
+            "webhook": self._send_webhook_async,
+            "discord": self._send_discord_async,
+        }
+    
+    def _senders(self) -> Dict[str, Callable[..., Awaitable[bool]]]:
+        """ฟังก์ชันส่งของช่องทางที่กำหนดปลายทางส่วนกลางไว้ใน env"""
+        configured = {
+            "email": bool(SMTP_USERNAME and SMTP_PASSWORD and EMAIL_RECIPIENTS),
+            "webhook": bool(WEBHOOK_URL),
+            "discord": bool(DISCORD_WEBHOOK_URL),
+        }
+        return {name: send for name, send in self._channel_senders().items() if configured[name]}
+    
+    async def dispatch(self, signal: Dict[str, Any]) -> Dict[str, bool]:
+        """
+        ส่งการแจ้งเตือนทุกช่องทางพร้อมกัน (อีเมลส่งในเธรดแยกเพื่อไม่บล็อก event loop)
+        
+        Args:
+            signal: ข้อมูลสัญญาณที่จะส่ง
+            
+        Returns:
+            สถานะความสำเร็จของแต่ละช่องทางที่เปิดใช้งาน
+        """
+        channels = {name: send(signal) for name, send in self._senders().items()}
+        results = await asyncio.gather(*channels.values(), return_exceptions=True)
+        return {name: result is True for name, result in zip(channels, results)}
+    
+    async def dispatch_rules(self, signal: Dict[str, Any], rules: List[AlertRule]) -> Dict[str, bool]:
+        """
+        ส่งการแจ้งเตือนไปยังปลายทางของกฎผู้ใช้ที่ผ่านเงื่อนไขพร้อมกัน
+        
+        Returns:
+            สถานะความสำเร็จของแต่ละกฎ
+        """
+        senders = self._channel_senders()
+        results = await asyncio.gather(
+            *(senders[rule.channel](signal, rule.target) for rule in rules), return_exceptions=True
+        )
+        return {rule.rule_id: result is True for rule, result in zip(rules, results)}
+    
+    async def _dispatch_limited(self, signal: Dict[str, Any], broadcast: bool = True,
+                                rules: Optional[List[AlertRule]] = None) -> None:
+        """ส่งการแจ้งเตือนโดยจำกัดจำนวนสัญญาณที่กำลังส่งพร้อมกัน"""
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(NOTIFICATION_MAX_IN_FLIGHT)
+        async with self._in_flight:
+            jobs = [self.dispatch(signal)] if broadcast else []
+            if rules:
+                jobs.append(self.dispatch_rules(signal, rules))
+            await asyncio.gather(*jobs)
+    
     def _get_category_emoji(self, category: str) -> str:
         """รับอีโมจิที่เหมาะสมสำหรับประเภทสัญญาณ"""
-        emoji_map = {
-            "strong buy": "🚀",
-            "weak buy": "📈",
-            "hold": "⏸️",
-            "weak sell": "📉",
-            "strong sell": "⚠️"
-        }
-        return emoji_map.get(category.lower(), "🔔")
+        return CATEGORY_EMOJI.get(category.lower(), DEFAULT_EMOJI)
     
     def _get_category_color(self, category: str) -> str:
         """รับสีที่เหมาะสมสำหรับประเภทสัญญาณ"""
-        color_map = {
-            "strong buy": "#00b33c",  # เขียวเข้ม
-            "weak buy": "#66cc66",    # เขียวอ่อน
-            "hold": "#b3b3b3",        # เทา
-            "weak sell": "#ff9980",   # แดงอ่อน
-            "strong sell": "#ff3300"  # แดงเข้ม
-        }
-        return color_map.get(category.lower(), "#b3b3b3")
+        return CATEGORY_COLOR.get(category.lower(), DEFAULT_COLOR)
     
     def _get_discord_color(self, category: str) -> int:
         """รับรหัสสี int สำหรับ Discord embed"""
-        color_map = {
-            "strong buy": 0x00b33c,  # เขียวเข้ม
-            "weak buy": 0x66cc66,    # เขียวอ่อน
-            "hold": 0xb3b3b3,        # เทา
-            "weak sell": 0xff9980,   # แดงอ่อน
-            "strong sell": 0xff3300  # แดงเข้ม
-        }
-        return color_map.get(category.lower(), 0xb3b3b3)
+        return DISCORD_COLOR.get(category.lower(), DEFAULT_DISCORD_COLOR)
     
     def process_message(self, message: Dict) -> None:
         """
@@ -262,39 +365,127 @@ class NotificationService:
         Args:
             message: ข้อความจาก Redis
         """
+        signal_data = self._parse_signal(message)
+        if signal_data:
+            # ส่งการแจ้งเตือนผ่านช่องทางต่างๆ
+            self.send_email_notification(signal_data)
+            self.send_webhook_notification(signal_data)
+            self.send_discord_notification(signal_data)
+    
+    async def process_message_async(self, message: Dict) -> None:
+        """
+        ตรวจสอบข้อความแล้วส่งการแจ้งเตือนเป็น task เบื้องหลัง (คืนค่าทันที ไม่รอการส่ง)
+        
+        Args:
+            message: ข้อความจาก Redis
+        """
+        signal_data = self._decode_signal(message)
+        if not signal_data:
+            return
+        
+        # ปลายทางส่วนกลางได้รับทุกสัญญาณที่ไม่ใช่ hold ส่วนกฎของผู้ใช้ตัดสินเอง
+        broadcast = self._should_broadcast(signal_data)
+        try:
+            rules = await asyncio.to_thread(self.alert_rules.match, signal_data)
+        except redis.RedisError as e:
+            logger.error("ไม่สามารถโหลดกฎการแจ้งเตือน: %s", str(e))
+            rules = []
+        
+        if self.outbox is not None:
+            # เขียนลง outbox แล้วให้ worker ส่ง (ส่งซ้ำได้และไม่ส่งสัญญาณเดิมซ้ำ)
+            await asyncio.to_thread(self._enqueue_outbox, signal_data, broadcast, rules)
+        elif broadcast or rules:
+            task = asyncio.create_task(self._dispatch_limited(signal_data, broadcast, rules))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    def _enqueue_outbox(self, signal: Dict[str, Any], broadcast: bool, rules: List[AlertRule]) -> None:
+        if broadcast:
+            self.outbox.enqueue(signal, list(self._senders()))
+        for rule in rules:
+            self.outbox.enqueue(signal, [rule.channel], target=rule.target)
+    
+    def _decode_signal(self, message: Dict) -> Optional[Dict[str, Any]]:
+        """แปลงข้อความจาก Redis เป็นสัญญาณ (None ถ้าไม่ใช่ข้อความสัญญาณ)"""
         try:
             if message['type'] == 'message':
                 # แปลง string เป็น JSON
-                signal_data = json.loads(message['data'])
-                
-                # ส่งการแจ้งเตือนเฉพาะเมื่อไม่ใช่สัญญาณ "hold"
-                if signal_data.get('category', '').lower() != 'hold':
-                    logger.info("ได้รับสัญญาณ %s สำหรับ %s ที่ความมั่นใจ %.2f%%", 
-                               signal_data.get('category', ''), 
-                               signal_data.get('symbol', ''), 
-                               signal_data.get('confidence', 0) * 100)
-                    
-                    # ส่งการแจ้งเตือนผ่านช่องทางต่างๆ
-                    self.send_email_notification(signal_data)
-                    self.send_webhook_notification(signal_data)
-                    self.send_discord_notification(signal_data)
+                return json.loads(message['data'])
         except Exception as e:
             logger.error("เกิดข้อผิดพลาดในการประมวลผลข้อความ: %s", str(e))
+        return None
+    
+    def _should_broadcast(self, signal_data: Dict[str, Any]) -> bool:
+        """ส่งการแจ้งเตือนส่วนกลางเฉพาะเมื่อไม่ใช่สัญญาณ hold"""
+        if signal_data.get('category', '').lower() == 'hold':
+            return False
+        logger.info("ได้รับสัญญาณ %s สำหรับ %s ที่ความมั่นใจ %.2f%%", 
+                   signal_data.get('category', ''), 
+                   signal_data.get('symbol', ''), 
+                   signal_data.get('confidence', 0) * 100)
+        return True
+    
+    def _parse_signal(self, message: Dict) -> Optional[Dict[str, Any]]:
+        """แปลงข้อความจาก Redis เป็นสัญญาณที่ต้องแจ้งเตือน (None ถ้าไม่ต้องแจ้งเตือน)"""
+        signal_data = self._decode_signal(message)
+        if signal_data and self._should_broadcast(signal_data):
+            return signal_data
+        return None
+    
+    def start_outbox_worker(self) -> Optional[asyncio.Task]:
+        """เริ่ม worker ที่ส่งการแจ้งเตือนจาก outbox ใน event loop ปัจจุบัน"""
+        if self.outbox is not None and self._outbox_task is None:
+            self._outbox_task = asyncio.create_task(self.outbox.run())
+        return self._outbox_task
+    
+    async def aclose(self, timeout: float = 10.0) -> None:
+        """หยุด outbox worker และรอการแจ้งเตือนที่กำลังส่ง (ไม่เกิน timeout วินาที) แล้วปิด HTTP client"""
+        if self._outbox_task is not None:
+            # entry ที่ยังไม่ได้ยืนยันจะถูก worker ตัวอื่นหรือรอบถัดไปรับไปส่งต่อ
+            self.outbox.stop()
+            done, _ = await asyncio.wait({self._outbox_task}, timeout=timeout)
+            if not done:
+                self._outbox_task.cancel()
+            self._outbox_task = None
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._email_digest is not None:
+            await asyncio.to_thread(self._email_digest.close)
+    
+    async def run(self) -> None:
+        """รอรับข้อความจาก Redis PubSub และส่งการแจ้งเตือนแบบ async"""
+        self.start_outbox_worker()
+        try:
+            await self.pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+            while True:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message:
+                    await self.process_message_async(message)
+        finally:
+            await self.pubsub.aclose()
+            await self.aclose()
+    
+    async def _run_standalone(self) -> None:
+        """รันบริการเป็นโปรเซสเดี่ยว แล้วปิด redis.asyncio pools ก่อน event loop จะถูกปิด"""
+        try:
+            await self.run()
+        finally:
+            await close_async_redis()
     
     def start(self) -> None:
         """เริ่มต้นบริการแจ้งเตือนและรอรับข้อความจาก Redis PubSub"""
         logger.info("เริ่มต้นการทำงานของบริการแจ้งเตือน...")
         
         try:
-            for message in self.pubsub.listen():
-                self.process_message(message)
+            asyncio.run(self._run_standalone())
         except KeyboardInterrupt:
             logger.info("หยุดบริการแจ้งเตือนเนื่องจากการยกเลิกจากผู้ใช้")
         except Exception as e:
             logger.error("เกิดข้อผิดพลาดในบริการแจ้งเตือน: %s", str(e))
         finally:
-            # ทำความสะอาดทรัพยากร
-            self.pubsub.unsubscribe()
             logger.info("บริการแจ้งเตือนถูกปิดลง")
 
 if __name__ == "__main__":
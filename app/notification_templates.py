@@ -0,0 +1,183 @@
+"""
+notification_templates.py - แม่แบบข้อความแจ้งเตือนที่เรนเดอร์ส่วนคงที่ไว้ล่วงหน้า
+
+ส่วนที่ขึ้นกับประเภทสัญญาณ (อีโมจิ สี ชื่อประเภท) ถูกแทนลงในแม่แบบของแต่ละช่องทางครั้งเดียวตอน import
+ตอนส่งเหลือเพียงเติมสัญลักษณ์และตัวเลข ลดงานต่อข้อความในโหมด digest และการส่งให้ผู้ใช้หลายคน
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+# ตารางค้นหาของแต่ละประเภทสัญญาณ
+CATEGORY_EMOJI = {
+    "strong buy": "🚀",
+    "weak buy": "📈",
+    "hold": "⏸️",
+    "weak sell": "📉",
+    "strong sell": "⚠️",
+}
+CATEGORY_COLOR = {
+    "strong buy": "#00b33c",  # เขียวเข้ม
+    "weak buy": "#66cc66",    # เขียวอ่อน
+    "hold": "#b3b3b3",        # เทา
+    "weak sell": "#ff9980",   # แดงอ่อน
+    "strong sell": "#ff3300", # แดงเข้ม
+}
+DISCORD_COLOR = {category: int(color[1:], 16) for category, color in CATEGORY_COLOR.items()}
+DEFAULT_EMOJI = "🔔"
+DEFAULT_COLOR = "#b3b3b3"
+DEFAULT_DISCORD_COLOR = 0xb3b3b3
+
+DISCLAIMER = "ข้อมูลนี้เป็นเพียงการวิเคราะห์เชิงเทคนิค ไม่ใช่คำแนะนำในการลงทุน"
+
+# แม่แบบดิบ: {{...}} คือช่องที่เติมตอนส่ง ส่วน {emoji} {color} {label} ถูกแทนต่อประเภทล่วงหน้า
+_EMAIL_SUBJECT = "🚨 สัญญาณการซื้อขาย: {label} สำหรับ {{symbol}}"
+_EMAIL_HTML = """
+        <html>
+        <body>
+            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                <h2 style="color: #333;">{emoji} สัญญาณการซื้อขายคริปโต</h2>
+                <div style="border-left: 4px solid {color}; padding: 10px; background-color: #f9f9f9; margin: 20px 0;">
+                    <h3 style="color: {color}; margin: 0;">{label}</h3>
+                    <p style="font-size: 18px; margin: 10px 0;">สัญลักษณ์: <strong>{{symbol}}</strong></p>
+                    <p>ราคาปัจจุบัน: ${{price:.2f}}</p>
+                    <p>การคาดการณ์: {{forecast_pct:.2f}}%</p>
+                    <p>ความมั่นใจ: {{confidence_pct:.1f}}%</p>
+                </div>
+                <div style="font-size: 12px; color: #999; margin-top: 30px;">
+                    <p>{disclaimer}</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+_DIGEST_ROW = """
+                <tr>
+                    <td>{emoji}</td>
+                    <td style="color: {color};"><strong>{label}</strong></td>
+                    <td>{{symbol}}</td>
+                    <td>${{price:.2f}}</td>
+                    <td>{{forecast_pct:.2f}}%</td>
+                    <td>{{confidence_pct:.1f}}%</td>
+                </tr>"""
+_DIGEST_HTML = """
+        <html>
+        <body>
+            <div style="font-family: Arial, sans-serif; max-width: 700px; margin: 0 auto;">
+                <h2 style="color: #333;">📊 สรุปสัญญาณการซื้อขายคริปโต ({count} รายการ)</h2>
+                <table style="width: 100%; border-collapse: collapse;">
+                    <tr style="background-color: #f2f2f2;">
+                        <th></th><th>สัญญาณ</th><th>สัญลักษณ์</th><th>ราคา</th><th>การคาดการณ์</th><th>ความมั่นใจ</th>
+                    </tr>{rows}
+                </table>
+                <div style="font-size: 12px; color: #999; margin-top: 30px;">
+                    <p>""" + DISCLAIMER + """</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+_DISCORD_TITLE = "{emoji} สัญญาณ {label} สำหรับ {{symbol}}"
+
+
+class _Shells:
+    """แม่แบบของประเภทสัญญาณหนึ่งที่แทนส่วนคงที่แล้ว"""
+    __slots__ = ("email_subject", "email_html", "digest_row", "discord_title", "discord_color")
+
+    def __init__(self, category: str):
+        parts = {
+            "emoji": CATEGORY_EMOJI.get(category, DEFAULT_EMOJI),
+            "color": CATEGORY_COLOR.get(category, DEFAULT_COLOR),
+            "label": category.upper(),
+            "disclaimer": DISCLAIMER,
+        }
+        self.email_subject = _EMAIL_SUBJECT.format_map(parts)
+        self.email_html = _EMAIL_HTML.format_map(parts)
+        self.digest_row = _DIGEST_ROW.format_map(parts)
+        self.discord_title = _DISCORD_TITLE.format_map(parts)
+        self.discord_color = DISCORD_COLOR.get(category, DEFAULT_DISCORD_COLOR)
+
+
+_SHELLS: Dict[str, _Shells] = {category: _Shells(category) for category in CATEGORY_EMOJI}
+_MAX_SHELLS = 64
+
+
+def _shells(category: str) -> _Shells:
+    """แม่แบบของประเภทสัญญาณ (ประเภทที่ไม่รู้จักถูกสร้างเมื่อพบครั้งแรกและเก็บไว้ไม่เกิน _MAX_SHELLS แบบ)"""
+    key = category.lower()
+    shells = _SHELLS.get(key)
+    if shells is None:
+        shells = _Shells(key)
+        if len(_SHELLS) < _MAX_SHELLS:
+            _SHELLS[key] = shells
+    return shells
+
+
+def _fields(signal: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "symbol": signal['symbol'],
+        "price": signal['price'],
+        "forecast_pct": signal['forecast_pct'],
+        "confidence_pct": signal['confidence'] * 100,
+    }
+
+
+def render_email(signal: Dict[str, Any]) -> Tuple[str, str]:
+    """หัวเรื่องและเนื้อหา HTML ของอีเมลแจ้งเตือนสัญญาณเดียว"""
+    shells = _shells(signal['category'])
+    fields = _fields(signal)
+    return shells.email_subject.format_map(fields), shells.email_html.format_map(fields)
+
+
+def render_digest(signals: Iterable[Dict[str, Any]]) -> str:
+    """เนื้อหา HTML ของอีเมลสรุปหลายสัญญาณ"""
+    rows = [_shells(signal['category']).digest_row.format_map(_fields(signal)) for signal in signals]
+    return _DIGEST_HTML.format(count=len(rows), rows="".join(rows))
+
+
+def _format_indicator(name: str, value: Any) -> str:
+    return f"• {name}: {value:.2f}" if value else f"• {name}: N/A"
+
+
+def render_discord_payload(signal: Dict[str, Any]) -> Dict[str, Any]:
+    """payload พร้อม embed สำหรับ Discord webhook"""
+    shells = _shells(signal['category'])
+    fields: List[Dict[str, Any]] = [
+        {"name": "ราคาปัจจุบัน", "value": f"${signal['price']:.2f}", "inline": True},
+        {"name": "การคาดการณ์", "value": f"{signal['forecast_pct']:.2f}%", "inline": True},
+        {"name": "ความมั่นใจ", "value": f"{signal['confidence'] * 100:.1f}%", "inline": True},
+    ]
+
+    # เพิ่มข้อมูลตัวชี้วัดถ้ามี
+    indicators = signal.get('indicators')
+    if indicators:
+        fields.append({
+            "name": "ตัวชี้วัดเทคนิคอล",
+            "value": "\n".join((
+                _format_indicator("EMA9", indicators.get('ema9')),
+                _format_indicator("EMA21", indicators.get('ema21')),
+                _format_indicator("RSI14", indicators.get('rsi14')),
+            )),
+            "inline": False,
+        })
+
+    return {
+        "username": "Crypto Signal Bot",
+        "embeds": [{
+            "title": shells.discord_title.format(symbol=signal['symbol']),
+            "color": shells.discord_color,
+            "fields": fields,
+            "footer": {"text": DISCLAIMER},
+        }],
+    }
+
+
+def render_webhook_payload(signal: Dict[str, Any]) -> Dict[str, Any]:
+    """ข้อมูลที่ส่งไปยัง webhook ทั่วไป"""
+    return {
+        "signal_type": signal['category'],
+        "symbol": signal['symbol'],
+        "price": signal['price'],
+        "forecast_pct": signal['forecast_pct'],
+        "confidence": signal['confidence'],
+        "timestamp": signal['timestamp'],
+        "indicators": signal.get('indicators', {}),
+    }
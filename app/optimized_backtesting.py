@@ -1,6 +1,7 @@
 import os
 import sys
 import argparse
+import asyncio
 import json
 import pandas as pd
 import numpy as np
@@ -21,7 +22,7 @@ from concurrent.futures import ThreadPoolExecutor
 
 from .logger import LoggerFactory, log_execution_time, error_logger, MetricsLogger
 from .signal_processor import grade_signal
-from .influxdb_storage import InfluxDBStorage
+from .influxdb_storage import get_influxdb_storage
 
 # Initialize loggers
 logger = LoggerFactory.get_logger('backtesting')
@@ -111,35 +112,28 @@ class MemoryOptimizedBacktester:
                 continue
             yield chunk
     
+    async def _load_columns(self) -> Dict[str, np.ndarray]:
+        """Stream candles page by page from InfluxDB and concatenate the NumPy columns"""
+        storage = get_influxdb_storage()
+        batches = []
+        try:
+            async for batch in storage.iter_market_data(self.symbol, self.start_timestamp, self.end_timestamp):
+                batches.append(batch)
+        finally:
+            await storage.aclose()
+        
+        if not batches:
+            return {name: np.array([]) for name in ("timestamp", "open", "high", "low", "close", "volume")}
+        return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+    
     @log_execution_time()
     def load_historical_data(self) -> pd.DataFrame:
         """Load historical data with memory optimization"""
         with self._memory_managed_operation("data_loading"):
             try:
-                storage = InfluxDBStorage()
-                query = f"""
-                    from(bucket: "crypto_data")
-                        |> range(start: {self.start_timestamp}, stop: {self.end_timestamp})
-                        |> filter(fn: (r) => r["symbol"] == "{self.symbol}")
-                        |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
-                """
-                
-                # Load data in chunks
-                chunk_size = 10000
-                all_data = []
-                
-                for chunk in storage.query_chunks(query, chunk_size):
-                    df_chunk = pd.DataFrame(chunk)
-                    all_data.append(df_chunk)
-                    
-                    # Monitor memory
-                    if len(all_data) >= self.chunk_config.max_chunks:
-                        combined = pd.concat(all_data, ignore_index=True)
-                        all_data = [combined]
-                        gc.collect()
-                
-                df = pd.concat(all_data, ignore_index=True)
-                return df
+                # Pages arrive as NumPy columns; build the DataFrame once at the end
+                columns = asyncio.run(self._load_columns())
+                return pd.DataFrame(columns)
                 
             except Exception as e:
                 self.logger.error(f"Error loading historical data: {e}")
@@ -5,21 +5,29 @@ import pandas as pd
 import redis
 import json
 import os
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 from .cache_manager import cache_manager
-from .influxdb_storage import InfluxDBStorage
+from .redis_manager import get_redis_client
+from .signal_store import signal_store
+from .influxdb_storage import get_influxdb_storage
 from .logger import LoggerFactory, log_execution_time, error_logger, MetricsLogger
+from .metrics import registry
+from . import latency_trace
 
 # โหลด environment variables
 load_dotenv()
 
 # ตั้งค่าการเชื่อมต่อ Redis
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 REDIS_SIGNAL_CHANNEL = "crypto_signals:signals"
 
+# เมตริกของ hot path (สะสมในหน่วยความจำ ดูได้ที่ /metrics)
+PRICE_HISTORY_LENGTH = registry.gauge("signal_price_history_length", "Prices kept per symbol", ("symbol",))
+INDICATOR_SECONDS = registry.histogram("signal_indicator_seconds", "Time to calculate the indicator batch")
+PROCESSING_SECONDS = registry.histogram("signal_processing_seconds", "Time to process one closed kline into a signal")
+SIGNALS = registry.counter("signals_total", "Signals generated by category", ("category",))
+
 # คลาส Enum สำหรับประเภทสัญญาณ
 class SignalCategory(str, Enum):
     STRONG_BUY = "strong buy"
@@ -37,16 +45,8 @@ class OptimizedSignalProcessor:
         self.metrics = MetricsLogger('signal_processor')
         
         try:
-            self.redis_client = redis.Redis(
-                host=REDIS_HOST,
-                port=REDIS_PORT,
-                password=REDIS_PASSWORD,
-                decode_responses=True,
-                socket_timeout=5,
-                socket_connect_timeout=5,
-                socket_keepalive=True,
-                health_check_interval=30
-            )
+            # ใช้ Redis client จาก connection pool ที่ใช้ร่วมกันทั้งแอป
+            self.redis_client = get_redis_client(decode_responses=True)
             self.logger.info("เชื่อมต่อ Redis สำเร็จ")
         except redis.RedisError as e:
             self.logger.error(f"ไม่สามารถเชื่อมต่อ Redis ได้: {e}")
@@ -54,8 +54,8 @@ class OptimizedSignalProcessor:
             raise
             
         try:
-            self.influxdb_storage = InfluxDBStorage()
-            self.logger.info("เชื่อมต่อ InfluxDB สำเร็จ")
+            # storage ใช้ร่วมกันทั้ง process และสร้าง client เมื่อเขียนครั้งแรก
+            self.influxdb_storage = get_influxdb_storage()
         except Exception as e:
             self.logger.error(f"ไม่สามารถเชื่อมต่อ InfluxDB ได้: {e}")
             error_logger.log_error(e, {'component': 'signal_processor', 'connection': 'influxdb'})
@@ -93,11 +93,7 @@ class OptimizedSignalProcessor:
                 self.logger.debug(f"ตัดประวัติราคาของ {symbol} เหลือ {self.max_history_length} รายการ")
                 
             # บันทึกเมตริก
-            self.metrics.record_metric(f'price_history_{symbol}', {
-                'length': len(self.price_history[symbol]),
-                'latest_price': price,
-                'timestamp': datetime.now().isoformat()
-            })
+            PRICE_HISTORY_LENGTH.labels(symbol).set(len(self.price_history[symbol]))
                 
         except Exception as e:
             self.logger.error(f"ข้อผิดพลาดในการอัพเดทประวัติราคา: {e}")
@@ -109,11 +105,19 @@ class OptimizedSignalProcessor:
             })
             raise
 
+    def prime_price_history(self, symbol: str, prices: List[float]) -> None:
+        """เติมประวัติราคาจากแท่งที่บันทึกไว้ (เรียกตอนเริ่ม process ก่อนรับข้อมูลสด)"""
+        if not prices:
+            return
+        history = list(prices) + self.price_history.get(symbol, [])
+        self.price_history[symbol] = history[-self.max_history_length:]
+        self.logger.info(f"เติมประวัติราคาของ {symbol} {len(self.price_history[symbol])} รายการ")
+
     @log_execution_time()
     def calculate_indicators_batch(self, symbol: str, prices: List[float]) -> Dict[str, Any]:
         """คำนวณตัวบ่งชี้ทางเทคนิคทั้งหมดพร้อมการจัดการข้อผิดพลาด"""
         try:
-            start_time = datetime.now()
+            start_time = time.perf_counter()
             
             if len(prices) < 22:
                 self.logger.warning(f"ข้อมูลราคาไม่เพียงพอสำหรับ {symbol} ({len(prices)} < 22)")
@@ -153,12 +157,7 @@ class OptimizedSignalProcessor:
             }
             
             # บันทึกเมตริก
-            execution_time = (datetime.now() - start_time).total_seconds()
-            self.metrics.record_metric(f'indicators_calculation_{symbol}', {
-                'execution_time': execution_time,
-                'indicators': result,
-                'timestamp': datetime.now().isoformat()
-            })
+            INDICATOR_SECONDS.observe(time.perf_counter() - start_time)
             
             return result
             
@@ -181,7 +180,9 @@ class OptimizedSignalProcessor:
     def process_market_data(self, symbol: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """ประมวลผลข้อมูลตลาดพร้อมการจัดการข้อผิดพลาดที่สมบูรณ์"""
         try:
-            start_time = datetime.now()
+            start_time = time.perf_counter()
+            trace = data.get('trace')
+            latency_trace.mark(trace, "process")
             
             # ตรวจสอบแคช
             cache_key = f"market_data:{symbol}"
@@ -217,20 +218,18 @@ class OptimizedSignalProcessor:
                 'indicators': indicators
             }
             
-            # บันทึกข้อมูลแบบ batch
+            # บันทึกข้อมูลแบบ atomic
+            latency_trace.mark(trace, "publish")
             try:
-                pipeline = self.redis_client.pipeline()
-                pipeline.publish(REDIS_SIGNAL_CHANNEL, json.dumps(signal))
-                pipeline.set(f"latest_signal:{symbol}", json.dumps(signal))
-                pipeline.lpush(f"signal_history:{symbol}", json.dumps(signal))
-                pipeline.ltrim(f"signal_history:{symbol}", 0, 99)
-                pipeline.execute()
+                # SET/LPUSH/LTRIM/PUBLISH ผ่านสคริปต์ Lua เดียว serialize JSON ครั้งเดียว
+                # (trace ไปกับข้อความ Pub/Sub เท่านั้น เพื่อวัดช่วง publish -> broadcast)
+                signal_store.publish(symbol, signal, REDIS_SIGNAL_CHANNEL, trace=trace)
             except redis.RedisError as e:
                 self.logger.error(f"ข้อผิดพลาดในการบันทึกข้อมูลใน Redis: {e}")
                 error_logger.log_error(e, {
                     'component': 'signal_processor',
                     'method': 'process_market_data',
-                    'operation': 'redis_batch_write',
+                    'operation': 'redis_signal_publish',
                     'symbol': symbol
                 })
             
@@ -250,12 +249,8 @@ class OptimizedSignalProcessor:
             self.cache.set_market_data(cache_key, "processed", signal, ttl=300)
             
             # บันทึกเมตริก
-            execution_time = (datetime.now() - start_time).total_seconds()
-            self.metrics.record_metric(f'market_data_processing_{symbol}', {
-                'execution_time': execution_time,
-                'signal_category': category,
-                'timestamp': datetime.now().isoformat()
-            })
+            PROCESSING_SECONDS.observe(time.perf_counter() - start_time)
+            SIGNALS.labels(SignalCategory(category).value).inc()
             
             return signal
             
@@ -352,13 +347,12 @@ class OptimizedSignalProcessor:
                 'timestamp': datetime.now().isoformat()
             })
             
-            # ล้างแคชเก่า
-            self.cache.cleanup_old_keys("market:*")
-            self.cache.cleanup_old_keys("prediction:*")
+            # ล้างแคชเก่า (market:* ครอบคลุม market:prediction:* ด้วย) ในเธรดเบื้องหลัง
+            # cleanup() ถูกเรียกจาก close() แบบ async ของ WebSocket client จึงต้องไม่รอ SCAN ทุก node
+            self.cache.stop_background_cleanup()
+            self.cache.schedule_cleanup(["market:*"])
             
-            # ปิดการเชื่อมต่อ
-            self.influxdb_storage.close()
-            self.redis_client.close()
+            # InfluxDBStorage และ Redis pool ใช้ร่วมกันทั้ง process จึงไม่ปิดที่นี่ (ปิดใน shutdown_event)
             
             self.logger.info("ทำความสะอาด resources เสร็จสมบูรณ์")
             
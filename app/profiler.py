@@ -0,0 +1,269 @@
+"""
+profiler.py - sampling profiler ในตัวและตัววัดความหน่วงของ event loop
+
+SamplingProfiler อ่าน stack ของทุกเธรด (event loop, executor ของ to_thread และเธรดของไลบรารี)
+ด้วย sys._current_frames() จากเธรดแยกทุก interval โดยไม่ต้องติดตั้ง hook ใด ๆ ในโค้ดที่ถูกวัด
+เมื่อไม่ได้ profile จึงไม่มี overhead เลย ผลลัพธ์เป็น collapsed stacks
+(บรรทัดละ "เธรด;frame;...;frame จำนวน") ที่ใช้กับ flamegraph.pl หรือ speedscope ได้ทันที
+
+- โหมด wall: นับทุกเธรดทุกรอบ (รวมเวลารอ I/O และ lock)
+- โหมด cpu: นับเฉพาะเธรดที่ได้ใช้ CPU ตั้งแต่รอบก่อน (อ่านจาก /proc/self/task บน Linux)
+
+EventLoopLagMonitor วัดว่า event loop ตื่นช้ากว่ากำหนดเท่าใด (เวลาที่ถูกบล็อกโดยโค้ดแบบ synchronous)
+และมีเธรด watchdog ที่ log stack ของ event loop ระหว่างที่ยังถูกบล็อกอยู่
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# นำเข้าโมดูลจัดการตัวแปรสภาพแวดล้อม
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+import env_manager as env
+
+try:
+    from .logger import LoggerFactory
+    from .metrics import registry
+except ImportError:
+    from logger import LoggerFactory
+    from metrics import registry
+
+logger = LoggerFactory.get_logger('profiler')
+
+# endpoint /admin/profile ปิดไว้จนกว่าจะตั้ง PROFILER_ENABLED=true และ PROFILER_TOKEN
+PROFILER_ENABLED = env.getenv("PROFILER_ENABLED", False, bool)
+PROFILER_TOKEN = env.getenv("PROFILER_TOKEN", "")
+PROFILER_MAX_SECONDS = env.getenv("PROFILER_MAX_SECONDS", 60, float)
+PROFILER_MIN_INTERVAL = 0.001
+PROFILE_MODES = ("wall", "cpu")
+
+EVENT_LOOP_LAG_INTERVAL = env.getenv("EVENT_LOOP_LAG_INTERVAL", 0.5, float)
+EVENT_LOOP_LAG_WARN_SECONDS = env.getenv("EVENT_LOOP_LAG_WARN_SECONDS", 0.25, float)
+
+EVENT_LOOP_LAG = registry.histogram("event_loop_lag_seconds", "How late the event loop woke up from a timed sleep")
+EVENT_LOOP_LAG_LAST = registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag measurement")
+EVENT_LOOP_STALLS = registry.counter("event_loop_stalls_total", "Event loop stalls longer than EVENT_LOOP_LAG_WARN_SECONDS")
+
+
+class ProfilerBusy(RuntimeError):
+    """มีการ profile อื่นกำลังทำงานอยู่ (ให้ทำได้ครั้งละหนึ่งรายการ)"""
+
+
+@dataclass
+class Profile:
+    """ผลการ profile"""
+    collapsed: str       # collapsed stacks เรียงจากจำนวนมากไปน้อย
+    samples: int         # จำนวนรอบที่สุ่ม
+    mode: str
+    interval: float
+    seconds: float       # เวลาที่ใช้จริง
+
+
+def _thread_cpu_ns(native_id: Optional[int]) -> Optional[int]:
+    """เวลา CPU สะสมของเธรด (ns) จาก /proc หรือ None ถ้าอ่านไม่ได้"""
+    if native_id is None:
+        return None
+    try:
+        with open(f"/proc/self/task/{native_id}/schedstat") as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        return ticks * 1_000_000_000 // os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SamplingProfiler:
+    """สุ่ม stack ของทุกเธรดในเธรดที่เรียก run() (ควรเรียกนอก event loop)"""
+
+    def __init__(self, interval: float = 0.01, mode: str = "wall", max_depth: int = 128,
+                 loop_thread_id: Optional[int] = None):
+        """
+        Args:
+            interval: ระยะห่างระหว่างการสุ่ม (วินาที ไม่ต่ำกว่า PROFILER_MIN_INTERVAL)
+            mode: "wall" หรือ "cpu"
+            max_depth: ความลึกสูงสุดของ stack ที่เก็บ (frame ที่ลึกกว่านี้ใกล้ราก thread ถูกตัด)
+            loop_thread_id: threading.get_ident() ของเธรด event loop (ใช้ติดป้ายใน stack)
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode ต้องเป็นหนึ่งใน {PROFILE_MODES}")
+        self.interval = max(interval, PROFILER_MIN_INTERVAL)
+        self.mode = mode
+        self.max_depth = max_depth
+        self.loop_thread_id = loop_thread_id
+        self._labels: Dict[Tuple[object, int], str] = {}
+        self._cpu: Dict[int, int] = {}
+
+    def _frame_label(self, frame) -> str:
+        code = frame.f_code
+        key = (code, frame.f_lineno)
+        label = self._labels.get(key)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})".replace(";", ":")
+            self._labels[key] = label
+        return label
+
+    def _collapse(self, ident: int, frame, thread: Optional[threading.Thread]) -> str:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._frame_label(frame))
+            frame = frame.f_back
+        root = thread.name if thread is not None else f"thread-{ident}"
+        if ident == self.loop_thread_id:
+            root += " [event loop]"
+        labels.append(root.replace(";", ":").replace(" ", "_"))
+        labels.reverse()
+        return ";".join(labels)
+
+    def _on_cpu(self, ident: int, thread: Optional[threading.Thread]) -> bool:
+        cpu_ns = _thread_cpu_ns(getattr(thread, "native_id", None))
+        if cpu_ns is None:
+            return True  # อ่านเวลา CPU ไม่ได้ (ไม่ใช่ Linux) นับแบบ wall
+        previous = self._cpu.get(ident)
+        self._cpu[ident] = cpu_ns
+        return previous is not None and cpu_ns > previous
+
+    def run(self, seconds: float) -> Profile:
+        """สุ่มเป็นเวลา seconds วินาทีแล้วคืนผลแบบ collapsed stacks"""
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_tick = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                thread = threads.get(ident)
+                if self.mode == "cpu" and not self._on_cpu(ident, thread):
+                    continue
+                stacks[self._collapse(ident, frame, thread)] += 1
+            # ไม่ถือ frame ไว้ข้ามรอบ (กันไม่ให้ object ในเธรดอื่นค้างอยู่)
+            frames = frame = None
+            samples += 1
+            next_tick += self.interval
+            if next_tick < now:
+                next_tick = now  # สุ่มไม่ทัน (เช่น GIL ถูกถือนาน) ไม่ต้องไล่ให้ทัน
+            time.sleep(max(next_tick - time.perf_counter(), 0))
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        return Profile(collapsed, samples, self.mode, self.interval, time.perf_counter() - started)
+
+
+_profile_lock = threading.Lock()
+
+
+def run_profile(seconds: float, mode: str = "wall", interval: float = 0.01,
+                loop_thread_id: Optional[int] = None) -> Profile:
+    """
+    profile ทั้ง process (ทำงานแบบ blocking ให้เรียกผ่าน asyncio.to_thread)
+
+    Raises:
+        ProfilerBusy: มีการ profile อื่นกำลังทำงาน
+        ValueError: mode ไม่ถูกต้อง
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("มีการ profile อื่นกำลังทำงานอยู่")
+    try:
+        profiler = SamplingProfiler(interval, mode, loop_thread_id=loop_thread_id)
+        logger.info("เริ่ม profile แบบ %s เป็นเวลา %.1f วินาที (ทุก %.1f ms)", mode, seconds, profiler.interval * 1000)
+        return profiler.run(seconds)
+    finally:
+        _profile_lock.release()
+
+
+class EventLoopLagMonitor:
+    """วัดความหน่วงของ event loop และ log stack ของ loop เมื่อถูกบล็อกนาน"""
+
+    def __init__(self, interval: float = EVENT_LOOP_LAG_INTERVAL,
+                 warn_seconds: float = EVENT_LOOP_LAG_WARN_SECONDS):
+        """
+        Args:
+            interval: ระยะห่างระหว่างการวัด (วินาที)
+            warn_seconds: ความหน่วงที่ถือว่า loop ถูกบล็อก (log stack และนับใน event_loop_stalls_total)
+        """
+        self.interval = interval
+        self.warn_seconds = warn_seconds
+        self.loop_thread_id: Optional[int] = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._last_tick = time.monotonic()
+        self._watchdog: Optional[threading.Thread] = None
+        self._running = False
+
+    async def run(self) -> None:
+        """วนวัดจนกว่า task จะถูกยกเลิก (เรียกด้วย asyncio.create_task ตอนเริ่มแอป)"""
+        loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self._running = True
+        self._last_tick = time.monotonic()
+        if self.warn_seconds > 0 and self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+            self._watchdog.start()
+        try:
+            while True:
+                started = loop.time()
+                await asyncio.sleep(self.interval)
+                self._record(max(loop.time() - started - self.interval, 0.0))
+        finally:
+            self._running = False
+            self._watchdog = None
+
+    def _record(self, lag: float) -> None:
+        self._last_tick = time.monotonic()
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+        if lag >= self.warn_seconds > 0:
+            self.stalls += 1
+            EVENT_LOOP_STALLS.inc()
+            logger.warning("Event loop ถูกบล็อก %.3f วินาที", lag)
+
+    def _watch(self) -> None:
+        """เธรด watchdog: ถ้า loop ไม่ตื่นตามกำหนด ให้ log stack ของ loop ครั้งเดียวต่อการบล็อกหนึ่งครั้ง"""
+        reported = None
+        while self._running:
+            time.sleep(self.interval)
+            tick = self._last_tick
+            if time.monotonic() - tick < self.interval + self.warn_seconds or tick == reported:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+            reported = tick
+            logger.warning("Event loop ไม่ตอบสนองนานกว่า %.3f วินาที stack ปัจจุบัน:\n%s",
+                           self.warn_seconds, stack)
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """สรุปความหน่วงของ event loop (วินาที, quantile เป็นขอบบนของ bucket)"""
+        return {
+            "interval": self.interval,
+            "count": EVENT_LOOP_LAG.count,
+            "last": self.last_lag,
+            "max": self.max_lag,
+            "p50": EVENT_LOOP_LAG.quantile(0.5),
+            "p99": EVENT_LOOP_LAG.quantile(0.99),
+            "stalls": self.stalls,
+        }
+
+
+loop_lag_monitor = EventLoopLagMonitor()
@@ -1,8 +1,23 @@
 """
 Redis Connection Manager - สร้าง Redis connection pool เพื่อใช้ร่วมกันในแอพพลิเคชัน
+
+เป็นจุดสร้าง Redis client เพียงจุดเดียวของทุกโมดูล ทั้งแบบ synchronous และ redis.asyncio
+พร้อมเก็บสถิติการใช้งาน pool (จำนวนที่ถูกยืม, ที่รออยู่, ที่สร้างขึ้น, และจำนวน timeout)
+
+รองรับ 3 โหมดผ่าน REDIS_MODE:
+- standalone: Redis เครื่องเดียว (ค่าเริ่มต้น)
+- cluster: Redis Cluster (REDIS_CLUSTER_NODES)
+- sharded: แบ่งข้อมูลตามสัญลักษณ์ไปยังหลาย Redis ด้วย consistent hashing (REDIS_SHARDS)
+  โดย shard แรกใช้เก็บคีย์ส่วนกลางและ Pub/Sub
 """
 import redis
-from typing import Optional
+import redis.asyncio
+import threading
+import hashlib
+import bisect
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
+import logging
 import os
 import sys
 
@@ -11,80 +26,478 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 import env_manager as env
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PoolStats:
+    """สถิติการใช้งาน connection pool หนึ่งชุด"""
+    created: int = 0          # จำนวน connection ที่สร้างขึ้นทั้งหมด
+    checked_out: int = 0      # จำนวน connection ที่ถูกยืมอยู่ในขณะนี้
+    peak_checked_out: int = 0 # จำนวนที่ถูกยืมพร้อมกันสูงสุด
+    waiting: int = 0          # จำนวนผู้เรียกที่กำลังรอ connection
+    acquired: int = 0         # จำนวนครั้งที่ยืม connection สำเร็จ
+    timeouts: int = 0         # จำนวนครั้งที่รอ connection จนหมดเวลา
+    _leased: set = field(default_factory=set, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record_created(self) -> None:
+        with self._lock:
+            self.created += 1
+
+    def record_wait_start(self) -> None:
+        with self._lock:
+            self.waiting += 1
+
+    def record_wait_end(self, connection=None, timed_out: bool = False) -> None:
+        with self._lock:
+            self.waiting -= 1
+            if connection is not None:
+                self.acquired += 1
+                self._leased.add(id(connection))
+                self.checked_out = len(self._leased)
+                self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            elif timed_out:
+                self.timeouts += 1
+
+    def record_release(self, connection) -> None:
+        # redis-py เรียก release ภายใน get_connection เมื่อเชื่อมต่อไม่สำเร็จ จึงนับเฉพาะที่ยืมไปจริง
+        with self._lock:
+            self._leased.discard(id(connection))
+            self.checked_out = len(self._leased)
+
+    def snapshot(self, max_connections: int) -> Dict[str, Any]:
+        """คืนค่าสถิติปัจจุบันพร้อมอัตราการใช้งาน pool"""
+        with self._lock:
+            return {
+                'max_connections': max_connections,
+                'created': self.created,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'utilization': self.checked_out / max_connections if max_connections else 0.0
+            }
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """BlockingConnectionPool ที่เก็บสถิติการยืม/คืน connection"""
+
+    def __init__(self, *args, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.stats.record_created()
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        self.stats.record_wait_start()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except redis.ConnectionError as e:
+            self.stats.record_wait_end(timed_out="No connection available" in str(e))
+            raise
+        except BaseException:
+            self.stats.record_wait_end()
+            raise
+        self.stats.record_wait_end(connection)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        self.stats.record_release(connection)
+
+
+class InstrumentedAsyncConnectionPool(redis.asyncio.BlockingConnectionPool):
+    """redis.asyncio BlockingConnectionPool ที่เก็บสถิติการยืม/คืน connection"""
+
+    def __init__(self, *args, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.stats.record_created()
+        return connection
+
+    async def get_connection(self, *args, **kwargs):
+        self.stats.record_wait_start()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except redis.asyncio.ConnectionError as e:
+            self.stats.record_wait_end(timed_out="No connection available" in str(e))
+            raise
+        except BaseException:
+            self.stats.record_wait_end()
+            raise
+        self.stats.record_wait_end(connection)
+        return connection
+
+    async def release(self, connection):
+        await super().release(connection)
+        self.stats.record_release(connection)
+
+
+def _resolve_parser_class(parser: str, protocol: int, use_async: bool):
+    """
+    เลือก parser class ตามการตั้งค่า REDIS_PARSER
+
+    Args:
+        parser: "auto" (ให้ redis-py เลือกเอง), "hiredis" หรือ "python"
+        protocol: เวอร์ชันของ RESP (2 หรือ 3)
+        use_async: True สำหรับ parser ของ redis.asyncio
+
+    Returns:
+        parser class หรือ None เพื่อใช้ค่าเริ่มต้นของ redis-py
+    """
+    if parser == "auto":
+        return None
+
+    try:
+        from redis import _parsers
+        from redis.utils import HIREDIS_AVAILABLE
+    except ImportError:
+        logger.warning("redis-py เวอร์ชันนี้ไม่รองรับการเลือก parser - ใช้ค่าเริ่มต้น")
+        return None
+
+    if parser == "hiredis":
+        if not HIREDIS_AVAILABLE:
+            logger.warning("ไม่พบแพ็กเกจ hiredis - ใช้ parser ค่าเริ่มต้นแทน")
+            return None
+        return _parsers._AsyncHiredisParser if use_async else _parsers._HiredisParser
+
+    if parser == "python":
+        if protocol == 3:
+            return _parsers._AsyncRESP3Parser if use_async else _parsers._RESP3Parser
+        return _parsers._AsyncRESP2Parser if use_async else _parsers._RESP2Parser
+
+    logger.warning(f"ไม่รู้จัก REDIS_PARSER={parser} - ใช้ parser ค่าเริ่มต้น")
+    return None
+
+
+def _parse_nodes(nodes: str) -> List[Tuple[str, int]]:
+    """แปลงสตริง "host:port,host:port" เป็นรายการ (host, port)"""
+    result = []
+    for node in nodes.split(","):
+        node = node.strip()
+        if not node:
+            continue
+        host, _, port = node.rpartition(":")
+        result.append((host or node, int(port) if host else 6379))
+    return result
+
+
+class ConsistentHashRing:
+    """วงแหวน consistent hashing สำหรับกระจายสัญลักษณ์ไปยัง shard"""
+
+    def __init__(self, nodes: List[str], vnodes: int = 160):
+        """
+        Args:
+            nodes: รายชื่อ shard
+            vnodes: จำนวน virtual node ต่อ shard (ยิ่งมากยิ่งกระจายสม่ำเสมอ)
+        """
+        self._hashes: List[int] = []
+        self._nodes: List[str] = []
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node)
+            for node in nodes
+            for i in range(vnodes)
+        )
+        for point, node in points:
+            self._hashes.append(point)
+            self._nodes.append(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def get_node(self, key: str) -> str:
+        """หา shard ที่รับผิดชอบคีย์"""
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
 class RedisManager:
     """
     จัดการการเชื่อมต่อกับ Redis ด้วย Connection Pool สำหรับใช้ร่วมกันทั้งแอปพลิเคชัน
     ช่วยลดการสร้างและปิดการเชื่อมต่อซ้ำซ้อน
     """
-    
+
     _instance = None
     _pool = None
     _text_pool = None  # สำหรับ decode_responses=True
-    
+
     @staticmethod
     def get_instance():
         """
         รับ singleton instance ของ RedisManager
-        
+
         Returns:
             RedisManager: instance ที่ใช้ร่วมกัน
         """
         if RedisManager._instance is None:
             RedisManager._instance = RedisManager()
         return RedisManager._instance
-      def __init__(self):
+
+    def __init__(self):
         """เริ่มต้น connection pool สำหรับ Redis"""
         if RedisManager._pool is not None:
             return
-            
+
         # ดึงการตั้งค่า Redis จาก env_manager
-        redis_config = env.get_redis_config()
-        
+        self.config = env.get_redis_config()
+        self.mode = self.config["mode"]
+
+        # async pools จะถูกสร้างเมื่อมีการขอใช้ครั้งแรก (ต้องสร้างภายใน event loop)
+        self._async_pool = None
+        self._async_text_pool = None
+        self._cluster = None
+        self._text_cluster = None
+        self._async_clusters: Dict[bool, Any] = {}
+        self._shards: Dict[str, Dict[str, Any]] = {}
+        self._ring: Optional[ConsistentHashRing] = None
+
+        if self.mode == "cluster":
+            self._cluster = self._create_cluster(decode_responses=False)
+            self._text_cluster = self._create_cluster(decode_responses=True)
+            return
+
+        if self.mode == "sharded":
+            for index, (host, port) in enumerate(_parse_nodes(self.config["shards"])):
+                self._shards[f"shard{index}"] = {
+                    'host': host,
+                    'port': port,
+                    'pool': self._create_pool(False, host, port),
+                    'text_pool': self._create_pool(True, host, port),
+                    'async_pool': None,
+                    'async_text_pool': None
+                }
+            if not self._shards:
+                raise ValueError("REDIS_MODE=sharded ต้องกำหนด REDIS_SHARDS อย่างน้อยหนึ่งเครื่อง")
+            self._ring = ConsistentHashRing(list(self._shards), self.config["shard_vnodes"])
+
+            # shard แรกใช้สำหรับคีย์ส่วนกลางและ Pub/Sub
+            primary = self._shards["shard0"]
+            self._pool = primary['pool']
+            self._text_pool = primary['text_pool']
+            return
+
         # สร้าง pool สำหรับข้อมูลไบนารี (สำหรับใช้กับ pickle และการบีบอัด)
-        self._pool = redis.ConnectionPool(
-            host=redis_config["host"],
-            port=redis_config["port"],
-            password=redis_config["password"],
-            decode_responses=False,
-            max_connections=20,
-            socket_timeout=5,
-            socket_connect_timeout=5,
-            socket_keepalive=True,
-            health_check_interval=30
-        )
-        
+        self._pool = self._create_pool(decode_responses=False)
+
         # สร้าง pool สำหรับข้อความ (สำหรับใช้กับ JSON)
-        self._text_pool = redis.ConnectionPool(
-            host=redis_config["host"],
-            port=redis_config["port"],
-            password=REDIS_PASSWORD,
-            decode_responses=True,
-            max_connections=20,
-            socket_timeout=5,
-            socket_connect_timeout=5,
-            socket_keepalive=True,
-            health_check_interval=30
+        self._text_pool = self._create_pool(decode_responses=True)
+
+    def _connection_kwargs(self, decode_responses: bool, use_async: bool,
+                           host: Optional[str] = None, port: Optional[int] = None) -> Dict[str, Any]:
+        """สร้างพารามิเตอร์การเชื่อมต่อที่ใช้ร่วมกันระหว่าง sync และ async pool"""
+        kwargs = {
+            'host': host or self.config["host"],
+            'port': port or self.config["port"],
+            'password': self.config["password"],
+            'decode_responses': decode_responses,
+            'max_connections': self.config["max_connections"],
+            'timeout': self.config["pool_timeout"],
+            'socket_timeout': 5,
+            'socket_connect_timeout': 5,
+            'socket_keepalive': True,
+            'health_check_interval': 30
+        }
+
+        # RESP3 ต้องใช้ redis-py >= 5.0 จึงส่งค่าเฉพาะเมื่อไม่ใช่ค่าเริ่มต้น
+        if self.config["protocol"] != 2:
+            kwargs['protocol'] = self.config["protocol"]
+
+        parser_class = _resolve_parser_class(self.config["parser"], self.config["protocol"], use_async)
+        if parser_class is not None:
+            kwargs['parser_class'] = parser_class
+
+        return kwargs
+
+    def _create_pool(self, decode_responses: bool, host: Optional[str] = None,
+                     port: Optional[int] = None) -> InstrumentedConnectionPool:
+        """สร้าง synchronous connection pool ที่เก็บสถิติ"""
+        return InstrumentedConnectionPool(**self._connection_kwargs(decode_responses, False, host, port))
+
+    def _create_async_pool(self, decode_responses: bool, host: Optional[str] = None,
+                           port: Optional[int] = None) -> InstrumentedAsyncConnectionPool:
+        """สร้าง redis.asyncio connection pool ที่เก็บสถิติ"""
+        return InstrumentedAsyncConnectionPool(**self._connection_kwargs(decode_responses, True, host, port))
+
+    def _create_cluster(self, decode_responses: bool, use_async: bool = False):
+        """สร้าง client สำหรับ Redis Cluster (sync หรือ redis.asyncio)"""
+        if use_async:
+            from redis.asyncio.cluster import RedisCluster, ClusterNode
+        else:
+            from redis.cluster import RedisCluster, ClusterNode
+
+        kwargs = self._connection_kwargs(decode_responses, use_async)
+        # RedisCluster จัดการ pool ของแต่ละ node เอง
+        for key in ('host', 'port', 'timeout', 'max_connections'):
+            kwargs.pop(key)
+
+        startup_nodes = [ClusterNode(host, port) for host, port in _parse_nodes(self.config["cluster_nodes"])]
+        if not startup_nodes:
+            startup_nodes = [ClusterNode(self.config["host"], self.config["port"])]
+
+        return RedisCluster(
+            startup_nodes=startup_nodes,
+            max_connections=self.config["max_connections"],
+            **kwargs
         )
-    
+
     def get_redis_client(self, decode_responses: bool = False) -> redis.Redis:
         """
         รับ Redis client ที่ใช้ connection pool
-        
+
+        ในโหมด cluster จะได้ RedisCluster client และในโหมด sharded จะได้ client ของ shard หลัก
+
         Args:
             decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ (เหมาะสำหรับ JSON)
-            
+
         Returns:
             redis.Redis: client ที่ใช้ connection pool
         """
+        if self.mode == "cluster":
+            return self._text_cluster if decode_responses else self._cluster
+
         if decode_responses:
             return redis.Redis(connection_pool=self._text_pool)
         else:
             return redis.Redis(connection_pool=self._pool)
-    
+
+    def get_redis_client_for_symbol(self, symbol: str, decode_responses: bool = False) -> redis.Redis:
+        """
+        รับ Redis client ที่รับผิดชอบข้อมูลของสัญลักษณ์
+
+        Args:
+            symbol: สัญลักษณ์คู่เหรียญ
+            decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ
+
+        Returns:
+            redis.Redis: client ของ shard ที่เก็บข้อมูลสัญลักษณ์นี้
+        """
+        if self.mode != "sharded":
+            return self.get_redis_client(decode_responses)
+
+        shard = self._shards[self._ring.get_node(symbol)]
+        return redis.Redis(connection_pool=shard['text_pool' if decode_responses else 'pool'])
+
+    def shard_for(self, symbol: str) -> str:
+        """
+        ชื่อ shard ที่เก็บข้อมูลของสัญลักษณ์ ใช้จัดกลุ่มคำสั่งหลายสัญลักษณ์ให้เหลือหนึ่ง round-trip ต่อ shard
+
+        Returns:
+            ชื่อ shard ในโหมด sharded หรือชื่อโหมด (standalone/cluster) ซึ่งทุกสัญลักษณ์ใช้ client เดียวกัน
+        """
+        if self.mode != "sharded":
+            return self.mode
+        return self._ring.get_node(symbol)
+
+    def get_async_redis_client(self, decode_responses: bool = False) -> redis.asyncio.Redis:
+        """
+        รับ redis.asyncio client ที่ใช้ async connection pool ร่วมกัน
+
+        Args:
+            decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ (เหมาะสำหรับ JSON)
+
+        Returns:
+            redis.asyncio.Redis: client ที่ใช้ async connection pool
+        """
+        if self.mode == "cluster":
+            if decode_responses not in self._async_clusters:
+                self._async_clusters[decode_responses] = self._create_cluster(decode_responses, use_async=True)
+            return self._async_clusters[decode_responses]
+
+        if self.mode == "sharded":
+            return self._get_async_shard_client("shard0", decode_responses)
+
+        if decode_responses:
+            if self._async_text_pool is None:
+                self._async_text_pool = self._create_async_pool(decode_responses=True)
+            return redis.asyncio.Redis(connection_pool=self._async_text_pool)
+        else:
+            if self._async_pool is None:
+                self._async_pool = self._create_async_pool(decode_responses=False)
+            return redis.asyncio.Redis(connection_pool=self._async_pool)
+
+    def get_async_redis_client_for_symbol(self, symbol: str, decode_responses: bool = False) -> redis.asyncio.Redis:
+        """
+        รับ redis.asyncio client ที่รับผิดชอบข้อมูลของสัญลักษณ์
+
+        Args:
+            symbol: สัญลักษณ์คู่เหรียญ
+            decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ
+
+        Returns:
+            redis.asyncio.Redis: client ของ shard ที่เก็บข้อมูลสัญลักษณ์นี้
+        """
+        if self.mode != "sharded":
+            return self.get_async_redis_client(decode_responses)
+        return self._get_async_shard_client(self._ring.get_node(symbol), decode_responses)
+
+    def _get_async_shard_client(self, name: str, decode_responses: bool) -> redis.asyncio.Redis:
+        """สร้าง (ถ้ายังไม่มี) และคืน async client ของ shard"""
+        shard = self._shards[name]
+        key = 'async_text_pool' if decode_responses else 'async_pool'
+        if shard[key] is None:
+            shard[key] = self._create_async_pool(decode_responses, shard['host'], shard['port'])
+        return redis.asyncio.Redis(connection_pool=shard[key])
+
+    def get_node_clients(self, decode_responses: bool = False) -> List[redis.Redis]:
+        """
+        รับ client แยกของทุก node สำหรับงานที่ต้องทำทีละเครื่อง เช่น SCAN
+
+        Returns:
+            รายการ client: เครื่องเดียวในโหมด standalone, ทุก shard ในโหมด sharded
+            และทุก primary node ในโหมด cluster
+        """
+        if self.mode == "cluster":
+            cluster = self._text_cluster if decode_responses else self._cluster
+            return [cluster.get_redis_connection(node) for node in cluster.get_primaries()]
+
+        if self.mode == "sharded":
+            key = 'text_pool' if decode_responses else 'pool'
+            return [redis.Redis(connection_pool=shard[key]) for shard in self._shards.values()]
+
+        return [self.get_redis_client(decode_responses)]
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        ดึงสถิติการใช้งานของทุก connection pool
+
+        Returns:
+            dict ของสถิติแยกตามชื่อ pool (binary, text, async_binary, async_text)
+            ในโหมด sharded ชื่อจะขึ้นต้นด้วยชื่อ shard และในโหมด cluster จะไม่มีสถิติ
+            เพราะ RedisCluster จัดการ pool ของแต่ละ node เอง
+        """
+        if self.mode == "sharded":
+            kinds = {'pool': 'binary', 'text_pool': 'text', 'async_pool': 'async_binary', 'async_text_pool': 'async_text'}
+            pools = {
+                f"{name}:{label}": shard[kind]
+                for name, shard in self._shards.items()
+                for kind, label in kinds.items()
+            }
+        else:
+            pools = {
+                'binary': self._pool,
+                'text': self._text_pool,
+                'async_binary': self._async_pool,
+                'async_text': self._async_text_pool
+            }
+        return {
+            name: pool.stats.snapshot(pool.max_connections)
+            for name, pool in pools.items()
+            if pool is not None
+        }
+
     def ping(self) -> bool:
         """
         ทดสอบการเชื่อมต่อกับ Redis
-        
+
         Returns:
             bool: True ถ้าเชื่อมต่อได้สำเร็จ
         """
@@ -96,10 +509,32 @@ class RedisManager:
 
     def close(self):
         """ปิดการเชื่อมต่อ Redis pools"""
-        if self._pool:
-            self._pool.disconnect()
-        if self._text_pool:
-            self._text_pool.disconnect()
+        if self.mode == "cluster":
+            for cluster in (self._cluster, self._text_cluster):
+                cluster.close()
+            return
+
+        pools = [self._pool, self._text_pool]
+        pools += [shard[key] for shard in self._shards.values() for key in ('pool', 'text_pool')]
+        for pool in pools:
+            if pool:
+                pool.disconnect()
+
+    async def aclose(self):
+        """ปิดการเชื่อมต่อ redis.asyncio pools"""
+        for cluster in self._async_clusters.values():
+            await cluster.aclose()
+        self._async_clusters.clear()
+
+        pools = [self._async_pool, self._async_text_pool]
+        for shard in self._shards.values():
+            pools += [shard['async_pool'], shard['async_text_pool']]
+            shard['async_pool'] = shard['async_text_pool'] = None
+        for pool in pools:
+            if pool:
+                await pool.disconnect()
+        self._async_pool = None
+        self._async_text_pool = None
 
 # สร้าง singleton instance ที่พร้อมใช้งาน
 redis_manager = RedisManager.get_instance()
@@ -108,19 +543,116 @@ redis_manager = RedisManager.get_instance()
 def get_redis_client(decode_responses: bool = False) -> redis.Redis:
     """
     รับ Redis client ที่ใช้ connection pool จาก singleton instance
-    
+
     Args:
         decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ (เหมาะสำหรับ JSON)
-        
+
     Returns:
         redis.Redis: client ที่ใช้ connection pool
     """
     return redis_manager.get_redis_client(decode_responses)
 
+def get_async_redis_client(decode_responses: bool = False) -> redis.asyncio.Redis:
+    """
+    รับ redis.asyncio client ที่ใช้ async connection pool จาก singleton instance
+
+    Args:
+        decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ (เหมาะสำหรับ JSON)
+
+    Returns:
+        redis.asyncio.Redis: client ที่ใช้ async connection pool
+    """
+    return redis_manager.get_async_redis_client(decode_responses)
+
+async def close_async_redis() -> None:
+    """ปิด redis.asyncio pools ของ singleton instance (เรียกตอนปิดแอปภายใน event loop เดียวกับที่ใช้งาน)"""
+    await redis_manager.aclose()
+
+def get_redis_client_for_symbol(symbol: str, decode_responses: bool = False) -> redis.Redis:
+    """
+    รับ Redis client ที่รับผิดชอบข้อมูลของสัญลักษณ์ (ใช้กับคีย์ที่สร้างจาก symbol_key)
+
+    Args:
+        symbol: สัญลักษณ์คู่เหรียญ
+        decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ
+
+    Returns:
+        redis.Redis: client ของ shard/cluster ที่เก็บข้อมูลสัญลักษณ์นี้
+    """
+    return redis_manager.get_redis_client_for_symbol(symbol, decode_responses)
+
+def get_async_redis_client_for_symbol(symbol: str, decode_responses: bool = False) -> redis.asyncio.Redis:
+    """
+    รับ redis.asyncio client ที่รับผิดชอบข้อมูลของสัญลักษณ์
+
+    Args:
+        symbol: สัญลักษณ์คู่เหรียญ
+        decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ
+
+    Returns:
+        redis.asyncio.Redis: client ของ shard/cluster ที่เก็บข้อมูลสัญลักษณ์นี้
+    """
+    return redis_manager.get_async_redis_client_for_symbol(symbol, decode_responses)
+
+def shard_for(symbol: str) -> str:
+    """
+    ชื่อ shard ที่เก็บข้อมูลของสัญลักษณ์ (สัญลักษณ์ที่ได้ชื่อเดียวกันใช้ client เดียวกันได้)
+
+    Args:
+        symbol: สัญลักษณ์คู่เหรียญ
+
+    Returns:
+        ชื่อ shard เช่น "shard0" หรือ "standalone"/"cluster" เมื่อไม่ได้แบ่ง shard
+    """
+    return redis_manager.shard_for(symbol)
+
+def get_node_clients(decode_responses: bool = False) -> List[redis.Redis]:
+    """
+    รับ client ของทุก node (standalone, ทุก shard หรือทุก cluster primary)
+
+    Args:
+        decode_responses: True เพื่อแปลงข้อมูลเป็น string โดยอัตโนมัติ
+
+    Returns:
+        รายการ client แยกตาม node
+    """
+    return redis_manager.get_node_clients(decode_responses)
+
+def get_redis_mode() -> str:
+    """ดึงโหมดการใช้งาน Redis ปัจจุบัน (standalone, cluster หรือ sharded)"""
+    return redis_manager.mode
+
+def symbol_key(prefix: str, symbol: str) -> str:
+    """
+    สร้างคีย์ Redis ของข้อมูลรายสัญลักษณ์
+
+    ในโหมด cluster/sharded จะใส่ hash tag ({symbol}) เพื่อให้ทุกคีย์ของสัญลักษณ์เดียวกัน
+    อยู่ใน slot เดียวกัน ทำให้ pipeline และสคริปต์ของสัญลักษณ์นั้นทำงานได้ใน node เดียว
+
+    Args:
+        prefix: คำนำหน้าคีย์ เช่น "latest_signal"
+        symbol: สัญลักษณ์คู่เหรียญ
+
+    Returns:
+        คีย์ เช่น "latest_signal:BTCUSDT" หรือ "latest_signal:{BTCUSDT}"
+    """
+    if redis_manager.mode == "standalone":
+        return f"{prefix}:{symbol}"
+    return f"{prefix}:{{{symbol}}}"
+
+def get_redis_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    ดึงสถิติการใช้งาน connection pool ทั้งหมด
+
+    Returns:
+        dict ของสถิติแยกตามชื่อ pool
+    """
+    return redis_manager.get_pool_stats()
+
 def check_redis_connection() -> bool:
     """
     ตรวจสอบการเชื่อมต่อกับ Redis
-    
+
     Returns:
         bool: True ถ้าเชื่อมต่อได้สำเร็จ
     """
@@ -3,6 +3,7 @@ from enum import Enum
 from typing import Tuple, Dict, Any, List, Optional
 import pandas as pd
 import json
+import redis
 
 import os
 import sys
@@ -14,31 +15,39 @@ import env_manager as env
 
 # นำเข้าคลาส Redis Manager ที่สร้างใหม่
 from .redis_manager import get_redis_client
+from .signal_store import signal_store
+from .logger import LoggerFactory
+from . import latency_trace
+
+logger = LoggerFactory.get_logger('signal_processor')
 
 # นำเข้าคลาส InfluxDBStorage ด้วยการลองหลายวิธี
 try:
     # เมื่อรันเป็น module โดยตรง
-    from .influxdb_storage import InfluxDBStorage
+    from .influxdb_storage import InfluxDBStorage, get_influxdb_storage
 except (ImportError, ModuleNotFoundError):
     try:
         # เมื่อรันจาก app directory โดยตรง
-        from app.influxdb_storage import InfluxDBStorage
+        from app.influxdb_storage import InfluxDBStorage, get_influxdb_storage
     except (ImportError, ModuleNotFoundError):
         try:
             # เมื่อรันเป็น script โดยตรง
-            from influxdb_storage import InfluxDBStorage
+            from influxdb_storage import InfluxDBStorage, get_influxdb_storage
         except (ImportError, ModuleNotFoundError):
-            print("ไม่สามารถนำเข้า InfluxDBStorage ได้ - จะทำงานโดยไม่มีการบันทึกข้อมูลลง InfluxDB")
+            logger.warning("ไม่สามารถนำเข้า InfluxDBStorage ได้ - จะทำงานโดยไม่มีการบันทึกข้อมูลลง InfluxDB")
             # สร้างคลาสจำลองเพื่อหลีกเลี่ยงข้อผิดพลาด
             class InfluxDBStorage:
                 def __init__(self):
-                    print("คลาส InfluxDBStorage จำลอง - ไม่มีการเชื่อมต่อกับ InfluxDB จริง")
+                    logger.info("คลาส InfluxDBStorage จำลอง - ไม่มีการเชื่อมต่อกับ InfluxDB จริง")
                 
                 def store_signal(self, signal):
                     pass
                 
                 def close(self):
                     pass
+            
+            def get_influxdb_storage():
+                return InfluxDBStorage()
 
 # ตั้งค่าการเชื่อมต่อ Redis
 redis_config = env.get_redis_config()
@@ -60,10 +69,11 @@ class SignalProcessor:
         # ใช้ Redis client จาก connection pool แทนการสร้างใหม่
         self.redis_client = get_redis_client(decode_responses=True)
         
-        # สร้างอินสแตนซ์ของ InfluxDBStorage
-        self.influxdb_storage = InfluxDBStorage()
+        # ใช้ InfluxDBStorage ที่ใช้ร่วมกันทั้ง process
+        self.influxdb_storage = get_influxdb_storage()
         
         self.price_history = {}
+        self.max_history_length = 50
         self.cache = cache_manager
         
     def update_price_history(self, symbol: str, price: float):
@@ -77,8 +87,20 @@ class SignalProcessor:
         if symbol not in self.price_history:
             self.price_history[symbol] = []
         self.price_history[symbol].append(price)
-        if len(self.price_history[symbol]) > 50:
-            self.price_history[symbol] = self.price_history[symbol][-50:]
+        if len(self.price_history[symbol]) > self.max_history_length:
+            self.price_history[symbol] = self.price_history[symbol][-self.max_history_length:]
+            
+    def prime_price_history(self, symbol: str, prices: List[float]):
+        """
+        เติมประวัติราคาจากแท่งที่บันทึกไว้ (เรียกตอนเริ่ม process ก่อนรับข้อมูลสด)
+        
+        Args:
+            symbol: สัญลักษณ์คู่สกุลเงิน
+            prices: ราคาปิดเรียงจากเก่าไปใหม่
+        """
+        if prices:
+            history = list(prices) + self.price_history.get(symbol, [])
+            self.price_history[symbol] = history[-self.max_history_length:]
     
     @cache_manager.cache_technical_indicator
     def calculate_ema(self, prices: List[float], period: int) -> List[float]:
@@ -188,6 +210,8 @@ class SignalProcessor:
             
         try:
             if data.get('is_closed', False):
+                trace = data.get('trace')
+                latency_trace.mark(trace, "process")
                 open_price = float(data.get('open', 0))
                 close_price = float(data.get('close', 0))
                 if open_price > 0:
@@ -204,35 +228,21 @@ class SignalProcessor:
                         'price': close_price,
                         'indicators': indicators
                     }
+                    latency_trace.mark(trace, "publish")
                     
                     try:
-                        # เผยแพร่สัญญาณผ่าน Redis Pub/Sub
-                        self.redis_client.publish(
-                            REDIS_SIGNAL_CHANNEL, 
-                            json.dumps(signal)
-                        )
-                        
-                        # เก็บสัญญาณล่าสุดใน Redis
-                        self.redis_client.set(
-                            f"latest_signal:{symbol}", 
-                            json.dumps(signal)
-                        )
-                        
-                        # เก็บประวัติสัญญาณใน Redis
-                        self.redis_client.lpush(
-                            f"signal_history:{symbol}", 
-                            json.dumps(signal)
-                        )
-                        self.redis_client.ltrim(f"signal_history:{symbol}", 0, 99)
+                        # เผยแพร่และเก็บสัญญาณล่าสุด/ประวัติใน Redis ด้วยสคริปต์ Lua เดียว
+                        # (trace ไปกับข้อความ Pub/Sub เท่านั้น เพื่อวัดช่วง publish -> broadcast)
+                        signal_store.publish(symbol, signal, REDIS_SIGNAL_CHANNEL, trace=trace)
                     except redis.RedisError as e:
-                        print(f"⚠️ เกิดข้อผิดพลาด Redis ในการบันทึกสัญญาณ: {e}")
+                        logger.warning("⚠️ เกิดข้อผิดพลาด Redis ในการบันทึกสัญญาณ: %s", e)
                     
                     # บันทึกสัญญาณลงใน InfluxDB
                     try:
                         self.influxdb_storage.store_signal(signal)
-                        print(f"บันทึกสัญญาณลง InfluxDB สำเร็จ: {symbol} {category}")
+                        logger.debug("บันทึกสัญญาณลง InfluxDB สำเร็จ: %s %s", symbol, category)
                     except Exception as e:
-                        print(f"เกิดข้อผิดพลาดในการบันทึกสัญญาณลง InfluxDB: {e}")
+                        logger.error("เกิดข้อผิดพลาดในการบันทึกสัญญาณลง InfluxDB: %s", e)
                         # ไม่ควรล้มเหลวเนื่องจาก InfluxDB ไม่พร้อมใช้งาน
                     
                     # บันทึกลงแคช
@@ -241,16 +251,14 @@ class SignalProcessor:
                     return signal
             return None
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการประมวลผลข้อมูลตลาด: {e}")
+            logger.error("❌ เกิดข้อผิดพลาดในการประมวลผลข้อมูลตลาด: %s", e)
             return None
     
     def close(self):
-        """ปิดการเชื่อมต่อกับ InfluxDB"""
-        try:
-            self.influxdb_storage.close()
-            print("ปิดการเชื่อมต่อกับ InfluxDB")
-        except Exception as e:
-            print(f"เกิดข้อผิดพลาดในการปิดการเชื่อมต่อกับ InfluxDB: {e}")
+        """
+        ปล่อย resources ของ processor
+        InfluxDBStorage เป็น instance ที่ใช้ร่วมกันทั้ง process จึงไม่ปิดที่นี่ (เจ้าของ process ปิดเองตอนจบ)
+        """
 
 def grade_signal(forecast_pct: float, confidence: float) -> str:
     """
@@ -297,4 +305,5 @@ if __name__ == "__main__":
         processor.update_price_history("BTCUSDT", 20000 + (i * 100))
     print("Indicators:", processor.calculate_indicators("BTCUSDT"))
     print("Prediction:", processor.predict_next_price("BTCUSDT"))
-    processor.close()  # ปิดการเชื่อมต่อกับ InfluxDB
\ No newline at end of file
+    processor.close()
+    get_influxdb_storage().close()  # flush batch ที่ค้างและปิดการเชื่อมต่อกับ InfluxDB
\ No newline at end of file
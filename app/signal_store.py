@@ -0,0 +1,156 @@
+"""
+signal_store.py - บันทึกและเผยแพร่สัญญาณการซื้อขายใน Redis
+
+ใช้สคริปต์ Lua ที่ลงทะเบียนไว้ (EVALSHA) ทำ SET latest_signal, LPUSH + LTRIM signal_history,
+XADD signal_stream (ถ้าเปิดใช้) และ PUBLISH แบบ atomic ใน round-trip เดียว
+โดย serialize สัญญาณเป็น JSON เพียงครั้งเดียวต่อสัญญาณ
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import os
+import sys
+
+# นำเข้าโมดูลจัดการตัวแปรสภาพแวดล้อม
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+import env_manager as env
+
+try:
+    from .redis_manager import get_redis_client, get_redis_client_for_symbol, get_redis_mode, shard_for, symbol_key
+except ImportError:
+    from redis_manager import get_redis_client, get_redis_client_for_symbol, get_redis_mode, shard_for, symbol_key
+
+REDIS_SIGNAL_CHANNEL = "crypto_signals:signals"
+
+# KEYS[1] = latest_signal, KEYS[2] = signal_history, KEYS[3] = signal_stream (ไม่บังคับ)
+# ARGV[1] = payload JSON, ARGV[2] = ช่อง Pub/Sub ('' = ไม่ publish),
+# ARGV[3] = จำนวนประวัติที่เก็บ, ARGV[4] = MAXLEN โดยประมาณของ stream,
+# ARGV[5] = ข้อความ Pub/Sub ถ้าต่างจาก payload ที่เก็บ ('' = ใช้ payload)
+# คืนค่า: จำนวนผู้รับข้อความ Pub/Sub
+_PUBLISH_SIGNAL_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[3]) - 1)
+if KEYS[3] then
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[4], '*', 'data', ARGV[1])
+end
+if ARGV[2] ~= '' then
+    local message = ARGV[5]
+    if message == nil or message == '' then
+        message = ARGV[1]
+    end
+    return redis.call('PUBLISH', ARGV[2], message)
+end
+return 0
+"""
+
+
+class SignalStore:
+    """จัดเก็บสัญญาณล่าสุด ประวัติ และ stream ของแต่ละสัญลักษณ์ใน Redis"""
+
+    def __init__(self, history_length: int = 100, stream_maxlen: Optional[int] = None):
+        """
+        Args:
+            history_length: จำนวนสัญญาณย้อนหลังที่เก็บใน signal_history
+            stream_maxlen: ความยาวสูงสุดโดยประมาณของ signal_stream (0 หรือ None = ไม่เขียน stream)
+        """
+        self.history_length = history_length
+        self.stream_maxlen = stream_maxlen if stream_maxlen is not None else env.getenv("SIGNAL_STREAM_MAXLEN", 0, int)
+        self._script = None
+
+    def _get_script(self):
+        """ลงทะเบียนสคริปต์ครั้งแรก (redis-py จะใช้ EVALSHA และส่ง EVAL ใหม่เองเมื่อเจอ NOSCRIPT)"""
+        if self._script is None:
+            self._script = get_redis_client(decode_responses=True).register_script(_PUBLISH_SIGNAL_SCRIPT)
+        return self._script
+
+    def publish(self, symbol: str, signal: Union[Dict[str, Any], str],
+                channel: str = REDIS_SIGNAL_CHANNEL, trace: Optional[Dict[str, float]] = None) -> str:
+        """
+        บันทึกสัญญาณล่าสุด ประวัติ stream และเผยแพร่ผ่าน Pub/Sub ใน round-trip เดียว
+
+        Args:
+            symbol: สัญลักษณ์คู่เหรียญ
+            signal: ข้อมูลสัญญาณ (dict) หรือ JSON ที่ serialize แล้ว
+            channel: ช่อง Pub/Sub ที่จะเผยแพร่
+            trace: trace ความหน่วง (latency_trace) ที่แนบไปกับข้อความ Pub/Sub เท่านั้น ไม่ถูกเก็บ
+
+        Returns:
+            payload JSON ที่ถูกบันทึก (นำไปใช้ต่อได้โดยไม่ต้อง serialize ซ้ำ)
+
+        Raises:
+            redis.RedisError: เมื่อบันทึกลง Redis ไม่สำเร็จ
+        """
+        payload = signal if isinstance(signal, str) else json.dumps(signal)
+        # ต่อ trace ท้าย object JSON แทนการ serialize สัญญาณซ้ำ
+        message = ""
+        if trace:
+            separator = ", " if payload.rstrip()[:-1].rstrip() != "{" else ""
+            message = f'{payload.rstrip()[:-1]}{separator}"trace": {json.dumps(trace)}}}'
+
+        keys = [symbol_key("latest_signal", symbol), symbol_key("signal_history", symbol)]
+        if self.stream_maxlen:
+            keys.append(symbol_key("signal_stream", symbol))
+
+        # ในโหมด sharded ช่อง Pub/Sub อยู่ที่ shard หลัก ไม่ใช่ shard ของสัญลักษณ์
+        sharded = get_redis_mode() == "sharded"
+
+        self._get_script()(
+            keys=keys,
+            args=[payload, "" if sharded else channel, self.history_length, self.stream_maxlen or 0, message],
+            client=get_redis_client_for_symbol(symbol, decode_responses=True)
+        )
+
+        if sharded:
+            get_redis_client(decode_responses=True).publish(channel, message or payload)
+
+        return payload
+
+    def _group_by_client(self, symbols: List[str]) -> List[Tuple[Any, List[str]]]:
+        """
+        จัดกลุ่มสัญลักษณ์ตาม shard ที่เก็บข้อมูล เพื่อให้แต่ละ shard ใช้ round-trip เดียว
+        (จัดกลุ่มด้วยชื่อ shard เพราะ get_redis_client_for_symbol สร้าง client ใหม่ทุกครั้งที่เรียก)
+        """
+        groups: Dict[str, List[str]] = {}
+        for symbol in symbols:
+            groups.setdefault(shard_for(symbol), []).append(symbol)
+        return [
+            (get_redis_client_for_symbol(group[0], decode_responses=True), group)
+            for group in groups.values()
+        ]
+
+    def get_latest_many(self, symbols: List[str]) -> Dict[str, Optional[str]]:
+        """
+        ดึงสัญญาณล่าสุดของหลายสัญลักษณ์ด้วย MGET (หนึ่งคำสั่งต่อ shard)
+
+        Returns:
+            dict ของสัญลักษณ์ -> JSON ดิบที่เก็บไว้ (None ถ้ายังไม่มีสัญญาณ)
+        """
+        result: Dict[str, Optional[str]] = {}
+        cluster = get_redis_mode() == "cluster"
+        for client, group in self._group_by_client(symbols):
+            keys = [symbol_key("latest_signal", symbol) for symbol in group]
+            # คีย์ของแต่ละสัญลักษณ์อยู่คนละ slot ใน cluster จึงต้องใช้ mget_nonatomic
+            values = client.mget_nonatomic(keys) if cluster else client.mget(keys)
+            result.update(zip(group, values))
+        return result
+
+    def get_history_many(self, symbols: List[str], limit: int = 10) -> Dict[str, List[str]]:
+        """
+        ดึงประวัติสัญญาณของหลายสัญลักษณ์ด้วย LRANGE แบบ pipeline (หนึ่ง round-trip ต่อ shard)
+
+        Returns:
+            dict ของสัญลักษณ์ -> รายการ JSON ดิบ เรียงจากใหม่ไปเก่า
+        """
+        result: Dict[str, List[str]] = {}
+        for client, group in self._group_by_client(symbols):
+            pipeline = client.pipeline(transaction=False)
+            for symbol in group:
+                pipeline.lrange(symbol_key("signal_history", symbol), 0, limit - 1)
+            result.update(zip(group, pipeline.execute()))
+        return result
+
+
+# สร้าง singleton instance
+signal_store = SignalStore()
@@ -0,0 +1,193 @@
+"""
+smtp_pool.py - pool ของ SMTP connection ที่ใช้ซ้ำได้ และการรวมอีเมลเป็น digest
+
+SMTPPool เก็บ connection ที่ login แล้วไว้ใช้ซ้ำ (ไม่ต้อง TLS handshake + login ทุกอีเมล)
+เมื่อ connection หลุดหรือถูก server ปิดระหว่างว่าง จะเชื่อมต่อใหม่และส่งซ้ำหนึ่งครั้ง
+EmailDigest รวมรายการที่เข้ามาในช่วงเวลาหนึ่งแล้วส่งเป็นอีเมลฉบับเดียว
+"""
+import logging
+import queue
+import smtplib
+import threading
+import time
+from email.message import Message
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("smtp_pool")
+
+
+class SMTPPool:
+    """pool ของ SMTP connection แบบ STARTTLS ที่ login ค้างไว้"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, size: int = 2,
+                 idle_timeout: float = 240.0, timeout: float = 30.0,
+                 smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP):
+        """
+        Args:
+            host: SMTP server
+            port: พอร์ตของ SMTP server
+            username: ชื่อผู้ใช้สำหรับ login
+            password: รหัสผ่านสำหรับ login
+            size: จำนวน connection สูงสุด (จำนวนอีเมลที่ส่งพร้อมกันได้)
+            idle_timeout: ถ้า connection ว่างนานกว่านี้ (วินาที) จะตรวจด้วย NOOP ก่อนใช้
+            timeout: timeout ของ socket
+            smtp_factory: คลาสหรือฟังก์ชันที่สร้าง SMTP connection
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+
+        self._idle: "queue.LifoQueue[Tuple[smtplib.SMTP, float]]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.stats = {'connects': 0, 'reconnects': 0, 'sent': 0}
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        conn.starttls()
+        conn.login(self.username, self.password)
+        self.stats['connects'] += 1
+        return conn
+
+    @staticmethod
+    def _discard(conn: smtplib.SMTP) -> None:
+        """ปิด connection โดยไม่สนใจข้อผิดพลาด (connection อาจหลุดไปแล้ว)"""
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _checkout(self) -> smtplib.SMTP:
+        """connection ว่างที่ใช้ล่าสุด (ตรวจด้วย NOOP ถ้าว่างนาน) หรือสร้างใหม่"""
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            if time.monotonic() - last_used < self.idle_timeout:
+                return conn
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except Exception:
+                pass
+            self._discard(conn)
+
+    def send(self, msg: Message) -> None:
+        """
+        ส่งอีเมลผ่าน connection ใน pool (เชื่อมต่อใหม่และส่งซ้ำหนึ่งครั้งถ้า connection หลุด)
+
+        Args:
+            msg: ข้อความอีเมล
+        """
+        with self._slots:
+            conn = self._checkout()
+            try:
+                conn.send_message(msg)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                # server ปฏิเสธอีเมลฉบับนี้ (ผู้รับ/ผู้ส่ง/ข้อมูล) แต่ connection ยังใช้ได้ จึงไม่ส่งซ้ำ
+                # ยกเว้น 421 ที่ server กำลังปิด connection
+                if getattr(e, 'smtp_code', None) == 421:
+                    self._discard(conn)
+                else:
+                    self._idle.put((conn, time.monotonic()))
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                logger.warning("SMTP connection หลุด กำลังเชื่อมต่อใหม่: %s", str(e))
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+                conn = self._connect()
+                try:
+                    conn.send_message(msg)
+                except Exception:
+                    self._discard(conn)
+                    raise
+            except Exception:
+                self._discard(conn)
+                raise
+
+            self.stats['sent'] += 1
+            self._idle.put((conn, time.monotonic()))
+
+    def close(self) -> None:
+        """ปิด connection ที่ว่างอยู่ทั้งหมด"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+class EmailDigest:
+    """รวมรายการที่เข้ามาในแต่ละช่วงเวลา แล้วส่งทั้งชุดผ่าน callback ครั้งเดียว"""
+
+    def __init__(self, window_seconds: float, flush: Callable[[List[Any]], None], max_items: int = 500):
+        """
+        Args:
+            window_seconds: ระยะเวลาที่รวบรวมรายการก่อนส่ง
+            flush: ฟังก์ชันที่รับรายการทั้งชุด (เรียกจากเธรดเบื้องหลัง)
+            max_items: ส่งทันทีเมื่อมีรายการครบจำนวนนี้
+        """
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self._flush = flush
+        self._items: List[Any] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, item: Any) -> None:
+        """เพิ่มรายการลง digest ปัจจุบัน"""
+        with self._lock:
+            self._items.append(item)
+            full = len(self._items) >= self.max_items
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="email-digest", daemon=True)
+                self._thread.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """ส่งรายการที่รวบรวมไว้ทันที"""
+        with self._lock:
+            items, self._items = self._items, []
+        if not items:
+            return
+        try:
+            self._flush(items)
+        except Exception as e:
+            logger.error("ส่งอีเมลสรุป %d รายการไม่สำเร็จ: %s", len(items), str(e))
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.window_seconds):
+            self.flush()
+
+    def close(self) -> None:
+        """หยุดเธรดเบื้องหลังและส่งรายการที่ค้างอยู่"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.window_seconds + 1)
+            self._thread = None
+        self.flush()
+
+
+# pool ใช้ร่วมกันทั้ง process ต่อ server และผู้ใช้
+_pools: Dict[Tuple[str, int, str], SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str, port: int, username: str, password: str, **kwargs) -> SMTPPool:
+    """ดึง SMTPPool ของ server และผู้ใช้ที่ระบุ (สร้างใหม่ถ้ายังไม่มี)"""
+    key = (host, port, username)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SMTPPool(host, port, username, password, **kwargs)
+        return _pools[key]
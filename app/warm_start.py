@@ -0,0 +1,132 @@
+"""
+warm_start.py - เติมประวัติราคาของ signal processor จากแท่งที่บันทึกไว้เมื่อเริ่ม process
+
+โหลดราคาปิดของแท่งล่าสุด N แท่งของทุกสัญลักษณ์พร้อมกันจาก measurement ของ timeframe นั้น
+ช่วงที่ไม่มีแท่งจะถูกรวมจากแท่ง 1m ใน InfluxDB หรือไฟล์ dump ในเครื่อง (ถ้าระบุ)
+ทำให้ตัวชี้วัดพร้อมคำนวณทันทีแทนการรอแท่งใหม่ 22 แท่งหลังรีสตาร์ท
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import os
+import sys
+
+# นำเข้าโมดูลจัดการตัวแปรสภาพแวดล้อม
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+import env_manager as env
+
+try:
+    from .backfill import CsvSource, KlineSource
+    from .candle_aggregator import CandleAggregator, TIMEFRAME_MS, kline_measurement
+    from .influxdb_storage import get_influxdb_storage
+    from .logger import LoggerFactory
+except ImportError:
+    from backfill import CsvSource, KlineSource
+    from candle_aggregator import CandleAggregator, TIMEFRAME_MS, kline_measurement
+    from influxdb_storage import get_influxdb_storage
+    from logger import LoggerFactory
+
+logger = LoggerFactory.get_logger('warm_start')
+
+WARM_START_CANDLES = env.getenv("WARM_START_CANDLES", 100, int)
+WARM_START_TIMEOUT = env.getenv("WARM_START_TIMEOUT", 15, int)
+WARM_START_ARCHIVE_PATH = env.getenv("WARM_START_ARCHIVE_PATH", "")
+
+_OHLCV_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+async def _load_closes(storage, symbol: str, measurement: str, start_ms: int, end_ms: int) -> Dict[int, float]:
+    """ราคาปิดของแท่งใน measurement ที่ระบุ {เวลาเปิด: ราคาปิด}"""
+    closes = {}
+    async for batch in storage.iter_market_data(symbol, start_ms, end_ms, fields=("close",),
+                                                measurement=measurement):
+        closes.update(zip(batch["timestamp"].tolist(), batch["close"].tolist()))
+    return closes
+
+
+async def _load_minutes(storage, symbol: str, start_ms: int, end_ms: int) -> List[Dict[str, float]]:
+    """แท่ง 1m ใน InfluxDB ของช่วงที่ระบุ"""
+    klines = []
+    async for batch in storage.iter_market_data(symbol, start_ms, end_ms, fields=_OHLCV_FIELDS):
+        columns = {name: values.tolist() for name, values in batch.items()}
+        klines.extend(dict(zip(columns, row)) for row in zip(*columns.values()))
+    return klines
+
+
+def _roll_up(symbol: str, klines: List[Dict[str, float]], timeframe: str) -> Dict[int, float]:
+    """รวมแท่ง 1m เป็น timeframe ที่ต้องการ แล้วคืนราคาปิดของแท่งที่ครบ"""
+    if timeframe == "1m":
+        return {int(kline["timestamp"]): float(kline["close"]) for kline in klines}
+    aggregator = CandleAggregator((timeframe,))
+    closes = {}
+    for kline in sorted(klines, key=lambda k: k["timestamp"]):
+        for candle in aggregator.add_kline(symbol, kline):
+            closes[candle.timestamp] = candle.close
+    return closes
+
+
+async def load_recent_closes(symbol: str, count: int, timeframe: str = "2m", storage=None,
+                             archive: Optional[KlineSource] = None) -> List[float]:
+    """
+    ราคาปิดของแท่งที่ปิดแล้วล่าสุดไม่เกิน count แท่ง เรียงจากเก่าไปใหม่
+
+    Args:
+        symbol: สัญลักษณ์คู่เหรียญ
+        count: จำนวนแท่งที่ต้องการ
+        timeframe: timeframe ของแท่งที่ signal processor ใช้
+        storage: InfluxDBStorage (ค่าเริ่มต้นคือ instance ที่ใช้ร่วมกันทั้ง process)
+        archive: แหล่งแท่ง 1m สำรองเมื่อ InfluxDB มีข้อมูลไม่พอ
+    """
+    storage = storage or get_influxdb_storage()
+    interval_ms = TIMEFRAME_MS[timeframe]
+    now_ms = int(time.time() * 1000)
+    end_ms = now_ms - now_ms % interval_ms  # ไม่รวมแท่งที่กำลังก่อตัว
+    start_ms = end_ms - count * interval_ms
+
+    closes = await _load_closes(storage, symbol, kline_measurement(timeframe), start_ms, end_ms)
+    if len(closes) < count and timeframe != "1m":
+        closes = {**_roll_up(symbol, await _load_minutes(storage, symbol, start_ms, end_ms), timeframe), **closes}
+    if len(closes) < count and archive is not None:
+        klines = await asyncio.to_thread(archive.fetch, symbol, start_ms, end_ms)
+        closes = {**_roll_up(symbol, list(klines), timeframe), **closes}
+
+    return [closes[timestamp] for timestamp in sorted(closes)][-count:]
+
+
+async def warm_start(processor, symbols: List[str], count: Optional[int] = None, timeframe: str = "2m",
+                     storage=None, archive: Optional[KlineSource] = None) -> Dict[str, int]:
+    """
+    โหลดประวัติราคาของทุกสัญลักษณ์พร้อมกันแล้วเติมลง processor.price_history
+
+    Args:
+        processor: signal processor ที่มีเมธอด prime_price_history
+        symbols: สัญลักษณ์ที่ต้องการ
+        count: จำนวนแท่งต่อสัญลักษณ์ (ค่าเริ่มต้นจาก WARM_START_CANDLES)
+        timeframe: timeframe ของแท่งที่ processor ใช้
+        storage: InfluxDBStorage
+        archive: แหล่งแท่ง 1m สำรอง (ค่าเริ่มต้นคือ CSV ใน WARM_START_ARCHIVE_PATH ถ้าระบุ)
+
+    Returns:
+        จำนวนแท่งที่เติมของแต่ละสัญลักษณ์
+    """
+    count = count or WARM_START_CANDLES
+    if archive is None and WARM_START_ARCHIVE_PATH:
+        archive = CsvSource(WARM_START_ARCHIVE_PATH)
+
+    results = await asyncio.gather(
+        *(load_recent_closes(symbol, count, timeframe, storage, archive) for symbol in symbols),
+        return_exceptions=True
+    )
+
+    loaded = {}
+    for symbol, closes in zip(symbols, results):
+        if isinstance(closes, Exception):
+            logger.warning(f"ไม่สามารถโหลดประวัติราคาของ {symbol}: {closes}")
+            closes = []
+        processor.prime_price_history(symbol, closes)
+        loaded[symbol] = len(closes)
+
+    logger.info(f"เติมประวัติราคาจากข้อมูลที่บันทึกไว้: {loaded}")
+    return loaded
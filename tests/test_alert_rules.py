@@ -0,0 +1,99 @@
+import unittest
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.alert_rules import AlertRule, AlertRuleEngine, AlertRuleIndex
+
+
+def make_signal(symbol="BTCUSDT", category="strong buy", confidence=0.8, price=50000.0, rsi=None):
+    return {"symbol": symbol, "category": category, "confidence": confidence, "price": price,
+            "timestamp": 1619712000000, "indicators": {"rsi14": rsi}}
+
+
+class FakeStore:
+    """ที่เก็บกฎในหน่วยความจำที่นับจำนวนครั้งที่โหลด"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.current_version = 1
+        self.loads = 0
+
+    def list(self, user_id=None):
+        self.loads += 1
+        return list(self.rules)
+
+    def version(self):
+        return self.current_version
+
+
+class TestAlertRuleIndex(unittest.TestCase):
+    """ทดสอบการค้นกฎจากดัชนีตามสัญลักษณ์ ประเภท และความมั่นใจ"""
+
+    def test_candidates_filter_by_symbol_category_and_confidence(self):
+        rules = [
+            AlertRule("u1", "discord", "https://d/1", symbol="btcusdt", categories=["Strong Buy"]),
+            AlertRule("u2", "webhook", "https://w/2", symbol="BTCUSDT", min_confidence=0.9),
+            AlertRule("u3", "email", "u3@example.com", categories=["strong buy", "weak buy"], min_confidence=0.5),
+            AlertRule("u4", "email", "u4@example.com", symbol="ETHUSDT"),
+        ]
+        index = AlertRuleIndex(rules)
+
+        matched = {rule.user_id for rule in index.candidates("BTCUSDT", "strong buy", 0.8)}
+        self.assertEqual(matched, {"u1", "u3"})
+        self.assertEqual({rule.user_id for rule in index.candidates("BTCUSDT", "weak sell", 0.95)}, {"u2"})
+
+    def test_large_rule_set_only_returns_relevant_rules(self):
+        """กฎของสัญลักษณ์อื่นต้องไม่ถูกนำมาตรวจ"""
+        rules = [AlertRule(f"user{i}", "email", f"user{i}@example.com", symbol=f"COIN{i % 1000}USDT")
+                 for i in range(10000)]
+        index = AlertRuleIndex(rules)
+
+        candidates = index.candidates("COIN7USDT", "weak buy", 0.6)
+        self.assertEqual(len(candidates), 10)
+        self.assertTrue(all(rule.symbol == "COIN7USDT" for rule in candidates))
+
+
+class TestAlertRuleEngine(unittest.TestCase):
+    """ทดสอบการประเมินเงื่อนไขราคา/RSI และการโหลดกฎใหม่ตามเวอร์ชัน"""
+
+    def test_rsi_cross_above_requires_previous_value_below(self):
+        store = FakeStore([AlertRule("u1", "discord", "https://d/1", rsi_cross_above=70)])
+        engine = AlertRuleEngine(store, refresh_seconds=0)
+
+        self.assertEqual(engine.match(make_signal(rsi=65)), [])
+        self.assertEqual(len(engine.match(make_signal(category="hold", rsi=72))), 1)
+        # ยังอยู่เหนือ 70 จึงไม่ใช่การตัดผ่านครั้งใหม่
+        self.assertEqual(engine.match(make_signal(rsi=75)), [])
+
+    def test_price_thresholds(self):
+        store = FakeStore([AlertRule("u1", "webhook", "https://w/1", price_above=48000, price_below=52000)])
+        engine = AlertRuleEngine(store, refresh_seconds=0)
+
+        self.assertEqual(len(engine.match(make_signal(price=50000))), 1)
+        self.assertEqual(engine.match(make_signal(price=53000)), [])
+
+    def test_reload_only_when_version_changes(self):
+        store = FakeStore([AlertRule("u1", "email", "u1@example.com")])
+        engine = AlertRuleEngine(store, refresh_seconds=0)
+
+        engine.match(make_signal())
+        engine.match(make_signal())
+        self.assertEqual(store.loads, 1)
+
+        store.rules.append(AlertRule("u2", "email", "u2@example.com"))
+        store.current_version = 2
+        self.assertEqual(len(engine.match(make_signal())), 2)
+        self.assertEqual(store.loads, 2)
+
+    def test_validate_rejects_unknown_channel(self):
+        with self.assertRaises(ValueError):
+            AlertRule("u1", "sms", "+66000000").validate()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.backfill import CsvSource, find_gaps, repair_gaps, run_backfill, split_chunks
+from app.candle_coverage import CoverageIndex
+
+DAY_MS = 86_400_000
+BASE_MS = 1704067200000  # 2024-01-01 UTC
+
+
+class FakeStorage:
+    """เก็บข้อมูลที่เขียนไว้ใน dict โดยใช้ (measurement, symbol, timestamp) เป็นคีย์เหมือน InfluxDB"""
+
+    def __init__(self):
+        self.points = {}
+        self.coverage = CoverageIndex()
+
+    def store_kline_data(self, symbol, data_points, measurement="kline_data"):
+        for point in data_points:
+            self.points[(measurement, symbol, int(point["timestamp"]))] = point
+        if measurement == "kline_data":
+            self.coverage.record(symbol, (point["timestamp"] for point in data_points))
+
+    def close(self):
+        pass
+
+
+class TestBackfill(unittest.TestCase):
+    """ทดสอบการเติมข้อมูลย้อนหลังจากไฟล์ CSV"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        # 2 วัน ขาดนาทีที่ 100-104 ของวันแรก ใช้ timestamp แบบ microsecond เหมือน dump ปี 2025
+        with open(os.path.join(self.test_dir, "BTCUSDT-1m-2024.csv"), "w") as f:
+            f.write("open_time,open,high,low,close,volume,close_time\n")
+            for minute in range(2 * 1440):
+                if 100 <= minute < 105:
+                    continue
+                ts = BASE_MS + minute * 60_000
+                f.write(f"{ts * 1000},1.0,2.0,0.5,1.5,10.0,{(ts + 59_999) * 1000}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_split_chunks_aligned_to_epoch(self):
+        """ขอบของ chunk ต้องตรงกับผลคูณของขนาด chunk"""
+        self.assertEqual(
+            split_chunks(DAY_MS // 2, 2 * DAY_MS, DAY_MS),
+            [(DAY_MS // 2, DAY_MS), (DAY_MS, 2 * DAY_MS)]
+        )
+
+    def test_find_gaps(self):
+        """ต้องรายงานช่วงที่ขาดทั้งกลางช่วงและท้ายช่วง"""
+        self.assertEqual(find_gaps([0, 60_000, 240_000], 0, 360_000),
+                         [(120_000, 240_000), (300_000, 360_000)])
+
+    def test_backfill_writes_all_timeframes_and_is_idempotent(self):
+        """ต้องเขียนแท่ง 1m และแท่งรวม รายงานช่องว่าง และรันซ้ำได้ผลเท่าเดิม"""
+        storage = FakeStorage()
+        source = CsvSource(self.test_dir)
+
+        results = run_backfill(["BTCUSDT"], BASE_MS, BASE_MS + 2 * DAY_MS, source, concurrency=2,
+                               timeframes=("1h", "1d"), storage=storage)
+        snapshot = dict(storage.points)
+
+        self.assertEqual([r.candles for r in results], [1435, 1440])
+        self.assertEqual(results[0].gaps, [(BASE_MS + 100 * 60_000, BASE_MS + 105 * 60_000)])
+        self.assertEqual(results[1].gaps, [])
+
+        kline_1m = [k for k in storage.points if k[0] == "kline_data"]
+        self.assertEqual(len(kline_1m), 2 * 1440 - 5)
+        self.assertEqual(len([k for k in storage.points if k[0] == "kline_1h"]), 48)
+        daily = storage.points[("kline_1d", "BTCUSDT", BASE_MS)]
+        self.assertEqual(daily["count"], 1435)
+        self.assertTrue(daily["partial"])
+        self.assertAlmostEqual(daily["volume"], 14350.0)
+        self.assertFalse(storage.points[("kline_1d", "BTCUSDT", BASE_MS + DAY_MS)]["partial"])
+        partial_hours = [k[2] for k, bar in storage.points.items() if k[0] == "kline_1h" and bar["partial"]]
+        self.assertEqual(partial_hours, [BASE_MS + 3_600_000])
+
+        run_backfill(["BTCUSDT"], BASE_MS, BASE_MS + 2 * DAY_MS, source, timeframes=("1h", "1d"), storage=storage)
+        self.assertEqual(storage.points, snapshot)
+
+    def test_repair_reloads_only_chunks_with_gaps(self):
+        """การซ่อมต้องโหลดเฉพาะ chunk ที่ดัชนีระบุว่ามีแท่งขาด"""
+        storage = FakeStorage()
+        storage.coverage.record("BTCUSDT", range(BASE_MS + DAY_MS, BASE_MS + 2 * DAY_MS, 60_000))
+        storage.coverage.record("BTCUSDT", range(BASE_MS, BASE_MS + 100 * 60_000, 60_000))
+
+        results = repair_gaps(["BTCUSDT"], BASE_MS, BASE_MS + 2 * DAY_MS, CsvSource(self.test_dir),
+                              timeframes=("1h",), storage=storage)
+
+        self.assertEqual([(r.start_ms, r.end_ms) for r in results], [(BASE_MS, BASE_MS + DAY_MS)])
+        # ช่วงที่แหล่งข้อมูลก็ไม่มี (นาทีที่ 100-104) ยังคงเป็นช่วงที่ขาด
+        self.assertEqual(storage.coverage.gaps("BTCUSDT", BASE_MS, BASE_MS + 2 * DAY_MS),
+                         [(BASE_MS + 100 * 60_000, BASE_MS + 105 * 60_000)])
+
+    def test_chunk_must_align_with_timeframes(self):
+        """chunk ที่หารด้วย timeframe ไม่ลงตัวต้องถูกปฏิเสธ"""
+        with self.assertRaises(ValueError):
+            run_backfill(["BTCUSDT"], 0, DAY_MS, CsvSource(self.test_dir), chunk_hours=6,
+                         timeframes=("1d",), storage=FakeStorage())
+
+
+if __name__ == '__main__':
+    unittest.main()
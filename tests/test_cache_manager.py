@@ -0,0 +1,112 @@
+import unittest
+import fnmatch
+import sys
+import pathlib
+from unittest.mock import patch
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app import cache_manager as cache_module
+
+
+class FakePipeline:
+    """pipeline จำลองที่รองรับเฉพาะ memory_usage"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def memory_usage(self, key):
+        self.commands.append(key)
+
+    def execute(self, raise_on_error=True):
+        return [len(self.client.store[key]) if key in self.client.store else None for key in self.commands]
+
+
+class FakeRedis:
+    """Redis จำลองในหน่วยความจำสำหรับทดสอบ SCAN/UNLINK"""
+
+    def __init__(self, keys):
+        self.store = dict(keys)
+        self.order = sorted(self.store)
+        self.unlink_calls = []
+        self.delete_calls = 0
+
+    def config_set(self, *args):
+        pass
+
+    def scan(self, cursor, match=None, count=10):
+        page = self.order[cursor:cursor + count]
+        matched = [key for key in page if key in self.store and fnmatch.fnmatch(key, match)]
+        next_cursor = cursor + count
+        return (0 if next_cursor >= len(self.order) else next_cursor), matched
+
+    def unlink(self, *keys):
+        self.unlink_calls.append(len(keys))
+        removed = 0
+        for key in keys:
+            if self.store.pop(key, None) is not None:
+                removed += 1
+        return removed
+
+    def delete(self, *keys):
+        self.delete_calls += 1
+        return self.unlink(*keys)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class TestCacheCleanup(unittest.TestCase):
+    """ทดสอบการล้างคีย์แบบไม่บล็อกของ CacheManager"""
+
+    def setUp(self):
+        keys = {f"market:BTC{i}:1m": b"x" * 10 for i in range(25)}
+        keys.update({f"signal:{i}": b"y" for i in range(5)})
+        self.fake = FakeRedis(keys)
+        with patch.object(cache_module, "get_redis_client", return_value=self.fake):
+            self.cache = cache_module.CacheManager()
+
+    def test_cleanup_uses_unlink_in_bounded_batches(self):
+        """ต้องลบเฉพาะคีย์ที่ตรงแพทเทิร์น ด้วย UNLINK ชุดละไม่เกิน batch_size"""
+        result = self.cache.cleanup_old_keys("market:*", batch_size=4, max_keys_per_second=None)
+
+        self.assertTrue(result['done'])
+        self.assertEqual(result['deleted'], 25)
+        self.assertEqual(result['reclaimed_bytes'], 250)
+        self.assertEqual(self.fake.delete_calls, 0)
+        self.assertTrue(all(size <= 4 for size in self.fake.unlink_calls))
+        self.assertEqual(sorted(self.fake.store), [f"signal:{i}" for i in range(5)])
+
+    def test_cleanup_reports_progress(self):
+        """ต้องเรียก progress_callback ทุกชุดพร้อมยอดสะสม"""
+        updates = []
+        self.cache.cleanup_old_keys("market:*", batch_size=10, max_keys_per_second=None,
+                                    progress_callback=updates.append)
+
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(updates[-1]['deleted'], 25)
+        self.assertEqual(self.cache.get_cleanup_progress()["market:*"]['deleted'], 25)
+
+    def test_lua_cleanup_reports_scanned_separately(self):
+        """สคริปต์ Lua ต้องรายงานจำนวนคีย์ที่พบแยกจากจำนวนที่ลบได้จริง"""
+        def fake_script(args, client):
+            cursor, keys = client.scan(int(args[0]), match=args[1], count=int(args[2]))
+            # คีย์หนึ่งหมดอายุไปก่อน UNLINK
+            if keys:
+                client.store.pop(keys[0])
+            return [cursor, len(keys), client.unlink(*keys) if keys else 0, 0]
+
+        self.fake.register_script = lambda script: fake_script
+        result = self.cache.cleanup_old_keys("market:*", batch_size=10, max_keys_per_second=None,
+                                             measure_memory=False, use_lua=True)
+
+        self.assertEqual(result['scanned'], 25)
+        self.assertEqual(result['deleted'], 22)
+
+
+if __name__ == '__main__':
+    unittest.main()
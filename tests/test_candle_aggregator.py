@@ -0,0 +1,98 @@
+import unittest
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.candle_aggregator import CandleAggregator, kline_measurement
+
+START = 1_700_006_400_000  # 2023-11-15 00:00 UTC (ตรงกับขอบของทุก timeframe)
+
+
+def minute(i, price=100.0, volume=1.0):
+    """แท่ง 1m ลำดับที่ i นับจาก START"""
+    return {
+        "timestamp": START + i * 60_000,
+        "open": price,
+        "high": price + 1,
+        "low": price - 1,
+        "close": price + 0.5,
+        "volume": volume
+    }
+
+
+class TestCandleAggregator(unittest.TestCase):
+    """ทดสอบการรวมแท่ง 1m เป็น timeframe ที่ใหญ่ขึ้น"""
+
+    def test_closes_bar_on_last_minute(self):
+        """แท่ง 5m ต้องปิดเมื่อได้รับนาทีที่ 5 พร้อม OHLCV ที่ถูกต้อง"""
+        aggregator = CandleAggregator(("5m",))
+        closed = []
+        for i in range(5):
+            closed.extend(aggregator.add_kline("BTCUSDT", minute(i, price=100.0 + i, volume=2.0)))
+
+        self.assertEqual(len(closed), 1)
+        bar = closed[0]
+        self.assertEqual((bar.timestamp, bar.close_time), (START, START + 300_000 - 1))
+        self.assertEqual((bar.open, bar.high, bar.low, bar.close), (100.0, 105.0, 99.0, 104.5))
+        self.assertEqual((bar.volume, bar.count), (10.0, 5))
+        self.assertFalse(bar.partial)
+        self.assertFalse(bar.to_dict()["partial"])
+
+    def test_multiple_timeframes(self):
+        """หนึ่งชั่วโมงของแท่ง 1m ต้องได้ 30 แท่ง 2m, 12 แท่ง 5m, 4 แท่ง 15m และ 1 แท่ง 1h"""
+        aggregator = CandleAggregator(("2m", "5m", "15m", "1h"))
+        closed = []
+        for i in range(60):
+            closed.extend(aggregator.add_kline("BTCUSDT", minute(i)))
+
+        counts = {}
+        for bar in closed:
+            counts[bar.timeframe] = counts.get(bar.timeframe, 0) + 1
+        self.assertEqual(counts, {"2m": 30, "5m": 12, "15m": 4, "1h": 1})
+
+    def test_gap_closes_previous_bar(self):
+        """ถ้านาทีสุดท้ายของแท่งหายไป แท่งต้องปิดเมื่อเริ่มแท่งถัดไป"""
+        aggregator = CandleAggregator(("5m",))
+        for i in range(4):
+            self.assertEqual(aggregator.add_kline("BTCUSDT", minute(i)), [])
+
+        closed = aggregator.add_kline("BTCUSDT", minute(5))
+        self.assertEqual(len(closed), 1)
+        self.assertEqual(closed[0].count, 4)
+        self.assertTrue(closed[0].partial)
+
+    def test_gap_inside_bar_marks_partial(self):
+        """ชั่วโมงที่ขาด 5 นาทีกลางแท่งต้องปิดตามปกติแต่มี partial=True"""
+        aggregator = CandleAggregator(("5m", "1h"))
+        closed = []
+        for i in range(60):
+            if not 20 <= i < 25:
+                closed.extend(aggregator.add_kline("BTCUSDT", minute(i)))
+
+        hourly = [bar for bar in closed if bar.timeframe == "1h"]
+        self.assertEqual([(bar.count, bar.partial) for bar in hourly], [(55, True)])
+        self.assertTrue(hourly[0].to_dict()["partial"])
+        five = [bar for bar in closed if bar.timeframe == "5m"]
+        self.assertEqual(len(five), 11)
+        self.assertFalse(any(bar.partial for bar in five))
+
+    def test_partial_bar_after_start_is_dropped(self):
+        """แท่งที่เริ่มรวมกลางแท่ง (เช่นหลังรีสตาร์ท) ต้องไม่ถูกส่งออก"""
+        aggregator = CandleAggregator(("5m",))
+        closed = []
+        for i in range(3, 10):
+            closed.extend(aggregator.add_kline("BTCUSDT", minute(i)))
+
+        self.assertEqual([bar.timestamp for bar in closed], [START + 300_000])
+
+    def test_measurement_names(self):
+        self.assertEqual(kline_measurement("1m"), "kline_data")
+        self.assertEqual(kline_measurement("4h"), "kline_4h")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.candle_coverage import CoverageIndex, IntervalSet
+
+MINUTE = 60_000
+
+
+class TestIntervalSet(unittest.TestCase):
+    """ทดสอบชุดช่วงเวลาที่ใช้ bisect"""
+
+    def test_add_merges_overlapping_and_adjacent(self):
+        """ช่วงที่ซ้อนทับหรือติดกันต้องถูกรวมเป็นช่วงเดียว"""
+        intervals = IntervalSet([(0, 10), (20, 30), (40, 50)])
+        intervals.add(10, 20)
+        self.assertEqual(intervals.intervals(), [(0, 30), (40, 50)])
+        intervals.add(25, 45)
+        self.assertEqual(intervals.intervals(), [(0, 50)])
+
+    def test_gaps_and_covers(self):
+        """ต้องคืนเฉพาะช่วงที่ขาดภายในช่วงที่ถาม"""
+        intervals = IntervalSet([(0, 10), (20, 30), (40, 50)])
+        self.assertEqual(intervals.gaps(5, 45), [(10, 20), (30, 40)])
+        self.assertEqual(intervals.gaps(-5, 60), [(-5, 0), (10, 20), (30, 40), (50, 60)])
+        self.assertEqual(intervals.gaps(21, 29), [])
+        self.assertTrue(intervals.covers(20, 30))
+        self.assertFalse(intervals.covers(5, 25))
+
+
+class TestCoverageIndex(unittest.TestCase):
+    """ทดสอบดัชนีช่วงข้อมูลแท่ง 1m"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "coverage.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_record_collapses_runs(self):
+        """แท่งที่ต่อเนื่องกันต้องกลายเป็นช่วงเดียว และช่วงที่ขาดถูกรายงานครบ"""
+        index = CoverageIndex()
+        index.record("BTCUSDT", [m * MINUTE for m in range(60) if not 10 <= m < 13])
+
+        self.assertEqual(index.gaps("BTCUSDT", 0, 60 * MINUTE), [(10 * MINUTE, 13 * MINUTE)])
+        self.assertFalse(index.is_complete("BTCUSDT", 0, 60 * MINUTE))
+        self.assertTrue(index.is_complete("BTCUSDT", 13 * MINUTE, 60 * MINUTE))
+        self.assertEqual(index.gaps("ETHUSDT", 0, MINUTE), [(0, MINUTE)])
+
+    def test_save_merges_with_existing_file(self):
+        """การบันทึกต้องรวมกับช่วงที่ process อื่นบันทึกไว้ในไฟล์"""
+        other = CoverageIndex(self.path)
+        other.record("BTCUSDT", [0])
+        other.save()
+
+        index = CoverageIndex(self.path)
+        index.record("BTCUSDT", [MINUTE])
+        other.record("BTCUSDT", [2 * MINUTE])
+        other.save()
+        index.save()
+
+        reloaded = CoverageIndex(self.path)
+        self.assertTrue(reloaded.is_complete("BTCUSDT", 0, 3 * MINUTE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.influx_spool import WriteSpool
+
+
+class TestWriteSpool(unittest.TestCase):
+    """ทดสอบ spool แบบแบ่ง segment สำหรับข้อมูล InfluxDB"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_replay_in_order_and_remove_segments(self):
+        """ต้องส่งซ้ำตามลำดับที่เขียน ข้าม segment และลบไฟล์ที่ส่งครบ"""
+        spool = WriteSpool(self.test_dir, segment_bytes=64)
+        records = [f"kline_data,symbol=BTCUSDT close={i}.0 {i}" for i in range(10)]
+        for record in records:
+            spool.append(record)
+
+        self.assertGreater(len(os.listdir(self.test_dir)), 1)
+
+        written = []
+        self.assertEqual(spool.replay(written.append, lines_per_second=None), 10)
+        self.assertEqual(written, records)
+        self.assertEqual(os.listdir(self.test_dir), [])
+        self.assertEqual(spool.pending_bytes(), 0)
+
+    def test_failed_replay_keeps_segment(self):
+        """ถ้าเขียนไม่สำเร็จ segment ต้องยังอยู่เพื่อส่งซ้ำรอบถัดไป"""
+        spool = WriteSpool(self.test_dir)
+        spool.append("a value=1 1")
+
+        def failing_write(record):
+            raise ConnectionError("influx down")
+
+        with self.assertRaises(ConnectionError):
+            spool.replay(failing_write, lines_per_second=None)
+
+        written = []
+        spool.replay(written.append, lines_per_second=None)
+        self.assertEqual(written, ["a value=1 1"])
+
+    def test_permanently_rejected_record_is_skipped(self):
+        """record ที่ถูกปฏิเสธถาวรต้องถูกข้ามเพื่อไม่ให้ขวาง record อื่นและ segment ต้องถูกลบ"""
+        spool = WriteSpool(self.test_dir)
+        for record in ("a value=1 1", "a value=nan 2", "a value=3 3"):
+            spool.append(record)
+
+        written = []
+
+        def write(record):
+            if "nan" in record:
+                raise ValueError("400 bad request")
+            written.append(record)
+
+        count = spool.replay(write, lines_per_second=None,
+                             is_permanent=lambda e: isinstance(e, ValueError))
+        self.assertEqual(count, 2)
+        self.assertEqual(written, ["a value=1 1", "a value=3 3"])
+        self.assertEqual(spool.stats['rejected'], 1)
+        self.assertEqual(os.listdir(self.test_dir), [])
+
+    def test_size_is_bounded(self):
+        """ขนาดรวมต้องไม่เกิน max_bytes โดยลบ segment เก่าที่สุดทิ้ง"""
+        spool = WriteSpool(self.test_dir, max_bytes=200, segment_bytes=50)
+        for i in range(20):
+            spool.append(f"m value={i} {i:020d}")
+
+        self.assertLessEqual(spool.pending_bytes(), 200)
+        self.assertGreater(spool.stats['dropped_segments'], 0)
+
+        written = []
+        spool.replay(written.append, lines_per_second=None)
+        self.assertEqual(written[-1], f"m value=19 {19:020d}")
+
+    def test_truncated_tail_record_is_ignored(self):
+        """record ท้ายไฟล์ที่เขียนไม่ครบ (process ตายกลางทาง) ต้องถูกข้าม"""
+        spool = WriteSpool(self.test_dir)
+        spool.append("a value=1 1")
+        spool.close()
+
+        segment = os.path.join(self.test_dir, os.listdir(self.test_dir)[0])
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x00\x10partial")
+
+        written = []
+        WriteSpool(self.test_dir).replay(written.append, lines_per_second=None)
+        self.assertEqual(written, ["a value=1 1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
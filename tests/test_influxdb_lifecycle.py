@@ -0,0 +1,136 @@
+import unittest
+import sys
+import threading
+import time
+import pathlib
+from unittest.mock import MagicMock, PropertyMock, patch
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import app.influxdb_storage as storage_module
+from app.influxdb_storage import InfluxDBStorage
+
+SIGNAL = {"symbol": "BTCUSDT", "category": "hold", "timestamp": 1619712000000, "price": 50000.0}
+
+
+class FakeWriteApi:
+    """write API ที่นับบรรทัดและปฏิเสธการเขียนหลังถูกปิด"""
+
+    def __init__(self):
+        self.records = []
+        self.closed = False
+
+    def write(self, bucket, record, write_precision):
+        if self.closed:
+            raise RuntimeError("write after close")
+        time.sleep(0.0001)  # เปิดช่องให้เธรดอื่นเรียก close() ระหว่างการเขียน
+        if self.closed:
+            raise RuntimeError("closed during write")
+        self.records.append(record)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.write_apis = []
+        self.closed = False
+        FakeClient.instances.append(self)
+
+    def write_api(self, **kwargs):
+        api = FakeWriteApi()
+        self.write_apis.append(api)
+        return api
+
+    def query_api(self):
+        return MagicMock()
+
+    def delete_api(self):
+        return MagicMock()
+
+    def close(self):
+        self.closed = True
+
+
+class TestStorageLifecycle(unittest.TestCase):
+    """client ถูกสร้างเมื่อใช้งานครั้งแรก สร้างใหม่ได้หลัง close() และ close() ไม่ตัดการเขียนกลางคัน"""
+
+    def setUp(self):
+        FakeClient.instances = []
+        patchers = [
+            patch.object(storage_module, "InfluxDBClient", FakeClient),
+            patch.dict(storage_module.influxdb_config, {"spool_dir": ""}),
+            patch.object(InfluxDBStorage, "coverage", new_callable=PropertyMock),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.storage = InfluxDBStorage()
+
+    def _written(self):
+        return sum(len(api.records) for client in FakeClient.instances for api in client.write_apis)
+
+    def test_client_is_created_on_first_write(self):
+        self.assertEqual(FakeClient.instances, [])
+        self.assertIsNone(self.storage.write_api)
+
+        self.storage.store_signal(SIGNAL)
+        self.storage.store_signal(SIGNAL)
+
+        self.assertEqual(len(FakeClient.instances), 1)
+        self.assertTrue(self.storage.connected)
+        self.assertEqual(self._written(), 2)
+
+    def test_write_after_close_creates_new_client(self):
+        self.storage.store_signal(SIGNAL)
+        first = FakeClient.instances[0]
+
+        self.storage.close()
+        self.assertTrue(first.closed)
+        self.assertTrue(first.write_apis[0].closed)
+        self.assertIsNone(self.storage.write_api)
+        self.assertFalse(self.storage.connected)
+
+        self.storage.store_signal(SIGNAL)
+
+        self.assertEqual(len(FakeClient.instances), 2)
+        self.assertEqual(len(FakeClient.instances[1].write_apis[0].records), 1)
+
+    def test_concurrent_writes_survive_close(self):
+        """ทุกการเขียนต้องลง write API ที่ยังไม่ถูกปิด แม้อีกเธรดเรียก close() ซ้ำ ๆ"""
+        writers, per_writer = 8, 200
+        errors = []
+        start = threading.Barrier(writers + 1)
+
+        def write():
+            start.wait()
+            for _ in range(per_writer):
+                try:
+                    self.storage.store_signal(SIGNAL)
+                except Exception as e:
+                    errors.append(e)
+                time.sleep(0)  # สลับเธรดบ่อย ๆ ให้ close() แทรกระหว่างการเขียน
+
+        threads = [threading.Thread(target=write) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        while any(thread.is_alive() for thread in threads):
+            self.storage.close()
+            time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self._written(), writers * per_writer)
+        self.assertGreater(len(FakeClient.instances), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.influxdb_storage import encode_kline_lines, encode_line, escape_tag
+
+
+class TestKlineLineProtocol(unittest.TestCase):
+    """ทดสอบการแปลง kline เป็น line protocol โดยตรง"""
+
+    def setUp(self):
+        self.kline = {
+            "timestamp": 1619712000000,
+            "open": 54000.0,
+            "high": 54100.5,
+            "low": 53900.0,
+            "close": 54050.25,
+            "volume": 15.5
+        }
+
+    def test_encode_uses_nanosecond_timestamp(self):
+        """ต้องได้บรรทัดเดียวกับรูปแบบที่คาดไว้ พร้อม timestamp แบบ nanosecond"""
+        lines = encode_kline_lines("BTCUSDT", [self.kline])
+
+        self.assertEqual(lines, [
+            "kline_data,symbol=BTCUSDT open=54000.0,high=54100.5,low=53900.0,"
+            "close=54050.25,volume=15.5 1619712000000000000"
+        ])
+
+    def test_encode_line_field_types(self):
+        """ต้องแปลงชนิดของ field ตาม line protocol และข้าม field ที่เป็น None"""
+        line = encode_line(
+            "signal",
+            {"symbol": "BTCUSDT", "category": "strong buy"},
+            {"price": 100.0, "trade_id": 7, "closed": True, "note": 'a"b', "rsi14": None},
+            1619712000000000000
+        )
+
+        self.assertEqual(
+            line,
+            'signal,symbol=BTCUSDT,category=strong\\ buy '
+            'price=100.0,trade_id=7i,closed=true,note="a\\"b" 1619712000000000000'
+        )
+
+    def test_encode_line_skips_non_finite_floats(self):
+        """NaN และ inf (เช่น RSI เมื่อราคาไม่เปลี่ยน) ต้องถูกข้ามเหมือน None"""
+        line = encode_line(
+            "signal",
+            {"symbol": "BTCUSDT"},
+            {"price": 100.0, "rsi14": float("nan"), "ema9": float("inf"), "ema21": float("-inf")},
+            1619712000000000000
+        )
+
+        self.assertEqual(line, "signal,symbol=BTCUSDT price=100.0 1619712000000000000")
+
+    def test_encode_line_without_fields_returns_none(self):
+        """บรรทัดที่ทุก field ถูกกรองออกไม่ใช่ line protocol ที่ถูกต้อง จึงต้องไม่ถูกสร้าง"""
+        line = encode_line(
+            "signal",
+            {"symbol": "BTCUSDT"},
+            {"rsi14": float("nan"), "ema9": None},
+            1619712000000000000
+        )
+
+        self.assertIsNone(line)
+
+    def test_encode_kline_skips_non_finite_values(self):
+        """NaN/inf ใน OHLCV ต้องถูกข้ามทีละ field และแท่งที่ไม่เหลือ field ต้องถูกข้ามทั้งแถว"""
+        partial = dict(self.kline, high=float("nan"), volume=float("inf"))
+        empty = dict(self.kline, timestamp=1619712060000,
+                     **{field: float("nan") for field in ("open", "high", "low", "close", "volume")})
+
+        lines = encode_kline_lines("BTCUSDT", [partial, empty])
+
+        self.assertEqual(lines, [
+            "kline_data,symbol=BTCUSDT open=54000.0,low=53900.0,close=54050.25 1619712000000000000"
+        ])
+
+    def test_encode_kline_writes_partial_flag_of_aggregated_bars(self):
+        """แท่งรวมต้องบันทึก partial ทั้ง true/false ส่วนแท่ง 1m ที่ไม่มีคีย์ partial ไม่ต้องมี field นี้"""
+        incomplete = dict(self.kline, partial=True)
+        complete = dict(self.kline, timestamp=1619712060000, partial=False)
+
+        lines = encode_kline_lines("BTCUSDT", [incomplete, complete], measurement="kline_1h")
+
+        self.assertTrue(lines[0].endswith(",partial=true 1619712000000000000"))
+        self.assertTrue(lines[1].endswith(",partial=false 1619712060000000000"))
+        self.assertNotIn("partial", encode_kline_lines("BTCUSDT", [self.kline])[0])
+
+    def test_escape_tag(self):
+        """ต้อง escape คอมมา เครื่องหมายเท่ากับ และช่องว่างในค่า tag"""
+        self.assertEqual(escape_tag("a,b=c d"), "a\\,b\\=c\\ d")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import asyncio
+import sys
+import pathlib
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.influxdb_storage import InfluxDBStorage
+
+
+class FakeRecord:
+    """FluxRecord จำลองหลัง pivot"""
+
+    def __init__(self, timestamp_ms, close):
+        self.values = {"_time": datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc), "close": close}
+
+    def get_time(self):
+        return self.values["_time"]
+
+
+class FakeQueryApi:
+    """query API จำลองที่คืนข้อมูลตาม limit/offset ใน query"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def query_stream(self, query, org=None):
+        self.queries.append(query)
+        limit = query.split("limit(n: ")[1]
+        page_size = int(limit.split(",")[0])
+        offset = int(limit.split("offset: ")[1].split(")")[0])
+
+        async def _records():
+            for timestamp_ms, close in self.rows[offset:offset + page_size]:
+                yield FakeRecord(timestamp_ms, close)
+
+        return _records()
+
+
+class TestIterMarketData(unittest.TestCase):
+    """ทดสอบการดึงข้อมูลแบบ async เป็นหน้าและคืนค่าเป็นคอลัมน์ NumPy"""
+
+    def setUp(self):
+        self.storage = InfluxDBStorage.__new__(InfluxDBStorage)
+        self.storage._async_client = None
+        self.storage._async_loop = None
+        self.storage._query_semaphore = None
+        self.storage.max_concurrent_queries = 2
+        self.storage.missing_buckets = set()
+
+        self.query_api = FakeQueryApi([(1_000 * i, float(i)) for i in range(5)])
+        self.client = MagicMock()
+        self.client.query_api.return_value = self.query_api
+
+    def _collect(self, **kwargs):
+        async def run():
+            with patch("influxdb_client.client.influxdb_client_async.InfluxDBClientAsync", return_value=self.client):
+                return [batch async for batch in self.storage.iter_market_data("BTCUSDT", 0, 3_600_000, **kwargs)]
+        return asyncio.run(run())
+
+    def test_pages_are_numpy_columns(self):
+        """ต้องแบ่งเป็นหน้าตาม page_size และคืนเฉพาะ field ที่ขอ"""
+        batches = self._collect(fields=("close",), page_size=2)
+
+        self.assertEqual([len(batch["timestamp"]) for batch in batches], [2, 2, 1])
+        self.assertEqual(list(batches[0].keys()), ["timestamp", "close"])
+        self.assertEqual(batches[2]["timestamp"].tolist(), [4000])
+        self.assertEqual(batches[1]["close"].dtype.name, "float64")
+        self.assertTrue(all('r["_field"] == "close"' in query for query in self.query_api.queries))
+
+    def test_range_is_split_into_bounded_windows(self):
+        """ช่วงเวลาที่ยาวกว่า window ต้องแบ่งเป็นหลาย query"""
+        async def run():
+            with patch("influxdb_client.client.influxdb_client_async.InfluxDBClientAsync", return_value=self.client):
+                return [batch async for batch in self.storage.iter_market_data(
+                    "BTCUSDT", 0, 3 * 3_600_000, fields=("close",), window_hours=1)]
+        asyncio.run(run())
+
+        self.assertEqual(len(self.query_api.queries), 3)
+        self.assertIn("stop: time(v: 3600000000000)", self.query_api.queries[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import unittest
+import sys
+import time
+import pathlib
+from types import SimpleNamespace
+from unittest.mock import MagicMock, PropertyMock, patch
+
+from influxdb_client.rest import ApiException
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.candle_coverage import CoverageIndex
+from app.influxdb_storage import (
+    COMPACTION_TASKS, INFLUXDB_BUCKET, STORAGE_TIERS, InfluxDBStorage, bucket_for
+)
+
+
+class FakeWriteApi:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, bucket, record, write_precision):
+        self.writes.append((bucket, record))
+
+
+class FakeBucketsApi:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.updated = []
+
+    def find_bucket_by_name(self, name):
+        return self.buckets.get(name)
+
+    def create_bucket(self, bucket_name, retention_rules, org):
+        self.buckets[bucket_name] = SimpleNamespace(name=bucket_name, retention_rules=retention_rules)
+
+    def update_bucket(self, bucket):
+        self.updated.append(bucket.name)
+
+
+class FakeTasksApi:
+    def __init__(self):
+        self.created = []
+
+    def find_tasks(self, name):
+        return []
+
+    def create_task(self, task_create_request):
+        self.created.append(task_create_request.flux)
+
+
+class TestStorageTiers(unittest.TestCase):
+    """ทดสอบการแยก bucket ตาม tier และการจัดเตรียม bucket/task"""
+
+    def setUp(self):
+        self.storage = InfluxDBStorage()
+        self.storage._initialized = True
+        self.storage.connected = True
+
+    def test_measurements_are_routed_to_tiers(self):
+        """ข้อมูลดิบ แท่ง 1m และข้อมูลสรุปต้องลง bucket ของ tier ตัวเอง"""
+        raw, candles, aggregates = (tier.bucket for tier in STORAGE_TIERS)
+        self.assertEqual(bucket_for("depth"), raw)
+        self.assertEqual(bucket_for("kline_data"), candles)
+        self.assertEqual(candles, INFLUXDB_BUCKET)
+        self.assertEqual(bucket_for("kline_1h"), aggregates)
+        self.assertEqual(bucket_for("signal"), aggregates)
+
+        self.storage.write_api = FakeWriteApi()
+        self.storage.store_trade({"s": "BTCUSDT", "t": 1, "p": "1", "q": "2", "T": 1000, "m": False})
+        self.assertEqual(self.storage.write_api.writes[0][0], raw)
+
+    def _provision(self, enforce_retention):
+        existing = SimpleNamespace(name=INFLUXDB_BUCKET, retention_rules=[])
+        buckets_api = FakeBucketsApi({INFLUXDB_BUCKET: existing})
+        tasks_api = FakeTasksApi()
+        self.storage.client = SimpleNamespace(buckets_api=lambda: buckets_api, tasks_api=lambda: tasks_api)
+        self.assertTrue(self.storage.provision_storage(enforce_retention=enforce_retention))
+        return existing, buckets_api, tasks_api
+
+    def test_provision_creates_missing_and_keeps_existing_retention(self):
+        """ต้องสร้าง bucket ที่ยังไม่มีและ task compaction แต่ไม่แตะ retention ของ bucket ที่มีอยู่"""
+        existing, buckets_api, tasks_api = self._provision(enforce_retention=False)
+
+        self.assertEqual(set(buckets_api.buckets), {tier.bucket for tier in STORAGE_TIERS})
+        self.assertEqual(buckets_api.updated, [])
+        self.assertEqual(existing.retention_rules, [])
+        self.assertEqual(buckets_api.buckets[STORAGE_TIERS[2].bucket].retention_rules, [])
+        self.assertEqual(len(tasks_api.created), len(COMPACTION_TASKS))
+
+    def test_provision_enforces_retention_only_when_requested(self):
+        """เมื่อตั้ง enforce_retention ต้องปรับ retention ของ bucket ที่มีอยู่ให้ตรงกับ tier"""
+        existing, buckets_api, _ = self._provision(enforce_retention=True)
+
+        self.assertEqual(buckets_api.updated, [INFLUXDB_BUCKET])
+        self.assertEqual(existing.retention_rules[0].every_seconds, STORAGE_TIERS[1].retention_seconds)
+
+    def test_missing_tier_bucket_falls_back_to_main_bucket(self):
+        """404 จาก bucket ของ tier ต้องเปลี่ยนไปเขียนลง bucket หลัก แทนการวนอยู่ใน spool"""
+        raw = STORAGE_TIERS[0].bucket
+        spool = MagicMock()
+        self.storage.spools = {INFLUXDB_BUCKET: spool, raw: MagicMock()}
+        self.storage._on_write_error((raw, "org", "ns"), b"trade price=1.0 1", ApiException(status=404))
+
+        spool.append.assert_called_once_with("trade price=1.0 1")
+        self.assertTrue(self.storage.available)
+
+        self.storage.write_api = FakeWriteApi()
+        self.storage.store_trade({"s": "BTCUSDT", "t": 1, "p": "1", "q": "2", "T": 1000, "m": False})
+        self.assertEqual(self.storage.write_api.writes[0][0], INFLUXDB_BUCKET)
+
+        # ข้อมูลเก่าใน spool ของ tier ที่ได้ 404 ระหว่างส่งซ้ำต้องไปลง bucket หลัก
+        replay_api = MagicMock()
+        self.storage.missing_buckets.clear()
+        replay_api.write.side_effect = [ApiException(status=404), None]
+        self.storage._replay_write(replay_api, raw, "trade price=1.0 1")
+        self.assertEqual([c.kwargs["bucket"] for c in replay_api.write.call_args_list], [raw, INFLUXDB_BUCKET])
+        self.assertIn(raw, self.storage.missing_buckets)
+
+        # เมื่อจัดเตรียม bucket แล้วต้องกลับไปใช้ bucket ของ tier
+        self._provision(enforce_retention=False)
+        self.assertEqual(self.storage._bucket_for("trade"), raw)
+
+    def test_signal_without_finite_fields_is_not_written(self):
+        """สัญญาณที่ไม่เหลือ field หลังกรอง NaN ต้องไม่ถูกส่งเป็นบรรทัดว่างที่ทำให้ batch ถูกปฏิเสธ"""
+        self.storage.write_api = FakeWriteApi()
+        self.storage.store_signal({"symbol": "BTCUSDT", "timestamp": 1000, "forecast_pct": float("nan"),
+                                   "confidence": None, "price": float("inf")})
+        self.assertEqual(self.storage.write_api.writes, [])
+
+
+class TestWriteErrors(unittest.TestCase):
+    """batch ที่ถูกปฏิเสธถาวรต้องไม่ลง spool ส่วนความล้มเหลวชั่วคราวต้องลง spool"""
+
+    def setUp(self):
+        self.storage = InfluxDBStorage()
+        self.spool = MagicMock()
+        self.storage.spools = {INFLUXDB_BUCKET: self.spool}
+        self.storage.available = True
+        self.conf = (INFLUXDB_BUCKET, "org", "ns")
+
+    def test_rejected_batch_is_dropped(self):
+        for status in (400, 413, 422):
+            self.storage._on_write_error(self.conf, b"a value=nan 1", ApiException(status=status))
+        self.spool.append.assert_not_called()
+        self.assertTrue(self.storage.available)
+
+    def test_retryable_failure_is_spooled(self):
+        for exception in (ApiException(status=503), ApiException(status=429), ConnectionError("down")):
+            self.storage._on_write_error(self.conf, b"a value=1 1", exception)
+        self.assertEqual(self.spool.append.call_count, 3)
+        self.assertFalse(self.storage.available)
+
+
+class TestCoverageOnWrite(unittest.TestCase):
+    """ดัชนีช่วงข้อมูลต้องอัปเดตเฉพาะแท่งที่ InfluxDB ยืนยันการเขียนแล้ว"""
+
+    def setUp(self):
+        self.storage = InfluxDBStorage()
+        self.storage._initialized = True
+        self.storage.connected = True
+        self.storage.write_api = FakeWriteApi()
+        self.index = CoverageIndex()
+        patcher = patch.object(InfluxDBStorage, "coverage", new_callable=PropertyMock, return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conf = (INFLUXDB_BUCKET, "org", "ns")
+
+    def _store(self, minutes, is_closed=True):
+        self.storage.store_kline_data("BTCUSDT", [
+            {"timestamp": m * 60_000, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0,
+             "is_closed": is_closed}
+            for m in minutes
+        ])
+        return self.storage.write_api.writes[-1][1]
+
+    def test_coverage_waits_for_write_success(self):
+        record = self._store(range(3))
+        self.assertEqual(self.index.gaps("BTCUSDT", 0, 180_000), [(0, 180_000)])
+
+        self.storage._on_write_success(self.conf, record.encode("utf-8"))
+        self.assertEqual(self.index.gaps("BTCUSDT", 0, 180_000), [])
+
+    def test_open_bar_is_not_covered_until_closed(self):
+        open_record = self._store([0], is_closed=False)
+        self.storage._on_write_success(self.conf, open_record)
+        self.assertEqual(self.index.gaps("BTCUSDT", 0, 60_000), [(0, 60_000)])
+
+        self.storage._on_write_success(self.conf, self._store([0]))
+        self.assertEqual(self.index.gaps("BTCUSDT", 0, 60_000), [])
+
+    def test_rejected_batch_stays_a_gap(self):
+        record = self._store(range(3))
+        self.storage._on_write_error(self.conf, record.encode("utf-8"), ApiException(status=400))
+        self.assertEqual(self.index.gaps("BTCUSDT", 0, 180_000), [(0, 180_000)])
+
+    def test_spool_replay_records_coverage(self):
+        record = self._store(range(2))
+        self.storage._replay_write(MagicMock(), INFLUXDB_BUCKET, record)
+        self.assertEqual(self.index.gaps("BTCUSDT", 0, 120_000), [])
+
+    def test_index_is_saved_periodically(self):
+        self.index.save = MagicMock()
+        record = self._store(range(2))
+        self.storage._coverage_saved_at = time.monotonic() - 3600
+        self.storage._on_write_success(self.conf, record)
+        self.index.save.assert_called_once()
+
+        self.storage._on_write_success(self.conf, record)
+        self.index.save.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
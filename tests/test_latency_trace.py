@@ -0,0 +1,117 @@
+import unittest
+import json
+import sys
+import pathlib
+from unittest.mock import MagicMock, patch
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app import latency_trace
+from app.candle_aggregator import Candle, persist_and_publish
+from app.optimized_signal_processor import signal_processor
+from app.signal_store import SignalStore
+
+EVENT_MS = 1_700_000_000_000
+EVENT = EVENT_MS / 1000.0
+
+
+def _counts(stage):
+    return (latency_trace.STAGE_SECONDS.labels(stage).count,
+            latency_trace.AGE_SECONDS.labels(stage).count)
+
+
+class TestLatencyTrace(unittest.TestCase):
+    """ทดสอบการประทับเวลาแต่ละ stage และการสะสมลง histogram"""
+
+    def test_stages_record_delta_and_age(self):
+        before = {stage: _counts(stage) for stage in ("receive", "flush", "process")}
+
+        trace = latency_trace.start({"e": "kline", "E": EVENT_MS}, now=EVENT + 0.2)
+        latency_trace.mark(trace, "flush", EVENT + 0.7)
+        # trace ผ่าน JSON (Redis Pub/Sub) แล้วลำดับ stage ต้องยังอยู่
+        trace = json.loads(json.dumps(trace))
+        latency_trace.mark(trace, "process", EVENT + 1.0)
+
+        self.assertEqual(list(trace), ["event", "receive", "flush", "process"])
+        for stage, (stage_count, age_count) in before.items():
+            self.assertEqual(_counts(stage), (stage_count + 1, age_count + 1))
+
+        flush_age = latency_trace.AGE_SECONDS.labels("flush")
+        self.assertLessEqual(flush_age.quantile(1.0), 1.0)
+        summary = latency_trace.snapshot()["process"]
+        self.assertGreaterEqual(summary["since_event"]["count"], 1)
+
+    def test_messages_without_event_time_are_ignored(self):
+        self.assertIsNone(latency_trace.start({"result": None, "id": 1}))
+        self.assertIsNone(latency_trace.start(None))
+        before = _counts("flush")
+        latency_trace.mark(None, "flush")
+        latency_trace.mark({"event": EVENT}, "unknown")
+        self.assertEqual(_counts("flush"), before)
+
+    def test_clock_skew_is_clamped(self):
+        age = latency_trace.AGE_SECONDS.labels("receive")
+        count, total = age.count, age.sum
+        trace = latency_trace.start({"T": EVENT_MS}, now=EVENT - 0.5)
+        self.assertEqual(trace["receive"], EVENT - 0.5)
+        self.assertEqual((age.count, age.sum), (count + 1, total))
+
+
+class TestCandleTracePublish(unittest.TestCase):
+    """trace ต้องไปกับข้อความ Pub/Sub แต่ไม่ถูกบันทึกลง InfluxDB"""
+
+    def test_trace_only_in_published_payload(self):
+        candle = Candle("BTCUSDT", "2m", 0, 119_999, 1.0, 2.0, 0.5, 1.5, 10.0)
+        candle.trace = {"event": EVENT, "receive": EVENT + 0.1}
+        storage, redis_client = MagicMock(), MagicMock()
+
+        persist_and_publish([candle], storage, redis_client)
+
+        stored = storage.store_kline_data.call_args[0][1]
+        self.assertNotIn("trace", stored[0])
+        channel, payload = redis_client.publish.call_args[0]
+        self.assertEqual(channel, "crypto_signals:kline:BTCUSDT:2m")
+        self.assertEqual(json.loads(payload)["trace"], candle.trace)
+
+
+class TestPipelineStages(unittest.TestCase):
+    """trace ต้องผ่านทุก stage ของเส้นทางจริง (OptimizedSignalProcessor) และไม่ถูกเก็บใน Redis"""
+
+    def test_all_stages_recorded_through_processor(self):
+        before = {stage: _counts(stage) for stage in latency_trace.STAGES}
+        trace = latency_trace.start({"E": EVENT_MS})
+        latency_trace.mark(trace, "flush")
+        candle = dict(Candle("TRACEUSDT", "2m", 0, 119_999, 1.0, 2.0, 0.5, 1.5, 10.0).to_dict(), trace=trace)
+        data = json.loads(json.dumps(candle))
+
+        script = MagicMock()
+        store = SignalStore(stream_maxlen=0)
+        store._script = script
+        cache = MagicMock()
+        cache.get_market_data.return_value = None
+        with patch("app.optimized_signal_processor.signal_store", store), \
+                patch("app.signal_store.get_redis_mode", return_value="standalone"), \
+                patch("app.signal_store.get_redis_client_for_symbol"), \
+                patch.object(signal_processor, "cache", cache), \
+                patch.object(signal_processor, "influxdb_storage", MagicMock()):
+            signal = signal_processor.process_market_data("TRACEUSDT", data)
+
+        self.assertIsNotNone(signal)
+        payload, channel, _, _, message = script.call_args.kwargs["args"]
+        self.assertNotIn("trace", json.loads(payload))
+        self.assertNotIn("trace", signal)
+
+        # ConnectionManager.broadcast แยก trace ออกจากข้อความ Pub/Sub ก่อนส่งให้ client
+        published = json.loads(message)
+        self.assertEqual(published["symbol"], "TRACEUSDT")
+        latency_trace.mark(published.pop("trace"), "broadcast")
+
+        for stage, (stage_count, age_count) in before.items():
+            self.assertEqual(_counts(stage), (stage_count + 1, age_count + 1), stage)
+
+
+if __name__ == '__main__':
+    unittest.main()
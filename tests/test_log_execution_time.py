@@ -0,0 +1,74 @@
+import unittest
+import asyncio
+import logging
+import sys
+import pathlib
+from unittest.mock import MagicMock
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.logger import log_execution_time
+from app.metrics import registry
+
+
+def _histogram(name):
+    return registry.get("function_duration_seconds").labels(name)
+
+
+class TestLogExecutionTime(unittest.TestCase):
+    """ทดสอบการวัดเวลาแบบ async-aware การสุ่ม และการข้าม format เมื่อปิด DEBUG"""
+
+    def setUp(self):
+        self.logger = MagicMock()
+        self.logger.isEnabledFor.return_value = False
+
+    def test_async_function_is_timed_until_completion(self):
+        @log_execution_time(self.logger, name="test.async_sleep")
+        async def sleeper():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        self.assertTrue(asyncio.iscoroutinefunction(sleeper))
+        self.assertEqual(asyncio.run(sleeper()), "done")
+        histogram = _histogram("test.async_sleep")
+        self.assertEqual(histogram.count, 1)
+        self.assertGreaterEqual(histogram.sum, 0.04)
+
+    def test_sampling_times_every_nth_call(self):
+        @log_execution_time(self.logger, sample_rate=0.25, name="test.sampled")
+        def add(a, b):
+            return a + b
+
+        for i in range(8):
+            self.assertEqual(add(i, 1), i + 1)
+        self.assertEqual(_histogram("test.sampled").count, 2)
+
+    def test_debug_message_skipped_when_disabled(self):
+        @log_execution_time(self.logger, name="test.quiet")
+        def work():
+            return 1
+
+        work()
+        self.logger.debug.assert_not_called()
+
+        self.logger.isEnabledFor.return_value = True
+        work()
+        self.logger.debug.assert_called_once()
+        self.assertEqual(self.logger.isEnabledFor.call_args[0][0], logging.DEBUG)
+
+    def test_errors_are_logged_even_when_not_sampled(self):
+        @log_execution_time(self.logger, sample_rate=0, name="test.failing")
+        async def broken():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(broken())
+        self.logger.error.assert_called_once()
+        self.assertEqual(_histogram("test.failing").count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
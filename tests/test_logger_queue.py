@@ -0,0 +1,98 @@
+import unittest
+import logging
+import logging.handlers
+import sys
+import pathlib
+from unittest.mock import patch
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.logger import ErrorLogger, LoggerFactory, RateLimitFilter
+
+
+class _ListHandler(logging.Handler):
+    """เก็บ record ที่ listener ส่งมา พร้อมข้อความที่จัดรูปแบบแล้ว"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.messages = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.messages.append(self.format(record))
+
+
+def _record(level=logging.ERROR, msg="Redis error: %s", args=("timeout",), lineno=10):
+    return logging.LogRecord("test", level, __file__, lineno, msg, args, None)
+
+
+class TestLoggerFactoryQueue(unittest.TestCase):
+    """logger ต้องเขียนลงคิว และให้ listener ในเธรดเบื้องหลังเขียนไปยัง handler จริง"""
+
+    def setUp(self):
+        self.logger = LoggerFactory.get_logger("test_logger_queue")
+        self.listener = LoggerFactory._listeners[-1]
+        self.sink = _ListHandler()
+        self.sink.setFormatter(logging.Formatter("%(message)s"))
+        self.original_handlers = self.listener.handlers
+        self.listener.handlers = (self.sink,)
+
+    def tearDown(self):
+        self.listener.handlers = self.original_handlers
+
+    def _drain(self):
+        # หยุด listener เพื่อให้เขียนทุกข้อความในคิวก่อน แล้วเริ่มใหม่
+        self.listener.stop()
+        self.listener.start()
+
+    def test_logger_only_has_queue_handler(self):
+        self.assertEqual(len(self.logger.handlers), 1)
+        self.assertIsInstance(self.logger.handlers[0], logging.handlers.QueueHandler)
+        self.assertIs(LoggerFactory.get_logger("test_logger_queue"), self.logger)
+
+    def test_records_reach_handlers_through_listener(self):
+        self.logger.info("สัญญาณ %s", "BTCUSDT")
+        self._drain()
+        self.assertEqual(self.sink.messages, ["สัญญาณ BTCUSDT"])
+
+    def test_traceback_is_formatted_by_listener(self):
+        try:
+            raise ValueError("boom")
+        except ValueError as error:
+            ErrorLogger("test_logger_queue").log_error(error, {"event": "queue_test"})
+        self._drain()
+        self.assertEqual(len(self.sink.records), 1)
+        self.assertIsNotNone(self.sink.records[0].exc_info)
+        self.assertIn("Traceback", self.sink.messages[0])
+        self.assertIn('"event": "queue_test"', self.sink.messages[0])
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    """ข้อความ error ที่ซ้ำจากจุดเดียวกันต้องถูกจำกัดและแจ้งจำนวนที่ถูกระงับ"""
+
+    def test_repeated_errors_are_suppressed_and_counted(self):
+        rate_filter = RateLimitFilter(burst=2, window=60)
+        with patch("app.logger.time.monotonic", return_value=100.0):
+            results = [rate_filter.filter(_record()) for _ in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+
+        with patch("app.logger.time.monotonic", return_value=161.0):
+            record = _record()
+            self.assertTrue(rate_filter.filter(record))
+        self.assertIn("timeout", record.getMessage())
+        self.assertIn("3", record.getMessage())
+
+    def test_info_and_distinct_sources_are_not_limited(self):
+        rate_filter = RateLimitFilter(burst=1, window=60)
+        self.assertTrue(all(rate_filter.filter(_record(logging.INFO)) for _ in range(5)))
+        self.assertTrue(rate_filter.filter(_record(lineno=1)))
+        self.assertTrue(rate_filter.filter(_record(lineno=2)))
+        self.assertFalse(rate_filter.filter(_record(lineno=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import sys
+import pathlib
+from unittest.mock import patch
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.metrics import MetricsRegistry
+from app.logger import MetricsLogger
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """ทดสอบการสะสมค่าในหน่วยความจำและการเรนเดอร์แบบ Prometheus"""
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_and_gauge_render(self):
+        messages = self.registry.counter("ws_messages_total", "Messages received")
+        signals = self.registry.counter("signals_total", "Signals by category", ("category",))
+        buffer_size = self.registry.gauge("ws_buffer_size", "Buffered messages")
+
+        messages.inc()
+        messages.inc(2)
+        signals.labels("strong buy").inc()
+        buffer_size.set(7)
+
+        text = self.registry.render_prometheus()
+        self.assertIn("# TYPE ws_messages_total counter\nws_messages_total 3\n", text)
+        self.assertIn('signals_total{category="strong buy"} 1', text)
+        self.assertIn("ws_buffer_size 7", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = self.registry.histogram("flush_seconds", "Flush time", buckets=(0.01, 0.1, 1.0))
+        for value in (0.005, 0.05, 0.05, 2.0):
+            latency.observe(value)
+
+        text = self.registry.render_prometheus()
+        self.assertIn('flush_seconds_bucket{le="0.01"} 1', text)
+        self.assertIn('flush_seconds_bucket{le="0.1"} 3', text)
+        self.assertIn('flush_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn("flush_seconds_count 4", text)
+        self.assertEqual(latency.quantile(0.5), 0.1)
+
+    def test_same_name_returns_same_metric(self):
+        first = self.registry.counter("x_total", "X")
+        self.assertIs(self.registry.counter("x_total", "X"), first)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("x_total", "X")
+
+    def test_collector_runs_before_render(self):
+        gauge = self.registry.gauge("pool_in_use", "Connections in use")
+        self.registry.add_collector(lambda: gauge.set(4))
+        self.assertIn("pool_in_use 4", self.registry.render_prometheus())
+
+
+class TestMetricsLogger(unittest.TestCase):
+    """MetricsLogger ต้องไม่เขียน log ต่อการบันทึกในระดับค่าเริ่มต้น"""
+
+    def test_record_metric_does_not_log_by_default(self):
+        metrics = MetricsLogger("test_metrics_registry")
+        with patch.object(metrics.logger, "handle") as handle:
+            metrics.record_metric("message_processing", {"buffer_size": 3})
+        handle.assert_not_called()
+        self.assertEqual(metrics.get_metrics()["message_processing"], {"buffer_size": 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+import unittest
+import asyncio
+import itertools
+import json
+import sys
+import time
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app import notification_outbox as outbox_module
+from app.notification_outbox import (
+    DEAD_LETTER_STREAM, NotificationOutbox, RateLimited, TokenBucket, outbox_stream, retry_zset
+)
+
+SIGNAL = {"symbol": "BTCUSDT", "category": "strong buy", "price": 50000.0, "timestamp": 1619712000000}
+STREAM = outbox_stream("discord")
+RETRY = retry_zset("discord")
+
+
+class FakeRedis:
+    """Redis จำลองเฉพาะคำสั่งที่ outbox ใช้ (สคริปต์ Lua จำลองด้วยฟังก์ชัน Python)"""
+
+    def __init__(self):
+        self.keys = set()
+        self.streams = {}
+        self.zsets = {}
+        self.acked = []
+        self.read_counts = []
+        self.delivered = set()
+        self.on_idle = None
+        self._ids = itertools.count(1)
+
+    def register_script(self, script):
+        if script == outbox_module._ENQUEUE_SCRIPT:
+            return self._enqueue
+        return self._promote
+
+    def _enqueue(self, keys, args):
+        if keys[0] in self.keys:
+            return None
+        self.keys.add(keys[0])
+        return self.xadd(keys[1], {"entry": args[0]})
+
+    def _promote(self, keys, args):
+        due = [member for member, score in self.zsets.get(keys[0], {}).items() if score <= args[0]]
+        for member in due:
+            self.xadd(keys[1], {"entry": member})
+            del self.zsets[keys[0]][member]
+        return len(due)
+
+    def xadd(self, stream, fields, **kwargs):
+        entry_id = f"{next(self._ids)}-0"
+        self.streams.setdefault(stream, []).append((entry_id, fields))
+        return entry_id
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def xack(self, stream, group, entry_id):
+        self.acked.append(entry_id)
+
+    def xgroup_create(self, *args, **kwargs):
+        pass
+
+    def xautoclaim(self, *args, **kwargs):
+        return ["0-0", [], []]
+
+    def xreadgroup(self, group, consumer, streams, count, block):
+        (stream, _), = streams.items()
+        self.read_counts.append(count)
+        entries = [entry for entry in self.streams.get(stream, []) if entry[0] not in self.delivered][:count]
+        self.delivered.update(entry_id for entry_id, _ in entries)
+        if not entries and self.on_idle:
+            self.on_idle()
+        return [[stream, entries]] if entries else []
+
+    def xdel(self, stream, entry_id):
+        self.streams[stream] = [entry for entry in self.streams[stream] if entry[0] != entry_id]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def read_all(self):
+        return list(self.streams.get(STREAM, []))
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class TestNotificationOutbox(unittest.TestCase):
+    """ทดสอบการเขียน outbox, การกันส่งซ้ำ, การส่งซ้ำแบบ backoff และ dead-letter"""
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.results = []
+        self.calls = []
+
+        async def sender(signal, target=None):
+            self.calls.append(signal)
+            result = self.results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.outbox = NotificationOutbox(self.redis, {"discord": sender}, max_attempts=3, base_backoff=2.0)
+
+    def _deliver_all(self):
+        async def run():
+            for entry_id, fields in self.redis.read_all():
+                await self.outbox._handle("discord", entry_id, fields)
+        asyncio.run(run())
+
+    def test_duplicate_signal_is_enqueued_once(self):
+        """สัญญาณเดียวกัน (สัญลักษณ์, เวลา, ประเภท) ต้องเข้า outbox ครั้งเดียว"""
+        self.assertEqual(len(self.outbox.enqueue(SIGNAL, ["discord"])), 1)
+        self.assertEqual(self.outbox.enqueue(dict(SIGNAL), ["discord"]), [])
+        self.assertEqual(len(self.outbox.enqueue({**SIGNAL, "category": "weak buy"}, ["discord"])), 1)
+        self.assertEqual(self.outbox.stats["duplicates"], 1)
+
+    def test_success_acks_and_removes_entry(self):
+        self.outbox.enqueue(SIGNAL, ["discord"])
+        self.results = [True]
+        self._deliver_all()
+
+        self.assertEqual(self.redis.read_all(), [])
+        self.assertEqual(len(self.redis.acked), 1)
+        self.assertEqual(self.outbox.stats["delivered"], 1)
+
+    def test_failure_is_scheduled_with_backoff(self):
+        self.outbox.enqueue(SIGNAL, ["discord"])
+        self.results = [False]
+        before = time.time() * 1000
+        self._deliver_all()
+
+        (member, due), = self.redis.zsets[RETRY].items()
+        self.assertEqual(json.loads(member)["attempt"], 1)
+        self.assertGreaterEqual(due - before, 1600)  # 2 วินาที +- jitter 20%
+        self.assertEqual(self.redis.read_all(), [])
+
+    def test_rate_limited_waits_for_retry_after(self):
+        self.outbox.enqueue(SIGNAL, ["discord"])
+        self.results = [RateLimited(30.0)]
+        before = time.time() * 1000
+        self._deliver_all()
+
+        due, = self.redis.zsets[RETRY].values()
+        self.assertGreaterEqual(due - before, 29990)  # เวลาถูกปัดเป็น ms
+
+    def test_exhausted_entry_goes_to_dead_letter(self):
+        """ล้มเหลวครบ max_attempts แล้วต้องย้ายไป dead-letter stream"""
+        self.outbox.enqueue(SIGNAL, ["discord"])
+        self.results = [False, ConnectionError("reset"), False]
+        for _ in range(3):
+            self._deliver_all()
+            # ทำให้ทุก entry ที่รออยู่ถึงเวลาส่งซ้ำทันที
+            self.redis._promote([RETRY, STREAM], [float("inf")])
+
+        self.assertEqual(len(self.calls), 3)
+        (_, fields), = self.redis.streams[DEAD_LETTER_STREAM]
+        entry = json.loads(fields["entry"])
+        self.assertEqual(entry["attempt"], 3)
+        self.assertEqual(entry["signal"]["symbol"], "BTCUSDT")
+        self.assertEqual(self.redis.read_all(), [])
+
+    def test_entry_without_token_is_deferred_not_held(self):
+        """เมื่อไม่มี token (เช่นหลัง 429) entry ต้องกลับไปรอใน retry zset ทันทีโดยไม่นับเป็นความพยายาม"""
+        self.outbox.enqueue(SIGNAL, ["discord"])
+        self.outbox.buckets["discord"].pause(10.0)
+        before = time.time() * 1000
+        self._deliver_all()
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(len(self.redis.acked), 1)
+        (member, due), = self.redis.zsets[RETRY].items()
+        self.assertEqual(json.loads(member)["attempt"], 0)
+        self.assertGreaterEqual(due - before, 9000)
+        self.assertEqual(self.outbox.stats["deferred"], 1)
+
+    def test_malformed_entry_goes_to_dead_letter(self):
+        self.redis.xadd(STREAM, {"entry": "{not json"})
+        self._deliver_all()
+
+        (_, fields), = self.redis.streams[DEAD_LETTER_STREAM]
+        self.assertEqual(fields["entry"], "{not json")
+        self.assertEqual(self.redis.read_all(), [])
+        self.assertEqual(len(self.redis.acked), 1)
+
+    def test_worker_reads_within_tokens_and_survives_bad_entries(self):
+        """worker ต้องอ่านไม่เกินจำนวน token และ entry ที่เสียต้องไม่ทำให้ worker หยุด"""
+        self.outbox.buckets["discord"] = TokenBucket(rate=50.0, capacity=5)
+        self.redis.xadd(STREAM, {"entry": "[]"})
+        for minute in range(6):
+            self.outbox.enqueue({**SIGNAL, "timestamp": minute}, ["discord"])
+        self.results = [True] * 6
+        self.redis.on_idle = self.outbox.stop
+
+        asyncio.run(asyncio.wait_for(self.outbox.run(), timeout=10))
+
+        # bucket เริ่มที่ 5 token จึงอ่านได้ 5 รายการก่อน แล้วตามจำนวน token ที่เติมกลับมา
+        self.assertEqual(self.redis.read_counts[0], 5)
+        self.assertTrue(all(count <= 5 for count in self.redis.read_counts))
+        self.assertEqual(len(self.calls), 6)
+        self.assertEqual(self.outbox.stats["dead_lettered"], 1)
+        self.assertEqual(self.outbox.claim_idle_ms, 60000)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """ทดสอบการจำกัดอัตราด้วย token bucket"""
+
+    def test_burst_then_rate(self):
+        async def run():
+            bucket = TokenBucket(rate=20.0, capacity=2)
+            started = time.monotonic()
+            for _ in range(4):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        # สองอันแรกได้ทันที อีกสองอันต้องรอ 1/20 วินาทีต่ออัน
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+    def test_pause_blocks_until_elapsed(self):
+        async def run():
+            bucket = TokenBucket(rate=10.0, capacity=5)
+            bucket.pause(0.2)
+            started = time.monotonic()
+            await bucket.acquire()
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import asyncio
+import json
+import sys
+import time
+import pathlib
+from unittest.mock import MagicMock, patch
+
+import httpx
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import app.notification_service as notification_module
+from app.notification_service import NotificationService
+from app.alert_rules import AlertRule
+
+SIGNAL = {
+    "symbol": "BTCUSDT", "category": "strong buy", "price": 50000.0, "forecast_pct": 1.5,
+    "confidence": 0.8, "timestamp": 1619712000000, "indicators": {"ema9": 1.0, "ema21": 2.0, "rsi14": 55.0},
+}
+
+
+class TestAsyncDispatch(unittest.TestCase):
+    """ทดสอบการส่งการแจ้งเตือนทุกช่องทางพร้อมกันแบบ async"""
+
+    def setUp(self):
+        patchers = [
+            patch.object(notification_module, "get_redis_client", return_value=MagicMock()),
+            patch.object(notification_module, "get_async_redis_client", return_value=MagicMock()),
+            patch.object(notification_module, "WEBHOOK_URL", "https://hooks.example/signal"),
+            patch.object(notification_module, "DISCORD_WEBHOOK_URL", "https://discord.example/webhook"),
+            patch.object(notification_module, "SMTP_USERNAME", ""),
+            patch.object(notification_module, "NOTIFY_OUTBOX_ENABLED", False),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = NotificationService()
+        self.requests = []
+
+    async def _handler(self, request):
+        self.requests.append((str(request.url), json.loads(request.content)))
+        await asyncio.sleep(0.2)
+        return httpx.Response(204 if "discord" in str(request.url) else 200)
+
+    def test_channels_are_sent_concurrently(self):
+        """ช่องทางที่ช้าต้องไม่รอกันตามลำดับ"""
+        async def run():
+            self.service._http = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+            started = time.monotonic()
+            results = await self.service.dispatch(SIGNAL)
+            elapsed = time.monotonic() - started
+            await self.service.aclose()
+            return results, elapsed
+
+        results, elapsed = asyncio.run(run())
+
+        self.assertEqual(results, {"webhook": True, "discord": True})
+        self.assertLess(elapsed, 0.35)
+        payloads = dict(self.requests)
+        self.assertEqual(payloads["https://hooks.example/signal"]["signal_type"], "strong buy")
+        self.assertEqual(payloads["https://discord.example/webhook"]["username"], "Crypto Signal Bot")
+
+    def test_process_message_async_does_not_wait_for_delivery(self):
+        """process_message_async ต้องคืนค่าทันทีและไม่ส่งสัญญาณ hold"""
+        async def run():
+            self.service._http = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+            started = time.monotonic()
+            await self.service.process_message_async({"type": "message", "data": json.dumps(SIGNAL)})
+            await self.service.process_message_async(
+                {"type": "message", "data": json.dumps({**SIGNAL, "category": "hold"})}
+            )
+            elapsed = time.monotonic() - started
+            await self.service.aclose()
+            return elapsed
+
+        self.assertLess(asyncio.run(run()), 0.1)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_matching_user_rule_is_sent_to_its_target(self):
+        """กฎของผู้ใช้ส่งไปยังปลายทางของตัวเอง แม้เป็นสัญญาณ hold ที่ไม่ส่งให้ปลายทางส่วนกลาง"""
+        rule = AlertRule("u1", "discord", "https://discord.example/user1", categories=["hold"])
+        self.service.alert_rules.match = MagicMock(return_value=[rule])
+
+        async def run():
+            self.service._http = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+            await self.service.process_message_async(
+                {"type": "message", "data": json.dumps({**SIGNAL, "category": "hold"})}
+            )
+            await self.service.aclose()
+
+        asyncio.run(run())
+        self.assertEqual([url for url, _ in self.requests], ["https://discord.example/user1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
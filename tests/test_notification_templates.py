@@ -0,0 +1,62 @@
+import unittest
+import sys
+import pathlib
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.notification_templates import (
+    DISCLAIMER, render_digest, render_discord_payload, render_email
+)
+
+SIGNAL = {
+    "symbol": "BTCUSDT", "category": "strong buy", "price": 50000.0, "forecast_pct": 1.5,
+    "confidence": 0.8, "timestamp": 1619712000000, "indicators": {"ema9": 1.0, "ema21": 2.0, "rsi14": None},
+}
+
+
+class TestNotificationTemplates(unittest.TestCase):
+    """ทดสอบการเติมค่าลงแม่แบบที่เรนเดอร์ส่วนคงที่ไว้ล่วงหน้า"""
+
+    def test_email_fills_category_and_numbers(self):
+        subject, html = render_email(SIGNAL)
+
+        self.assertEqual(subject, "🚨 สัญญาณการซื้อขาย: STRONG BUY สำหรับ BTCUSDT")
+        self.assertIn('<h3 style="color: #00b33c; margin: 0;">STRONG BUY</h3>', html)
+        self.assertIn("ราคาปัจจุบัน: $50000.00", html)
+        self.assertIn("การคาดการณ์: 1.50%", html)
+        self.assertIn("ความมั่นใจ: 80.0%", html)
+        self.assertNotIn("{", html)
+
+    def test_unknown_category_uses_defaults(self):
+        subject, html = render_email({**SIGNAL, "category": "Neutral"})
+
+        self.assertIn("NEUTRAL", subject)
+        self.assertIn("🔔", html)
+        self.assertIn("#b3b3b3", html)
+
+    def test_digest_has_one_row_per_signal(self):
+        html = render_digest([SIGNAL, {**SIGNAL, "symbol": "ETHUSDT", "category": "weak sell"}])
+
+        self.assertIn("(2 รายการ)", html)
+        self.assertEqual(html.count("<tr>"), 2)
+        self.assertIn("#ff9980", html)
+        self.assertIn(DISCLAIMER, html)
+
+    def test_discord_payload(self):
+        payload = render_discord_payload(SIGNAL)
+        embed = payload["embeds"][0]
+
+        self.assertEqual(embed["title"], "🚀 สัญญาณ STRONG BUY สำหรับ BTCUSDT")
+        self.assertEqual(embed["color"], 0x00b33c)
+        self.assertEqual([field["value"] for field in embed["fields"][:3]], ["$50000.00", "1.50%", "80.0%"])
+        self.assertEqual(embed["fields"][3]["value"], "• EMA9: 1.00\n• EMA21: 2.00\n• RSI14: N/A")
+
+        # payload แต่ละครั้งต้องเป็นออบเจกต์ใหม่ ไม่แชร์รายการ fields กัน
+        self.assertIsNot(render_discord_payload(SIGNAL)["embeds"][0]["fields"], embed["fields"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import asyncio
+import sys
+import pathlib
+import threading
+import time
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app import profiler
+from app.profiler import EventLoopLagMonitor, ProfilerBusy, SamplingProfiler, run_profile
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def idle_wait(stop, ready):
+    ready.set()  # บอกว่ากำลังจะบล็อก เวลา CPU ตอนเริ่มเธรดใช้ไปหมดแล้ว
+    stop.wait()
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """ทดสอบการสุ่ม stack ของเธรดอื่นและรูปแบบ collapsed stacks"""
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.idle_ready = threading.Event()
+        self.threads = [
+            threading.Thread(target=busy_loop, args=(self.stop,), name="busy worker"),
+            threading.Thread(target=idle_wait, args=(self.stop, self.idle_ready), name="idle-worker"),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def tearDown(self):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _stacks(self, profile):
+        stacks = {}
+        for line in profile.collapsed.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            stacks[stack] = int(count)
+        return stacks
+
+    def test_wall_mode_samples_every_thread(self):
+        profile = SamplingProfiler(interval=0.005, mode="wall").run(0.2)
+        stacks = self._stacks(profile)
+
+        self.assertGreater(profile.samples, 5)
+        self.assertTrue(any(s.startswith("busy_worker;") and "busy_loop (test_profiler.py:" in s for s in stacks))
+        self.assertTrue(any(s.startswith("idle-worker;") and "idle_wait" in s for s in stacks))
+        self.assertFalse(any("run (profiler.py" in s for s in stacks))
+
+    def test_cpu_mode_skips_idle_threads(self):
+        if profiler._thread_cpu_ns(threading.main_thread().native_id) is None:
+            self.skipTest("ไม่มี /proc/self/task สำหรับอ่านเวลา CPU ของเธรด")
+        # รอให้เธรด idle บล็อกจริงและเวลา CPU ตอนเริ่มเธรดถูกนับครบ (นับเป็น tick) ก่อนตัวอย่างแรกซึ่งเป็น baseline
+        # ไม่เช่นนั้นเวลาตอนเริ่มอาจตกระหว่างสองตัวอย่างแรกและถูกนับว่าเธรดนี้ใช้ CPU
+        self.assertTrue(self.idle_ready.wait(1.0))
+        idle = self.threads[1]
+        baseline = profiler._thread_cpu_ns(idle.native_id)
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            current = profiler._thread_cpu_ns(idle.native_id)
+            if current == baseline:
+                break
+            baseline = current
+        stacks = self._stacks(SamplingProfiler(interval=0.01, mode="cpu").run(0.3))
+
+        self.assertTrue(any(s.startswith("busy_worker;") for s in stacks))
+        self.assertFalse(any(s.startswith("idle-worker;") for s in stacks))
+
+    def test_event_loop_thread_is_labelled(self):
+        profile = SamplingProfiler(interval=0.005, loop_thread_id=self.threads[1].ident).run(0.05)
+        self.assertIn("idle-worker_[event_loop];", profile.collapsed)
+
+    def test_only_one_profile_at_a_time(self):
+        with profiler._profile_lock:
+            with self.assertRaises(ProfilerBusy):
+                run_profile(0.01)
+        self.assertGreater(run_profile(0.02, interval=0.005).samples, 0)
+
+
+class TestEventLoopLagMonitor(unittest.TestCase):
+    """ความหน่วงต้องสะท้อนเวลาที่ event loop ถูกบล็อก"""
+
+    def test_blocking_call_is_measured(self):
+        monitor = EventLoopLagMonitor(interval=0.02, warn_seconds=0.1)
+
+        async def scenario():
+            task = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            time.sleep(0.25)  # บล็อก event loop
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+        self.assertGreaterEqual(monitor.max_lag, 0.2)
+        self.assertEqual(monitor.stalls, 1)
+        self.assertEqual(monitor.snapshot()["max"], monitor.max_lag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+import unittest
+import asyncio
+import sys
+import pathlib
+from unittest.mock import patch
+
+import redis
+import redis.asyncio
+from redis.crc import key_slot
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app import redis_manager as redis_manager_module
+from app.redis_manager import (
+    ConsistentHashRing, InstrumentedAsyncConnectionPool, InstrumentedConnectionPool, RedisManager, symbol_key
+)
+
+SYMBOLS = [f"SYM{i}USDT" for i in range(3000)]
+SHARDS = "10.0.0.1:6379,10.0.0.2:6380,10.0.0.3:6381"
+
+
+class FakeConnection(redis.Connection):
+    """connection ที่ไม่เปิด socket จริง ใช้ทดสอบการยืม/คืนจาก pool"""
+
+    def connect(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return False
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+
+class FakeAsyncConnection(redis.asyncio.Connection):
+    """connection ของ redis.asyncio ที่ไม่เปิด socket จริง"""
+
+    async def connect(self):
+        pass
+
+    async def can_read_destructive(self):
+        return False
+
+    can_read = can_read_destructive
+
+    async def disconnect(self, nowait=False):
+        pass
+
+
+def _manager(**overrides):
+    """สร้าง RedisManager ใหม่ตามการตั้งค่าที่กำหนด (ไม่เชื่อมต่อ Redis จริง)"""
+    config = dict(redis_manager_module.env.get_redis_config(), **overrides)
+    with patch.object(redis_manager_module.env, "get_redis_config", return_value=config):
+        return RedisManager()
+
+
+class TestPoolStats(unittest.TestCase):
+    """สถิติ pool ต้องนับ connection ที่สร้าง ที่ถูกยืม และการรอจนหมดเวลา"""
+
+    def test_sync_pool_counts_checkouts_and_timeouts(self):
+        pool = InstrumentedConnectionPool(connection_class=FakeConnection, max_connections=2, timeout=0.05)
+
+        first = pool.get_connection()
+        second = pool.get_connection()
+        with self.assertRaises(redis.ConnectionError):
+            pool.get_connection()
+
+        stats = pool.stats.snapshot(pool.max_connections)
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["checked_out"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["waiting"], 0)
+        self.assertEqual(stats["utilization"], 1.0)
+
+        pool.release(first)
+        again = pool.get_connection()
+        pool.release(again)
+        pool.release(second)
+
+        stats = pool.stats.snapshot(pool.max_connections)
+        self.assertIs(again, first)
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["acquired"], 3)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["peak_checked_out"], 2)
+
+    def test_async_pool_counts_checkouts_and_timeouts(self):
+        async def run():
+            pool = InstrumentedAsyncConnectionPool(connection_class=FakeAsyncConnection, max_connections=1, timeout=0.05)
+            connection = await pool.get_connection()
+            with self.assertRaises(redis.ConnectionError):
+                await pool.get_connection()
+            during = pool.stats.snapshot(pool.max_connections)
+            await pool.release(connection)
+            return during, pool.stats.snapshot(pool.max_connections)
+
+        during, after = asyncio.run(run())
+
+        self.assertEqual(during["created"], 1)
+        self.assertEqual(during["checked_out"], 1)
+        self.assertEqual(during["timeouts"], 1)
+        self.assertEqual(after["checked_out"], 0)
+        self.assertEqual(after["acquired"], 1)
+
+    def test_async_pools_are_reported_and_closed(self):
+        manager = _manager(mode="standalone")
+        self.assertEqual(set(manager.get_pool_stats()), {"binary", "text"})
+
+        async def run():
+            manager.get_async_redis_client(decode_responses=True)
+            reported = set(manager.get_pool_stats())
+            await manager.aclose()
+            return reported
+
+        self.assertEqual(asyncio.run(run()), {"binary", "text", "async_text"})
+        self.assertEqual(set(manager.get_pool_stats()), {"binary", "text"})
+        manager.close()
+
+    def test_sharded_stats_are_named_by_shard(self):
+        manager = _manager(mode="sharded", shards="10.0.0.1:6379,10.0.0.2:6379")
+
+        async def run():
+            client = manager.get_async_redis_client_for_symbol("BTCUSDT", decode_responses=True)
+            reported = set(manager.get_pool_stats())
+            await manager.aclose()
+            return client, reported
+
+        client, reported = asyncio.run(run())
+        shard = manager.shard_for("BTCUSDT")
+
+        self.assertEqual(client.connection_pool.connection_kwargs["host"], manager._shards[shard]["host"])
+        self.assertIn(f"{shard}:async_text", reported)
+        self.assertEqual({name for name in reported if ":async" in name}, {f"{shard}:async_text"})
+        self.assertEqual(len([name for name in reported if name.endswith(":binary")]), 2)
+        manager.close()
+
+
+class FakeCluster:
+    """RedisCluster จำลองที่ไม่เชื่อมต่อเครือข่าย"""
+
+    def __init__(self, startup_nodes, max_connections, **kwargs):
+        self.startup_nodes = startup_nodes
+        self.decode_responses = kwargs.get("decode_responses")
+        self.primaries = [f"node{i}" for i in range(3)]
+
+    def get_primaries(self):
+        return self.primaries
+
+    def get_redis_connection(self, node):
+        return (self, node)
+
+    def close(self):
+        pass
+
+
+class TestConsistentHashRing(unittest.TestCase):
+    """วงแหวนต้องให้ผลเดิมทุกครั้ง กระจายสม่ำเสมอ และย้ายคีย์น้อยที่สุดเมื่อเพิ่ม shard"""
+
+    def test_mapping_is_stable_across_instances(self):
+        first = ConsistentHashRing(["shard0", "shard1", "shard2"])
+        second = ConsistentHashRing(["shard2", "shard0", "shard1"])
+        self.assertEqual([first.get_node(s) for s in SYMBOLS], [second.get_node(s) for s in SYMBOLS])
+
+    def test_keys_are_spread_evenly(self):
+        ring = ConsistentHashRing(["shard0", "shard1", "shard2"])
+        counts = {}
+        for symbol in SYMBOLS:
+            node = ring.get_node(symbol)
+            counts[node] = counts.get(node, 0) + 1
+
+        self.assertEqual(set(counts), {"shard0", "shard1", "shard2"})
+        mean = len(SYMBOLS) / 3
+        for node, count in counts.items():
+            self.assertLess(abs(count - mean) / mean, 0.25, counts)
+
+    def test_adding_shard_only_moves_keys_to_new_shard(self):
+        before = ConsistentHashRing(["shard0", "shard1", "shard2"])
+        after = ConsistentHashRing(["shard0", "shard1", "shard2", "shard3"])
+
+        moved = [s for s in SYMBOLS if before.get_node(s) != after.get_node(s)]
+
+        self.assertTrue(all(after.get_node(s) == "shard3" for s in moved))
+        self.assertLess(len(moved) / len(SYMBOLS), 0.35)
+        self.assertGreater(len(moved) / len(SYMBOLS), 0.15)
+
+    def test_single_node_owns_every_key(self):
+        ring = ConsistentHashRing(["only"], vnodes=4)
+        self.assertEqual({ring.get_node(s) for s in SYMBOLS[:100]}, {"only"})
+
+
+class TestRouting(unittest.TestCase):
+    """คำสั่งของแต่ละสัญลักษณ์ต้องไปยัง shard/node ที่ถูกต้องในทุกโหมด"""
+
+    def test_sharded_mode_routes_symbol_to_its_shard(self):
+        manager = _manager(mode="sharded", shards=SHARDS)
+        self.addCleanup(manager.close)
+        ring = ConsistentHashRing(["shard0", "shard1", "shard2"], manager.config["shard_vnodes"])
+
+        for symbol in SYMBOLS[:50]:
+            shard = manager.shard_for(symbol)
+            self.assertEqual(shard, ring.get_node(symbol))
+            self.assertIs(manager.get_redis_client_for_symbol(symbol, decode_responses=True).connection_pool,
+                          manager._shards[shard]["text_pool"])
+            self.assertIs(manager.get_redis_client_for_symbol(symbol).connection_pool,
+                          manager._shards[shard]["pool"])
+
+        self.assertEqual({manager.shard_for(s) for s in SYMBOLS[:50]}, {"shard0", "shard1", "shard2"})
+        self.assertEqual([(shard["host"], shard["port"]) for shard in manager._shards.values()],
+                         [("10.0.0.1", 6379), ("10.0.0.2", 6380), ("10.0.0.3", 6381)])
+        # คีย์ส่วนกลางและ Pub/Sub อยู่ที่ shard แรก
+        self.assertIs(manager.get_redis_client(decode_responses=True).connection_pool, manager._shards["shard0"]["text_pool"])
+
+    def test_sharded_node_clients_cover_every_shard(self):
+        manager = _manager(mode="sharded", shards=SHARDS)
+        self.addCleanup(manager.close)
+
+        pools = [client.connection_pool for client in manager.get_node_clients(decode_responses=True)]
+
+        self.assertEqual(pools, [shard["text_pool"] for shard in manager._shards.values()])
+
+    def test_sharded_mode_requires_shards(self):
+        with self.assertRaises(ValueError):
+            _manager(mode="sharded", shards=" , ")
+
+    def test_standalone_uses_one_client(self):
+        manager = _manager(mode="standalone")
+        self.addCleanup(manager.close)
+
+        self.assertEqual(manager.shard_for("BTCUSDT"), "standalone")
+        self.assertIs(manager.get_redis_client_for_symbol("BTCUSDT").connection_pool, manager._pool)
+        self.assertEqual([c.connection_pool for c in manager.get_node_clients()], [manager._pool])
+
+    def test_cluster_node_clients_are_per_primary(self):
+        with patch("redis.cluster.RedisCluster", FakeCluster):
+            manager = _manager(mode="cluster", cluster_nodes="10.0.0.1:7000,10.0.0.2:7001")
+
+        text_clients = manager.get_node_clients(decode_responses=True)
+        binary_clients = manager.get_node_clients()
+
+        self.assertEqual(text_clients, [(manager._text_cluster, f"node{i}") for i in range(3)])
+        self.assertEqual(binary_clients, [(manager._cluster, f"node{i}") for i in range(3)])
+        self.assertTrue(manager._text_cluster.decode_responses)
+        self.assertEqual([(n.host, n.port) for n in manager._cluster.startup_nodes],
+                         [("10.0.0.1", 7000), ("10.0.0.2", 7001)])
+        self.assertIs(manager.get_redis_client_for_symbol("BTCUSDT", decode_responses=True), manager._text_cluster)
+        self.assertEqual(manager.shard_for("BTCUSDT"), "cluster")
+        self.assertEqual(manager.get_pool_stats(), {})
+
+    def test_symbol_key_uses_hash_tag_outside_standalone(self):
+        with patch.object(redis_manager_module.redis_manager, "mode", "standalone"):
+            self.assertEqual(symbol_key("latest_signal", "BTCUSDT"), "latest_signal:BTCUSDT")
+
+        for mode in ("cluster", "sharded"):
+            with patch.object(redis_manager_module.redis_manager, "mode", mode):
+                keys = [symbol_key(prefix, "BTCUSDT") for prefix in ("latest_signal", "signal_history", "signal_stream")]
+            self.assertEqual(keys[0], "latest_signal:{BTCUSDT}")
+            # ทุกคีย์ของสัญลักษณ์เดียวกันอยู่ใน slot เดียวกัน จึงใช้ pipeline/สคริปต์ใน node เดียวได้
+            self.assertEqual(len({key_slot(key.encode()) for key in keys}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import unittest
+import json
+import sys
+import pathlib
+from unittest.mock import patch
+
+import redis
+from starlette.requests import Request
+
+try:
+    import fakeredis
+except ImportError:  # fakeredis[lua] เป็น dependency สำหรับทดสอบเท่านั้น
+    fakeredis = None
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app import redis_manager as redis_manager_module
+from app.http_cache import etag_json_response
+from app.redis_manager import RedisManager
+from app.signal_store import REDIS_SIGNAL_CHANNEL, SignalStore
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT", "ADAUSDT", "DOGEUSDT", "DOTUSDT"]
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class TestShardedReads(unittest.TestCase):
+    """การอ่านหลายสัญลักษณ์ต้องใช้หนึ่ง round-trip ต่อ shard ไม่ใช่ต่อสัญลักษณ์"""
+
+    def setUp(self):
+        config = dict(redis_manager_module.env.get_redis_config(), mode="sharded",
+                      shards="10.0.0.1:6379,10.0.0.2:6379,10.0.0.3:6379")
+        with patch.object(redis_manager_module.env, "get_redis_config", return_value=config):
+            self.manager = RedisManager()
+        self.shards = {self.manager.shard_for(symbol) for symbol in SYMBOLS}
+        self.assertGreater(len(self.shards), 1)
+
+        self.patches = [
+            patch("app.signal_store.get_redis_client_for_symbol", self.manager.get_redis_client_for_symbol),
+            patch("app.signal_store.shard_for", self.manager.shard_for),
+            patch("app.signal_store.get_redis_mode", return_value="sharded"),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        self.store = SignalStore(stream_maxlen=0)
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        self.manager.close()
+
+    def _shard_pools(self):
+        return {id(shard['text_pool']) for shard in self.manager._shards.values()}
+
+    def test_latest_uses_one_mget_per_shard(self):
+        calls = []
+
+        def fake_mget(client, keys):
+            calls.append((id(client.connection_pool), list(keys)))
+            return ['{"symbol": "%s"}' % key.rsplit(":", 1)[1].strip("{}") for key in keys]
+
+        with patch.object(redis.Redis, "mget", autospec=True, side_effect=fake_mget):
+            latest = self.store.get_latest_many(SYMBOLS)
+
+        pools = {pool for pool, _ in calls}
+        self.assertEqual(len(calls), len(self.shards))
+        self.assertEqual(len(pools), len(calls))
+        self.assertLessEqual(pools, self._shard_pools())
+        self.assertEqual(sum(len(keys) for _, keys in calls), len(SYMBOLS))
+        self.assertEqual(set(latest), set(SYMBOLS))
+        self.assertEqual(latest["ETHUSDT"], '{"symbol": "ETHUSDT"}')
+
+    def test_history_uses_one_pipeline_per_shard(self):
+        executed = []
+
+        def fake_execute(pipeline, *args, **kwargs):
+            executed.append(len(pipeline.command_stack))
+            return [[] for _ in pipeline.command_stack]
+
+        with patch.object(redis.client.Pipeline, "execute", autospec=True, side_effect=fake_execute):
+            history = self.store.get_history_many(SYMBOLS, limit=5)
+
+        self.assertEqual(len(executed), len(self.shards))
+        self.assertEqual(sum(executed), len(SYMBOLS))
+        self.assertEqual(history["BTCUSDT"], [])
+
+
+@unittest.skipIf(fakeredis is None, "ต้องติดตั้ง fakeredis[lua] เพื่อรันสคริปต์ Lua")
+class TestPublishScript(unittest.TestCase):
+    """สคริปต์ Lua ต้องเขียนทุกคีย์และเผยแพร่ข้อความที่มี trace โดยไม่เก็บ trace ลง Redis"""
+
+    SIGNAL = {"symbol": "BTCUSDT", "category": "strong buy", "price": 50000.0}
+    TRACE = {"event": 1.0, "receive": 1.5}
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        self.pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+        self.pubsub.get_message(timeout=1.0)  # ข้อความยืนยันการ subscribe
+
+    def tearDown(self):
+        self.pubsub.close()
+
+    def _publish(self, store, signal, trace=None, mode="standalone", main=None):
+        with patch("app.signal_store.get_redis_client", return_value=main or self.redis), \
+                patch("app.signal_store.get_redis_client_for_symbol", return_value=self.redis), \
+                patch("app.signal_store.get_redis_mode", return_value=mode):
+            return store.publish("BTCUSDT", signal, trace=trace)
+
+    def _published(self, pubsub=None, timeout=1.0):
+        message = (pubsub or self.pubsub).get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return message["data"] if message else None
+
+    def test_writes_every_key_and_publishes_trace(self):
+        store = SignalStore(history_length=2, stream_maxlen=100)
+        payloads = [self._publish(store, dict(self.SIGNAL, price=price), self.TRACE) for price in (1.0, 2.0, 3.0)]
+
+        self.assertEqual(self.redis.get("latest_signal:BTCUSDT"), payloads[-1])
+        self.assertNotIn("trace", json.loads(payloads[-1]))
+        self.assertEqual(self.redis.lrange("signal_history:BTCUSDT", 0, -1), payloads[:0:-1])
+        stream = self.redis.xrange("signal_stream:BTCUSDT")
+        self.assertEqual([fields["data"] for _, fields in stream], payloads)
+
+        published = [json.loads(self._published()) for _ in payloads]
+        self.assertEqual([message["price"] for message in published], [1.0, 2.0, 3.0])
+        self.assertEqual(published[0]["trace"], self.TRACE)
+        self.assertEqual(dict(published[0], trace=None), dict(json.loads(payloads[0]), trace=None))
+
+    def test_publishes_stored_payload_without_trace_or_stream(self):
+        store = SignalStore(stream_maxlen=0)
+        payload = self._publish(store, json.dumps(self.SIGNAL))
+
+        self.assertEqual(self._published(), payload)
+        self.assertEqual(self.redis.get("latest_signal:BTCUSDT"), payload)
+        self.assertFalse(self.redis.exists("signal_stream:BTCUSDT"))
+
+    def test_trace_splice_into_empty_object(self):
+        store = SignalStore(stream_maxlen=0)
+        self._publish(store, "{}", self.TRACE)
+
+        self.assertEqual(json.loads(self._published()), {"trace": self.TRACE})
+        self.assertEqual(self.redis.get("latest_signal:BTCUSDT"), "{}")
+
+    def test_sharded_mode_publishes_on_primary(self):
+        """ในโหมด sharded สคริปต์บน shard ของสัญลักษณ์ต้องไม่ publish แต่ shard หลักเป็นผู้ publish"""
+        primary = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        pubsub = primary.pubsub()
+        pubsub.subscribe(REDIS_SIGNAL_CHANNEL)
+        pubsub.get_message(timeout=1.0)
+        self.addCleanup(pubsub.close)
+
+        payload = self._publish(SignalStore(stream_maxlen=0), self.SIGNAL, self.TRACE, mode="sharded", main=primary)
+
+        self.assertEqual(self.redis.get("latest_signal:BTCUSDT"), payload)
+        self.assertIsNone(primary.get("latest_signal:BTCUSDT"))
+        self.assertIsNone(self._published(timeout=0.1))
+        self.assertEqual(json.loads(self._published(pubsub))["trace"], self.TRACE)
+
+
+class TestEtagResponse(unittest.TestCase):
+    """body เดิมต้องได้ 304 เมื่อ If-None-Match ตรงกัน (รวมถึง weak tag และ *)"""
+
+    def test_not_modified_for_matching_etag(self):
+        body = '{"BTCUSDT":null}'
+        first = etag_json_response(body, _request())
+        etag = first.headers["etag"]
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.body, body.encode())
+        for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            response = etag_json_response(body, _request(header))
+            self.assertEqual(response.status_code, 304, header)
+            self.assertEqual(response.headers["etag"], etag)
+            self.assertEqual(response.body, b"")
+
+    def test_changed_body_is_sent_again(self):
+        etag = etag_json_response('{"BTCUSDT":null}', _request()).headers["etag"]
+        response = etag_json_response('{"BTCUSDT":{"price":1.0}}', _request(etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["etag"], etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import smtplib
+import sys
+import pathlib
+from email.message import EmailMessage
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.smtp_pool import EmailDigest, SMTPPool
+
+
+class FakeSMTP:
+    """SMTP connection จำลองที่นับการเชื่อมต่อและอีเมลที่ส่ง"""
+    instances = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.logged_in = False
+        self.fail_next = False
+        self.reject_next = None
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        self.logged_in = True
+
+    def send_message(self, msg):
+        if self.fail_next:
+            raise smtplib.SMTPServerDisconnected("closed by server")
+        if self.reject_next is not None:
+            error, self.reject_next = self.reject_next, None
+            raise error
+        self.sent.append(msg["Subject"])
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+
+def make_message(subject):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    return msg
+
+
+class TestSMTPPool(unittest.TestCase):
+    """ทดสอบการใช้ SMTP connection ซ้ำและการเชื่อมต่อใหม่"""
+
+    def setUp(self):
+        FakeSMTP.instances = []
+        self.pool = SMTPPool("smtp.example", 587, "user", "pass", smtp_factory=FakeSMTP)
+
+    def test_connection_is_reused(self):
+        """อีเมลหลายฉบับต้องใช้ connection เดียวกัน"""
+        for i in range(3):
+            self.pool.send(make_message(f"m{i}"))
+
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(FakeSMTP.instances[0].sent, ["m0", "m1", "m2"])
+
+    def test_reconnect_on_disconnect(self):
+        """connection ที่ถูก server ปิดต้องถูกแทนที่และส่งซ้ำ"""
+        self.pool.send(make_message("first"))
+        FakeSMTP.instances[0].fail_next = True
+
+        self.pool.send(make_message("second"))
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertEqual(FakeSMTP.instances[1].sent, ["second"])
+        self.assertEqual(self.pool.stats["reconnects"], 1)
+
+    def test_rejected_message_is_not_resent(self):
+        """อีเมลที่ server ปฏิเสธต้องไม่ถูกส่งซ้ำ และ connection ต้องกลับเข้า pool"""
+        self.pool.send(make_message("first"))
+        rejections = (
+            smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")}),
+            smtplib.SMTPDataError(554, b"rejected"),
+            smtplib.SMTPSenderRefused(553, b"bad sender", "me@example.com"),
+        )
+        for error in rejections:
+            FakeSMTP.instances[0].reject_next = error
+            with self.assertRaises(type(error)):
+                self.pool.send(make_message("rejected"))
+
+        self.pool.send(make_message("after"))
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(FakeSMTP.instances[0].sent, ["first", "after"])
+        self.assertEqual(self.pool.stats["reconnects"], 0)
+
+
+class TestEmailDigest(unittest.TestCase):
+    """ทดสอบการรวมรายการเป็น digest"""
+
+    def test_items_are_flushed_together(self):
+        """รายการในช่วงเวลาเดียวกันต้องถูกส่งเป็นชุดเดียว"""
+        batches = []
+        digest = EmailDigest(60, batches.append, max_items=3)
+        for i in range(4):
+            digest.add(i)
+        digest.close()
+
+        self.assertEqual(batches, [[0, 1, 2], [3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
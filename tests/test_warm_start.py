@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import sys
+import time
+import pathlib
+
+import numpy as np
+
+# สร้าง path ไปยังโฟลเดอร์หลักของแอปพลิเคชัน
+parent_dir = str(pathlib.Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from app.warm_start import warm_start
+
+MINUTE = 60_000
+
+
+class FakeStorage:
+    """คืนแท่งจาก dict {measurement: {timestamp: close}} ในรูปแบบเดียวกับ iter_market_data"""
+
+    def __init__(self, series):
+        self.series = series
+        self.calls = []
+
+    async def iter_market_data(self, symbol, start, end, fields=("open", "high", "low", "close", "volume"),
+                               measurement="kline_data"):
+        self.calls.append((symbol, measurement))
+        rows = sorted((ts, close) for ts, close in self.series.get((symbol, measurement), {}).items()
+                      if start <= ts < end)
+        if rows:
+            batch = {"timestamp": np.array([ts for ts, _ in rows], dtype=np.int64)}
+            for field in fields:
+                batch[field] = np.array([close if field != "volume" else 1.0 for _, close in rows])
+            yield batch
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.price_history = {}
+
+    def prime_price_history(self, symbol, prices):
+        self.price_history[symbol] = list(prices)
+
+
+class TestWarmStart(unittest.TestCase):
+    """ทดสอบการเติมประวัติราคาเมื่อเริ่ม process"""
+
+    def setUp(self):
+        now = int(time.time() * 1000)
+        self.end = now - now % (2 * MINUTE)
+
+    def test_uses_timeframe_measurement_and_fills_from_minutes(self):
+        """ต้องใช้แท่ง 2m ที่มีอยู่ และรวมแท่ง 1m สำหรับช่วงที่ขาด"""
+        two_minute = {self.end - i * 2 * MINUTE: float(i) for i in range(1, 5)}  # 4 แท่งล่าสุด
+        minutes = {self.end - 10 * MINUTE + m * MINUTE: 100.0 + m for m in range(2)}  # แท่ง 2m ที่ 5
+        storage = FakeStorage({
+            ("BTCUSDT", "kline_2m"): two_minute,
+            ("BTCUSDT", "kline_data"): minutes,
+        })
+        processor = FakeProcessor()
+
+        loaded = asyncio.run(warm_start(processor, ["BTCUSDT", "ETHUSDT"], count=5, storage=storage))
+
+        self.assertEqual(loaded, {"BTCUSDT": 5, "ETHUSDT": 0})
+        self.assertEqual(processor.price_history["BTCUSDT"], [101.0, 4.0, 3.0, 2.0, 1.0])
+        self.assertEqual(processor.price_history["ETHUSDT"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()